@@ -5,16 +5,18 @@
 @file mi/core/driver_scheduler.py
 @author Bill French
 @brief Provides task/event scheduling for drivers
-uses the PolledScheduler and provides a common, simplified interface
-for instrument and platform drivers.
+uses the process wide SchedulerService and provides a common, simplified
+interface for instrument and platform drivers.  All driver schedulers in
+a process share the service's timer thread and workers; polled job names
+are only required to be unique within one DriverScheduler.
 
 The scheduler is configured by passing a configuration dictionary
 to the constructor or my calling add_config.  Calling add_config
 more than once create new schedulers, but leave older schedulers
 inplace.
 
-Note: All schedulers with trigger type of 'polled' are required
-to have unique names.  An exception is thrown if you try to add
+Note: All schedulers with trigger type of 'polled' in a DriverScheduler
+are required to have unique names.  An exception is thrown if you try to add
 duplicate names.
 
 Configuration Dict:
@@ -127,7 +129,7 @@ import inspect
 from mi.core.log import get_logger; log = get_logger()
 
 from mi.core.common import BaseEnum
-from mi.core.scheduler import PolledScheduler
+from mi.core.scheduler import get_scheduler_service
 from mi.core.exceptions import SchedulerException
 
 class TriggerType(BaseEnum):
@@ -187,7 +189,7 @@ class DriverScheduler(object):
         }
         @param config: job configuration structure.
         """
-        self._scheduler = PolledScheduler()
+        self._scheduler = get_scheduler_service()
         if(config):
             self.add_config(config)
 
@@ -198,7 +200,7 @@ class DriverScheduler(object):
         @param name: name of the job
         @raise LookupError if we fail to find the job
         """
-        return self._scheduler.run_polled_job(name)
+        return self._scheduler.run_polled_job(name, owner=self)
 
     def add_config(self, config):
         """
@@ -231,7 +233,26 @@ class DriverScheduler(object):
             self._scheduler.start()
 
     def remove_job(self, callback):
-        self._scheduler.unschedule_func(callback)
+        """
+        Remove all jobs of this scheduler that call callback.
+        @param callback: job callback
+        @raise KeyError if no job calls callback
+        """
+        self._scheduler.unschedule_func(callback, owner=self)
+
+    def shutdown(self):
+        """
+        Remove all jobs added through this scheduler.  The shared
+        service keeps running for other drivers.
+        """
+        for job in self._scheduler.get_jobs(owner=self):
+            self._scheduler.remove_job(job)
+
+    def get_job_stats(self):
+        """
+        @return: dict of job name to run count and firing latency
+        """
+        return self._scheduler.job_stats(owner=self)
     
     def _add_job(self, name, config):
         """
@@ -310,7 +331,7 @@ class DriverScheduler(object):
         if(dt == None):
             raise SchedulerException("trigger missing parameter: %s" % DriverSchedulerConfigKey.DATE)
 
-        self._scheduler.add_date_job(callback, dt)
+        self._scheduler.add_date_job(callback, dt, name=name, owner=self)
 
     def _add_job_cron(self, name, config):
         """
@@ -339,7 +360,8 @@ class DriverScheduler(object):
             raise SchedulerException("at least one cron parameter required!")
 
         self._scheduler.add_cron_job(callback, year=year, month=month, day=day, week=week,
-                                     day_of_week=day_of_week, hour=hour, minute=minute, second=second)
+                                     day_of_week=day_of_week, hour=hour, minute=minute, second=second,
+                                     name=name, owner=self)
 
     def _add_job_interval(self, name, config):
         """
@@ -364,7 +386,8 @@ class DriverScheduler(object):
             raise SchedulerException("at least interval parameter required!")
 
         self._scheduler.add_interval_job(callback, weeks=weeks, days=days, hours=hours,
-                                                   minutes=minutes, seconds=seconds)
+                                                   minutes=minutes, seconds=seconds,
+                                                   name=name, owner=self)
 
     def _add_job_polled_interval(self, name, config):
         """
@@ -412,7 +435,7 @@ class DriverScheduler(object):
             if(max_weeks or max_days or max_hours or max_minutes or max_seconds):
                 max_interval_obj = self._scheduler.interval(max_weeks, max_days, max_hours, max_minutes, max_seconds)
 
-        self._scheduler.add_polled_job(callback, name, min_interval_obj, max_interval_obj)
+        self._scheduler.add_polled_job(callback, name, min_interval_obj, max_interval_obj, owner=self)
 
 
 
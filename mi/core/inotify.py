@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.inotify
+@file mi/core/inotify.py
+@author Bill French
+@brief Minimal ctypes binding to the Linux inotify API, used by the pollers
+to wait for file system changes instead of rescanning on a timer.
+
+Usage:
+
+watcher = InotifyWatcher('/tmp/dsatest', IN_CLOSE_WRITE | IN_MOVED_TO)
+for event in watcher.read_events(timeout=1):
+    print event.name
+
+InotifyWatcher raises InotifyUnavailable when inotify can not be used for a
+path: a non Linux platform, a kernel or C library without inotify, an
+exhausted watch limit, or a remote file system that does not generate
+events for changes made on other hosts.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from collections import namedtuple
+
+from mi.core.log import get_logger ; log = get_logger()
+
+# Event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+# File systems on which changes made by other hosts produce no events.
+REMOTE_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afs', 'ncpfs',
+                      'coda', 'gfs', 'gfs2', 'ocfs2', 'glusterfs', '9p',
+                      'fuse.sshfs', 'fuse.glusterfs', 'fuse.s3fs', 'lustre')
+
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+InotifyEvent = namedtuple('InotifyEvent', ['wd', 'mask', 'cookie', 'name'])
+
+
+class InotifyUnavailable(Exception):
+    """
+    inotify can not be used to watch the requested path.
+    """
+    pass
+
+
+def _load_libc():
+    """
+    @return: (inotify_init1, inotify_add_watch) or None
+    """
+    path = ctypes.util.find_library('c')
+    if path is None:
+        return None
+    try:
+        libc = ctypes.CDLL(path, use_errno=True)
+        functions = (libc.inotify_init1, libc.inotify_add_watch)
+    except (OSError, AttributeError):
+        return None
+    functions[0].argtypes = [ctypes.c_int]
+    functions[1].argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return functions
+
+_libc = _load_libc()
+
+
+def filesystem_type(path, mounts='/proc/mounts'):
+    """
+    @param path: path on the file system of interest
+    @return: file system type of the mount holding path, or None if unknown
+    """
+    path = os.path.realpath(path)
+    best = (-1, None)
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+                    if len(mount_point) > best[0]:
+                        best = (len(mount_point), fields[2])
+    except IOError:
+        return None
+    return best[1]
+
+
+class InotifyWatcher(object):
+    """
+    Watches one path for the events in mask.
+    """
+
+    def __init__(self, path, mask):
+        """
+        @param path: file or directory to watch
+        @param mask: bitwise or of IN_* events
+        @raise InotifyUnavailable: if the path can not be watched with inotify
+        """
+        if _libc is None:
+            raise InotifyUnavailable('inotify is not supported on this platform')
+
+        fstype = filesystem_type(path)
+        if fstype in REMOTE_FILESYSTEMS:
+            raise InotifyUnavailable('%s is on a %s file system' % (path, fstype))
+
+        (inotify_init1, inotify_add_watch) = _libc
+        self.path = path
+        self.fd = inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise InotifyUnavailable('inotify_init1 failed: %s' % os.strerror(ctypes.get_errno()))
+
+        self.wd = inotify_add_watch(self.fd, path, mask)
+        if self.wd < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            self.fd = None
+            raise InotifyUnavailable('inotify_add_watch(%s) failed: %s' % (path, os.strerror(error)))
+        log.debug('inotify watching %s, mask 0x%x', path, mask)
+
+    def fileno(self):
+        return self.fd
+
+    def read_events(self, timeout=None):
+        """
+        Wait for events and return all that are queued.
+        @param timeout: seconds to wait, None to wait forever, 0 to poll
+        @return: list of InotifyEvent, empty on timeout
+        """
+        try:
+            (readable, _, _) = select.select([self.fd], [], [], timeout)
+        except (select.error, IOError, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self.fd, _READ_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        return self.decode(data)
+
+    @staticmethod
+    def decode(data):
+        """
+        @param data: bytes read from an inotify file descriptor
+        @return: list of InotifyEvent
+        """
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            (wd, mask, cookie, length) = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        """
+        Close the inotify descriptor, which also removes the watch.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -11,9 +11,14 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+from collections import deque
+
 from mi.core.log import get_logger ; log = get_logger()
 
 from mi.core.exceptions import SampleException
+from mi.core.metrics import get_metrics, DriverMetric
+from mi.core.time import get_monotonic_time
+metrics = get_metrics()
 
 class Chunker(object):
     """
@@ -48,7 +53,13 @@ class Chunker(object):
         
         """ To be filled out by the subclass """
         self.buffer = None
-        
+
+    def __len__(self):
+        """
+        @retval number of items added and not yet cleaned away
+        """
+        return len(self.buffer)
+
     def add_chunk(self, raw_data, timestamp):
         """
         Adds a chunk of data to the end of the buffer, includes the new indices
@@ -77,6 +88,7 @@ class Chunker(object):
             self.buffer.append(raw_data)
             
         self.raw_chunk_list.append((start_index, end_index, timestamp))
+        metrics.set(DriverMetric.CHUNKER_BUFFER_SIZE, len(self.buffer))
 
         # find data
         result = self._generate_data_lists(timestamp,
@@ -133,7 +145,9 @@ class Chunker(object):
         """
         log.debug("Generating data lists with start index %s", start_index)
         return_list = {'data_chunk_list':[], 'non_data_chunk_list':[]}
+        sieve_start = get_monotonic_time()
         result = self.sieve(self.buffer[start_index:])
+        metrics.observe(DriverMetric.CHUNKER_SIEVE_TIME, get_monotonic_time() - sieve_start)
         # assert no overlap!
         if (self.overlaps(result)):
             raise SampleException("Overlapping blocks in sieve list: %s" % result)
@@ -456,4 +470,240 @@ class BinaryChunker(Chunker):
     def __init__(self, data_sieve_fn):
         Chunker.__init__(self, data_sieve_fn)
         self.buffer = []
-    
\ No newline at end of file
+    
+
+class BlockChunker(object):
+    """
+    A string chunker for large inputs such as data set files, with the same
+    get_next_* interface as StringChunker.  StringChunker copies the rest of
+    its buffer and rebuilds every chunk list each time a chunk is taken, so
+    its cost grows with the square of the number of chunks held, which is
+    fine for instrument streams but not for megabyte blocks read from a
+    file.  This chunker keeps chunk positions as absolute offsets in deques
+    and only trims the buffer when more data is added, so taking a chunk
+    costs the same however much is buffered.
+
+    The sieve is handed a read only buffer over the unsieved data rather
+    than a copy, so it must only index, slice or regex match it (as
+    Chunker.regex_sieve_function does).  The data can also come from an
+    mmap attached with attach(); the sieve then runs over the mapping
+    itself and nothing but the returned chunks is copied.
+
+    Indices returned by the get_next_*_with_index methods are relative to
+    the end of the last chunk cleaned away, as with StringChunker.
+    """
+    # drop consumed data from the front of the buffer once it is this big
+    COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, data_sieve_fn, hold_tail=False):
+        """
+        @param data_sieve_fn sieve function, as for Chunker
+        @param hold_tail Do not hand out a data chunk that ends exactly at the
+            end of the data until more data is added or flush() is called.
+            Regex sieves that end records with an optional field or \\Z
+            match a record cut short by the end of a read.
+        """
+        self.sieve = data_sieve_fn
+        self.hold_tail = hold_tail
+        # a data chunk is held back at the end of the data
+        self._held = False
+        self._data = ''
+        # absolute offset of _data[0], of the first unconsumed byte and of
+        # the end of the data added so far
+        self._data_start = 0
+        self._consumed = 0
+        self._end = 0
+        self._mapped = False
+        self._raw = deque()
+        self._chunks = deque()
+        self._gaps = deque()
+
+    def __len__(self):
+        """
+        @retval number of bytes added and not yet cleaned away
+        """
+        return self._end - self._consumed
+
+    def attach(self, mapping, offset=0):
+        """
+        Take data from an mmap instead of add_chunk; extend() makes more of
+        it available.
+        @param mapping mmap (or string) holding the data
+        @param offset offset in mapping of the first byte to chunk
+        """
+        self._data = mapping
+        self._data_start = 0
+        self._consumed = self._end = offset
+        self._mapped = True
+        self._raw.clear()
+        self._chunks.clear()
+        self._gaps.clear()
+
+    def remap(self, mapping):
+        """
+        Carry on with a new mapping of the same file, after it has grown.
+        @param mapping mmap with the same data at the same offsets
+        """
+        assert self._mapped, 'remap() needs an attached mapping'
+        self._data = mapping
+
+    def add_chunk(self, raw_data, timestamp):
+        """
+        Add data to the end of the buffer and sieve it.
+        @param raw_data string to add
+        @param timestamp NTP4 time the data was collected
+        """
+        assert not self._mapped, 'use extend() with an attached mapping'
+        if self._consumed - self._data_start > self.COMPACT_SIZE:
+            self._data = self._data[self._consumed - self._data_start:]
+            self._data_start = self._consumed
+        self._data += raw_data
+        self._add(len(raw_data), timestamp)
+
+    def extend(self, length, timestamp):
+        """
+        Make the next length bytes of an attached mapping available and
+        sieve them.
+        @param length number of bytes
+        @param timestamp NTP4 time the data was collected
+        """
+        assert self._mapped, 'extend() needs an attached mapping'
+        self._add(length, timestamp)
+
+    def flush(self, timestamp):
+        """
+        Release a data chunk held back at the end of the data, once it is
+        known no more data will follow.
+        @param timestamp NTP4 time for any new non-data
+        @retval length of the chunk released, 0 if none was held
+        """
+        if not self._held:
+            return 0
+        self._add(0, timestamp, final=True)
+        return self._chunks[-1][1] - self._chunks[-1][0]
+
+    def _add(self, length, timestamp, final=False):
+        assert isinstance(timestamp, float)
+        start = self._end
+        self._end += length
+        if length:
+            self._raw.append((start, self._end, timestamp))
+        metrics.set(DriverMetric.CHUNKER_BUFFER_SIZE, len(self))
+
+        # sieve everything after the last data chunk found
+        sieve_from = self._chunks[-1][1] if self._chunks else self._consumed
+        view = buffer(self._data, sieve_from - self._data_start, self._end - sieve_from)
+        sieve_start = get_monotonic_time()
+        result = self.sieve(view)
+        metrics.observe(DriverMetric.CHUNKER_SIEVE_TIME, get_monotonic_time() - sieve_start)
+        if Chunker.overlaps(result):
+            raise SampleException("Overlapping blocks in sieve list: %s" % result)
+        result.sort()
+        self._held = bool(self.hold_tail and not final and result and
+                          result[-1][1] + sieve_from == self._end)
+
+        # the sieved range is classified again from scratch
+        while self._gaps and self._gaps[-1][0] >= sieve_from:
+            self._gaps.pop()
+        merge_from = None
+        if self._gaps and self._gaps[-1][1] >= sieve_from:
+            (s, e, t) = self._gaps.pop()
+            merge_from = (s, t)
+
+        previous_end = sieve_from
+        gaps = []
+        for (s, e) in result:
+            (s, e) = (s + sieve_from, e + sieve_from)
+            if s > previous_end:
+                gaps.append((previous_end, s))
+            if not (self._held and e == self._end):
+                self._chunks.append((s, e, self._timestamp_at(s)))
+            previous_end = e
+        # data after the last chunk found may be the start of the next one,
+        # so it is only non-data if nothing was found at all
+        if not result and self._end > sieve_from:
+            gaps.append((sieve_from, self._end))
+
+        for (s, e) in gaps:
+            if merge_from and s == sieve_from:
+                self._gaps.append((merge_from[0], e, merge_from[1]))
+            elif result:
+                self._gaps.append((s, e, self._timestamp_at(s)))
+            else:
+                self._gaps.append((s, e, timestamp))
+            merge_from = None
+        if merge_from:
+            # the earlier gap now ends where the new data starts
+            self._gaps.append((merge_from[0], sieve_from, merge_from[1]))
+
+    def _timestamp_at(self, offset):
+        for (s, e, t) in self._raw:
+            if offset < e:
+                return t
+        return self._raw[-1][2] if self._raw else None
+
+    def _slice(self, start, end):
+        return self._data[start - self._data_start:end - self._data_start]
+
+    def _clean(self, end):
+        """
+        Drop everything before the absolute offset end.
+        """
+        self._consumed = max(self._consumed, end)
+        for chunks in (self._raw, self._chunks, self._gaps):
+            while chunks and chunks[0][1] <= end:
+                chunks.popleft()
+            if chunks and chunks[0][0] < end:
+                (s, e, t) = chunks.popleft()
+                chunks.appendleft((end, e, t))
+
+    def _next(self, chunks, clean):
+        if not chunks:
+            return (None, None, None, None)
+        (start, end, timestamp) = chunks[0]
+        block = self._slice(start, end)
+        result = (timestamp, block, start - self._consumed, end - self._consumed)
+        if clean:
+            chunks.popleft()
+            self._clean(end)
+        return result
+
+    def get_next_data_with_index(self, clean=True):
+        """
+        @retval (timestamp, data, start, end) of the next data chunk, or
+        (None, None, None, None)
+        """
+        return self._next(self._chunks, clean)
+
+    def get_next_data(self, clean=True):
+        (timestamp, block, start, end) = self.get_next_data_with_index(clean)
+        return (timestamp, block)
+
+    def get_next_non_data_with_index(self, clean=True):
+        """
+        @retval (timestamp, non_data, start, end) of the next non-data
+        chunk, or (None, None, None, None)
+        """
+        return self._next(self._gaps, clean)
+
+    def get_next_non_data(self, clean=True):
+        (timestamp, block, start, end) = self.get_next_non_data_with_index(clean)
+        return (timestamp, block)
+
+    def get_next_raw(self, clean=True):
+        """
+        @retval (timestamp, data) of the next chunk as it was added, or
+        (None, None).  A data chunk it cuts into becomes non-data.
+        """
+        if not self._raw:
+            return (None, None)
+        (start, end, timestamp) = self._raw[0]
+        block = self._slice(start, end)
+        if clean:
+            if self._chunks and self._chunks[0][0] < end < self._chunks[0][1]:
+                (s, e, t) = self._chunks.popleft()
+                self._gaps.appendleft((end, e, t))
+            self._clean(end)
+        return (timestamp, block)
+
+    regex_sieve_function = staticmethod(Chunker.regex_sieve_function)
@@ -21,6 +21,12 @@ import time
 import traceback
 from mi.core.exceptions import InstrumentException, InstrumentCommandException
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.metrics import get_metrics, DriverMetric
+from mi.core.time import get_monotonic_time
+metrics = get_metrics()
+from mi.core.tracing import get_tracer
+from mi.core.profiler import ProcessProfiler
+tracer = get_tracer()
 
 from ooi.logging import log
 
@@ -58,6 +64,9 @@ class DriverProcess(object):
         self.driver = None
         self.events = []
         self.messaging_started = False
+        self.metrics_interval = None
+        self.last_metrics_time = None
+        self.profiler = ProcessProfiler()
         
     def construct_driver(self):
         """
@@ -130,6 +139,19 @@ class DriverProcess(object):
         'stop_driver_process' - signal to close messaging and terminate.
         'test_events' - populate event queue with test data.
         'process_echo' - echos the message back.
+        'get_metrics' - return a snapshot of the process metrics, resetting
+        them if the reset kwarg is True.
+        'set_metrics_interval' - publish a metrics snapshot event every
+        args[0] seconds; None or 0 disables the event.
+        'set_trace_ratio' - trace the fraction args[0] of samples through
+        the driver; 0 disables tracing.
+        'get_trace_stats' - return per stage and stream latency percentiles
+        of traced samples, resetting them if the reset kwarg is True.
+        'start_profile' - start profiling the process; kwargs mode
+        ('statistical' or 'deterministic') and interval.
+        'stop_profile' - stop the running profile.
+        'dump_profile' - return the profile report as text, or write it to
+        the path kwarg and return the path.
         If the command is not found in the driver, an echo message is
         replied to the client.
         @param msg A driver command message.
@@ -138,8 +160,7 @@ class DriverProcess(object):
         cmd = msg.get('cmd', None)
         args = msg.get('args', None)
         kwargs = msg.get('kwargs', None)
-        cmd_func = getattr(self.driver, cmd, None)
-        log.debug("DriverProcess.cmd_driver(): cmd=%s, cmd_func=%s" %(cmd, cmd_func))
+        log.debug("DriverProcess.cmd_driver(): cmd=%s" % cmd)
         if cmd == 'stop_driver_process':
             self.stop_messaging()
             return'stop_driver_process'
@@ -147,6 +168,24 @@ class DriverProcess(object):
             events = kwargs['events']
             self.events += events
             reply = 'test_events'
+        elif cmd == 'get_metrics':
+            reply = metrics.snapshot((kwargs or {}).get('reset', False))
+        elif cmd == 'set_metrics_interval':
+            self.metrics_interval = args[0] if args else None
+            self.last_metrics_time = get_monotonic_time()
+            reply = self.metrics_interval
+        elif cmd == 'set_trace_ratio':
+            tracer.set_sample_ratio(args[0] if args else 0)
+            reply = tracer.sample_ratio
+        elif cmd == 'get_trace_stats':
+            reply = tracer.snapshot()
+            if (kwargs or {}).get('reset', False):
+                tracer.reset()
+        elif cmd in ('start_profile', 'stop_profile', 'dump_profile'):
+            try:
+                reply = getattr(self.profiler, cmd.split('_')[0])(*(args or ()), **(kwargs or {}))
+            except Exception as e:
+                reply = e
         elif cmd == 'process_echo':
             reply = 'ping from resource ppid:%s, resource:%s' % (str(self.ppid), str(self.driver))
             #try:
@@ -154,42 +193,72 @@ class DriverProcess(object):
             #except IndexError:
             #    msg = 'no message to echo'
             # reply = 'process_echo: %s' % msg
-        elif cmd_func:
-            try:
-                reply = cmd_func(*args, **kwargs)
-            except Exception as e:
-                reply = e
-                # Command error events are better handled in the agent directly.
-                #event = {
-                #    'type' : DriverAsyncEvent.ERROR,
-                #    'value' : str(e),
-                #    'exception' : e,
-                #    'time' : time.time()
-                #}
-                #self.send_event(event)
-                if not isinstance(e, InstrumentException):
-                    trace = traceback.format_exc()
-                    log.critical("Python error, Trace follows: \n%s" %trace)
-                
-                
         else:
-            reply = InstrumentCommandException('Unknown driver command.')
-            # Command error events are better handled in the agent directly.
-            #event = {
-            #    'type' : DriverAsyncEvent.ERROR,
-            #    'value' : str(reply),
-            #    'exception' : reply,
-            #    'time' : time.time()
-            #}
-            #self.send_event(event)
-        
+            reply = self.call_driver(self.driver, cmd, args, kwargs)
+
         return reply        
             
+    def call_driver(self, driver, cmd, args, kwargs):
+        """
+        Call a command of a driver, passing supplied args and kwargs.
+        @param driver The driver object.
+        @param cmd The command name.
+        @param args The command args.
+        @param kwargs The command kwargs.
+        @retval The driver command result, or the exception it raised, or
+            an InstrumentCommandException if the driver has no such command.
+        """
+        cmd_func = getattr(driver, cmd, None)
+        if not cmd_func:
+            # Command error events are better handled in the agent directly.
+            return InstrumentCommandException('Unknown driver command.')
+
+        cmd_start = get_monotonic_time()
+        try:
+            reply = cmd_func(*args, **kwargs)
+            metrics.observe(DriverMetric.DRIVER_COMMAND_TIME, get_monotonic_time() - cmd_start)
+        except Exception as e:
+            reply = e
+            # Command error events are better handled in the agent directly.
+            if not isinstance(e, InstrumentException):
+                trace = traceback.format_exc()
+                log.critical("Python error, Trace follows: \n%s" %trace)
+        return reply
+
     def send_event(self, evt):
         """
         Append an event to the list to be sent by the event threaed.
         """
+        tracer.queued(evt)
         self.events.append(evt)
+        metrics.set(DriverMetric.EVENT_QUEUE_DEPTH, len(self.events))
+
+    def event_sent(self, evt):
+        """
+        Record that an event left the process. Called by the messaging
+        implementation after each event is sent.
+        @param evt the event sent
+        """
+        metrics.inc(DriverMetric.EVENTS_SENT)
+        tracer.sent(evt)
+        if isinstance(evt, dict) and isinstance(evt.get('time'), float):
+            metrics.observe(DriverMetric.EVENT_SEND_LATENCY, time.time() - evt['time'])
+
+    def check_metrics_event(self):
+        """
+        Queue a metrics snapshot event if the metrics interval has elapsed.
+        Called periodically by the messaging implementation.
+        """
+        if not self.metrics_interval:
+            return
+        now = get_monotonic_time()
+        if now - self.last_metrics_time >= self.metrics_interval:
+            self.last_metrics_time = now
+            self.send_event({
+                'type' : DriverAsyncEvent.METRICS,
+                'value' : metrics.snapshot(),
+                'time' : time.time()
+            })
             
     def run(self):
         """
@@ -176,6 +176,7 @@ class DriverAsyncEvent(BaseEnum):
     RESULT = 'DRIVER_ASYNC_RESULT'
     DIRECT_ACCESS = 'DRIVER_ASYNC_EVENT_DIRECT_ACCESS'
     AGENT_EVENT = 'DRIVER_ASYNC_EVENT_AGENT_EVENT'
+    METRICS = 'DRIVER_ASYNC_EVENT_METRICS'
 
 class DriverParameter(BaseEnum):
     """
@@ -13,6 +13,9 @@ __license__ = 'Apache 2.0'
 from threading import RLock
 
 from mi.core.exceptions import InstrumentStateException
+from mi.core.metrics import get_metrics, DriverMetric
+from mi.core.time import get_monotonic_time
+metrics = get_metrics()
 
 from mi.core.log import get_logger,LoggerManager
 log = get_logger()
@@ -103,7 +106,9 @@ class InstrumentFSM(object):
         if self.events.has(event):
             handler = self.state_handlers.get((self.current_state, event), None)
             if handler:
+                handler_start = get_monotonic_time()
                 (next_state, result) = handler(*args, **kwargs)
+                metrics.observe(DriverMetric.FSM_HANDLER_TIME, get_monotonic_time() - handler_start)
             else:
                 raise InstrumentStateException('Command (%s) not handled in current state (%s).' % (event, self.current_state))
         else:
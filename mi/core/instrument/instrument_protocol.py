@@ -43,6 +43,12 @@ from mi.core.exceptions import InstrumentProtocolException
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import NotImplementedException
 from mi.core.exceptions import InstrumentParameterExpirationException
+from mi.core.metrics import get_metrics, DriverMetric
+metrics = get_metrics()
+from mi.core.tracing import get_tracer
+tracer = get_tracer()
+from mi.core.timeout import Deadline
+from mi.core.time import get_monotonic_time
 
 DEFAULT_CMD_TIMEOUT=20
 DEFAULT_WRITE_DELAY=0
@@ -250,8 +256,13 @@ class InstrumentProtocol(object):
         sample = None
         if regex.match(line):
         
+            build_start = get_monotonic_time()
             particle = particle_class(line, port_timestamp=timestamp)
+            tracer.particle_built(timestamp, particle_class.type())
             parsed_sample = particle.generate()
+            tracer.json_encoded()
+            metrics.observe(DriverMetric.PARTICLE_BUILD_TIME, get_monotonic_time() - build_start)
+            metrics.inc('%s.%s' % (DriverMetric.PARTICLES_BUILT, particle_class.type()))
 
             if publish and self._driver_event:
                 self._driver_event(DriverAsyncEvent.SAMPLE, parsed_sample)
@@ -435,6 +446,9 @@ class InstrumentProtocol(object):
         """
         log.debug("Scheduler config: %s" % self._get_scheduler_config())
         log.debug("Scheduler callbacks: %s" % self._scheduler_callback)
+        if self._scheduler:
+            # drop jobs from a previous initialization from the shared service
+            self._scheduler.shutdown()
         self._scheduler = DriverScheduler()
         for name in self._scheduler_callback.keys():
             log.debug("Add job for callback: %s" % name)
@@ -845,7 +859,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         @throw InstrumentTimeoutExecption on timeout
         """
         # Grab time for timeout and wait for prompt.
-        starttime = time.time()
+        deadline = Deadline(timeout)
         
         if response_regex and not isinstance(response_regex, RE_PATTERN):
             raise InstrumentProtocolException('Response regex is not a compiled pattern!')
@@ -882,7 +896,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
                     else:
                         time.sleep(.1)
 
-            if time.time() > starttime + timeout:
+            if deadline.expired():
                 raise InstrumentTimeoutException("in InstrumentProtocol._get_response()")
 
     def _get_raw_response(self, timeout=10, expected_prompt=None):
@@ -898,7 +912,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         # Grab time for timeout and wait for prompt.
         strip_chars = "\t "
 
-        starttime = time.time()
+        deadline = Deadline(timeout)
         if expected_prompt == None:
             prompt_list = self._get_prompts()
         else:
@@ -914,7 +928,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
                 else:
                     time.sleep(.1)
 
-            if time.time() > starttime + timeout:
+            if deadline.expired():
                 raise InstrumentTimeoutException("in InstrumentProtocol._get_raw_response()")
 
     def _do_cmd_resp(self, cmd, *args, **kwargs):
@@ -960,6 +974,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             raise InstrumentProtocolException('Cannot build command: %s' % cmd)
 
         cmd_line = build_handler(cmd, *args)
+        cmd_start = get_monotonic_time()
         # Wakeup the device, pass up exception if timeout
 
         prompt = self._wakeup(timeout)
@@ -996,6 +1011,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         if resp_handler:
             resp_result = resp_handler(result, prompt)
 
+        metrics.observe(DriverMetric.COMMAND_ROUND_TRIP, get_monotonic_time() - cmd_start)
         return resp_result
             
     def _do_cmd_no_resp(self, cmd, *args, **kwargs):
@@ -1076,6 +1092,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             self._chunker.add_chunk(data, timestamp)
             (timestamp, chunk) = self._chunker.get_next_data()
             while(chunk):
+                tracer.chunk_complete(timestamp)
                 self._got_chunk(chunk, timestamp)
                 (timestamp, chunk) = self._chunker.get_next_data()
 
@@ -1136,7 +1153,7 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         self._promptbuf = ''
         
         # Grab time for timeout.
-        starttime = time.time()
+        deadline = Deadline(timeout)
         
         while True:
             # Send a line return and wait a sec.
@@ -1153,10 +1170,11 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
                 log.debug("Got prompt (index: %s): %s ", index, repr(self._promptbuf))
                 if index >= 0:
                     log.trace('wakeup got prompt: %s', repr(item))
+                    metrics.observe(DriverMetric.WAKEUP_TIME, deadline.elapsed())
                     return item
             log.debug("Searched for all prompts")
 
-            if time.time() > starttime + timeout:
+            if deadline.expired():
                 raise InstrumentTimeoutException("in _wakeup()")
 
     def _wakeup_until(self, timeout, desired_prompt, delay=1, no_tries=5):
@@ -24,6 +24,12 @@ import subprocess
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import InstrumentConnectionException
+from mi.core.metrics import get_metrics, DriverMetric
+metrics = get_metrics()
+from mi.core.tracing import get_tracer
+tracer = get_tracer()
+from mi.core.time import get_monotonic_time
+from mi.core.timeout import get_timeout_service, monotonic_sleep
 
 HEADER_SIZE = 16 # BBBBHHLL = 1 + 1 + 1 + 1 + 2 + 2 + 4 + 4 = 16
 
@@ -319,7 +325,7 @@ class PortAgentClient(object):
             # time window.
             ###
             if (self.last_retry_time):
-                current_time = time.time()
+                current_time = get_monotonic_time()
                 log.debug(" Thread %s: current_time: %r; last_retry_time: %r", 
                           str(threading.current_thread().name), current_time,  (self.last_retry_time))
                 if current_time > (self.last_retry_time + MIN_RETRY_WINDOW):
@@ -329,7 +335,7 @@ class PortAgentClient(object):
                     log.info('PortAgentClient._init_comms(): still within min ' +
                               'retry window: not resetting retry counter')
             else:
-                self.last_retry_time = time.time()
+                self.last_retry_time = get_monotonic_time()
             
             log.info('PortAgentClient._init_comms(), thread: %s: connected to port agent at %s:%i.',
                            str(threading.current_thread().name), self.host, self.port)
@@ -339,14 +345,7 @@ class PortAgentClient(object):
             errorString = "_init_comms(): Exception initializing comms for " +  \
                       str(self.host) + ": " + str(self.port) + ": " + repr(e)
             log.error(errorString, exc_info = True)
-            time.sleep(self.RECOVERY_SLEEP_TIME)
-            returnCode = self.callback_error(errorString)
-            if returnCode == True:
-                log.debug("_init_comms: callback_error succeeded.")
-            else:
-                log.error("_init_comms: callback_error failed to recover connection.")
-            
-            return returnCode
+            return False
 
     def _create_connection(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -373,10 +372,14 @@ class PortAgentClient(object):
         self.max_missed_heartbeats = max_missed_heartbeats
         self.start_listener = start_listener 
 
-        if  False == self._init_comms():
-            error_string = ' port_agent_client private _init_comms failed.'
-            log.error(error_string)
-            raise InstrumentConnectionException(error_string)
+        # The caller waits for the connection, so the first connection is
+        # retried on its thread.
+        while not self._init_comms():
+            if not self._next_recovery_attempt():
+                error_string = ' port_agent_client private _init_comms failed.'
+                log.error(error_string)
+                raise InstrumentConnectionException(error_string)
+            monotonic_sleep(self.RECOVERY_SLEEP_TIME)
 
     def stop_comms(self):
         """
@@ -424,46 +427,59 @@ class PortAgentClient(object):
     def callback_error(self, errorString = "No error string passed."):
         """
         A catastrophic error has occurred; attempt to recover, but only
-        attempt MAX_RECOVERY_ATTEMPTS times. 
+        attempt MAX_RECOVERY_ATTEMPTS times.  The attempt is scheduled on the
+        timeout service and runs on a thread of its own, so neither the
+        caller nor the timeout workers wait on the connection.  If it fails,
+        the next attempt is scheduled RECOVERY_SLEEP_TIME later, and once
+        there are none left the user error callback is called.
         @param errorString: reason for call
-        @ retval True: recovery attempt worked
-                 False: recovery attempt failed
+        @ retval True: recovery attempt scheduled
+                 False: maximum recovery attempts reached
         """
-        returnValue = False
-        
-        self.recovery_mutex.acquire()
-
-        if (self.recovery_attempts >= MAX_RECOVERY_ATTEMPTS):
-            """
-            Release the mutex here.  The other thread can notice an error and
-            we will have not released the semaphore, and the thread will hang.  
-            The fact that we've incremented the MAX_RECOVERY_ATTEMPTS will
-            stop any re-entry.
-            """        
-            self.recovery_mutex.release()
-            log.error("Maximum connection_level recovery attempts (%d) reached." % (self.recovery_attempts))
+        if not self._next_recovery_attempt():
             if self.listener_thread and self.listener_thread.is_alive():
                 log.info("Stopping listener thread.") 
                 self.listener_thread.done()
-            returnValue = False
-        else:
-            """
-            Try calling _init_comms() again;
-            release the mutex before calling _init_comms, which can cause
-            another exception, and we will have not released the semaphore.  
-            The fact that we've incremented the MAX_RECOVERY_ATTEMPTS will
-            stop any re-entry.
-            """
+            return False
+
+        get_timeout_service().call_later_blocking(0, self._recover, errorString)
+        return True
+
+    def _next_recovery_attempt(self):
+        """
+        Count a recovery attempt, unless MAX_RECOVERY_ATTEMPTS have been made.
+        @retval True if another attempt may be made
+        """
+        with self.recovery_mutex:
+            if (self.recovery_attempts >= MAX_RECOVERY_ATTEMPTS):
+                log.error("Maximum connection_level recovery attempts (%d) reached." % (self.recovery_attempts))
+                return False
             self.recovery_attempts = self.recovery_attempts + 1
             log.error("Attempting connection_level recovery; attempt number %d" % (self.recovery_attempts))
-            self.recovery_mutex.release()
-            returnValue = self._init_comms()
-            if True == returnValue:
-                log.info("_init_comms recovery succeeded.")
-            else:
-                log.error("_init_comms recovery failed.")
-            
-        return returnValue
+            return True
+
+    def _recover(self, errorString):
+        """
+        Recovery attempt scheduled by callback_error.  A failed attempt
+        schedules the next one instead of sleeping.
+        @param errorString: reason for the recovery
+        """
+        if self._init_comms():
+            log.info("_init_comms recovery succeeded.")
+            return
+        log.error("_init_comms recovery failed.")
+        get_timeout_service().call_later_blocking(self.RECOVERY_SLEEP_TIME, self._retry_recovery, errorString)
+
+    def _retry_recovery(self, errorString):
+        """
+        Make the next recovery attempt, or tell the user error callback
+        there are none left.
+        @param errorString: reason for the recovery
+        """
+        if not self.callback_error(errorString):
+            log.error("_init_comms: callback_error failed to recover connection.")
+            if self.user_callback_error:
+                self.user_callback_error(errorString)
             
     def send_config_parameter(self, parameter, value):
         """
@@ -693,7 +709,9 @@ class Listener(threading.Thread):
         if self.heartbeat_missed_count <= 0:
             errorString = 'Maximum allowable Port Agent heartbeats (' + str(self.max_missed_heartbeats) + ') missed!'
             log.error(errorString)
-            self._invoke_error_callback(self.recovery_attempt, errorString)
+            # this runs on a timeout worker; the error callbacks may block
+            get_timeout_service().call_later_blocking(0, self._invoke_error_callback,
+                                                      self.recovery_attempt, errorString)
         else:
             self.start_heartbeat_timer()
 
@@ -718,35 +736,41 @@ class Listener(threading.Thread):
         
     def start_heartbeat_timer(self):
         """
-        Note: the threading timer here is only run once.  The cancel
-        only applies if the function has yet run.  You can't reset
-        it and start it again, you have to instantiate a new one.
-        I don't like this; we need to implement a tread timer that 
-        stays up and can be reset and started many times.
+        Arm the heartbeat timeout, or push it out if it is already armed.
+        The timeout is a handle on the shared monotonic timeout service,
+        so resetting it on every heartbeat does not create a thread.
         """
+        if self.heartbeat_timer:
+            self.heartbeat_timer.restart(self.heartbeat)
+        else:
+            self.heartbeat_timer = get_timeout_service().call_later(
+                self.heartbeat, self.heartbeat_timeout)
+
+    def stop_heartbeat_timer(self):
         if self.heartbeat_timer:
             self.heartbeat_timer.cancel()
 
-        self.heartbeat_timer = threading.Timer(self.heartbeat, 
-                                            self.heartbeat_timeout)
-        self.heartbeat_timer.start()
-        
     def done(self):
         """
         Signal to the listener thread to end its processing loop and
         conclude.
         """
         self._done = True
+        self.stop_heartbeat_timer()
 
     def handle_packet(self, paPacket):
         packet_type = paPacket.get_header_type()
+        metrics.inc(DriverMetric.PORT_AGENT_PACKETS)
+        metrics.inc(DriverMetric.PORT_AGENT_BYTES, paPacket.get_data_length())
         
         if packet_type == PortAgentPacket.DATA_FROM_INSTRUMENT:
+            tracer.packet_received(paPacket.get_timestamp())
             self.callback_raw(paPacket)
             self.callback_data(paPacket)
         elif packet_type == PortAgentPacket.DATA_FROM_DRIVER:
             self.callback_raw(paPacket)
         elif packet_type == PortAgentPacket.PICKLED_DATA_FROM_INSTRUMENT:
+            tracer.packet_received(paPacket.get_timestamp())
             self.callback_raw(paPacket)
             self.callback_data(paPacket)
         elif packet_type == PortAgentPacket.PICKLED_DATA_FROM_DRIVER:
@@ -868,6 +892,7 @@ class Listener(threading.Thread):
             except Exception as e:
                 self.default_callback_error(e)
 
+        self.stop_heartbeat_timer()
         log.info('Port_agent_client thread done listening; going away.')
 
     def _invoke_error_callback(self, recovery_attempt, error_string = "No error string passed."):
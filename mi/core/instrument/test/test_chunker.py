@@ -10,8 +10,12 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
-import unittest
+import os
 import re
+import mmap
+import random
+import tempfile
+import unittest
 from functools import partial
 from mi.core.unit_test import MiUnitTest, MiUnitTestCase
 from nose.plugins.attrib import attr
@@ -19,7 +23,7 @@ from pyon.util.unit_test import IonUnitTestCase
 from ooi.logging import log
 
 from mi.core.exceptions import SampleException
-from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import StringChunker, BlockChunker
 
 @attr('UNIT', group='mi')
 class UnitTestStringChunker(MiUnitTestCase):
@@ -99,7 +103,16 @@ class UnitTestStringChunker(MiUnitTestCase):
         self.assertEquals([(0,31), (33, 64)],
                           self._chunker.regex_sieve_function(self.MULTI_SAMPLE_1, [regex]))
 
-        
+
+    def test_len(self):
+        """
+        The length counts what is left once chunks are cleaned away.
+        """
+        self._chunker.add_chunk("Foo%s\r\n%s" % (self.SAMPLE_1, self.FRAGMENT_1), self.TIMESTAMP_1)
+        self.assertEqual(len(self._chunker), 3 + 31 + 2 + len(self.FRAGMENT_1))
+        self._chunker.get_next_data_with_index()
+        self.assertEqual(len(self._chunker), 2 + len(self.FRAGMENT_1))
+
     def test_generate_data_lists(self):
         sample_string = "Foo%sBar%sBat" % (self.SAMPLE_1, self.SAMPLE_2)
         self._chunker.add_chunk(sample_string, self.TIMESTAMP_1)
@@ -380,3 +393,87 @@ class UnitTestBinaryChunker(MiUnitTestCase):
         """
         pass
     
+
+
+@attr('UNIT', group='mi')
+class UnitTestBlockChunker(MiUnitTestCase):
+    """
+    Test that the block chunker gives the same chunks as the string chunker
+    """
+    SAMPLE_1 = UnitTestStringChunker.SAMPLE_1
+    SAMPLE_2 = UnitTestStringChunker.SAMPLE_2
+    TIMESTAMP_1 = UnitTestStringChunker.TIMESTAMP_1
+    TIMESTAMP_2 = UnitTestStringChunker.TIMESTAMP_2
+
+    def _drain(self, chunker, clean_non_data):
+        """
+        @retval list of everything the chunker has ready, taking non-data
+        before each data chunk like the data set parsers do
+        """
+        result = []
+        while True:
+            non_data = chunker.get_next_non_data_with_index(clean=clean_non_data)
+            data = chunker.get_next_data_with_index()
+            if clean_non_data and non_data[1] is not None:
+                result.append(('non_data',) + non_data)
+            if data[1] is None:
+                return result
+            result.append(('data',) + data)
+
+    def test_same_as_string_chunker(self):
+        random.seed(1)
+        pieces = [self.SAMPLE_1, self.SAMPLE_2, "\r\n", "noise", "SATPAR0229,1"]
+        data = ''.join(random.choice(pieces) for i in range(2000))
+        BlockChunker.COMPACT_SIZE = 100
+        self.addCleanup(setattr, BlockChunker, 'COMPACT_SIZE', 64 * 1024)
+
+        for trial in range(20):
+            string_chunker = StringChunker(UnitTestStringChunker.sieve_function)
+            block_chunker = BlockChunker(UnitTestStringChunker.sieve_function)
+            expected = []
+            result = []
+            position = 0
+            while position < len(data):
+                size = random.randint(1, 200)
+                timestamp = float(position)
+                string_chunker.add_chunk(data[position:position + size], timestamp)
+                block_chunker.add_chunk(data[position:position + size], timestamp)
+                position += size
+                expected += self._drain(string_chunker, trial % 2 == 0)
+                result += self._drain(block_chunker, trial % 2 == 0)
+            self.assertEqual(result, expected)
+            self.assertGreater(len(result), 500)
+
+    def test_hold_tail(self):
+        chunker = BlockChunker(partial(StringChunker.regex_sieve_function,
+                                       regex_list=[re.compile(r'SATPAR\d{4},[\d.,]*')]),
+                               hold_tail=True)
+        chunker.add_chunk(self.SAMPLE_1 + "\r\n" + self.SAMPLE_2[:20], self.TIMESTAMP_1)
+        self.assertEqual(chunker.get_next_data(), (self.TIMESTAMP_1, self.SAMPLE_1))
+        # the second sample matches, but may not be complete
+        self.assertEqual(chunker.get_next_data(), (None, None))
+        chunker.add_chunk(self.SAMPLE_2[20:], self.TIMESTAMP_2)
+        self.assertEqual(chunker.get_next_data(), (None, None))
+        self.assertEqual(chunker.flush(self.TIMESTAMP_2), len(self.SAMPLE_2))
+        self.assertEqual(chunker.get_next_non_data(), (self.TIMESTAMP_1, "\r\n"))
+        self.assertEqual(chunker.get_next_data(), (self.TIMESTAMP_1, self.SAMPLE_2))
+        self.assertEqual(chunker.flush(self.TIMESTAMP_2), 0)
+
+    def test_mapped(self):
+        data = "noise" + self.SAMPLE_1 + "\r\n" + self.SAMPLE_2
+        (fd, path) = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        os.write(fd, data)
+        mapping = mmap.mmap(fd, len(data), access=mmap.ACCESS_READ)
+        os.close(fd)
+        self.addCleanup(mapping.close)
+
+        chunker = BlockChunker(UnitTestStringChunker.sieve_function)
+        chunker.attach(mapping, 5)
+        chunker.extend(len(self.SAMPLE_1) + 1, self.TIMESTAMP_1)
+        self.assertEqual(chunker.get_next_data_with_index(),
+                         (self.TIMESTAMP_1, self.SAMPLE_1, 0, len(self.SAMPLE_1)))
+        chunker.extend(len(data) - len(self.SAMPLE_1) - 6, self.TIMESTAMP_2)
+        self.assertEqual(chunker.get_next_non_data(), (self.TIMESTAMP_1, "\r\n"))
+        self.assertEqual(chunker.get_next_data(), (self.TIMESTAMP_2, self.SAMPLE_2))
+        self.assertEqual(len(chunker), 0)
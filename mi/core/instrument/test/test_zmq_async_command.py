@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_zmq_async_command
+@file mi/core/instrument/test/test_zmq_async_command.py
+@author Edward Hunter
+@brief Test cases for the asynchronous driver command channel.
+"""
+
+__author__ = 'Edward Hunter'
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentTimeoutException
+from mi.core.instrument.zmq_driver_client import ZmqDriverClient
+from mi.core.instrument.zmq_driver_client import ZmqAsyncDriverClient
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+class SlowDriver(object):
+    """
+    Driver with one long running FSM command and one cheap query.
+    """
+    def __init__(self, event_callback):
+        self.executing = False
+
+    def execute_resource(self, duration, *args, **kwargs):
+        self.executing = True
+        time.sleep(duration)
+        self.executing = False
+        return 'done'
+
+    def get_resource_state(self, *args, **kwargs):
+        return 'BUSY' if self.executing else 'IDLE'
+
+    def unpicklable(self, *args, **kwargs):
+        return lambda: None
+
+    def get_config_metadata(self, *args, **kwargs):
+        # May build the protocol, so must not overlap FSM commands.
+        return 'BUSY' if self.executing else 'IDLE'
+
+
+@attr('UNIT', group='mi')
+class TestZmqAsyncCommand(MiUnitTest):
+    """
+    Unit tests for request id correlated commands.
+    """
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        self.process = ZmqDriverProcess('mi.core.instrument.test.test_zmq_async_command',
+                                        'SlowDriver', os.path.join(workdir, 'cmd'),
+                                        os.path.join(workdir, 'evt'), None)
+        self.assertTrue(self.process.construct_driver())
+        self.process.start_messaging()
+        self.addCleanup(self.process.stop_messaging)
+
+        self.cmd_port = self._read_port(self.process.cmd_port_fname)
+        self.evt_port = self._read_port(self.process.evt_port_fname)
+
+    def _read_port(self, fname):
+        timeout = time.time() + 5
+        while time.time() < timeout:
+            try:
+                return int(open(fname).read().strip())
+            except (IOError, ValueError):
+                time.sleep(.05)
+        self.fail('port file %s not written' % fname)
+
+    def _client(self, cls, *args):
+        client = cls('localhost', self.cmd_port, self.evt_port, *args)
+        client.start_messaging()
+        self.addCleanup(client.stop_messaging)
+        return client
+
+    def test_query_during_long_command(self):
+        """
+        A state query is answered while a long FSM command is in flight.
+        """
+        client = self._client(ZmqAsyncDriverClient)
+        long_cmd = client.send_cmd('execute_resource', (1.0, ))
+        time.sleep(.2)
+        start = time.time()
+        self.assertEqual(client.send_cmd('get_resource_state').result(1), 'BUSY')
+        self.assertLess(time.time() - start, .5)
+        self.assertFalse(long_cmd.done())
+        self.assertEqual(long_cmd.result(2), 'done')
+        self.assertEqual(client.cmd_dvr('get_resource_state'), 'IDLE')
+
+    def test_metadata_waits_for_fsm(self):
+        """
+        Config metadata queries are run in order with FSM commands.
+        """
+        client = self._client(ZmqAsyncDriverClient)
+        long_cmd = client.send_cmd('execute_resource', (.5, ))
+        time.sleep(.2)
+        self.assertEqual(client.send_cmd('get_config_metadata').result(2), 'IDLE')
+        self.assertTrue(long_cmd.done())
+
+    def test_command_errors(self):
+        """
+        A command that fails outside the driver, or whose reply can not be
+        pickled, is answered with the error and later commands still run.
+        """
+        client = self._client(ZmqAsyncDriverClient)
+        # test_events without its events kwarg
+        self.assertIsInstance(client.send_cmd('test_events').result(1), tuple)
+        self.assertIsInstance(client.send_cmd('unpicklable').result(1), tuple)
+        self.assertEqual(client.send_cmd('execute_resource', (0, )).result(1), 'done')
+
+    def test_command_timeout(self):
+        """
+        A command that outlives its timeout fails with a timeout exception.
+        """
+        client = self._client(ZmqAsyncDriverClient)
+        future = client.send_cmd('execute_resource', (.5, ), timeout=.1)
+        self.assertRaises(InstrumentTimeoutException, future.result)
+        # The late reply is discarded and the channel remains usable.
+        time.sleep(.6)
+        self.assertEqual(client.send_cmd('get_resource_state', timeout=1).result(), 'IDLE')
+
+    def test_req_client(self):
+        """
+        The blocking REQ client still works against the ROUTER socket.
+        """
+        client = self._client(ZmqDriverClient)
+        self.assertEqual(client.cmd_dvr('get_resource_state'), 'IDLE')
+        self.assertEqual(client.cmd_dvr('execute_resource', .1), 'done')
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_zmq_multi_driver_process
+@file mi/core/instrument/test/test_zmq_multi_driver_process.py
+@author Bill French
+@brief Test cases for the multi driver host process.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import cPickle as pickle
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument.zmq_driver_client import ZmqMultiDriverClient
+from mi.core.instrument.zmq_multi_driver_process import ZmqMultiDriverProcess
+from mi.core.instrument.zmq_multi_driver_process import HostedDriverKey
+
+from mi.core.log import get_logger ; log = get_logger()
+
+MODULE = 'mi.core.instrument.test.test_zmq_multi_driver_process'
+
+
+class EchoDriver(object):
+    """
+    Minimal driver used to exercise command routing.
+    """
+    def __init__(self, event_callback):
+        self._event_callback = event_callback
+        self.released = threading.Event()
+        self.disconnected = None
+
+    def get_resource_state(self, *args, **kwargs):
+        self._event_callback('state requested')
+        return 'STATE_%s' % id(self)
+
+    def explode(self, *args, **kwargs):
+        raise ValueError('boom')
+
+    def unpicklable(self, *args, **kwargs):
+        return lambda: None
+
+    def wait(self, *args, **kwargs):
+        self.released.wait(10)
+        return 'released'
+
+    def thread_ident(self, *args, **kwargs):
+        return threading.current_thread().ident
+
+    def disconnect(self, *args, **kwargs):
+        self.disconnected = threading.current_thread().ident
+
+
+class ThreadProfiler(object):
+    """
+    Profiler standing in for the process profiler, replying with the
+    thread each command ran on.
+    """
+    def start(self, *args, **kwargs):
+        return threading.current_thread().ident
+
+    stop = dump = start
+
+
+class BrokenDriver(object):
+    """
+    Driver that can not be constructed.
+    """
+    def __init__(self, event_callback):
+        raise RuntimeError('broken driver')
+
+
+@attr('UNIT', group='mi')
+class TestZmqMultiDriverProcess(MiUnitTest):
+    """
+    Unit tests for the multi driver host process.
+    """
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.process = ZmqMultiDriverProcess(
+            [('a', MODULE, 'EchoDriver'),
+             ('b', MODULE, 'EchoDriver'),
+             ('c', MODULE, 'BrokenDriver')],
+            os.path.join(self.workdir, 'cmd'), os.path.join(self.workdir, 'evt'), None)
+        self.addCleanup(shutil.rmtree, self.workdir)
+
+    def _cmd(self, cmd, driver_id=None):
+        msg = {'cmd': cmd, 'args': (), 'kwargs': {}}
+        if driver_id is not None:
+            msg['driver_id'] = driver_id
+        return self.process.cmd_driver(msg)
+
+    def test_unique_ids(self):
+        """
+        Duplicate driver ids are rejected.
+        """
+        with self.assertRaises(InstrumentParameterException):
+            ZmqMultiDriverProcess([('a', MODULE, 'EchoDriver'), ('a', MODULE, 'EchoDriver')],
+                                  'cmd', 'evt', None)
+
+    def test_routing_and_isolation(self):
+        """
+        Commands reach the addressed driver, failures are recorded against
+        that driver only and a broken driver does not stop the others.
+        """
+        self.assertTrue(self.process.construct_driver())
+        self.assertEqual(sorted(self.process.drivers.keys()), ['a', 'b'])
+
+        state_a = self._cmd('get_resource_state', 'a')
+        state_b = self._cmd('get_resource_state', 'b')
+        self.assertNotEqual(state_a, state_b)
+        self.assertEqual(self.process.events, [('a', 'state requested'),
+                                               ('b', 'state requested')])
+
+        self.assertIsInstance(self._cmd('explode', 'a'), ValueError)
+        self.assertIsInstance(self._cmd('get_resource_state', 'c'), Exception)
+
+        status = self._cmd('list_drivers')
+        self.assertEqual(status['a'][HostedDriverKey.FAULTS], 1)
+        self.assertEqual(status['b'][HostedDriverKey.FAULTS], 0)
+        self.assertFalse(status['c'][HostedDriverKey.CONSTRUCTED])
+        self.assertEqual(status['c'][HostedDriverKey.FAULTS], 1)
+
+        # Stopping one driver disconnects it and leaves the rest of the
+        # host running.
+        driver_a = self.process.drivers['a']
+        self.assertEqual(self._cmd('stop_driver_process', 'a'), 'stop_driver_process')
+        self.assertEqual(self.process.drivers.keys(), ['b'])
+        self.assertIsNotNone(driver_a.disconnected)
+        self.assertFalse(self._cmd('list_drivers')['a'][HostedDriverKey.CONSTRUCTED])
+        self.assertEqual(self._cmd('get_resource_state', 'b'), state_b)
+
+    def test_unpicklable_reply(self):
+        """
+        A reply that can not be pickled comes back as an error recorded
+        against the driver that returned it.
+        """
+        self.assertTrue(self.process.construct_driver())
+        msg = {'cmd': 'unpicklable', 'driver_id': 'a', 'args': (), 'kwargs': {}, 'request_id': 7}
+        self.process._queue_reply(['client', ''], msg, self._cmd('unpicklable', 'a'), 'a')
+        frames = self.process.reply_queue.get_nowait()
+        self.assertEqual(frames[:2], ['client', ''])
+        reply = pickle.loads(frames[2])
+        self.assertEqual(reply['request_id'], 7)
+        self.assertIsInstance(reply['reply'], tuple)
+        self.assertEqual(self._cmd('list_drivers')['a'][HostedDriverKey.FAULTS], 1)
+        self.assertTrue(self._cmd('get_resource_state', 'b').startswith('STATE_'))
+
+    def test_messaging(self):
+        """
+        Round trip commands and events through the ROUTER and PUB sockets.
+        """
+        self.assertTrue(self.process.construct_driver())
+        self.process.start_messaging()
+        self.addCleanup(self.process.stop_messaging)
+
+        cmd_port = ZmqMultiDriverProcess._read_port_file(self.process.cmd_port_fname)
+        evt_port = ZmqMultiDriverProcess._read_port_file(self.process.evt_port_fname)
+
+        events = []
+        client = ZmqMultiDriverClient('localhost', cmd_port, evt_port, 'b')
+        client.start_messaging(events.append)
+        self.addCleanup(client.stop_messaging)
+        time.sleep(1)
+
+        self.assertTrue(client.cmd_dvr('get_resource_state').startswith('STATE_'))
+        self.assertEqual(client.cmd_dvr('test_events', events=['x']), 'test_events')
+        self.process.cmd_driver({'cmd': 'test_events', 'driver_id': 'a',
+                                 'kwargs': {'events': ['not for b']}})
+
+        timeout = time.time() + 5
+        while len(events) < 2 and time.time() < timeout:
+            time.sleep(.1)
+        self.assertEqual(events, ['state requested', 'x'])
+
+    def test_slow_command(self):
+        """
+        A long running command on one driver does not hold up commands to
+        the other drivers or the events they publish.
+        """
+        self.assertTrue(self.process.construct_driver())
+        self.process.start_messaging()
+        self.addCleanup(self.process.stop_messaging)
+        self.addCleanup(self.process.drivers['a'].released.set)
+
+        cmd_port = ZmqMultiDriverProcess._read_port_file(self.process.cmd_port_fname)
+        evt_port = ZmqMultiDriverProcess._read_port_file(self.process.evt_port_fname)
+
+        client_a = ZmqMultiDriverClient('localhost', cmd_port, evt_port, 'a')
+        client_a.start_messaging()
+        self.addCleanup(client_a.stop_messaging)
+        events = []
+        client_b = ZmqMultiDriverClient('localhost', cmd_port, evt_port, 'b')
+        client_b.start_messaging(events.append)
+        self.addCleanup(client_b.stop_messaging)
+        time.sleep(1)
+
+        replies = []
+        waiter = threading.Thread(target=lambda: replies.append(client_a.cmd_dvr('wait')))
+        waiter.start()
+        time.sleep(.5)
+
+        self.assertTrue(client_b.cmd_dvr('get_resource_state').startswith('STATE_'))
+        timeout = time.time() + 5
+        while not events and time.time() < timeout:
+            time.sleep(.1)
+        self.assertEqual(events, ['state requested'])
+        self.assertEqual(replies, [])
+
+        self.process.drivers['a'].released.set()
+        waiter.join(5)
+        self.assertEqual(replies, ['released'])
+
+    def test_driver_worker(self):
+        """
+        Process level commands and stops addressed to a driver run on its
+        worker, after the commands queued before them.
+        """
+        self.assertTrue(self.process.construct_driver())
+        self.process.profiler = ThreadProfiler()
+        self.process.start_messaging()
+        self.addCleanup(self.process.stop_messaging)
+        driver_a = self.process.drivers['a']
+        self.addCleanup(driver_a.released.set)
+
+        cmd_port = ZmqMultiDriverProcess._read_port_file(self.process.cmd_port_fname)
+        evt_port = ZmqMultiDriverProcess._read_port_file(self.process.evt_port_fname)
+        client_a = ZmqMultiDriverClient('localhost', cmd_port, evt_port, 'a')
+        client_a.start_messaging()
+        self.addCleanup(client_a.stop_messaging)
+        client_b = ZmqMultiDriverClient('localhost', cmd_port, evt_port, 'b')
+        client_b.start_messaging()
+        self.addCleanup(client_b.stop_messaging)
+        # a second client, as one waits for each reply before the next command
+        client_stop = ZmqMultiDriverClient('localhost', cmd_port, evt_port, 'a')
+        client_stop.start_messaging()
+        self.addCleanup(client_stop.stop_messaging)
+        time.sleep(1)
+
+        worker = client_a.cmd_dvr('thread_ident')
+        self.assertEqual(client_a.cmd_dvr('start_profile'), worker)
+        self.assertEqual(client_a.cmd_dvr('dump_profile'), worker)
+        self.assertNotEqual(client_b.cmd_dvr('start_profile'), worker)
+
+        replies = []
+        waiter = threading.Thread(target=lambda: replies.append(client_a.cmd_dvr('wait')))
+        waiter.start()
+        time.sleep(.5)
+        stopper = threading.Thread(
+            target=lambda: replies.append(client_stop.cmd_dvr('stop_driver_process')))
+        stopper.start()
+        time.sleep(.5)
+        # the stop waits for the command before it
+        self.assertEqual(replies, [])
+        self.assertIsNone(driver_a.disconnected)
+        self.assertEqual(self.process.drivers.keys(), ['b'])
+
+        driver_a.released.set()
+        waiter.join(5)
+        stopper.join(5)
+        self.assertEqual(replies, ['released', 'stop_driver_process'])
+        self.assertEqual(driver_a.disconnected, worker)
@@ -20,15 +20,24 @@ c = zdc.ZmqDriverClient('localhost', 5556, 5557)
 import thread
 import logging
 import time
+import Queue
+import threading
+import itertools
+import cPickle as pickle
 
 # We import "regular" zmq, not the patched version because
 # we handle the nonblocking sockets directly as they need to work
 # with unpatched threads as well.
 import zmq
 
+from mi.core.exceptions import InstrumentTimeoutException
+from mi.core.time import get_monotonic_time
 from mi.core.instrument.driver_client import DriverClient
 from mi.core.log import get_logger ; log = get_logger()
 
+# Command socket poll timeout in ms for the asynchronous client.
+CMD_POLL_INTERVAL = 10
+
  
 class ZmqDriverClient(DriverClient):
     """
@@ -53,6 +62,7 @@ class ZmqDriverClient(DriverClient):
         self.zmq_cmd_socket = None
         self.event_thread = None
         self.stop_event_thread = True
+        self.event_topic = ''
         
     def start_messaging(self, evt_callback=None):
         """
@@ -62,10 +72,7 @@ class ZmqDriverClient(DriverClient):
         process independently of command request-reply.
         """
         self.zmq_context = zmq.Context()
-        self.zmq_cmd_socket = self.zmq_context.socket(zmq.REQ)
-        self.zmq_cmd_socket.connect(self.cmd_host_string)
-        log.info('Driver client cmd socket connected to %s.' %
-                       self.cmd_host_string)        
+        self._connect_cmd_socket()
         self.evt_callback = evt_callback
         
         def recv_evt_messages(driver_client):
@@ -77,7 +84,7 @@ class ZmqDriverClient(DriverClient):
             context = zmq.Context()
             sock = context.socket(zmq.SUB)
             sock.connect(driver_client.event_host_string)
-            sock.setsockopt(zmq.SUBSCRIBE, '')
+            sock.setsockopt(zmq.SUBSCRIBE, driver_client.event_topic)
             log.info('Driver client event thread connected to %s.' %
                   driver_client.event_host_string)
 
@@ -85,7 +92,7 @@ class ZmqDriverClient(DriverClient):
             #last_time = time.time()
             while not driver_client.stop_event_thread:
                 try:
-                    evt = sock.recv_pyobj(flags=zmq.NOBLOCK)
+                    evt = driver_client._recv_evt(sock)
                     log.debug('got event: %s' % str(evt))
                     if driver_client.evt_callback:
                         driver_client.evt_callback(evt)
@@ -100,6 +107,34 @@ class ZmqDriverClient(DriverClient):
             log.info('Client event socket closed.')
         self.event_thread = thread.start_new_thread(recv_evt_messages, (self,))
         log.info('Driver client messaging started.')
+
+    def _connect_cmd_socket(self):
+        """
+        Create and connect the command socket.
+        """
+        self.zmq_cmd_socket = self.zmq_context.socket(zmq.REQ)
+        self.zmq_cmd_socket.connect(self.cmd_host_string)
+        log.info('Driver client cmd socket connected to %s.' %
+                       self.cmd_host_string)        
+
+    def _recv_evt(self, sock):
+        """
+        Receive one event from the event socket without blocking.
+        @param sock connected SUB socket
+        @retval the event
+        @raise zmq.ZMQError if no event is waiting
+        """
+        return sock.recv_pyobj(flags=zmq.NOBLOCK)
+
+    def _build_cmd_msg(self, cmd, args, kwargs):
+        """
+        Package a command message for the driver process.
+        @param cmd The driver command identifier.
+        @param args Positional arguments of the command.
+        @param kwargs Keyword arguments of the command.
+        @retval command message dict
+        """
+        return {'cmd':cmd,'args':args,'kwargs':kwargs}
         
     def stop_messaging(self):
         """
@@ -130,7 +165,7 @@ class ZmqDriverClient(DriverClient):
         @retval Command result.
         """
         # Package command dictionary.
-        msg = {'cmd':cmd,'args':args,'kwargs':kwargs}
+        msg = self._build_cmd_msg(cmd, args, kwargs)
         
         log.debug('Sending command %s.' % str(msg))
         while True:
@@ -165,4 +200,233 @@ class ZmqDriverClient(DriverClient):
             raise reply
         else:
             return reply
-    
+
+
+class ZmqMultiDriverClient(ZmqDriverClient):
+    """
+    Client for one driver hosted in a ZmqMultiDriverProcess. Commands are
+    tagged with the driver id and only events published under that id are
+    delivered to the event callback.
+    """
+
+    def __init__(self, host, cmd_port, event_port, driver_id):
+        """
+        Initialize members.
+        @param host Host string address of the driver process.
+        @param cmd_port Port number for the driver process command port.
+        @param event_port Port number for the driver process event port.
+        @param driver_id Id of the hosted driver to talk to.
+        """
+        ZmqDriverClient.__init__(self, host, cmd_port, event_port)
+        self.driver_id = driver_id
+        self.event_topic = str(driver_id)
+
+    def _recv_evt(self, sock):
+        """
+        Receive one [driver_id, event] message, returning the event.
+        """
+        (topic, evt) = sock.recv_multipart(flags=zmq.NOBLOCK)
+        return pickle.loads(evt)
+
+    def _build_cmd_msg(self, cmd, args, kwargs):
+        """
+        Package a command message addressed to the hosted driver.
+        """
+        msg = ZmqDriverClient._build_cmd_msg(self, cmd, args, kwargs)
+        msg['driver_id'] = self.driver_id
+        return msg
+
+    def done(self):
+        """
+        Retire the hosted driver and stop client messaging resources. The
+        host process keeps running for the other drivers.
+        """
+        self.cmd_dvr('stop_driver_process')
+        self.stop_messaging()
+
+
+class DriverCommandFuture(object):
+    """
+    Handle on a command sent by ZmqAsyncDriverClient. The result is set by
+    the client I/O thread when the matching reply arrives, or an
+    InstrumentTimeoutException if the command deadline passes first.
+    """
+
+    def __init__(self, request_id, msg, timeout=None):
+        """
+        @param request_id correlation id of the request
+        @param msg the command message
+        @param timeout seconds to wait for a reply, None to wait forever
+        """
+        self.request_id = request_id
+        self.msg = msg
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = get_monotonic_time() + timeout
+        self._done = threading.Event()
+        self._reply = None
+        self._exception = None
+
+    def done(self):
+        """
+        @retval True if a reply or timeout has been recorded.
+        """
+        return self._done.is_set()
+
+    def set_result(self, reply):
+        self._reply = reply
+        self._done.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done.set()
+
+    def result(self, timeout=None):
+        """
+        Block until the command completes.
+        @param timeout maximum seconds to block in this call, None to wait
+        until the reply or the command deadline.
+        @retval The driver reply.
+        @raise InstrumentTimeoutException if no reply arrived in time.
+        @raise Exception if the driver replied with an exception.
+        """
+        if not self._done.wait(timeout):
+            raise InstrumentTimeoutException('No reply to %s (request %s) after %s seconds' %
+                                             (self.msg.get('cmd'), self.request_id, timeout))
+        if self._exception is not None:
+            raise self._exception
+        if isinstance(self._reply, Exception):
+            raise self._reply
+        return self._reply
+
+
+class ZmqAsyncDriverClient(ZmqDriverClient):
+    """
+    Driver client that keeps many commands in flight over a DEALER socket.
+    Each request carries a request_id that the driver process echoes in
+    its reply, so replies may come back in any order. send_cmd returns a
+    DriverCommandFuture; cmd_dvr keeps the blocking interface of the base
+    client on top of it.
+    """
+
+    def __init__(self, host, cmd_port, event_port, default_timeout=None):
+        """
+        Initialize members.
+        @param host Host string address of the driver process.
+        @param cmd_port Port number for the driver process command port.
+        @param event_port Port number for the driver process event port.
+        @param default_timeout Command timeout in seconds used when none is
+        given to send_cmd. None waits forever.
+        """
+        ZmqDriverClient.__init__(self, host, cmd_port, event_port)
+        self.default_timeout = default_timeout
+        self._request_ids = itertools.count(1)
+        self._send_queue = Queue.Queue()
+        self._cmd_thread = None
+        self._stop_cmd_thread = True
+
+    def _connect_cmd_socket(self):
+        """
+        Start the I/O thread that owns the DEALER command socket.
+        """
+        self._stop_cmd_thread = False
+        self._cmd_thread = threading.Thread(target=self._run_cmd_socket)
+        self._cmd_thread.daemon = True
+        self._cmd_thread.start()
+
+    def _run_cmd_socket(self):
+        """
+        Send queued requests, match replies to pending futures and expire
+        futures whose deadline has passed. ZMQ sockets are not thread
+        safe, so all socket traffic happens here.
+        """
+        sock = self.zmq_context.socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.cmd_host_string)
+        log.info('Driver client async cmd socket connected to %s.', self.cmd_host_string)
+
+        poller = zmq.Poller()
+        poller.register(sock, zmq.POLLIN)
+        pending = {}
+
+        while not self._stop_cmd_thread:
+            while True:
+                try:
+                    future = self._send_queue.get_nowait()
+                except Queue.Empty:
+                    break
+                pending[future.request_id] = future
+                sock.send_multipart(['', pickle.dumps(future.msg, -1)])
+
+            socks = dict(poller.poll(CMD_POLL_INTERVAL))
+            if socks.get(sock) == zmq.POLLIN:
+                while True:
+                    try:
+                        frames = sock.recv_multipart(flags=zmq.NOBLOCK)
+                    except zmq.ZMQError:
+                        break
+                    reply = pickle.loads(frames[-1])
+                    future = pending.pop(reply.get('request_id'), None)
+                    if future is None:
+                        log.debug('Discarding reply to expired request %s', reply.get('request_id'))
+                    else:
+                        future.set_result(reply.get('reply'))
+
+            if pending:
+                now = get_monotonic_time()
+                for (request_id, future) in pending.items():
+                    if future.deadline is not None and now > future.deadline:
+                        del pending[request_id]
+                        future.set_exception(InstrumentTimeoutException(
+                            'No reply to %s (request %s) before deadline' %
+                            (future.msg.get('cmd'), request_id)))
+
+        for future in pending.values():
+            future.set_exception(InstrumentTimeoutException('Driver client messaging closed'))
+        sock.close()
+
+    def stop_messaging(self):
+        """
+        Stop the command I/O thread and event thread and close the context.
+        """
+        self._stop_cmd_thread = True
+        if self._cmd_thread:
+            self._cmd_thread.join()
+            self._cmd_thread = None
+        self.zmq_context.term()
+        self.zmq_context = None
+        self.stop_event_thread = True
+        self.event_thread = None
+        self.evt_callback = None
+        log.info('Driver client messaging closed.')
+
+    def send_cmd(self, cmd, args=(), kwargs=None, timeout=None):
+        """
+        Send a command without waiting for the reply.
+        @param cmd The driver command identifier.
+        @param args Positional arguments of the command.
+        @param kwargs Keyword arguments of the command.
+        @param timeout Seconds to wait for the reply, defaults to
+        default_timeout.
+        @retval DriverCommandFuture for the reply.
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+        msg = self._build_cmd_msg(cmd, tuple(args), kwargs or {})
+        msg['request_id'] = self._request_ids.next()
+        future = DriverCommandFuture(msg['request_id'], msg, timeout)
+        log.debug('Sending command %s.', msg)
+        self._send_queue.put(future)
+        return future
+
+    def cmd_dvr(self, cmd, *args, **kwargs):
+        """
+        Command a driver and block for the reply.
+        @param cmd The driver command identifier.
+        @param args Positional arguments of the command.
+        @param kwargs Keyword arguments of the command.
+        @retval Command result.
+        @raise InstrumentTimeoutException if default_timeout expires.
+        """
+        return self.send_cmd(cmd, args, kwargs).result()
+
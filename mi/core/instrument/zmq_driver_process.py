@@ -24,6 +24,8 @@ import time
 import logging
 import sys
 import uuid
+import Queue
+import cPickle as pickle
 
 import zmq
 
@@ -34,6 +36,25 @@ import mi.core.instrument.driver_process as driver_process
 from mi.core.log import get_logger
 log = get_logger()
 
+# Driver commands that only read driver state and do not go through the
+# driver FSM lock. These may run concurrently with long FSM commands.
+# get_config_metadata is not one of them: it builds the protocol when the
+# driver has none yet.
+READ_ONLY_COMMANDS = ['get_resource_state',
+                      'get_resource_capabilities',
+                      'get_init_params',
+                      'get_cached_config',
+                      'driver_ping',
+                      'process_echo',
+                      'get_metrics',
+                      'get_trace_stats']
+
+# Number of threads serving read only queries.
+QUERY_WORKER_COUNT = 2
+
+# Command socket poll timeout in ms, which bounds reply latency.
+REPLY_POLL_INTERVAL = 10
+
 def _encode_exception(reply):
     if isinstance(reply, InstrumentException):
         # InstrumentExceptions have corresponding IonException error code built-in
@@ -43,12 +64,29 @@ def _encode_exception(reply):
         ex = UnexpectedError("%s('%s')" % (reply.__class__.__name__, reply.message))
         return ex.get_triple()
 
+def _pickle_reply(msg, reply):
+    """
+    Pickle a command reply. If the reply is an exception it is encoded as
+    a triple, and replies to requests carrying a request_id are wrapped so
+    the client can match them to the outstanding request.
+    @param msg the command message, None if it could not be decoded
+    @param reply the command result or exception
+    @retval the reply payload
+    """
+    if isinstance(reply, Exception):
+        reply = _encode_exception(reply)
+    if isinstance(msg, dict) and msg.get('request_id') is not None:
+        reply = {'request_id': msg['request_id'], 'reply': reply}
+    return pickle.dumps(reply, -1)
+
 class ZmqDriverProcess(driver_process.DriverProcess):
     """
     A OS-level driver process that communicates with ZMQ sockets.
-    Command-REP and event-PUB sockets monitor and react to comms
+    Command-ROUTER and event-PUB sockets monitor and react to comms
     needs in separate threads, which can be signaled to end
     by setting boolean flags stop_cmd_thread and stop_evt_thread.
+    Commands are executed by worker threads: one serial worker for
+    commands that drive the FSM and a small pool for read only queries.
     """
     
     @classmethod
@@ -122,52 +160,72 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         self.stop_evt_thread = True
         self.cmd_thread = None
         self.stop_cmd_thread = True
+        self.cmd_workers = []
+        self.query_worker_count = QUERY_WORKER_COUNT
+        self.fsm_queue = Queue.Queue()
+        self.query_queue = Queue.Queue()
+        self.reply_queue = Queue.Queue()
         
     def start_messaging(self):
         """
         Initialize and start messaging resources for the driver, blocking
         until messaging terminates. This ZMQ implementation starts and
         joins command and event threads, managing nonblocking send/recv calls
-        on REP and PUB sockets, respectively. Terminate loops and close
+        on ROUTER and PUB sockets, respectively. Terminate loops and close
         sockets when stop flag is set in driver process.
         """
         def recv_cmd_msg(zmq_driver_process):
             """
-            Await commands on a ZMQ REP socket, forwaring them to the
-            driver for processing and returning the result.
+            Await commands on a ZMQ ROUTER socket, handing them to the
+            command workers and sending back replies as they complete.
+            Plain REQ clients see the same strict request-reply behavior
+            as before; clients that tag requests with a request_id may
+            keep several commands in flight.
             """
             context = zmq.Context()
-            sock = context.socket(zmq.REP)
+            sock = context.socket(zmq.ROUTER)
             zmq_driver_process.cmd_port = sock.bind_to_random_port(zmq_driver_process.cmd_host_string)
             log.info('Driver process cmd socket bound to %i' %
                            zmq_driver_process.cmd_port)
             file(zmq_driver_process.cmd_port_fname,'w+').write(str(zmq_driver_process.cmd_port)+'\n')
 
+            poller = zmq.Poller()
+            poller.register(sock, zmq.POLLIN)
+
             zmq_driver_process.stop_cmd_thread = False
             while not zmq_driver_process.stop_cmd_thread:
-                try:
-                    msg = sock.recv_pyobj(flags=zmq.NOBLOCK)
-                    log.trace('Processing message %s', msg)
-                    reply = zmq_driver_process.cmd_driver(msg)
-                    # if operation raised exception, encode as triple
-                    if isinstance(reply, Exception):
-                        reply = _encode_exception(reply)
-                    # send, send, and resend
-                    while True:
-                        try:
-                            sock.send_pyobj(reply, flags=zmq.NOBLOCK)
-                            break
-                        except zmq.ZMQError:
-                            time.sleep(.1)
-                            if zmq_driver_process.stop_cmd_thread:
-                                break
-                except zmq.ZMQError:
-                    time.sleep(.1)
-                
+                socks = dict(poller.poll(REPLY_POLL_INTERVAL))
+                if socks.get(sock) == zmq.POLLIN:
+                    try:
+                        frames = sock.recv_multipart(flags=zmq.NOBLOCK)
+                        zmq_driver_process._queue_cmd(frames)
+                    except zmq.ZMQError:
+                        pass
+                zmq_driver_process._send_replies(sock)
+
+            zmq_driver_process._send_replies(sock)
             sock.close()
             context.term()
             log.info('Driver process cmd socket closed.')
 
+        def run_cmd_worker(zmq_driver_process, cmd_queue):
+            """
+            Execute queued commands against the driver until a None
+            sentinel is received.
+            """
+            while True:
+                item = cmd_queue.get()
+                if item is None:
+                    break
+                (envelope, msg) = item
+                try:
+                    reply = zmq_driver_process.cmd_driver(msg)
+                except Exception as e:
+                    # reply with the error and keep serving commands
+                    log.error('Failed to process command message: %s', e)
+                    reply = e
+                zmq_driver_process._queue_reply(envelope, msg, reply)
+
         def send_evt_msg(zmq_driver_process):
             """
             Await events on the driver process event queue and publish them
@@ -181,6 +239,7 @@ class ZmqDriverProcess(driver_process.DriverProcess):
 
             zmq_driver_process.stop_evt_thread = False
             while not zmq_driver_process.stop_evt_thread:
+                zmq_driver_process.check_metrics_event()
                 try:
                     evt = zmq_driver_process.events.pop(0)
                     log.trace('Event thread sending event %s',evt)
@@ -189,6 +248,7 @@ class ZmqDriverProcess(driver_process.DriverProcess):
                             if isinstance(evt, Exception):
                                 evt = _encode_exception(evt)
                             sock.send_pyobj(evt, flags=zmq.NOBLOCK)
+                            zmq_driver_process.event_sent(evt)
                             evt = None
                             log.trace('Event sent!')
                         except zmq.ZMQError:
@@ -202,11 +262,73 @@ class ZmqDriverProcess(driver_process.DriverProcess):
             context.term()
             log.info('Driver process event socket closed')
 
+        self.cmd_workers = [Thread(target=run_cmd_worker, args=(self, self.fsm_queue))]
+        for i in range(self.query_worker_count):
+            self.cmd_workers.append(Thread(target=run_cmd_worker, args=(self, self.query_queue)))
         self.cmd_thread = Thread(target=recv_cmd_msg, args=(self, ))
         self.evt_thread = Thread(target=send_evt_msg, args=(self, ))
+        for worker in self.cmd_workers:
+            worker.start()
         self.cmd_thread.start()        
         self.evt_thread.start()
         self.messaging_started = True
+
+    def _queue_cmd(self, frames):
+        """
+        Decode a command received on the ROUTER socket and queue it for
+        execution. Read only queries go to the query workers and run
+        concurrently with whatever the driver FSM is doing; all other
+        commands are run one at a time, in arrival order, by the FSM
+        worker. stop_driver_process is handled immediately.
+        @param frames multipart message [identity, ..., '', payload]
+        """
+        envelope, payload = frames[:-1], frames[-1]
+        try:
+            msg = pickle.loads(payload)
+        except Exception as e:
+            log.error('Could not decode command message: %s', e)
+            self._queue_reply(envelope, {}, e)
+            return
+
+        log.trace('Processing message %s', msg)
+        cmd = msg.get('cmd', None)
+        if cmd == 'stop_driver_process':
+            self._queue_reply(envelope, msg, self.cmd_driver(msg))
+        elif cmd in READ_ONLY_COMMANDS:
+            self.query_queue.put((envelope, msg))
+        else:
+            self.fsm_queue.put((envelope, msg))
+
+    def _queue_reply(self, envelope, msg, reply):
+        """
+        Queue a command reply to be sent by the command thread. A reply
+        that can not be pickled is replaced by the error.
+        @param envelope ROUTER routing frames of the request
+        @param msg the command message
+        @param reply the command result or exception
+        """
+        try:
+            payload = _pickle_reply(msg, reply)
+        except Exception as e:
+            log.error('Could not pickle the reply to %s: %s', msg.get('cmd'), e)
+            payload = _pickle_reply(msg, e)
+        self.reply_queue.put(envelope + [payload])
+
+    def _send_replies(self, sock):
+        """
+        Send all completed replies. Only called from the command thread,
+        which owns the socket.
+        @param sock bound ROUTER socket
+        """
+        while True:
+            try:
+                frames = self.reply_queue.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                sock.send_multipart(frames)
+            except zmq.ZMQError as e:
+                log.error('Could not send command reply: %s', e)
     
     def stop_messaging(self):
         """
@@ -216,6 +338,11 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         self.stop_cmd_thread = True
         self.stop_evt_thread = True
         self.messaging_started = False
+        if self.cmd_workers:
+            self.fsm_queue.put(None)
+            for i in range(len(self.cmd_workers) - 1):
+                self.query_queue.put(None)
+            self.cmd_workers = []
     
     def shutdown(self):
         """
@@ -0,0 +1,543 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.zmq_multi_driver_process
+@file mi/core/instrument/zmq_multi_driver_process.py
+@author Bill French
+@brief Host process running many instrument drivers behind one pair of
+ZMQ sockets.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+"""
+To launch this object from class static constructor:
+import mi.core.instrument.zmq_multi_driver_process as zmdp
+drivers = [('ctd_1', 'mi.instrument.seabird.sbe37smb.ooicore.driver', 'SBE37Driver'),
+           ('ctd_2', 'mi.instrument.seabird.sbe37smb.ooicore.driver', 'SBE37Driver')]
+p = zmdp.ZmqMultiDriverProcess.launch_process(drivers)
+
+Commands are sent to the ROUTER command socket as pickled dicts carrying a
+'driver_id' key in addition to the usual 'cmd', 'args' and 'kwargs'. Events
+are published as two part messages [driver_id, pickled event] so clients
+can subscribe to a single driver by topic.
+"""
+
+import os
+import time
+import Queue
+from threading import Thread, Lock
+import uuid
+import cPickle as pickle
+import importlib
+
+import zmq
+
+from mi.core.common import BaseEnum
+from mi.core.exceptions import InstrumentException
+from mi.core.exceptions import InstrumentCommandException
+from mi.core.exceptions import InstrumentParameterException
+import mi.core.instrument.driver_process as driver_process
+from mi.core.instrument.zmq_driver_process import _encode_exception
+from mi.core.instrument.zmq_driver_process import _pickle_reply
+from mi.core.instrument.zmq_driver_process import REPLY_POLL_INTERVAL
+from mi.core.instrument.zmq_driver_process import READ_ONLY_COMMANDS
+from mi.core.instrument.zmq_driver_process import QUERY_WORKER_COUNT
+from mi.core.metrics import get_metrics, DriverMetric
+metrics = get_metrics()
+from mi.core.tracing import get_tracer
+tracer = get_tracer()
+from mi.core.log import get_logger
+log = get_logger()
+
+
+class MultiDriverCommand(BaseEnum):
+    """
+    Process level commands understood by the multi driver host. These do
+    not require a driver_id.
+    """
+    STOP_DRIVER_PROCESS = 'stop_driver_process'
+    PROCESS_ECHO = 'process_echo'
+    LIST_DRIVERS = 'list_drivers'
+    GET_METRICS = 'get_metrics'
+    SET_METRICS_INTERVAL = 'set_metrics_interval'
+    SET_TRACE_RATIO = 'set_trace_ratio'
+    GET_TRACE_STATS = 'get_trace_stats'
+    START_PROFILE = 'start_profile'
+    STOP_PROFILE = 'stop_profile'
+    DUMP_PROFILE = 'dump_profile'
+
+# Process level commands handled by the base driver process, whatever
+# driver_id they carry. Sent with the id of a running driver they run on
+# that driver's worker, so a deterministic profile hooks the thread running
+# its commands.
+PROCESS_COMMANDS = (MultiDriverCommand.GET_METRICS,
+                    MultiDriverCommand.SET_METRICS_INTERVAL,
+                    MultiDriverCommand.SET_TRACE_RATIO,
+                    MultiDriverCommand.GET_TRACE_STATS,
+                    MultiDriverCommand.START_PROFILE,
+                    MultiDriverCommand.STOP_PROFILE,
+                    MultiDriverCommand.DUMP_PROFILE)
+
+
+class HostedDriverKey(BaseEnum):
+    """
+    Keys of the per driver status dicts returned by list_drivers.
+    """
+    MODULE = 'module'
+    CLASS = 'class'
+    CONSTRUCTED = 'constructed'
+    FAULTS = 'faults'
+    LAST_FAULT = 'last_fault'
+
+
+class ZmqMultiDriverProcess(driver_process.DriverProcess):
+    """
+    A OS-level process hosting several drivers in one interpreter. A
+    single messaging thread services a ROUTER command socket and a PUB
+    event socket, demultiplexing commands by driver id and tagging every
+    published event with the id of the driver that raised it. Driver
+    commands are executed by worker threads: one serial worker per hosted
+    driver and a small pool for read only queries, so a long command to
+    one driver does not hold up the others or event publishing. Process
+    level commands addressed to a driver, and stopping it, also run on its
+    worker. Driver
+    construction and command failures are caught and recorded per driver
+    so one faulty driver does not take its neighbours down.
+    """
+
+    @classmethod
+    def launch_process(cls, drivers, workdir='/tmp/', ppid=None):
+        """
+        Class method constructor to launch ZmqMultiDriverProcess as a
+        separate OS process.
+        @param drivers List of (driver_id, driver_module, driver_class)
+        tuples to host.
+        @param workdir The work directory when temporary port files are written.
+        @param ppid ID of the parent process, used to self destruct when
+        parent dies in test cases.
+        @retval Tuple containing (Popen object for the process, cmd port,
+            evt_port)
+        """
+        tag = str(uuid.uuid4())
+        cmd_port_fname = workdir + 'dvr_cmd_port_%s.txt' % tag
+        evt_port_fname = workdir + 'dvr_evt_port_%s.txt' % tag
+        cmd_str = 'from %s import %s; dp = %s(%r, "%s", "%s", %s);dp.run()' \
+            % (__name__, cls.__name__, cls.__name__, list(drivers),
+               cmd_port_fname, evt_port_fname, str(ppid))
+
+        dvr_proc = driver_process.DriverProcess.launch_process(cmd_str)
+        dvr_cmd_port = cls._read_port_file(cmd_port_fname)
+        dvr_evt_port = cls._read_port_file(evt_port_fname)
+
+        return (dvr_proc, dvr_cmd_port, dvr_evt_port)
+
+    @staticmethod
+    def _read_port_file(fname):
+        """
+        Block until the child process writes its bound port to fname, then
+        read and remove the file.
+        @param fname port file name
+        @retval port number
+        """
+        while True:
+            try:
+                port_file = file(fname, 'r')
+                port = int(port_file.read().strip())
+                port_file.close()
+                os.remove(fname)
+                return port
+            except (IOError, ValueError):
+                time.sleep(.1)
+
+    def __init__(self, drivers, cmd_port_fname, evt_port_fname, ppid):
+        """
+        Multi driver process constructor.
+        @param drivers List of (driver_id, driver_module, driver_class) tuples.
+        @param cmd_port_fname Filename for temp cmd port file.
+        @param evt_port_fname Filename for temp evt port file.
+        @param ppid ID of the parent process, used to self destruct when
+        parent dies in test cases.
+        @raise InstrumentParameterException if driver ids are not unique.
+        """
+        driver_process.DriverProcess.__init__(self, None, None, ppid)
+
+        ids = [d[0] for d in drivers]
+        if len(ids) != len(set(ids)):
+            raise InstrumentParameterException("driver ids must be unique: %s" % ids)
+
+        self.driver_specs = list(drivers)
+        self.drivers = {}
+        self.driver_status = {}
+        for (driver_id, module, klass) in self.driver_specs:
+            self.driver_status[driver_id] = {
+                HostedDriverKey.MODULE: module,
+                HostedDriverKey.CLASS: klass,
+                HostedDriverKey.CONSTRUCTED: False,
+                HostedDriverKey.FAULTS: 0,
+                HostedDriverKey.LAST_FAULT: None
+            }
+
+        self.cmd_port = None
+        self.cmd_port_fname = cmd_port_fname
+        self.evt_port = None
+        self.evt_port_fname = evt_port_fname
+        self.cmd_host_string = 'tcp://*'
+        self.event_host_string = 'tcp://*'
+        self.msg_thread = None
+        self.stop_msg_thread = True
+        self.cmd_workers = []
+        self.query_worker_count = QUERY_WORKER_COUNT
+        self.driver_queues = {}
+        self.query_queue = Queue.Queue()
+        self.reply_queue = Queue.Queue()
+        # Guards driver_status, which the command workers update.
+        self.status_lock = Lock()
+
+    def construct_driver(self):
+        """
+        Import and construct every hosted driver. A driver that fails to
+        construct is recorded as faulted and left out; the others are
+        still started.
+        @retval True if at least one driver was constructed.
+        """
+        for (driver_id, module, klass) in self.driver_specs:
+            try:
+                dvr_mod = importlib.import_module(module)
+                log.info('Imported driver module %s for %s', module, driver_id)
+                self.drivers[driver_id] = getattr(dvr_mod, klass)(
+                    self._event_callback(driver_id))
+                log.info('Constructed driver %s for %s', klass, driver_id)
+                with self.status_lock:
+                    self.driver_status[driver_id][HostedDriverKey.CONSTRUCTED] = True
+
+            except Exception as e:
+                log.error('Could not import/construct driver %s, module %s, class %s: %s',
+                          driver_id, module, klass, e)
+                self._record_fault(driver_id, e)
+
+        return len(self.drivers) > 0
+
+    def _event_callback(self, driver_id):
+        """
+        Build the event callback handed to a hosted driver. Events are
+        queued together with the id of the driver that raised them.
+        @param driver_id id of the hosted driver
+        @retval callback function
+        """
+        def send_event(evt):
+            tracer.queued(evt)
+            self.events.append((driver_id, evt))
+            metrics.set(DriverMetric.EVENT_QUEUE_DEPTH, len(self.events))
+        return send_event
+
+    def _record_fault(self, driver_id, exception):
+        """
+        Count a failure against a hosted driver.
+        @param driver_id id of the faulted driver
+        @param exception the exception raised
+        """
+        with self.status_lock:
+            status = self.driver_status.get(driver_id)
+            if status is not None:
+                status[HostedDriverKey.FAULTS] += 1
+                status[HostedDriverKey.LAST_FAULT] = str(exception)
+
+    def send_event(self, evt):
+        """
+        Queue a process level event, published with an empty driver id.
+        """
+        self.events.append(('', evt))
+
+    def cmd_driver(self, msg):
+        """
+        Process a command message. Process level commands are handled
+        here, everything else is run against the driver named by the
+        'driver_id' key of the message.
+        @param msg A driver command message.
+        @retval The command result, or an exception object on error.
+        """
+        cmd = msg.get('cmd', None)
+        driver_id = msg.get('driver_id', None)
+
+        if cmd == MultiDriverCommand.STOP_DRIVER_PROCESS and driver_id is None:
+            self.stop_messaging()
+            return 'stop_driver_process'
+
+        elif cmd == MultiDriverCommand.PROCESS_ECHO and driver_id is None:
+            return 'ping from multi driver resource ppid:%s, drivers:%s' % \
+                (str(self.ppid), sorted(self.drivers.keys()))
+
+        elif cmd in PROCESS_COMMANDS:
+            return driver_process.DriverProcess.cmd_driver(self, msg)
+
+        elif cmd == MultiDriverCommand.LIST_DRIVERS:
+            with self.status_lock:
+                return dict((k, dict(v)) for (k, v) in self.driver_status.iteritems())
+
+        driver = self.drivers.get(driver_id)
+        if driver is None:
+            return InstrumentCommandException('Unknown driver id: %s' % driver_id)
+
+        if cmd == MultiDriverCommand.STOP_DRIVER_PROCESS:
+            return self._stop_driver(driver_id, msg) or 'stop_driver_process'
+
+        elif cmd == 'test_events':
+            self.events += [(driver_id, evt) for evt in msg['kwargs']['events']]
+            return 'test_events'
+
+        return self._run_driver_cmd(driver_id, driver, msg)
+
+    def _stop_driver(self, driver_id, msg, envelope=None):
+        """
+        Retire one hosted driver, leaving the rest of the host running. No
+        more commands are routed to it. If it has a worker, the worker
+        disconnects it after the commands already queued, replies to the
+        stop and exits; otherwise it is disconnected here.
+        @param driver_id id of the hosted driver
+        @param msg the stop command message
+        @param envelope ROUTER routing frames to reply to, None for no reply
+        @retval The stop result if the driver was disconnected here, None
+        if it was left to its worker.
+        """
+        driver = self.drivers.pop(driver_id)
+        with self.status_lock:
+            self.driver_status[driver_id][HostedDriverKey.CONSTRUCTED] = False
+        cmd_queue = self.driver_queues.pop(driver_id, None)
+        if cmd_queue is None:
+            return self._run_driver_cmd(driver_id, driver, msg)
+        cmd_queue.put((envelope, msg, driver_id, driver))
+        cmd_queue.put(None)
+        return None
+
+    def _disconnect_driver(self, driver_id, driver):
+        """
+        Disconnect a hosted driver that is being stopped. A driver that is
+        not connected refuses to disconnect, which is not a fault.
+        @param driver_id id of the hosted driver
+        @param driver the hosted driver object
+        """
+        disconnect = getattr(driver, 'disconnect', None)
+        if disconnect is not None:
+            try:
+                disconnect()
+            except InstrumentException as e:
+                log.debug('Hosted driver %s not disconnected: %s', driver_id, e)
+            except Exception as e:
+                log.error('Hosted driver %s failed to disconnect: %s', driver_id, e)
+                self._record_fault(driver_id, e)
+        log.info('Hosted driver %s stopped', driver_id)
+
+    def _run_driver_cmd(self, driver_id, driver, msg):
+        """
+        Run a command against one hosted driver. Safe to call from the
+        command workers; no process state is shared between drivers.
+        @param driver_id id of the hosted driver
+        @param driver the hosted driver object
+        @param msg the command message
+        @retval The command result, or an exception object on error.
+        """
+        cmd = msg.get('cmd', None)
+        if cmd == MultiDriverCommand.PROCESS_ECHO:
+            return 'ping from resource ppid:%s, resource:%s' % (str(self.ppid), str(driver))
+
+        elif cmd == MultiDriverCommand.STOP_DRIVER_PROCESS:
+            self._disconnect_driver(driver_id, driver)
+            return 'stop_driver_process'
+
+        elif cmd in PROCESS_COMMANDS:
+            return driver_process.DriverProcess.cmd_driver(self, msg)
+
+        reply = self.call_driver(driver, cmd, msg.get('args', None), msg.get('kwargs', None))
+        if isinstance(reply, Exception) and not isinstance(reply, InstrumentException):
+            self._record_fault(driver_id, reply)
+
+        return reply
+
+    def _queue_cmd(self, frames):
+        """
+        Decode a command received on the ROUTER socket and queue it for
+        execution. Read only queries go to the query workers; all other
+        commands to a hosted driver, including process level commands and
+        its stop, are run one at a time, in arrival order, by that driver's
+        worker. Commands to no driver or an unknown one are handled
+        immediately.
+        @param frames multipart message [identity, ..., '', payload]
+        """
+        envelope, payload = frames[:-1], frames[-1]
+        try:
+            msg = pickle.loads(payload)
+            cmd = msg.get('cmd', None)
+            driver_id = msg.get('driver_id', None)
+        except Exception as e:
+            log.error('Could not decode command message: %s', e)
+            self._queue_reply(envelope, None, e)
+            return
+
+        log.trace('Processing message %s', msg)
+        cmd_queue = self.driver_queues.get(driver_id)
+        if cmd_queue is not None and cmd == MultiDriverCommand.STOP_DRIVER_PROCESS:
+            self._stop_driver(driver_id, msg, envelope)
+        elif cmd_queue is None or cmd in (MultiDriverCommand.LIST_DRIVERS, 'test_events'):
+            try:
+                reply = self.cmd_driver(msg)
+            except Exception as e:
+                log.error('Failed to process command message: %s', e)
+                reply = e
+            self._queue_reply(envelope, msg, reply, driver_id)
+        elif cmd in READ_ONLY_COMMANDS:
+            self.query_queue.put((envelope, msg, driver_id, self.drivers[driver_id]))
+        else:
+            cmd_queue.put((envelope, msg, driver_id, self.drivers[driver_id]))
+
+    def _run_cmd_worker(self, cmd_queue):
+        """
+        Execute queued driver commands until a None sentinel is received.
+        @param cmd_queue queue of (envelope, msg, driver_id, driver) items;
+        no reply is sent for a None envelope
+        """
+        while True:
+            item = cmd_queue.get()
+            if item is None:
+                break
+            (envelope, msg, driver_id, driver) = item
+            try:
+                reply = self._run_driver_cmd(driver_id, driver, msg)
+            except Exception as e:
+                log.error('Failed to process command for driver %s: %s', driver_id, e)
+                reply = e
+            if envelope is not None:
+                self._queue_reply(envelope, msg, reply, driver_id)
+
+    def _queue_reply(self, envelope, msg, reply, driver_id=None):
+        """
+        Queue a command reply to be sent by the messaging thread.
+        @param envelope ROUTER routing frames of the request
+        @param msg the command message, None if it could not be decoded
+        @param reply the command result or exception
+        @param driver_id id of the driver the command was for, if any
+        """
+        self.reply_queue.put(envelope + [self._encode_reply(msg, reply, driver_id)])
+
+    def _send_replies(self, sock):
+        """
+        Send all completed replies. Only called from the messaging thread,
+        which owns the socket.
+        @param sock bound ROUTER socket
+        """
+        while True:
+            try:
+                frames = self.reply_queue.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                sock.send_multipart(frames)
+            except zmq.ZMQError as e:
+                log.error('Could not send command reply: %s', e)
+
+    def _encode_reply(self, msg, reply, driver_id=None):
+        """
+        Pickle a command reply. A reply that can not be pickled is replaced
+        by the error, recorded as a fault of the driver that returned it.
+        @param msg the command message, None if it could not be decoded
+        @param reply the command result or exception
+        @param driver_id id of the driver the command was for, if any
+        @retval the reply payload
+        """
+        try:
+            return _pickle_reply(msg, reply)
+        except Exception as e:
+            log.error('Could not pickle the reply of driver %s: %s', driver_id, e)
+            self._record_fault(driver_id, e)
+            return _pickle_reply(msg, e)
+
+    def _publish_events(self, sock):
+        """
+        Publish all queued events on the PUB socket, tagged by driver id.
+        @param sock bound PUB socket
+        """
+        while self.events:
+            (driver_id, evt) = self.events.pop(0)
+            if isinstance(evt, Exception):
+                evt = _encode_exception(evt)
+            try:
+                sock.send_multipart([str(driver_id), pickle.dumps(evt, -1)])
+                self.event_sent(evt)
+                log.trace('Event sent for %s', driver_id)
+            except zmq.ZMQError:
+                self.events.insert(0, (driver_id, evt))
+                break
+
+    def start_messaging(self):
+        """
+        Bind the ROUTER command and PUB event sockets and service both
+        from one thread. Commands are handed to the per driver and query
+        workers, and their replies sent back as they complete.
+        """
+        def msg_loop(proc):
+            context = zmq.Context()
+            cmd_sock = context.socket(zmq.ROUTER)
+            evt_sock = context.socket(zmq.PUB)
+            proc.cmd_port = cmd_sock.bind_to_random_port(proc.cmd_host_string)
+            proc.evt_port = evt_sock.bind_to_random_port(proc.event_host_string)
+            log.info('Multi driver process cmd socket bound to %i, event socket bound to %i',
+                     proc.cmd_port, proc.evt_port)
+            file(proc.cmd_port_fname, 'w+').write(str(proc.cmd_port) + '\n')
+            file(proc.evt_port_fname, 'w+').write(str(proc.evt_port) + '\n')
+
+            poller = zmq.Poller()
+            poller.register(cmd_sock, zmq.POLLIN)
+
+            while not proc.stop_msg_thread:
+                socks = dict(poller.poll(REPLY_POLL_INTERVAL))
+                if socks.get(cmd_sock) == zmq.POLLIN:
+                    try:
+                        frames = cmd_sock.recv_multipart(flags=zmq.NOBLOCK)
+                        proc._queue_cmd(frames)
+                    except zmq.ZMQError:
+                        pass
+                proc._send_replies(cmd_sock)
+                proc.check_metrics_event()
+                proc._publish_events(evt_sock)
+
+            proc._send_replies(cmd_sock)
+            cmd_sock.close()
+            evt_sock.close()
+            context.term()
+            log.info('Multi driver process sockets closed.')
+
+        self.driver_queues = dict((driver_id, Queue.Queue()) for driver_id in self.drivers)
+        self.cmd_workers = [Thread(target=self._run_cmd_worker, args=(cmd_queue, ))
+                            for cmd_queue in self.driver_queues.values()]
+        for i in range(self.query_worker_count):
+            self.cmd_workers.append(Thread(target=self._run_cmd_worker, args=(self.query_queue, )))
+        for worker in self.cmd_workers:
+            worker.start()
+
+        self.stop_msg_thread = False
+        self.msg_thread = Thread(target=msg_loop, args=(self, ))
+        self.msg_thread.start()
+        self.messaging_started = True
+
+    def stop_messaging(self):
+        """
+        Set the flag causing the messaging thread to close its sockets,
+        and stop the command workers.
+        """
+        self.stop_msg_thread = True
+        self.messaging_started = False
+        if self.cmd_workers:
+            for cmd_queue in self.driver_queues.values():
+                cmd_queue.put(None)
+            for i in range(self.query_worker_count):
+                self.query_queue.put(None)
+            self.driver_queues = {}
+            self.cmd_workers = []
+
+    def shutdown(self):
+        """
+        Shutdown function prior to process exit.
+        """
+        driver_process.DriverProcess.shutdown(self)
+        self.drivers = {}
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.metrics
+@file mi/core/metrics.py
+@author Bill French
+@brief Process wide registry of counters, gauges and histograms used to
+report driver throughput and latency.
+"""
+
+from __future__ import absolute_import
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import time
+from threading import Lock
+
+from mi.core.common import BaseEnum
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.time import get_monotonic_time
+
+
+class DriverMetric(BaseEnum):
+    """
+    Names of the metrics recorded by the core driver classes. Per stream
+    metrics append '.<stream name>' to the base name.
+    """
+    # Data path
+    PORT_AGENT_PACKETS = 'port_agent.packets_received'
+    PORT_AGENT_BYTES = 'port_agent.bytes_received'
+    CHUNKER_BUFFER_SIZE = 'chunker.buffer_size'
+    CHUNKER_SIEVE_TIME = 'chunker.sieve_time'
+    PARTICLES_BUILT = 'protocol.particles_built'
+    PARTICLE_BUILD_TIME = 'protocol.particle_build_time'
+    EVENT_QUEUE_DEPTH = 'driver_process.event_queue_depth'
+    EVENT_SEND_LATENCY = 'driver_process.event_send_latency'
+    EVENTS_SENT = 'driver_process.events_sent'
+
+    # Command path
+    COMMAND_ROUND_TRIP = 'protocol.command_round_trip'
+    WAKEUP_TIME = 'protocol.wakeup_time'
+    FSM_HANDLER_TIME = 'fsm.handler_time'
+    DRIVER_COMMAND_TIME = 'driver_process.command_time'
+
+
+class MetricType(BaseEnum):
+    COUNTER = 'counter'
+    GAUGE = 'gauge'
+    HISTOGRAM = 'histogram'
+
+
+class Counter(object):
+    """
+    Monotonically increasing count.
+    """
+    metric_type = MetricType.COUNTER
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def reset(self):
+        with self._lock:
+            self.value = 0
+
+
+class Gauge(object):
+    """
+    Last observed value, with the high water mark since the last reset.
+    """
+    metric_type = MetricType.GAUGE
+
+    def __init__(self, name):
+        self.name = name
+        self.value = None
+        self.max = None
+
+    def set(self, value):
+        self.value = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        return {'value': self.value, 'max': self.max}
+
+    def reset(self):
+        self.max = self.value
+
+
+class Histogram(object):
+    """
+    Distribution of observed values. Keeps count, sum, min and max plus
+    counts in fixed, roughly logarithmic buckets so memory does not grow
+    with the number of observations. Times are recorded in seconds.
+    """
+    metric_type = MetricType.HISTOGRAM
+
+    # Upper bounds of the buckets; the last bucket is unbounded.
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+    def __init__(self, name, buckets=None):
+        self.name = name
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self._lock = Lock()
+        self.reset()
+
+    def observe(self, value):
+        """
+        Record one observation.
+        @param value observed value
+        """
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            self.bucket_counts[i] += 1
+
+    def time(self):
+        """
+        Context manager observing the elapsed time of its block.
+        """
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            mean = None
+            if self.count:
+                mean = self.sum / self.count
+            return {'count': self.count,
+                    'sum': self.sum,
+                    'min': self.min,
+                    'max': self.max,
+                    'mean': mean,
+                    'buckets': zip(self.buckets + (None, ), self.bucket_counts)}
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.sum = 0.0
+            self.min = None
+            self.max = None
+            self.bucket_counts = [0] * (len(self.buckets) + 1)
+
+
+class _Timer(object):
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = get_monotonic_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(get_monotonic_time() - self.start)
+        return False
+
+
+class MetricsRegistry(object):
+    """
+    Named collection of metrics. Metrics are created on first use so
+    instrumentation points do not need to be declared up front.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics = {}
+        self.enabled = True
+
+    def _get(self, name, cls):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = cls(name)
+                    self._metrics[name] = metric
+        return metric
+
+    def counter(self, name):
+        """
+        @param name metric name
+        @retval the Counter registered under name
+        """
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        """
+        @param name metric name
+        @retval the Gauge registered under name
+        """
+        return self._get(name, Gauge)
+
+    def histogram(self, name):
+        """
+        @param name metric name
+        @retval the Histogram registered under name
+        """
+        return self._get(name, Histogram)
+
+    def inc(self, name, amount=1):
+        if self.enabled:
+            self.counter(name).inc(amount)
+
+    def set(self, name, value):
+        if self.enabled:
+            self.gauge(name).set(value)
+
+    def observe(self, name, value):
+        if self.enabled:
+            self.histogram(name).observe(value)
+
+    def snapshot(self, reset=False):
+        """
+        Return the current value of every metric.
+        @param reset if True, reset the metrics after reading them.
+        @retval dict {'time': time, 'counter': {...}, 'gauge': {...},
+        'histogram': {...}} keyed by metric name.
+        """
+        result = {'time': time.time()}
+        for metric_type in MetricType.list():
+            result[metric_type] = {}
+
+        for (name, metric) in self._metrics.items():
+            result[metric.metric_type][name] = metric.snapshot()
+            if reset:
+                metric.reset()
+
+        return result
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def clear(self):
+        """
+        Drop all registered metrics.
+        """
+        with self._lock:
+            self._metrics = {}
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    @retval the process wide MetricsRegistry
+    """
+    return _registry
@@ -3,66 +3,552 @@ polling utilities -- general polling for condition, polling for file to appear i
 """
 import os
 import glob
+import random
+import fcntl
+import errno
+import select
+import fnmatch
+import atexit
+import threading
 from threading import Thread
+from collections import OrderedDict
 from gevent.event import Event
 from ooi.logging import log
 from Queue import Queue
+from mi.core.inotify import InotifyWatcher, InotifyUnavailable
+from mi.core.inotify import IN_CLOSE_WRITE, IN_MOVED_TO, IN_ONLYDIR, IN_Q_OVERFLOW, IN_IGNORED
+from mi.core.timeout import Deadline
+from mi.core.time import get_monotonic_time
+
+# while waiting on inotify, rescan this often anyway in case an event was missed
+INOTIFY_RESCAN_INTERVAL = 60
+# longest wait on inotify between checks of the shutdown flag
+SHUTDOWN_CHECK_INTERVAL = 1
+# weight of the latest check in the moving average hit rate
+HIT_RATE_WEIGHT = 0.1
+# most items of a check's result a PollingLoop hands to the poller's callback before the other pollers get a turn
+DISPATCH_BATCH_SIZE = 10
+# longest wait for the PollingLoop thread to finish when it is stopped
+LOOP_STOP_TIMEOUT = 5
+
+class PollingSchedule(object):
+    """
+    fixed interval between checks, and the hit rate: the moving average fraction of checks that found something.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.minimum = interval
+        self.maximum = interval
+        self.checks = 0
+        self.hits = 0
+        self.hit_rate = 0.0
+
+    def record(self, hit):
+        """
+        note the result of a check
+        """
+        self.checks += 1
+        if hit:
+            self.hits += 1
+        self.hit_rate += HIT_RATE_WEIGHT * ((1.0 if hit else 0.0) - self.hit_rate)
+
+    def next_wait(self):
+        return self.interval
+
+class AdaptivePollingSchedule(PollingSchedule):
+    """
+    check every minimum seconds while checks find something, multiplying the interval by backoff after each
+    empty check up to maximum.  jitter spreads each wait by up to that fraction either way, so a fleet of pollers
+    started together does not stay in step.
+    """
+    def __init__(self, minimum, maximum, backoff=2, jitter=0):
+        if not 0 < minimum <= maximum:
+            raise ValueError('polling interval needs 0 < min <= max, not %s and %s' % (minimum, maximum))
+        if backoff < 1:
+            raise ValueError('polling backoff must be at least 1, not %s' % backoff)
+        if not 0 <= jitter < 1:
+            raise ValueError('polling jitter must be between 0 and 1, not %s' % jitter)
+        super(AdaptivePollingSchedule, self).__init__(minimum)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.jitter = jitter
+
+    def record(self, hit):
+        super(AdaptivePollingSchedule, self).record(hit)
+        if hit:
+            self.interval = self.minimum
+        else:
+            self.interval = min(self.interval * self.backoff, self.maximum)
+
+    def next_wait(self):
+        if self.jitter:
+            return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        return self.interval
+
+def polling_schedule(frequency):
+    """
+    build the schedule for a poller interval or harvester 'frequency' setting: seconds between checks, or a dict
+    with 'min' and 'max' seconds and optionally 'backoff' and 'jitter' for an adaptive schedule, e.g.
+    {'min': 1, 'max': 600, 'backoff': 2, 'jitter': 0.1}
+    """
+    if isinstance(frequency, PollingSchedule):
+        return frequency
+    if isinstance(frequency, dict):
+        try:
+            return AdaptivePollingSchedule(frequency['min'], frequency['max'],
+                                           frequency.get('backoff', 2), frequency.get('jitter', 0))
+        except KeyError as e:
+            raise ValueError('adaptive polling frequency is missing %s' % e)
+    return PollingSchedule(frequency)
 
 class ConditionPoller(Thread):
     """
     generic polling mechanism: every interval seconds, check if condition returns a true value. if so, pass the value to callback
     if condition or callback raise exception, stop polling.
+
+    interval is either seconds or a dict for an AdaptivePollingSchedule, see polling_schedule().
+
+    subclasses may call watch() so that, where inotify is available, the condition is checked when a matching
+    file system event arrives instead of every interval seconds.  events are coalesced: a check follows the
+    previous one by at least the schedule's minimum interval, and covers every event that arrived meanwhile, so
+    a burst of writes costs one check per interval rather than one per write.
+
+    after use_loop(), start() hands the poller to a PollingLoop that checks it along with others on one thread,
+    instead of starting a thread for it.
     """
     def __init__(self, condition, condition_callback, exception_callback, interval):
-        self.polling_interval = interval
+        self.schedule = polling_schedule(interval)
+        self.rescan_interval = max(self.schedule.maximum, INOTIFY_RESCAN_INTERVAL)
         self._shutdown_now = Event()
         self._condition = condition
         self._callback = condition_callback
         self._on_exception = exception_callback
+        self._watch = None
+        self._watcher = None
+        self._loop = None
+        # monotonic time of the last check
+        self._last_check = None
         super(ConditionPoller,self).__init__()
         log.debug("ConditionPoller: __init__")
 
+    def watch(self, path, mask, name_filter=None):
+        """
+        check the condition on inotify events for path rather than on a timer.  name_filter, if given, is called
+        with the name of each event and selects the ones that trigger a check.  polling is used if inotify is
+        not available for path.
+        """
+        self._watch = (path, mask, name_filter)
+
+    def use_loop(self, loop):
+        """
+        have loop check the condition rather than a thread of this poller's own.  call before start().
+        """
+        self._loop = loop
+
+    @property
+    def polling_interval(self):
+        """
+        current interval between checks when polling
+        """
+        return self.schedule.interval
+
+    @property
+    def hit_rate(self):
+        """
+        moving average fraction of checks that found something
+        """
+        return self.schedule.hit_rate
+
+    @property
+    def event_driven(self):
+        return self._watcher is not None
+
+    def _event_check_due(self):
+        """
+        @retval monotonic time at which an event may trigger the next check
+        """
+        if self._last_check is None:
+            return get_monotonic_time()
+        return self._last_check + self.schedule.minimum
+
+    def _start_watcher(self):
+        if self._watch and not self._watcher:
+            try:
+                self._watcher = InotifyWatcher(self._watch[0], self._watch[1])
+            except InotifyUnavailable as e:
+                log.info('polling %s every %s seconds: %s', self._watch[0], self.polling_interval, e)
+
+    def _stop_watcher(self):
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
+
+    def _wait(self):
+        """
+        wait until the condition should be checked again
+        """
+        if self._watcher:
+            try:
+                self._wait_for_event()
+                return
+            except (OSError, IOError, select.error):
+                log.warn('inotify failed, falling back to polling', exc_info=True)
+                self._stop_watcher()
+        self._shutdown_now.wait(self.schedule.next_wait())
+
+    def _wait_for_event(self):
+        """
+        wait for a matching event, a lost watch or the rescan interval.  the shutdown flag is checked at least
+        every SHUTDOWN_CHECK_INTERVAL seconds.  after a matching event, keep taking in events until the minimum
+        interval since the last check is up; the coming check covers them all.
+        """
+        deadline = Deadline(self.rescan_interval)
+        while not self._shutdown_now.is_set() and not deadline.expired():
+            if self._wants_check(self._watcher.read_events(min(SHUTDOWN_CHECK_INTERVAL, deadline.remaining()))):
+                break
+        else:
+            return
+        due = self._event_check_due()
+        while not self._shutdown_now.is_set() and self._watcher:
+            remaining = due - get_monotonic_time()
+            if remaining <= 0:
+                break
+            self._wants_check(self._watcher.read_events(min(SHUTDOWN_CHECK_INTERVAL, remaining)))
+
+    def _wants_check(self, events):
+        """
+        @retval True if any of the inotify events calls for a check of the condition
+        """
+        name_filter = self._watch[2]
+        for event in events:
+            if event.mask & IN_IGNORED:
+                # the watched path is gone; let the condition report it
+                self._stop_watcher()
+                return True
+            if event.mask & IN_Q_OVERFLOW or name_filter is None or name_filter(event.name):
+                return True
+        return False
+
     def shutdown(self):
         log.debug("Shutting down poller: %s", self._shutdown_now)
         self.is_shutting_down = True
         self._shutdown_now.set()
+        if self._loop is not None:
+            self._loop.wake()
 
     def run(self):
         try:
+            # watch before the first check so no change is missed
+            self._start_watcher()
             while not self._shutdown_now.is_set():
                 self._check_condition()
-                self._shutdown_now.wait(self.polling_interval)
+                self._wait()
         except:
             log.error('thread failed', exc_info=True)
+        finally:
+            self._stopped()
+    def _stopped(self):
+        """
+        release what the poller holds once it has stopped, on its own thread or in a PollingLoop
+        """
+        self._stop_watcher()
     def _check_condition(self):
+        self._last_check = get_monotonic_time()
         try:
             value = self._condition()
+            self.schedule.record(bool(value))
             if value:
                 self._callback(value)
         except Exception as e:
-            log.debug('stopping poller after exception', exc_info=True)
-            self.shutdown()
-            if self._on_exception:
-                self._on_exception(e)
+            self._stop_on_exception(e)
+    def _stop_on_exception(self, e):
+        log.debug('stopping poller after exception', exc_info=True)
+        self.shutdown()
+        if self._on_exception:
+            self._on_exception(e)
     def start(self):
-        super(ConditionPoller,self).start()
+        if self._loop is not None:
+            self._loop.add(self)
+        else:
+            super(ConditionPoller,self).start()
+    def is_alive(self):
+        if self._loop is not None:
+            return self._loop.hosts(self)
+        return super(ConditionPoller,self).is_alive()
+
+class PollingLoop(object):
+    """
+    checks many pollers on one thread, so a host following many directories and files needs one thread for all
+    of them rather than one each.  the loop waits in a single select() on the inotify descriptors of the pollers
+    that watch and a pipe that wakes it when a poller is added or shut down, until the next poller is due.
+
+    a poller is checked as its own thread would check it: when a watched event arrives, no sooner than its
+    minimum interval after its last check, or when its polling schedule or rescan interval comes round.  a check that finds a list is handed to the callback at most
+    batch_size items at a time, taking turns with the other pollers that found something, so a directory with
+    a large backlog does not hold up the rest.  a poller is not checked again until all it found has been handed
+    on.  callbacks run on the loop thread and should return quickly, as the driver callbacks that queue files do.
+
+    a loop that has stopped is not started again; get_polling_loop() makes a new one.
+    """
+    def __init__(self, batch_size=DISPATCH_BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError('polling loop batch size must be at least 1, not %s' % batch_size)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        # pollers hosted, and the ones added but not yet taken up by the loop thread
+        self._pollers = set()
+        self._added = []
+        # only used on the loop thread: monotonic time each poller is next due a check, and what checks found
+        # that is still to be handed on, in turn order
+        self._due = {}
+        self._pending = OrderedDict()
+        self._wake_pipe = None
+        self._thread = None
+        self.running = False
+        self.stopped = False
+
+    def start(self):
+        with self._lock:
+            if self.running or self.stopped:
+                return
+            self.running = True
+            self._wake_pipe = os.pipe()
+            for fd in self._wake_pipe:
+                fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            self._thread = threading.Thread(target=self._run, name='PollingLoop')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        stop the loop, and with it every poller it hosts
+        """
+        with self._lock:
+            self.running = False
+            self.stopped = True
+        self.wake()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(LOOP_STOP_TIMEOUT)
+        self._thread = None
+
+    def add(self, poller):
+        """
+        start checking a poller, starting the loop if need be
+        """
+        self.start()
+        with self._lock:
+            if not self.running:
+                raise ValueError('polling loop has stopped')
+            self._pollers.add(poller)
+            self._added.append(poller)
+        self.wake()
+
+    def hosts(self, poller):
+        """
+        @retval True until a poller added to the loop has stopped
+        """
+        with self._lock:
+            return poller in self._pollers
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pollers)
+
+    def wake(self):
+        """
+        have the loop look over its pollers again
+        """
+        # under the lock, so the pipe is not closed under the write
+        with self._lock:
+            if self._wake_pipe:
+                try:
+                    os.write(self._wake_pipe[1], 'x')
+                except OSError as e:
+                    # a full pipe will wake the loop anyway
+                    if e.errno != errno.EAGAIN:
+                        raise
+
+    def _run(self):
+        try:
+            while self.running:
+                self._take_up_added()
+                self._drop_stopped()
+                self._wait(self._next_timeout())
+                self._check_due()
+                self._dispatch()
+        except:
+            log.error('polling loop failed', exc_info=True)
+        finally:
+            with self._lock:
+                self.running = False
+                self.stopped = True
+                pollers = list(self._pollers)
+                (pipe, self._wake_pipe) = (self._wake_pipe, None)
+            for poller in pollers:
+                poller.shutdown()
+                self._drop(poller)
+            for fd in pipe:
+                os.close(fd)
+
+    def _take_up_added(self):
+        with self._lock:
+            (added, self._added) = (self._added, [])
+        now = get_monotonic_time()
+        for poller in added:
+            # watch before the first check so no change is missed
+            poller._start_watcher()
+            self._due[poller] = now
+
+    def _drop_stopped(self):
+        for poller in list(self._due):
+            if poller._shutdown_now.is_set():
+                self._drop(poller)
+
+    def _drop(self, poller):
+        self._due.pop(poller, None)
+        self._pending.pop(poller, None)
+        with self._lock:
+            self._pollers.discard(poller)
+        try:
+            poller._stopped()
+        except Exception:
+            log.warn('failed to release poller %r', poller, exc_info=True)
+
+    def _next_timeout(self):
+        """
+        @retval seconds until a poller is due, 0 with results still to hand on, None with no pollers
+        """
+        if self._pending:
+            return 0
+        if not self._due:
+            return None
+        return max(0.0, min(self._due.values()) - get_monotonic_time())
+
+    def _wait(self, timeout):
+        """
+        wait for inotify events, a wake up or the timeout, and make the pollers with matching events due
+        """
+        watchers = dict((poller._watcher.fileno(), poller) for poller in self._due if poller._watcher)
+        try:
+            (readable, _, _) = select.select([self._wake_pipe[0]] + watchers.keys(), [], [], timeout)
+        except (select.error, IOError, OSError) as e:
+            if e.args[0] == errno.EINTR:
+                return
+            raise
+        now = get_monotonic_time()
+        for fd in readable:
+            if fd == self._wake_pipe[0]:
+                try:
+                    while os.read(fd, 4096):
+                        pass
+                except OSError as e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+                continue
+            poller = watchers[fd]
+            try:
+                if poller._wants_check(poller._watcher.read_events(0)):
+                    self._due[poller] = min(self._due[poller], max(now, poller._event_check_due()))
+            except (OSError, IOError, select.error):
+                log.warn('inotify failed, falling back to polling', exc_info=True)
+                poller._stop_watcher()
+                self._due[poller] = now
+
+    def _check_due(self):
+        now = get_monotonic_time()
+        for (poller, due) in self._due.items():
+            if due > now or poller in self._pending or poller._shutdown_now.is_set():
+                continue
+            poller._last_check = now
+            try:
+                value = poller._condition()
+                poller.schedule.record(bool(value))
+            except Exception as e:
+                poller._stop_on_exception(e)
+                continue
+            if value:
+                self._pending[poller] = value
+            if poller.event_driven:
+                self._due[poller] = now + poller.rescan_interval
+            else:
+                self._due[poller] = now + poller.schedule.next_wait()
+
+    def _dispatch(self):
+        """
+        hand each poller with results its next batch of them
+        """
+        for poller in list(self._pending):
+            value = self._pending.pop(poller)
+            if poller._shutdown_now.is_set():
+                continue
+            if isinstance(value, list) and len(value) > self.batch_size:
+                # the rest waits for the next round, behind the other pollers
+                (value, self._pending[poller]) = (value[:self.batch_size], value[self.batch_size:])
+            try:
+                poller._callback(value)
+            except Exception as e:
+                self._pending.pop(poller, None)
+                poller._stop_on_exception(e)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_polling_loop():
+    """
+    @retval the started PollingLoop shared by the process
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None or not _loop.running:
+            _loop = PollingLoop()
+            _loop.start()
+            atexit.register(_loop.stop)
+    return _loop
+
+def watch_directory(poller, directory, wildcard):
+    """
+    have poller check for new files in directory matching wildcard on inotify events
+    """
+    if os.sep in wildcard:
+        # events only carry names within the watched directory
+        return
+    poller.watch(directory, IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR,
+                 lambda name: fnmatch.fnmatch(name, wildcard))
 
 class DirectoryPoller(ConditionPoller):
     """
     poll for new files added to a directory that match a wildcard pattern.
     expects files to be added only, and added in ASCII order.
+    with use_inotify, the directory is checked when a matching file is closed after writing or moved in.
     """
-    def __init__(self, directory, wildcard, callback, exception_callback=None, interval=1):
+    # report every matching file whenever the set of files changes, including
+    # files that sort before the last file found, rather than only the files
+    # after it
+    report_all = False
+
+    def __init__(self, directory, wildcard, callback, exception_callback=None, interval=1, use_inotify=True):
         self._directory = directory
         self._path = directory + '/' + wildcard
         self._last_filename = None
+        self._last_filenames = None
         super(DirectoryPoller,self).__init__(self._check_for_files, callback, exception_callback, interval)
+        if use_inotify:
+            watch_directory(self, directory, wildcard)
 
     def _check_for_files(self):
         if not os.path.isdir(self._directory):
             raise ValueError('%s is not a directory' % self._directory)
 
         filenames = glob.glob(self._path)
+        if self.report_all:
+            filenames.sort()
+            if filenames == self._last_filenames:
+                return None
+            self._last_filenames = filenames
+            self._last_filename = filenames[-1] if filenames else None
+            log.trace('found files: %r', filenames)
+            return filenames or None
         # files, but no change since last time
         if self._last_filename and filenames and filenames[-1]==self._last_filename:
             return None
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.profiler
+@file mi/core/profiler.py
+@author Bill French
+@brief Profilers that can be switched on and off inside a running driver
+process.
+"""
+
+from __future__ import absolute_import
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import sys
+import time
+import threading
+import cProfile
+import pstats
+import StringIO
+
+from mi.core.common import BaseEnum
+from mi.core.exceptions import InstrumentCommandException
+from mi.core.log import get_logger ; log = get_logger()
+
+# Default sampling period of the statistical profiler in seconds.
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Default number of functions listed in a report.
+DEFAULT_REPORT_LIMIT = 40
+
+
+class ProfileMode(BaseEnum):
+    """
+    STATISTICAL samples the stacks of every thread in the process,
+    including threads that were already running, at low overhead.
+    DETERMINISTIC uses cProfile; it records every call but only in the
+    thread that executes driver commands.
+    """
+    STATISTICAL = 'statistical'
+    DETERMINISTIC = 'deterministic'
+
+
+class SamplingProfiler(object):
+    """
+    Periodically snapshots the stack of every other thread and counts, per
+    function, the samples in which it was executing (self) or on the
+    stack (cumulative).
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        """
+        @param interval seconds between samples
+        """
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = {}
+        self.cumulative_counts = {}
+        self.thread_counts = {}
+        self.start_time = None
+        self.stop_time = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.start_time = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='SamplingProfiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.stop_time = time.time()
+
+    def _run(self):
+        me = threading.current_thread().ident
+        while not self._stop.wait(self.interval):
+            self.sample(exclude=me)
+
+    def sample(self, exclude=None):
+        """
+        Take one sample of all thread stacks.
+        @param exclude thread ident not to sample
+        """
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+        for (ident, frame) in sys._current_frames().items():
+            if ident == exclude:
+                continue
+            name = names.get(ident, str(ident))
+            self.thread_counts[name] = self.thread_counts.get(name, 0) + 1
+            self.samples += 1
+
+            leaf = True
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                if leaf:
+                    self.self_counts[key] = self.self_counts.get(key, 0) + 1
+                    leaf = False
+                if key not in seen:
+                    seen.add(key)
+                    self.cumulative_counts[key] = self.cumulative_counts.get(key, 0) + 1
+                frame = frame.f_back
+
+    def report(self, limit=DEFAULT_REPORT_LIMIT):
+        """
+        @param limit number of functions to list
+        @retval text report
+        """
+        end = self.stop_time or time.time()
+        out = ['Statistical profile: %d samples over %.1f seconds, interval %s seconds' %
+               (self.samples, end - (self.start_time or end), self.interval),
+               '',
+               'Samples per thread:']
+        for (name, count) in sorted(self.thread_counts.items(), key=lambda x: -x[1]):
+            out.append('  %8d  %s' % (count, name))
+
+        total = float(self.samples or 1)
+        out.extend(['', '   self%%    cum%%  function'])
+        ranked = sorted(self.cumulative_counts.items(),
+                        key=lambda x: (-self.self_counts.get(x[0], 0), -x[1]))
+        for (key, cumulative) in ranked[:limit]:
+            out.append('  %6.2f  %6.2f  %s (%s:%d)' %
+                       (100 * self.self_counts.get(key, 0) / total,
+                        100 * cumulative / total, key[2], key[0], key[1]))
+        return '\n'.join(out) + '\n'
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.report(limit=None))
+
+
+class DeterministicProfiler(object):
+    """
+    cProfile based profiler. cProfile hooks only the thread that enables
+    it, so this profiles the thread that runs the driver commands; start,
+    stop and report must be called from that thread.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self, limit=DEFAULT_REPORT_LIMIT):
+        out = StringIO.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class ProcessProfiler(object):
+    """
+    Holds the profiler of a driver process between the start_profile,
+    stop_profile and dump_profile commands.
+    """
+
+    def __init__(self):
+        self.profiler = None
+        self.running = False
+
+    def start(self, mode=ProfileMode.STATISTICAL, interval=DEFAULT_SAMPLE_INTERVAL):
+        """
+        Start a new profile, discarding any previous one.
+        @param mode a ProfileMode value
+        @param interval sample interval for statistical profiles
+        @retval the mode started
+        @raise InstrumentCommandException if a profile is running or the
+        mode is unknown.
+        """
+        if self.running:
+            raise InstrumentCommandException('A profile is already running.')
+        if mode == ProfileMode.STATISTICAL:
+            self.profiler = SamplingProfiler(interval)
+        elif mode == ProfileMode.DETERMINISTIC:
+            self.profiler = DeterministicProfiler()
+        else:
+            raise InstrumentCommandException('Unknown profile mode: %s' % mode)
+
+        self.profiler.start()
+        self.running = True
+        log.info('Started %s profile', mode)
+        return mode
+
+    def stop(self):
+        """
+        @raise InstrumentCommandException if no profile is running.
+        """
+        if not self.running:
+            raise InstrumentCommandException('No profile is running.')
+        self.profiler.stop()
+        self.running = False
+        log.info('Stopped profile')
+
+    def dump(self, path=None, limit=DEFAULT_REPORT_LIMIT):
+        """
+        Report the last profile. A running statistical profile keeps
+        running; a running deterministic profile is stopped first.
+        @param path if given, write the profile to this file (pstats
+        format for deterministic profiles, text otherwise) and return it.
+        @param limit number of functions in a text report.
+        @retval the file path, or the text report if no path was given.
+        @raise InstrumentCommandException if no profile has been started.
+        """
+        if self.profiler is None:
+            raise InstrumentCommandException('No profile has been started.')
+        if self.running and isinstance(self.profiler, DeterministicProfiler):
+            # cProfile can not report while it is enabled.
+            self.stop()
+        if path:
+            self.profiler.dump(path)
+            log.info('Profile written to %s', path)
+            return path
+        return self.profiler.report(limit)
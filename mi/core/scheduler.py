@@ -48,11 +48,30 @@ scheduler.run_polled_job(test_name)
 
 This module extends the Advanced Python Scheduler:
 @see http://packages.python.org/APScheduler
+
+SchedulerService is a lightweight alternative shared by every driver in a
+process. It keeps all jobs in one heap ordered by monotonic deadline and
+serviced by a single thread, hands due jobs to a small worker pool, and
+records per job firing latency.  It accepts the same job types:
+
+service = get_scheduler_service()
+job = service.add_interval_job(some_callback, seconds=3)
+job = service.add_polled_job(some_callback, test_name, min_interval, max_interval)
+service.run_polled_job(test_name)
+service.remove_job(job)
+stats = service.job_stats()
 """
 
+from __future__ import absolute_import
+
 __author__ = 'Bill French'
 __license__ = 'Apache 2.0'
 
+import atexit
+import heapq
+import itertools
+import threading
+import Queue
 from datetime import timedelta
 from datetime import datetime
 from math import ceil
@@ -63,9 +82,17 @@ from apscheduler.scheduler import EVENT_JOBSTORE_JOB_ADDED
 from apscheduler.job import Job
 
 from apscheduler.util import convert_to_datetime, timedelta_seconds
+from apscheduler.triggers import CronTrigger, IntervalTrigger, SimpleTrigger
 
+from mi.core.time import get_monotonic_time
 from mi.core.log import get_logger; log = get_logger()
 
+# Number of worker threads running jobs for the shared scheduler service.
+DEFAULT_WORKER_COUNT = 2
+
+# Seconds to wait for each service thread to exit on shutdown.
+SHUTDOWN_TIMEOUT = 1
+
 class PolledScheduler(Scheduler):
     """
     Specialized advanced scheduler that allows for polled interval
@@ -421,5 +448,314 @@ class PolledIntervalTrigger(object):
             self.__class__.__name__, repr(self.min_interval), repr(self.max_interval))
 
 
+class ScheduledJob(object):
+    """
+    A job held by the SchedulerService.
+    :param trigger: apscheduler style trigger, or a PolledIntervalTrigger
+    :param func: callable to run
+    :param args: list of positional arguments to call func with
+    :param kwargs: dict of keyword arguments to call func with
+    :param name: name of the job, required for polled jobs
+    :param owner: any object; polled job names are unique per owner
+    """
+    def __init__(self, trigger, func, args=None, kwargs=None, name=None, owner=None):
+        self.trigger = trigger
+        self.func = func
+        self.args = args or []
+        self.kwargs = kwargs or {}
+        self.name = name or getattr(func, '__name__', repr(func))
+        self.owner = owner
+        self.next_run_time = None
+        self.generation = 0
+        self.removed = False
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_last = None
+
+    @property
+    def polled(self):
+        return isinstance(self.trigger, PolledIntervalTrigger)
+
+    def record_latency(self, latency):
+        self.latency_last = latency
+        self.latency_count += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def stats(self):
+        """
+        @return: dict of run count, skipped runs and firing latency in
+                 seconds between the scheduled and actual start times.
+        """
+        mean = None
+        if self.latency_count:
+            mean = self.latency_sum / self.latency_count
+        return {'runs': self.runs,
+                'skipped': self.skipped,
+                'next_run_time': self.next_run_time,
+                'latency_last': self.latency_last,
+                'latency_mean': mean,
+                'latency_max': self.latency_max}
+
+    def __repr__(self):
+        return '<%s (name=%s, trigger=%s)>' % (self.__class__.__name__, self.name, repr(self.trigger))
+
+
+class SchedulerService(object):
+    """
+    Scheduler shared by all drivers in a process. Jobs live in a heap
+    keyed by monotonic deadline, so adding and removing jobs is O(log n)
+    and the single scheduler thread only wakes for the next due job.
+    Removed and rescheduled jobs leave stale heap entries which are
+    skipped when popped. Due jobs are run by a small worker pool; a job
+    is not started again while a previous run is still going, matching
+    the APScheduler default of one instance per job.
+    """
+    def __init__(self, worker_count=DEFAULT_WORKER_COUNT):
+        self.worker_count = worker_count
+        self._cond = threading.Condition(threading.RLock())
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = []
+        self._polled_jobs = {}
+        self._run_queue = Queue.Queue()
+        self._threads = []
+        self.running = False
+
+    interval = staticmethod(PolledScheduler.interval)
+
+    def start(self):
+        """
+        Start the scheduler and worker threads.
+        """
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+            self._threads = [threading.Thread(target=self._run_scheduler, name='SchedulerService')]
+            for i in range(self.worker_count):
+                self._threads.append(threading.Thread(target=self._run_worker,
+                                                      name='SchedulerService-worker-%d' % i))
+            for thread in self._threads:
+                thread.daemon = True
+                thread.start()
+
+    def shutdown(self):
+        """
+        Stop the scheduler. Jobs stay registered.
+        """
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        for i in range(self.worker_count):
+            self._run_queue.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(SHUTDOWN_TIMEOUT)
+        self._threads = []
+
+    def add_job(self, trigger, func, args=None, kwargs=None, name=None, owner=None):
+        """
+        Add a job to the scheduler.
+        :return: the ScheduledJob
+        :raise ValueError: if the job would never run or a polled job of
+               the same name and owner exists.
+        """
+        job = ScheduledJob(trigger, func, args, kwargs, name, owner)
+        next_run_time = trigger.get_next_fire_time(datetime.now())
+
+        with self._cond:
+            if job.polled:
+                if (owner, job.name) in self._polled_jobs:
+                    raise ValueError("Not adding job since a job named '%s' already exists" % job.name)
+                self._polled_jobs[(owner, job.name)] = job
+            elif next_run_time is None:
+                raise ValueError('Not adding job since it would never be run')
+
+            self._jobs.append(job)
+            self._schedule(job, next_run_time)
+
+        log.info('Added job "%s" to scheduler service', job)
+        return job
+
+    def add_date_job(self, func, date, args=None, kwargs=None, name=None, owner=None):
+        return self.add_job(SimpleTrigger(date), func, args, kwargs, name, owner)
+
+    def add_interval_job(self, func, weeks=0, days=0, hours=0, minutes=0, seconds=0,
+                         start_date=None, args=None, kwargs=None, name=None, owner=None):
+        interval = timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+        return self.add_job(IntervalTrigger(interval, start_date), func, args, kwargs, name, owner)
+
+    def add_cron_job(self, func, year=None, month=None, day=None, week=None,
+                     day_of_week=None, hour=None, minute=None, second=None,
+                     start_date=None, args=None, kwargs=None, name=None, owner=None):
+        trigger = CronTrigger(year=year, month=month, day=day, week=week,
+                              day_of_week=day_of_week, hour=hour,
+                              minute=minute, second=second, start_date=start_date)
+        return self.add_job(trigger, func, args, kwargs, name, owner)
+
+    def add_polled_job(self, func, name, min_interval, max_interval=None,
+                       start_date=None, args=None, kwargs=None, owner=None):
+        trigger = PolledIntervalTrigger(min_interval, max_interval, start_date)
+        return self.add_job(trigger, func, args, kwargs, name, owner)
+
+    def remove_job(self, job):
+        """
+        Remove a job. Its heap entry is discarded lazily.
+        :raise KeyError: if the job is not scheduled.
+        """
+        with self._cond:
+            if job.removed:
+                raise KeyError('Job "%s" is not scheduled' % job)
+            job.removed = True
+            self._jobs.remove(job)
+            if job.polled:
+                self._polled_jobs.pop((job.owner, job.name), None)
+            self._compact()
+
+    def unschedule_func(self, func, owner=None):
+        """
+        Remove all jobs of an owner that run func.
+        :raise KeyError: if no such job is scheduled.
+        """
+        with self._cond:
+            jobs = [job for job in self._jobs if job.func == func and job.owner == owner]
+            if not jobs:
+                raise KeyError('The given function is not scheduled in this scheduler')
+            for job in jobs:
+                self.remove_job(job)
+
+    def get_jobs(self, owner=None):
+        with self._cond:
+            return [job for job in self._jobs if owner is None or job.owner == owner]
+
+    def run_polled_job(self, name, owner=None):
+        """
+        Run a polled job if its minimum interval has passed.
+        @param name: name of the job we are looking for
+        @param owner: owner the job was added with
+        @return: True if the job is run, false otherwise
+        @raise LookupError if the job name isn't found
+        """
+        with self._cond:
+            job = self._polled_jobs.get((owner, name))
+            if not job:
+                raise LookupError("no PolledIntervalJob found named '%s'" % name)
+
+            if job.trigger.pull_trigger():
+                log.debug("Job '%s' is ready to run" % job.name)
+                self._dispatch(job, get_monotonic_time())
+                self._schedule(job, job.trigger.get_next_fire_time())
+                return True
+
+            log.debug("Job '%s' is *NOT* ready to run" % job.name)
+            return False
 
+    def job_stats(self, owner=None):
+        """
+        @return: dict of job name to ScheduledJob.stats()
+        """
+        return dict((job.name, job.stats()) for job in self.get_jobs(owner))
+
+    def _schedule(self, job, next_run_time):
+        """
+        Push the next run of a job onto the heap. Wall clock run times
+        from the triggers are converted to monotonic deadlines so clock
+        steps do not disturb jobs already on the heap.
+        """
+        job.generation += 1
+        job.next_run_time = next_run_time
+        if next_run_time is None:
+            return
+        delay = max(0.0, timedelta_seconds(next_run_time - datetime.now()))
+        deadline = get_monotonic_time() + delay
+        heapq.heappush(self._heap, (deadline, next(self._seq), job.generation, job))
+        self._cond.notify()
+
+    def _compact(self):
+        """
+        Rebuild the heap once more than half of it is stale entries.
+        """
+        if len(self._heap) > 2 * len(self._jobs) + 16:
+            self._heap = [entry for entry in self._heap
+                          if not entry[3].removed and entry[2] == entry[3].generation]
+            heapq.heapify(self._heap)
+
+    def _dispatch(self, job, scheduled):
+        if job.running:
+            job.skipped += 1
+            log.warning('Run of job "%s" skipped: previous run still going', job)
+            return
+        job.running = True
+        self._run_queue.put((job, scheduled))
+
+    def _run_scheduler(self):
+        with self._cond:
+            while self.running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                (deadline, seq, generation, job) = self._heap[0]
+                if job.removed or generation != job.generation:
+                    heapq.heappop(self._heap)
+                    continue
+
+                wait = deadline - get_monotonic_time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                heapq.heappop(self._heap)
+                self._dispatch(job, deadline)
+
+                if job.polled:
+                    job.trigger.pull_trigger()
+                    next_run_time = job.trigger.get_next_fire_time()
+                else:
+                    next_run_time = job.trigger.get_next_fire_time(
+                        datetime.now() + timedelta(microseconds=1))
+
+                if next_run_time is None and not job.polled:
+                    job.removed = True
+                    self._jobs.remove(job)
+                else:
+                    self._schedule(job, next_run_time)
+
+    def _run_worker(self):
+        while True:
+            item = self._run_queue.get()
+            if item is None:
+                break
+            (job, scheduled) = item
+            job.record_latency(max(0.0, get_monotonic_time() - scheduled))
+            try:
+                job.func(*job.args, **job.kwargs)
+            except Exception:
+                log.exception('Job "%s" raised an exception', job)
+            finally:
+                job.runs += 1
+                job.running = False
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_scheduler_service():
+    """
+    @return: the started SchedulerService shared by the process
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SchedulerService()
+            _service.start()
+            # stop the threads before module globals are torn down
+            atexit.register(_service.shutdown)
+    return _service
 
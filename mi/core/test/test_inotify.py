@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_inotify
+@file mi/core/test/test_inotify.py
+@author Bill French
+@brief Test cases for the inotify binding and event driven pollers.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import tempfile
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.inotify import InotifyWatcher, InotifyUnavailable, filesystem_type
+from mi.core.inotify import IN_CLOSE_WRITE, IN_MOVED_TO, IN_MODIFY
+from mi.core.poller import DirectoryPoller
+from mi.dataset.harvester import FilePoller
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+@attr('UNIT', group='mi')
+class TestInotify(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.found = []
+
+    def _write(self, name, data='data'):
+        with open(os.path.join(self.directory, name), 'a') as f:
+            f.write(data)
+
+    def _callback(self, value):
+        self.found.append(value)
+
+    def _wait_for(self, count, timeout=3):
+        end = time.time() + timeout
+        while len(self.found) < count and time.time() < end:
+            time.sleep(.01)
+
+    def _start(self, poller):
+        poller.start()
+        self.addCleanup(poller.shutdown)
+        # let the poller run its first check and start waiting
+        time.sleep(.2)
+
+    def test_watcher(self):
+        try:
+            watcher = InotifyWatcher(self.directory, IN_CLOSE_WRITE | IN_MOVED_TO)
+        except InotifyUnavailable as e:
+            self.skipTest(str(e))
+        self.addCleanup(watcher.close)
+
+        self.assertEqual(watcher.read_events(0), [])
+        self._write('a.txt')
+        os.rename(os.path.join(self.directory, 'a.txt'), os.path.join(self.directory, 'b.txt'))
+        events = watcher.read_events(1)
+        self.assertEqual([e.name for e in events], ['a.txt', 'b.txt'])
+        self.assertTrue(events[0].mask & IN_CLOSE_WRITE)
+        self.assertTrue(events[1].mask & IN_MOVED_TO)
+
+    def test_remote_filesystem(self):
+        mounts = os.path.join(self.directory, 'mounts')
+        with open(mounts, 'w') as f:
+            f.write('/dev/sda1 / ext4 rw 0 0\n')
+            f.write('server:/export %s nfs4 rw 0 0\n' % self.directory)
+        self.assertEqual(filesystem_type('/usr', mounts), 'ext4')
+        self.assertEqual(filesystem_type(os.path.join(self.directory, 'x'), mounts), 'nfs4')
+
+        with patch('mi.core.inotify.filesystem_type', return_value='nfs'):
+            with self.assertRaisesRegexp(InotifyUnavailable, 'nfs'):
+                InotifyWatcher(self.directory, IN_MODIFY)
+
+    def test_directory_poller_events(self):
+        """
+        The directory is not checked while nothing happens.  New files are
+        found on close after write, and only for names matching the wildcard.
+        """
+        poller = DirectoryPoller(self.directory, '*.txt', self._callback, interval=.05)
+        self._start(poller)
+        if not poller.event_driven:
+            self.skipTest('inotify not available')
+        self.assertEqual(poller.schedule.checks, 1)
+
+        self._write('ignored.dat')
+        self._write('a.txt')
+        self._wait_for(1)
+        self.assertEqual(self.found, [[os.path.join(self.directory, 'a.txt')]])
+
+    def test_directory_poller_moved_in(self):
+        poller = DirectoryPoller(self.directory, '*.txt', self._callback, interval=.05)
+        self._start(poller)
+        if not poller.event_driven:
+            self.skipTest('inotify not available')
+
+        self._write('tmp')
+        os.rename(os.path.join(self.directory, 'tmp'), os.path.join(self.directory, 'b.txt'))
+        self._wait_for(1)
+        self.assertEqual(self.found, [[os.path.join(self.directory, 'b.txt')]])
+
+    def test_file_poller_events(self):
+        self._write('data.log', '')
+        poller = FilePoller(self.directory, 'data.log', None, self._callback, interval=.05)
+        self._start(poller)
+        if not poller.event_driven:
+            self.skipTest('inotify not available')
+
+        self._write('other.log')
+        self._write('data.log')
+        self._wait_for(1)
+        self.assertEqual(self.found, [os.path.join(self.directory, 'data.log')])
+
+    def test_file_poller_burst(self):
+        """
+        A burst of writes to the file is coalesced into at most one check
+        per polling interval.
+        """
+        self._write('data.log', '')
+        poller = FilePoller(self.directory, 'data.log', None, self._callback, interval=.2)
+        self._start(poller)
+        if not poller.event_driven:
+            self.skipTest('inotify not available')
+
+        start = time.time()
+        for i in range(100):
+            self._write('data.log', 'x')
+            time.sleep(.005)
+        elapsed = time.time() - start
+        time.sleep(.5)
+        self.assertGreater(len(self.found), 0)
+        self.assertLessEqual(poller.schedule.checks, 2 + int(elapsed / .2) + 1)
+
+    def test_polling_fallback(self):
+        """
+        Without inotify the poller sleeps for the polling interval between
+        checks, as before.
+        """
+        poller = DirectoryPoller(self.directory, '*.txt', self._callback, interval=.1)
+        with patch('mi.core.poller.InotifyWatcher', side_effect=InotifyUnavailable('test')):
+            poller._start_watcher()
+        self.assertFalse(poller.event_driven)
+
+        with patch.object(poller._shutdown_now, 'wait') as wait:
+            poller._wait()
+        wait.assert_called_once_with(.1)
+
+        # unwatchable wildcards are polled
+        poller = DirectoryPoller(self.directory, 'sub/*.txt', self._callback, interval=.1)
+        poller._start_watcher()
+        self.assertFalse(poller.event_driven)
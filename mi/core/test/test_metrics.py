@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_metrics
+@file mi/core/test/test_metrics.py
+@author Bill French
+@brief Test cases for the driver metrics registry.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import time
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.metrics import MetricsRegistry, DriverMetric, MetricType, get_metrics
+from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.driver_process import DriverProcess
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+@attr('UNIT', group='mi')
+class TestMetrics(MiUnitTest):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_gauge(self):
+        self.registry.inc('a')
+        self.registry.inc('a', 4)
+        self.registry.set('g', 10)
+        self.registry.set('g', 3)
+
+        snapshot = self.registry.snapshot()
+        self.assertEqual(snapshot[MetricType.COUNTER]['a'], 5)
+        self.assertEqual(snapshot[MetricType.GAUGE]['g'], {'value': 3, 'max': 10})
+
+    def test_histogram(self):
+        for value in [0.002, 0.004, 2.0]:
+            self.registry.observe('h', value)
+
+        result = self.registry.snapshot(reset=True)[MetricType.HISTOGRAM]['h']
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(result['min'], 0.002)
+        self.assertEqual(result['max'], 2.0)
+        self.assertAlmostEqual(result['mean'], 2.006 / 3)
+        self.assertEqual(dict(result['buckets'])[0.005], 2)
+        self.assertEqual(dict(result['buckets'])[5.0], 1)
+
+        # reset on read
+        result = self.registry.snapshot()[MetricType.HISTOGRAM]['h']
+        self.assertEqual(result['count'], 0)
+
+        with self.registry.histogram('t').time():
+            time.sleep(.01)
+        self.assertGreater(self.registry.histogram('t').sum, 0)
+
+    def test_disabled(self):
+        self.registry.enabled = False
+        self.registry.inc('a')
+        self.assertEqual(self.registry.snapshot()[MetricType.COUNTER], {})
+
+    def test_chunker_instrumentation(self):
+        metrics = get_metrics()
+        metrics.clear()
+        chunker = StringChunker(lambda raw: [])
+        chunker.add_chunk('abcdef', 1.0)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot[MetricType.GAUGE][DriverMetric.CHUNKER_BUFFER_SIZE]['value'], 6)
+        self.assertEqual(snapshot[MetricType.HISTOGRAM][DriverMetric.CHUNKER_SIEVE_TIME]['count'], 1)
+
+    def test_driver_process_commands(self):
+        get_metrics().clear()
+        process = DriverProcess('module', 'class', None)
+        process.send_event({'type': DriverAsyncEvent.SAMPLE, 'value': 1, 'time': time.time()})
+
+        snapshot = process.cmd_driver({'cmd': 'get_metrics', 'args': (), 'kwargs': {}})
+        self.assertEqual(snapshot[MetricType.GAUGE][DriverMetric.EVENT_QUEUE_DEPTH]['value'], 1)
+
+        process.event_sent(process.events.pop(0))
+        snapshot = process.cmd_driver({'cmd': 'get_metrics', 'args': (), 'kwargs': {}})
+        self.assertEqual(snapshot[MetricType.COUNTER][DriverMetric.EVENTS_SENT], 1)
+        self.assertEqual(snapshot[MetricType.HISTOGRAM][DriverMetric.EVENT_SEND_LATENCY]['count'], 1)
+
+        # periodic metrics event
+        process.check_metrics_event()
+        self.assertEqual(process.events, [])
+        process.cmd_driver({'cmd': 'set_metrics_interval', 'args': (0.01, ), 'kwargs': {}})
+        time.sleep(.02)
+        process.check_metrics_event()
+        self.assertEqual(len(process.events), 1)
+        self.assertEqual(process.events[0]['type'], DriverAsyncEvent.METRICS)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_poller
+@file mi/core/test/test_poller.py
+@author Bill French
+@brief Test cases for the fixed and adaptive poller schedules.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import tempfile
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.poller import ConditionPoller, PollingSchedule, AdaptivePollingSchedule, polling_schedule
+from mi.core.poller import PollingLoop, DirectoryPoller, get_polling_loop
+from mi.core.timeout import Deadline
+from mi.core.inotify import IN_MODIFY, IN_ONLYDIR
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+@attr('UNIT', group='mi')
+class TestPollingSchedule(MiUnitTest):
+
+    def test_fixed(self):
+        schedule = polling_schedule(5)
+        self.assertIs(type(schedule), PollingSchedule)
+        for hit in (True, False, False):
+            schedule.record(hit)
+            self.assertEqual(schedule.next_wait(), 5)
+        self.assertEqual((schedule.checks, schedule.hits), (3, 1))
+
+    def test_adaptive(self):
+        schedule = polling_schedule({'min': 1, 'max': 10})
+        self.assertEqual(schedule.interval, 1)
+        waits = []
+        for i in range(6):
+            schedule.record(False)
+            waits.append(schedule.next_wait())
+        self.assertEqual(waits, [2, 4, 8, 10, 10, 10])
+
+        schedule.record(True)
+        self.assertEqual(schedule.next_wait(), 1)
+        self.assertGreater(schedule.hit_rate, 0)
+
+        # the hit rate follows the recent checks
+        for i in range(50):
+            schedule.record(True)
+        busy = schedule.hit_rate
+        for i in range(50):
+            schedule.record(False)
+        self.assertGreater(busy, .9)
+        self.assertLess(schedule.hit_rate, .1)
+
+    def test_jitter(self):
+        schedule = AdaptivePollingSchedule(10, 10, jitter=.2)
+        waits = [schedule.next_wait() for i in range(200)]
+        self.assertTrue(all(8 <= wait <= 12 for wait in waits))
+        self.assertGreater(len(set(waits)), 1)
+
+    def test_bad_config(self):
+        for frequency in ({'min': 1}, {'min': 5, 'max': 1}, {'min': 0, 'max': 1},
+                          {'min': 1, 'max': 2, 'backoff': .5}, {'min': 1, 'max': 2, 'jitter': 1}):
+            self.assertRaises(ValueError, polling_schedule, frequency)
+
+    def test_poller(self):
+        """
+        The poller records each check and waits for the current interval.
+        """
+        results = [None, None, ['a'], None]
+        found = []
+        poller = ConditionPoller(lambda: results.pop(0), found.append, None,
+                                 {'min': .5, 'max': 4, 'backoff': 2})
+        self.assertEqual(poller.rescan_interval, 60)
+        waits = []
+        with patch.object(poller._shutdown_now, 'wait', side_effect=waits.append):
+            for i in range(4):
+                poller._check_condition()
+                poller._wait()
+        self.assertEqual(found, [['a']])
+        self.assertEqual(waits, [1, 2, .5, 1])
+        self.assertEqual(poller.polling_interval, 1)
+        self.assertGreater(poller.hit_rate, 0)
+
+def wait_for(predicate, timeout=5):
+    deadline = Deadline(timeout)
+    while not predicate():
+        if deadline.expired():
+            raise AssertionError('timed out waiting for %s' % predicate)
+        time.sleep(.01)
+
+@attr('UNIT', group='mi')
+class TestPollingLoop(MiUnitTest):
+
+    def setUp(self):
+        self.loop = PollingLoop(batch_size=2)
+        self.addCleanup(self.loop.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _touch(self, *path):
+        with open(os.path.join(self.directory, *path), 'w') as f:
+            f.write('x')
+
+    def test_directories(self):
+        """
+        Pollers on many directories are checked on the loop thread, not
+        threads of their own.
+        """
+        found = []
+        pollers = []
+        for i in range(20):
+            os.mkdir(os.path.join(self.directory, str(i)))
+            if i != 7:
+                self._touch(str(i), 'a.dat')
+            poller = DirectoryPoller(os.path.join(self.directory, str(i)), '*.dat', found.extend,
+                                     interval=.05, use_inotify=False)
+            poller.use_loop(self.loop)
+            poller.start()
+            pollers.append(poller)
+        wait_for(lambda: len(found) == 19)
+        self.assertEqual(len(self.loop), 20)
+        self.assertTrue(all(poller.is_alive() and poller.ident is None for poller in pollers))
+
+        self._touch('7', 'b.dat')
+        wait_for(lambda: len(found) == 20)
+        self.assertEqual(found[-1], os.path.join(self.directory, '7', 'b.dat'))
+
+        pollers[7].shutdown()
+        wait_for(lambda: not pollers[7].is_alive())
+        self.assertEqual(len(self.loop), 19)
+        self.loop.stop()
+        self.assertEqual(len(self.loop), 0)
+        self.assertFalse(pollers[0].is_alive())
+        self.assertRaises(ValueError, self.loop.add, pollers[0])
+
+    def test_inotify(self):
+        """
+        A watching poller is not checked while nothing happens, and is
+        checked when a file arrives.
+        """
+        found = []
+        poller = DirectoryPoller(self.directory, '*.dat', found.extend, interval=.1)
+        poller.use_loop(self.loop)
+        poller.start()
+        wait_for(lambda: poller.schedule.checks == 1)
+        if not poller.event_driven:
+            self.skipTest('inotify is not available')
+        time.sleep(.5)
+        self.assertEqual(poller.schedule.checks, 1)
+        self._touch('a.dat')
+        self._touch('a.txt')
+        wait_for(lambda: found)
+        self.assertEqual(found, [os.path.join(self.directory, 'a.dat')])
+
+    def test_inotify_burst(self):
+        """
+        A burst of writes is checked at most once per polling interval.
+        """
+        self._touch('data.log')
+        sizes = []
+        path = os.path.join(self.directory, 'data.log')
+        poller = ConditionPoller(lambda: os.path.getsize(path), sizes.append, None, .2)
+        poller.watch(self.directory, IN_MODIFY | IN_ONLYDIR, lambda name: name == 'data.log')
+        poller.use_loop(self.loop)
+        poller.start()
+        wait_for(lambda: poller.schedule.checks == 1)
+        if not poller.event_driven:
+            self.skipTest('inotify is not available')
+
+        start = time.time()
+        with open(path, 'a') as f:
+            for i in range(100):
+                f.write('x')
+                f.flush()
+                time.sleep(.005)
+        elapsed = time.time() - start
+        wait_for(lambda: sizes and sizes[-1] == 101)
+        self.assertLessEqual(poller.schedule.checks, 2 + int(elapsed / .2) + 1)
+
+    def test_fairness(self):
+        """
+        A large result is handed on in batches, taking turns with the other
+        pollers, and the poller is not checked again until it is all out.
+        """
+        calls = []
+        checks = {'big': [range(7)], 'small': [['s'], ['t']]}
+        loop = PollingLoop(batch_size=2)
+        for name in ('big', 'small'):
+            poller = ConditionPoller(lambda name=name: checks[name].pop(0) if checks[name] else None,
+                                     lambda value, name=name: calls.append((name, value)), None, 0)
+            # step the loop by hand rather than on its thread
+            loop._added.append(poller)
+        loop._take_up_added()
+
+        loop._check_due()
+        loop._dispatch()
+        self.assertEqual(sorted(calls), [('big', [0, 1]), ('small', ['s'])])
+        loop._check_due()
+        loop._dispatch()
+        self.assertEqual(calls[2:], [('big', [2, 3]), ('small', ['t'])])
+        for i in range(3):
+            loop._check_due()
+            loop._dispatch()
+        self.assertEqual(calls[4:], [('big', [4, 5]), ('big', [6])])
+        self.assertEqual(checks, {'big': [], 'small': []})
+
+    def test_exception(self):
+        """
+        A poller whose check or callback fails is stopped and reported, and
+        the others carry on.
+        """
+        errors = []
+        found = []
+        def condition():
+            raise ValueError('no directory')
+        def callback(value):
+            raise IOError('bad file')
+        failing = [ConditionPoller(condition, found.append, errors.append, .01),
+                   ConditionPoller(lambda: ['a'], callback, errors.append, .01)]
+        working = ConditionPoller(lambda: ['b'], found.append, None, .01)
+        for poller in failing + [working]:
+            poller.use_loop(self.loop)
+            poller.start()
+        wait_for(lambda: len(errors) == 2 and len(found) > 3)
+        self.assertEqual(sorted(type(e).__name__ for e in errors), ['IOError', 'ValueError'])
+        wait_for(lambda: len(self.loop) == 1)
+        self.assertTrue(working.is_alive())
+        self.assertFalse(any(poller.is_alive() for poller in failing))
+
+    def test_shared(self):
+        loop = get_polling_loop()
+        self.assertIs(get_polling_loop(), loop)
+        self.assertTrue(loop.running)
+        self.assertRaises(ValueError, PollingLoop, 0)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_profiler
+@file mi/core/test/test_profiler.py
+@author Bill French
+@brief Test cases for the driver process profiling commands.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import pstats
+import tempfile
+import threading
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentCommandException
+from mi.core.instrument.driver_process import DriverProcess
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+def busy_loop(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(range(100))
+
+
+@attr('UNIT', group='mi')
+class TestProfiler(MiUnitTest):
+
+    def setUp(self):
+        self.process = DriverProcess('module', 'class', None)
+
+    def _cmd(self, cmd, *args, **kwargs):
+        return self.process.cmd_driver({'cmd': cmd, 'args': args, 'kwargs': kwargs})
+
+    def test_statistical(self):
+        """
+        A statistical profile sees threads that were running before it started.
+        """
+        worker = threading.Thread(target=busy_loop, args=(.5, ), name='busy_worker')
+        worker.start()
+
+        self.assertEqual(self._cmd('start_profile', interval=.001), 'statistical')
+        self.assertIsInstance(self._cmd('start_profile'), InstrumentCommandException)
+        worker.join()
+        self.assertIsNone(self._cmd('stop_profile'))
+
+        report = self._cmd('dump_profile')
+        self.assertIn('busy_worker', report)
+        self.assertIn('busy_loop', report)
+
+        path = tempfile.mktemp()
+        self.addCleanup(os.remove, path)
+        self.assertEqual(self._cmd('dump_profile', path=path), path)
+        self.assertIn('busy_loop', open(path).read())
+
+    def test_deterministic(self):
+        self._cmd('start_profile', mode='deterministic')
+        busy_loop(.05)
+        self._cmd('stop_profile')
+        self.assertIn('busy_loop', self._cmd('dump_profile'))
+
+        path = tempfile.mktemp()
+        self.addCleanup(os.remove, path)
+        self._cmd('dump_profile', path=path)
+        self.assertTrue(pstats.Stats(path).total_calls > 0)
+
+    def test_errors(self):
+        self.assertIsInstance(self._cmd('stop_profile'), InstrumentCommandException)
+        self.assertIsInstance(self._cmd('dump_profile'), InstrumentCommandException)
+        self.assertIsInstance(self._cmd('start_profile', mode='bogus'), InstrumentCommandException)
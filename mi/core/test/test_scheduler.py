@@ -22,6 +22,7 @@ from mi.core.unit_test import MiUnitTest
 from mi.core.scheduler import PolledScheduler
 from mi.core.scheduler import PolledIntervalTrigger
 from mi.core.scheduler import PolledIntervalJob
+from mi.core.scheduler import SchedulerService
 from apscheduler.util import timedelta_seconds
 
 @attr('UNIT', group='mi')
@@ -367,3 +368,106 @@ class TestScheduler(MiUnitTest):
         self.assertFalse(job.ready_to_run())
         self.assert_datetime_close(next_time, now + max_interval)
 
+
+@attr('UNIT', group='mi')
+class TestSchedulerService(MiUnitTest):
+    """
+    Test the shared heap based scheduler service
+    """
+    def setUp(self):
+        self._service = SchedulerService()
+        self._service.start()
+        self._triggered = []
+        self.addCleanup(self._service.shutdown)
+
+    def _callback(self, tag=None):
+        self._triggered.append((tag, datetime.datetime.now()))
+
+    def _wait_for(self, count, timeout=5):
+        end = time.time() + timeout
+        while len(self._triggered) < count and time.time() < end:
+            time.sleep(.01)
+        self.assertGreaterEqual(len(self._triggered), count)
+
+    def test_date_job(self):
+        """
+        Jobs fire in deadline order regardless of the order they are added
+        and date jobs are dropped after they fire.
+        """
+        now = datetime.datetime.now()
+        self._service.add_date_job(self._callback, now + datetime.timedelta(seconds=.4), args=['b'])
+        self._service.add_date_job(self._callback, now + datetime.timedelta(seconds=.2), args=['a'])
+        self._wait_for(2)
+        self.assertEqual([t[0] for t in self._triggered], ['a', 'b'])
+        self.assertEqual(self._service.get_jobs(), [])
+
+        with self.assertRaisesRegexp(ValueError, 'Invalid date string'):
+            self._service.add_date_job(self._callback, 'foo')
+        with self.assertRaisesRegexp(ValueError, 'would never be run'):
+            self._service.add_date_job(self._callback, now - datetime.timedelta(seconds=1))
+
+    def test_interval_job(self):
+        job = self._service.add_interval_job(self._callback, seconds=.1)
+        self._wait_for(3)
+
+        stats = self._service.job_stats()['_callback']
+        self.assertGreaterEqual(stats['runs'], 3)
+        self.assertIsNotNone(stats['latency_mean'])
+        self.assertLess(stats['latency_max'], 1)
+
+        self._service.remove_job(job)
+        time.sleep(.2)
+        count = len(self._triggered)
+        time.sleep(.3)
+        self.assertEqual(len(self._triggered), count)
+
+        with self.assertRaises(KeyError):
+            self._service.remove_job(job)
+
+    def test_unschedule_func(self):
+        owner = object()
+        self._service.add_interval_job(self._callback, seconds=10, owner=owner)
+        self._service.add_interval_job(self._callback, seconds=10)
+        self._service.unschedule_func(self._callback, owner=owner)
+        self.assertEqual(len(self._service.get_jobs()), 1)
+
+        with self.assertRaises(KeyError):
+            self._service.unschedule_func(self._callback, owner=owner)
+
+    def test_polled_job(self):
+        """
+        Polled jobs run when polled after the minimum interval or on their
+        own after the maximum interval. Names are unique per owner.
+        """
+        min_interval = PolledScheduler.interval(seconds=.5)
+        max_interval = PolledScheduler.interval(seconds=1)
+        self._service.add_polled_job(self._callback, 'job', min_interval, max_interval, owner='a')
+        self._service.add_polled_job(self._callback, 'job', min_interval, owner='b')
+        with self.assertRaisesRegexp(ValueError, "job named 'job' already exists"):
+            self._service.add_polled_job(self._callback, 'job', min_interval, owner='a')
+        with self.assertRaisesRegexp(LookupError, 'no PolledIntervalJob found named'):
+            self._service.run_polled_job('job')
+
+        self.assertTrue(self._service.run_polled_job('job', owner='a'))
+        self._wait_for(1)
+        self.assertFalse(self._service.run_polled_job('job', owner='a'))
+
+        # triggered by the maximum interval
+        self._wait_for(2)
+        delta = self._triggered[1][1] - self._triggered[0][1]
+        self.assertAlmostEqual(timedelta_seconds(delta), 1, delta=.2)
+
+    def test_overlapping_runs_skipped(self):
+        """
+        A job is not started again while its previous run is going.
+        """
+        def slow():
+            self._triggered.append(None)
+            time.sleep(.35)
+
+        job = self._service.add_interval_job(slow, seconds=.1)
+        time.sleep(.5)
+        self._service.remove_job(job)
+        self.assertGreater(job.skipped, 0)
+        self.assertLessEqual(len(self._triggered), 2)
+
@@ -65,3 +65,13 @@ class TestTime(MiUnitTest):
             now = datetime.datetime.utcnow()
             self.assertLess(now.microsecond, 100)
             system_time.sleep(0.1)
+
+    def test_monotonic_time(self):
+        """
+        Test the monotonic clock only moves forward and tracks elapsed time
+        """
+        start = get_monotonic_time()
+        system_time.sleep(0.1)
+        elapsed = get_monotonic_time() - start
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 1.0)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_timeout
+@file mi/core/test/test_timeout.py
+@author Bill French
+@brief Test cases for the monotonic timeout service.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import time
+import socket
+import threading
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.timeout import TimeoutService, Deadline, monotonic_sleep, CALLBACK_WORKERS
+from mi.core.exceptions import InstrumentConnectionException
+from mi.core.instrument.port_agent_client import Listener, PortAgentClient
+from mi.core.instrument.port_agent_client import MAX_RECOVERY_ATTEMPTS
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+@attr('UNIT', group='mi')
+class TestTimeoutService(MiUnitTest):
+
+    def setUp(self):
+        self.service = TimeoutService()
+        self.service.start()
+        self.addCleanup(self.service.stop)
+        self.fired = []
+
+    def _callback(self, tag):
+        self.fired.append(tag)
+
+    def _wait_for(self, count, timeout=2):
+        deadline = Deadline(timeout)
+        while len(self.fired) < count and not deadline.expired():
+            time.sleep(.01)
+
+    def test_order_and_cancel(self):
+        self.service.call_later(.2, self._callback, 'b')
+        self.service.call_later(.1, self._callback, 'a')
+        handle = self.service.call_later(.15, self._callback, 'c')
+        handle.cancel()
+        handle.cancel()
+        self.assertEqual(self.service.pending(), 2)
+
+        self._wait_for(2)
+        time.sleep(.1)
+        self.assertEqual(self.fired, ['a', 'b'])
+        self.assertFalse(handle.active)
+        self.assertEqual(self.service.pending(), 0)
+
+    def test_restart(self):
+        """
+        A timeout restarted before it expires fires once, one delay after
+        the last restart, and can be re-armed after firing.
+        """
+        handle = self.service.call_later(.2, self._callback, 'x')
+        start = time.time()
+        for i in range(10):
+            time.sleep(.05)
+            handle.restart()
+        self._wait_for(1)
+        self.assertEqual(self.fired, ['x'])
+        self.assertGreaterEqual(time.time() - start, .65)
+        self.assertFalse(handle.active)
+
+        handle.restart(.05)
+        self._wait_for(2)
+        self.assertEqual(self.fired, ['x', 'x'])
+
+        # a cancelled timeout can be restarted with a shorter delay
+        handle.restart(1)
+        handle.cancel()
+        handle.restart(.05)
+        self._wait_for(3)
+        self.assertEqual(len(self.fired), 3)
+
+    def test_callback_does_not_block_service(self):
+        block = threading.Event()
+        self.service.call_later(.01, block.wait, 2)
+        self.service.call_later(.05, self._callback, 'after')
+        self._wait_for(1, timeout=1)
+        self.assertEqual(self.fired, ['after'])
+        block.set()
+
+    def test_blocking_callbacks(self):
+        """
+        More blocking callbacks than there are callback workers do not hold
+        up other timeouts.
+        """
+        block = threading.Event()
+        self.addCleanup(block.set)
+        for i in range(CALLBACK_WORKERS + 2):
+            self.service.call_later_blocking(.01, block.wait, 5)
+        self.service.call_later(.05, self._callback, 'heartbeat')
+        self._wait_for(1, timeout=1)
+        self.assertEqual(self.fired, ['heartbeat'])
+
+    def test_earlier_timeout_wakes_service(self):
+        """
+        A timeout armed to expire before the one the service is waiting
+        for fires on time, and callbacks run on the fixed worker pool.
+        """
+        self.service.call_later(5, self._callback, 'late')
+        time.sleep(.1)
+        threads = threading.active_count()
+        start = time.time()
+        for i in range(10):
+            self.service.call_later(.05, self._callback, i)
+        self._wait_for(10)
+        self.assertEqual(sorted(self.fired), range(10))
+        self.assertLess(time.time() - start, .5)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_deadline(self):
+        deadline = Deadline(.1)
+        self.assertFalse(deadline.expired())
+        self.assertGreater(deadline.remaining(), 0)
+        monotonic_sleep(.15)
+        self.assertTrue(deadline.expired())
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertGreaterEqual(deadline.elapsed(), .15)
+
+    def test_listener_heartbeat(self):
+        """
+        Heartbeats reset one handle instead of starting a Timer thread, and
+        missed heartbeats still count down.
+        """
+        listener = Listener(None, 0, heartbeat=1, max_missed_heartbeats=3)
+        listener.start_heartbeat_timer()
+        handle = listener.heartbeat_timer
+        threads = threading.active_count()
+        for i in range(20):
+            listener.start_heartbeat_timer()
+        self.assertIs(listener.heartbeat_timer, handle)
+        self.assertEqual(threading.active_count(), threads)
+
+        handle.restart(.05)
+        deadline = Deadline(1)
+        while listener.heartbeat_missed_count == 3 and not deadline.expired():
+            time.sleep(.01)
+        self.assertLess(listener.heartbeat_missed_count, 3)
+
+        listener.done()
+        self.assertFalse(listener.heartbeat_timer.active)
+
+
+@attr('UNIT', group='mi')
+class TestPortAgentRecovery(MiUnitTest):
+
+    def setUp(self):
+        # a port nothing listens on
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.client = PortAgentClient('localhost', port, None)
+        self.client.RECOVERY_SLEEP_TIME = .1
+        self.errors = []
+        self.client.user_callback_error = self.errors.append
+
+    def test_recovery_is_scheduled(self):
+        """
+        A recovery attempt does not block the caller, and the user error
+        callback is told once every attempt has failed.
+        """
+        start = time.time()
+        self.assertTrue(self.client.callback_error('lost'))
+        self.assertLess(time.time() - start, .1)
+
+        deadline = Deadline(5)
+        while not self.errors and not deadline.expired():
+            time.sleep(.01)
+        self.assertEqual(self.errors, ['lost'])
+        self.assertEqual(self.client.recovery_attempts, MAX_RECOVERY_ATTEMPTS)
+        self.assertFalse(self.client.callback_error('lost'))
+
+    def test_init_comms(self):
+        """
+        The first connection is retried before init_comms gives up.
+        """
+        with self.assertRaises(InstrumentConnectionException):
+            self.client.init_comms()
+        self.assertEqual(self.client.recovery_attempts, MAX_RECOVERY_ATTEMPTS)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_tracing
+@file mi/core/test/test_tracing.py
+@author Bill French
+@brief Test cases for sampled particle latency tracing.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+from nose.plugins.attrib import attr
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.tracing import ParticleTracer, TraceStage, ALL_STREAMS, percentile
+from mi.core.tracing import get_tracer
+from mi.core.instrument.driver_process import DriverProcess
+
+from mi.core.log import get_logger ; log = get_logger()
+
+
+@attr('UNIT', group='mi')
+class TestParticleTracer(MiUnitTest):
+
+    def _run_sample(self, tracer, timestamp, stream, evt):
+        tracer.packet_received(timestamp)
+        tracer.chunk_complete(timestamp)
+        tracer.particle_built(timestamp, stream)
+        tracer.json_encoded()
+        tracer.queued(evt)
+        tracer.sent(evt)
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 50), 51)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), None)
+
+    def test_disabled(self):
+        tracer = ParticleTracer()
+        self._run_sample(tracer, 1.0, 'ctd', {})
+        self.assertEqual(tracer.snapshot()['stages'], {})
+
+    def test_trace_stages(self):
+        tracer = ParticleTracer(sample_ratio=1.0)
+        for i in range(10):
+            self._run_sample(tracer, float(i), 'ctd' if i % 2 else 'adcp', {'n': i})
+
+        stages = tracer.snapshot()['stages']
+        for stage in [TraceStage.CHUNK_COMPLETE, TraceStage.PARTICLE_BUILT,
+                      TraceStage.JSON_ENCODED, TraceStage.QUEUED,
+                      TraceStage.SENT, TraceStage.TOTAL]:
+            self.assertEqual(stages[stage][ALL_STREAMS]['count'], 10)
+            self.assertEqual(stages[stage]['ctd']['count'], 5)
+            self.assertEqual(stages[stage]['adcp']['count'], 5)
+            self.assertGreaterEqual(stages[stage][ALL_STREAMS]['p99'], 0)
+        self.assertNotIn(TraceStage.PACKET_RECEIVED, stages)
+
+    def test_untraced_events(self):
+        """
+        Events without a particle on the queuing thread, and particles from
+        packets that were not sampled, are not traced.
+        """
+        tracer = ParticleTracer(sample_ratio=1.0)
+        tracer.queued({})
+        tracer.particle_built(5.0, 'ctd')
+        evt = {}
+        tracer.queued(evt)
+        tracer.sent(evt)
+        self.assertEqual(tracer.snapshot()['stages'], {})
+
+    def test_driver_process_commands(self):
+        process = DriverProcess('module', 'class', None)
+        self.assertEqual(process.cmd_driver({'cmd': 'set_trace_ratio', 'args': (0.5, ), 'kwargs': {}}), 0.5)
+        self.assertEqual(get_tracer().sample_ratio, 0.5)
+        stats = process.cmd_driver({'cmd': 'get_trace_stats', 'args': (), 'kwargs': {}})
+        self.assertEqual(stats['sample_ratio'], 0.5)
+        process.cmd_driver({'cmd': 'set_trace_ratio', 'args': (0, ), 'kwargs': {}})
+        self.assertEqual(get_tracer().sample_ratio, 0)
@@ -17,6 +17,35 @@ from mi.core.log import get_logger ; log = get_logger()
 
 import datetime
 import time
+import ctypes
+import ctypes.util
+import os
+
+CLOCK_MONOTONIC = 1
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    '''
+    Find clock_gettime in librt or libc.
+    @return: the ctypes function, or None if it is not available
+    '''
+    for name in ('rt', 'c'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        return clock_gettime
+    return None
+
+_clock_gettime = _load_clock_gettime()
 
 def get_timestamp_delayed(format):
     '''
@@ -64,3 +93,22 @@ def get_timestamp(format):
         raise ValueError
 
     return time.strftime(format, time.gmtime())
+
+
+def get_monotonic_time():
+    '''
+    Return seconds from an arbitrary, fixed starting point using a clock
+    that is not affected by system clock changes (NTP steps, manual
+    adjustments). Only differences between two values are meaningful.
+    Falls back to time.time() where CLOCK_MONOTONIC is not available.
+
+    @return: float seconds
+    '''
+    if _clock_gettime is None:
+        return time.time()
+
+    t = _timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return t.tv_sec + t.tv_nsec * 1e-9
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.timeout
+@file mi/core/timeout.py
+@author Bill French
+@brief Process wide timeout service and deadline helpers driven by the
+monotonic clock, so timeouts are not disturbed when NTP steps the wall
+clock.
+
+Usage:
+
+service = get_timeout_service()
+handle = service.call_later(5, some_callback, arg)
+handle.restart()    # push the expiry out another 5 seconds
+handle.cancel()
+
+# a callback that may block runs on a thread of its own
+service.call_later_blocking(2, reconnect)
+
+deadline = Deadline(10)
+while not deadline.expired():
+    ...
+"""
+
+from __future__ import absolute_import
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import atexit
+import heapq
+import itertools
+import threading
+import time
+import Queue
+
+from mi.core.time import get_monotonic_time
+from mi.core.log import get_logger ; log = get_logger()
+
+# Longest the service thread waits before looking at the heap again.
+# Condition.wait times out by the wall clock, so this bounds how late a
+# timeout can fire when NTP steps the clock back.
+MAX_WAIT = 1.0
+
+# Number of threads running expired callbacks that do not block.
+CALLBACK_WORKERS = 4
+
+
+class Deadline(object):
+    """
+    A point in monotonic time a given number of seconds from now.
+    """
+
+    def __init__(self, timeout):
+        """
+        @param timeout seconds from now
+        """
+        self.start = get_monotonic_time()
+        self.timeout = timeout
+        self.deadline = self.start + timeout
+
+    def elapsed(self):
+        return get_monotonic_time() - self.start
+
+    def remaining(self):
+        return max(0.0, self.deadline - get_monotonic_time())
+
+    def expired(self):
+        return get_monotonic_time() > self.deadline
+
+
+def monotonic_sleep(seconds):
+    """
+    Sleep for the given time as measured by the monotonic clock, resuming
+    if the sleep is cut short.
+    @param seconds time to sleep
+    """
+    deadline = get_monotonic_time() + seconds
+    remaining = seconds
+    while remaining > 0:
+        time.sleep(remaining)
+        remaining = deadline - get_monotonic_time()
+
+
+class TimeoutHandle(object):
+    """
+    A pending timeout returned by TimeoutService.call_later.
+    """
+
+    def __init__(self, service, delay, callback, args, kwargs, blocking=False):
+        self._service = service
+        self.delay = delay
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        # run on a thread of its own rather than a callback worker
+        self.blocking = blocking
+        self.deadline = None
+        self.cancelled = False
+        self.fired = False
+        # deadline of this handle's live heap entry
+        self._queued = None
+
+    @property
+    def active(self):
+        return not (self.cancelled or self.fired)
+
+    def restart(self, delay=None):
+        """
+        Re-arm the timeout to expire delay seconds from now, whether or not
+        it has already fired or been cancelled.
+        @param delay new delay, defaults to the original delay
+        """
+        if delay is not None:
+            self.delay = delay
+        self._service._arm(self, get_monotonic_time() + self.delay)
+
+    def cancel(self):
+        """
+        Stop the timeout from firing. Cancelling twice is harmless.
+        """
+        self.cancelled = True
+
+    def _fire(self):
+        try:
+            self.callback(*self.args, **self.kwargs)
+        except Exception:
+            log.exception('Timeout callback %r failed', self.callback)
+
+    def __repr__(self):
+        return '<%s %r in %ss>' % (self.__class__.__name__, self.callback, self.delay)
+
+
+class TimeoutService(object):
+    """
+    Holds every pending timeout of the process in one heap, serviced by a
+    single thread that sleeps until the earliest deadline and is woken when
+    a timeout is armed to expire sooner. Arming, restarting and cancelling
+    a timeout never creates a thread. Restarting only moves the handle's
+    deadline forward; the heap entry is refreshed lazily when the old
+    deadline comes up, so a timeout that is reset on every heartbeat costs
+    no heap operations.
+
+    Expired callbacks are run by a small fixed pool of worker threads, so
+    the service thread is never held up by one.  Callbacks that may block
+    for a long time, like port agent recovery, are armed with
+    call_later_blocking and each runs on a thread of its own, so however
+    many of them are running, heartbeat timeouts still fire on time.
+    """
+
+    def __init__(self, workers=CALLBACK_WORKERS):
+        """
+        @param workers number of threads running expired callbacks
+        """
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._heap = []
+        self._seq = itertools.count()
+        self._thread = None
+        self._expired = Queue.Queue()
+        self._worker_count = workers
+        self._workers = []
+        self.running = False
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self._thread = threading.Thread(target=self._run, name='TimeoutService')
+            self._thread.daemon = True
+            self._thread.start()
+            self._workers = [threading.Thread(target=self._run_callbacks, name='TimeoutService-callback')
+                             for i in range(self._worker_count)]
+            for worker in self._workers:
+                worker.daemon = True
+                worker.start()
+
+    def stop(self):
+        with self._lock:
+            self.running = False
+            self._wakeup.notify()
+            workers = self._workers
+            self._workers = []
+        # callbacks already expired still run
+        for worker in workers:
+            self._expired.put(None)
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(1)
+        self._thread = None
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        """
+        Call callback(*args, **kwargs) delay seconds from now.
+        @param delay seconds until the callback runs
+        @param callback callable to run
+        @retval a TimeoutHandle
+        """
+        handle = TimeoutHandle(self, delay, callback, args, kwargs)
+        self._arm(handle, get_monotonic_time() + delay)
+        return handle
+
+    def call_later_blocking(self, delay, callback, *args, **kwargs):
+        """
+        Call callback(*args, **kwargs) delay seconds from now on a thread of
+        its own, for callbacks that may block.
+        @param delay seconds until the callback runs
+        @param callback callable to run
+        @retval a TimeoutHandle
+        """
+        handle = TimeoutHandle(self, delay, callback, args, kwargs, blocking=True)
+        self._arm(handle, get_monotonic_time() + delay)
+        return handle
+
+    def pending(self):
+        """
+        @retval number of armed timeouts
+        """
+        with self._lock:
+            return len([entry for entry in self._heap
+                        if entry[2].active and entry[0] == entry[2]._queued])
+
+    def _arm(self, handle, deadline):
+        with self._lock:
+            handle.deadline = deadline
+            handle.cancelled = False
+            handle.fired = False
+            # A later deadline reuses the queued entry; it is pushed back
+            # with the new deadline when the old one comes up.
+            if handle._queued is None or deadline < handle._queued:
+                handle._queued = deadline
+                heapq.heappush(self._heap, (deadline, next(self._seq), handle))
+                if self._heap[0][2] is handle:
+                    self._wakeup.notify()
+
+    def _pop_expired(self, now):
+        """
+        Called with the lock held.
+        @retval list of handles due at now, dropping or requeuing stale
+        heap entries on the way.
+        """
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            (deadline, seq, handle) = heapq.heappop(self._heap)
+            if deadline != handle._queued:
+                continue
+            handle._queued = None
+            if not handle.active:
+                continue
+            if handle.deadline > deadline:
+                handle._queued = handle.deadline
+                heapq.heappush(self._heap, (handle.deadline, next(self._seq), handle))
+                continue
+            handle.fired = True
+            expired.append(handle)
+        return expired
+
+    def _next_wait(self, now):
+        """
+        Called with the lock held.
+        @retval seconds to wait for the earliest deadline
+        """
+        if not self._heap:
+            return MAX_WAIT
+        return max(0.0, min(MAX_WAIT, self._heap[0][0] - now))
+
+    def _run(self):
+        with self._lock:
+            while self.running:
+                for handle in self._pop_expired(get_monotonic_time()):
+                    if handle.blocking:
+                        thread = threading.Thread(target=handle._fire, name='TimeoutService-blocking')
+                        thread.daemon = True
+                        thread.start()
+                    else:
+                        self._expired.put(handle)
+                self._wakeup.wait(self._next_wait(get_monotonic_time()))
+
+    def _run_callbacks(self):
+        """
+        Run expired callbacks until a None sentinel is received.
+        """
+        while True:
+            handle = self._expired.get()
+            if handle is None:
+                break
+            handle._fire()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_timeout_service():
+    """
+    @retval the started TimeoutService shared by the process
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TimeoutService()
+            _service.start()
+            atexit.register(_service.stop)
+    return _service
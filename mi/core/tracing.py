@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.tracing
+@file mi/core/tracing.py
+@author Bill French
+@brief Sampled end to end latency tracing of instrument samples, from
+port agent packet receipt to the event leaving the driver process.
+"""
+
+__author__ = 'Bill French'
+__license__ = 'Apache 2.0'
+
+import random
+import threading
+from collections import deque, OrderedDict
+
+from mi.core.common import BaseEnum
+from mi.core.time import get_monotonic_time
+from mi.core.log import get_logger ; log = get_logger()
+
+# Default number of samples kept per stage and stream for percentiles.
+DEFAULT_WINDOW = 1000
+
+# Maximum number of sampled packets awaiting particles.
+MAX_PENDING = 1000
+
+# Key used for the statistics over all streams.
+ALL_STREAMS = 'all'
+
+
+class TraceStage(BaseEnum):
+    """
+    Pipeline stages, in order. The latency reported for a stage is the
+    time from the previous stamped stage.
+    """
+    PACKET_RECEIVED = 'packet_received'
+    CHUNK_COMPLETE = 'chunk_complete'
+    PARTICLE_BUILT = 'particle_built'
+    JSON_ENCODED = 'json_encoded'
+    QUEUED = 'queued'
+    SENT = 'sent'
+    TOTAL = 'total'
+
+STAGE_ORDER = [TraceStage.PACKET_RECEIVED,
+               TraceStage.CHUNK_COMPLETE,
+               TraceStage.PARTICLE_BUILT,
+               TraceStage.JSON_ENCODED,
+               TraceStage.QUEUED,
+               TraceStage.SENT]
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest rank percentile.
+    @param sorted_values ascending list of values
+    @param pct percentile, 0 - 100
+    @retval value or None if the list is empty
+    """
+    if not sorted_values:
+        return None
+    index = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class ParticleTracer(object):
+    """
+    Follows a sampled subset of port agent packets through the driver.
+    Packets are identified by their port agent timestamp, which the
+    chunker and data particles carry along, until a particle is built.
+    From there the trace follows the particle on the building thread and
+    then the event object it is queued in. All stages are stamped with
+    a monotonic clock.
+
+    With a sample ratio of 0 every hook returns immediately.
+    """
+
+    def __init__(self, sample_ratio=0.0, window=DEFAULT_WINDOW):
+        """
+        @param sample_ratio fraction of packets to trace, 0 - 1.
+        @param window number of samples kept for each percentile.
+        """
+        self.sample_ratio = sample_ratio
+        self.window = window
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending_packets = OrderedDict()
+        self._pending_events = {}
+        self._samples = {}
+
+    def set_sample_ratio(self, sample_ratio):
+        """
+        Change the fraction of packets traced. 0 disables tracing and
+        drops traces in flight.
+        @param sample_ratio fraction of packets to trace, 0 - 1.
+        """
+        self.sample_ratio = max(0.0, min(1.0, float(sample_ratio or 0)))
+        if not self.sample_ratio:
+            with self._lock:
+                self._pending_packets.clear()
+                self._pending_events.clear()
+
+    def packet_received(self, timestamp):
+        """
+        Stamp receipt of a port agent data packet, if it is sampled.
+        @param timestamp port agent timestamp of the packet
+        """
+        if not self.sample_ratio or random.random() >= self.sample_ratio:
+            return
+        with self._lock:
+            self._pending_packets[timestamp] = {TraceStage.PACKET_RECEIVED: get_monotonic_time()}
+            while len(self._pending_packets) > MAX_PENDING:
+                self._pending_packets.popitem(last=False)
+
+    def chunk_complete(self, timestamp):
+        """
+        Stamp a complete chunk from a sampled packet.
+        @param timestamp port agent timestamp of the chunk
+        """
+        if not self._pending_packets:
+            return
+        trace = self._pending_packets.get(timestamp)
+        if trace is not None:
+            trace[TraceStage.CHUNK_COMPLETE] = get_monotonic_time()
+
+    def particle_built(self, timestamp, stream):
+        """
+        Stamp construction of a particle from a sampled packet and make it
+        the current trace of this thread.
+        @param timestamp port timestamp of the particle
+        @param stream particle stream name
+        """
+        self._local.trace = None
+        if not self._pending_packets:
+            return
+        trace = self._pending_packets.get(timestamp)
+        if trace is not None:
+            # One packet may produce several particles, each traced on
+            # its own from here.
+            trace = dict(trace)
+            trace['stream'] = stream
+            trace[TraceStage.PARTICLE_BUILT] = get_monotonic_time()
+            self._local.trace = trace
+
+    def json_encoded(self):
+        """
+        Stamp JSON encoding of this thread's current particle.
+        """
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace[TraceStage.JSON_ENCODED] = get_monotonic_time()
+
+    def queued(self, evt):
+        """
+        Stamp queuing of the event carrying this thread's current particle.
+        @param evt the event queued for sending
+        """
+        trace = getattr(self._local, 'trace', None)
+        if trace is None:
+            return
+        self._local.trace = None
+        trace[TraceStage.QUEUED] = get_monotonic_time()
+        with self._lock:
+            self._pending_events[id(evt)] = trace
+
+    def sent(self, evt):
+        """
+        Stamp sending of a traced event and record its stage latencies.
+        @param evt the event sent
+        """
+        if not self._pending_events:
+            return
+        with self._lock:
+            trace = self._pending_events.pop(id(evt), None)
+        if trace is not None:
+            trace[TraceStage.SENT] = get_monotonic_time()
+            self._record(trace)
+
+    def _record(self, trace):
+        """
+        Add the stage latencies of a completed trace to the rolling windows.
+        """
+        stream = trace['stream']
+        previous = None
+        with self._lock:
+            for stage in STAGE_ORDER:
+                if stage not in trace:
+                    continue
+                if previous is not None:
+                    self._add_sample(stage, stream, trace[stage] - trace[previous])
+                previous = stage
+            first = [trace[s] for s in STAGE_ORDER if s in trace][0]
+            self._add_sample(TraceStage.TOTAL, stream, trace[TraceStage.SENT] - first)
+
+    def _add_sample(self, stage, stream, value):
+        for key in ((stage, stream), (stage, ALL_STREAMS)):
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(value)
+
+    def snapshot(self):
+        """
+        @retval dict {stage: {stream: {'count', 'p50', 'p95', 'p99', 'max'}}}
+        of latencies in seconds, with ALL_STREAMS covering every stream.
+        """
+        with self._lock:
+            items = [(key, sorted(samples)) for (key, samples) in self._samples.items()]
+
+        result = {'sample_ratio': self.sample_ratio, 'stages': {}}
+        for ((stage, stream), values) in items:
+            result['stages'].setdefault(stage, {})[stream] = {
+                'count': len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': values[-1] if values else None
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+
+_tracer = ParticleTracer()
+
+
+def get_tracer():
+    """
+    @retval the process wide ParticleTracer
+    """
+    return _tracer
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.compressed_file
+@file mi/dataset/compressed_file.py
+@author Steve Foley
+@brief Read gzip, bz2 and xz compressed data set files as if they were
+not compressed, decompressing them as they are read.
+"""
+
+__author__ = 'Steve Foley'
+__license__ = 'Apache 2.0'
+
+import os
+import bz2
+import zlib
+from bisect import bisect_right
+from collections import namedtuple
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.exceptions import DatasetParserException, ConfigurationException
+
+# compressed data is read this much at a time, and no more than this much
+# is decompressed from it at once where the codec allows
+READ_SIZE = 64 * 1024
+
+# decompressed bytes between the seek points kept for codecs whose
+# decompressor state can be copied
+SEEK_POINT_SPACING = 4 * 1024 * 1024
+
+def _gzip_decompressor():
+    # the window bits ask for a gzip header and trailer
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+def _bz2_decompressor():
+    return bz2.BZ2Decompressor()
+
+def _xz_decompressor():
+    if lzma is None:
+        raise ConfigurationException("Reading xz files needs the lzma module (backports.lzma)")
+    return lzma.LZMADecompressor()
+
+COMPRESSED_SUFFIXES = {
+    '.gz': _gzip_decompressor,
+    '.bz2': _bz2_decompressor,
+    '.xz': _xz_decompressor,
+}
+
+# where decoding can start again: the decompressed position, the offset in
+# the compressed file and a decompressor to copy, None for a new one
+SeekPoint = namedtuple('SeekPoint', ['position', 'offset', 'decompressor'])
+
+def is_compressed(name):
+    """
+    @param name A file name
+    @retval True if the name has a compressed file suffix
+    """
+    return os.path.splitext(name)[1] in COMPRESSED_SUFFIXES
+
+def open_data_file(name, mode='rb'):
+    """
+    Open a data set file, decompressing it as it is read if its name has a
+    compressed file suffix.
+    @param name The file name
+    @param mode The mode to open an uncompressed file with
+    @retval A file, or a CompressedFile
+    """
+    if is_compressed(name):
+        return CompressedFile(name)
+    return open(name, mode)
+
+class CompressedFile(object):
+    """
+    Read only file-like object over a compressed file, whose read(),
+    readline(), tell() and seek() work with decompressed positions, so
+    parsers read and resume in it as in the uncompressed file.  Only a
+    block of decompressed data is held at a time.  Files of several
+    concatenated streams, as written by pigz or pbzip2, are read through.
+
+    Seeking forward decompresses and discards what it skips.  Seeking back
+    starts again from the nearest seek point before the position: the
+    start of each stream in the file and, for gzip, a copy of the
+    decompressor every seek_point_spacing decompressed bytes.  The seek
+    points are kept for as long as the file is open.
+
+    There is no file descriptor, so parsers read it in blocks rather than
+    mapping it, and do not split it into ranges.
+    """
+    def __init__(self, name, read_size=READ_SIZE, seek_point_spacing=SEEK_POINT_SPACING):
+        """
+        @param name The compressed file
+        @param read_size Bytes of compressed data read at a time
+        @param seek_point_spacing Decompressed bytes between gzip seek points
+        @throws ConfigurationException if the codec is not available
+        """
+        self.name = name
+        self.mode = 'rb'
+        self._new_decompressor = COMPRESSED_SUFFIXES[os.path.splitext(name)[1]]
+        self._read_size = read_size
+        self._seek_point_spacing = seek_point_spacing
+        self._file = open(name, 'rb')
+        self._points = [SeekPoint(0, 0, None)]
+        self._restore(self._points[0])
+
+    def _restore(self, point):
+        """
+        Start decoding again from a seek point.
+        """
+        self._file.seek(point.offset)
+        if point.decompressor is None:
+            self._decompressor = self._new_decompressor()
+        else:
+            # copy again so the seek point can be used again
+            self._decompressor = point.decompressor.copy()
+        # compressed data read and not yet decompressed
+        self._input = ''
+        # decompressed data not yet read, starting at _buffer_start
+        self._buffer = ''
+        self._buffer_start = point.position
+        self._position = point.position
+        self._eof = False
+
+    def _add_seek_point(self, point):
+        if point.position > self._points[-1].position:
+            self._points.append(point)
+
+    def _decoded(self):
+        """
+        @retval decompressed position of the end of the buffer
+        """
+        return self._buffer_start + len(self._buffer)
+
+    def _input_offset(self):
+        """
+        @retval offset in the compressed file of the next input to decompress
+        """
+        return self._file.tell() - len(self._input)
+
+    def _decode(self):
+        """
+        Decompress some more data into the buffer.
+        @retval False at the end of the file
+        @throws DatasetParserException if the data is corrupt
+        """
+        if not self._input:
+            if self._eof:
+                return False
+            self._input = self._file.read(self._read_size)
+            if not self._input:
+                self._eof = True
+                return False
+
+        data = self._input
+        self._input = ''
+        try:
+            if hasattr(self._decompressor, 'unconsumed_tail'):
+                # zlib can hold back output, which keeps memory bounded
+                output = self._decompressor.decompress(data, self._read_size)
+                self._input = self._decompressor.unconsumed_tail
+            else:
+                output = self._decompressor.decompress(data)
+        except EOFError:
+            # the stream ended with the last input, this is the next one
+            self._input = data
+            self._decompressor = self._new_decompressor()
+            self._add_seek_point(SeekPoint(self._decoded(), self._input_offset(), None))
+            return True
+        except (IOError, zlib.error) as e:
+            raise DatasetParserException("Corrupt compressed data in %s at %d: %s" %
+                                         (self.name, self._input_offset(), e))
+
+        self._buffer += output
+        unused = getattr(self._decompressor, 'unused_data', '')
+        if unused:
+            # the stream ended part way through the input, which zlib also
+            # leaves in unconsumed_tail
+            self._input = unused
+            self._decompressor = self._new_decompressor()
+            self._add_seek_point(SeekPoint(self._decoded(), self._input_offset(), None))
+        elif (hasattr(self._decompressor, 'copy') and
+              self._decoded() - self._points[-1].position >= self._seek_point_spacing):
+            self._add_seek_point(SeekPoint(self._decoded(), self._input_offset(), self._decompressor.copy()))
+        return True
+
+    def _compact(self):
+        """
+        Drop data that has been read from the front of the buffer.
+        """
+        if self._position - self._buffer_start >= self._read_size:
+            self._buffer = self._buffer[self._position - self._buffer_start:]
+            self._buffer_start = self._position
+
+    def _skip_to(self, position):
+        """
+        Decompress up to a position, discarding what is not needed.
+        """
+        while self._decoded() < position and self._decode():
+            if self._decoded() <= position:
+                self._buffer_start = self._decoded()
+                self._buffer = ''
+        self._position = position
+        self._compact()
+
+    def read(self, size=-1):
+        """
+        @param size Most bytes to read, all the rest if negative
+        @retval the decompressed data, '' at the end of the file
+        """
+        self._check_open()
+        if size is None or size < 0:
+            while self._decode():
+                pass
+            size = max(self._decoded() - self._position, 0)
+        while self._decoded() - self._position < size and self._decode():
+            pass
+        start = self._position - self._buffer_start
+        data = self._buffer[start:start + size]
+        self._position += len(data)
+        self._compact()
+        return data
+
+    def readline(self, size=-1):
+        """
+        @param size Most bytes to read, no limit if negative
+        @retval the next line, with its newline
+        """
+        self._check_open()
+        start = self._position - self._buffer_start
+        search_from = start
+        while True:
+            end = self._buffer.find('\n', search_from)
+            if end >= 0:
+                end += 1
+                break
+            search_from = len(self._buffer)
+            if size is not None and 0 <= size <= search_from - start:
+                end = len(self._buffer)
+                break
+            if not self._decode():
+                end = len(self._buffer)
+                break
+        if size is not None and size >= 0:
+            end = min(end, start + size)
+        data = self._buffer[start:end]
+        self._position += len(data)
+        self._compact()
+        return data
+
+    def readlines(self):
+        return list(self)
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+    def tell(self):
+        self._check_open()
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Move to a decompressed position.
+        @param offset The position
+        @param whence os.SEEK_SET, os.SEEK_CUR or os.SEEK_END, as for files
+        """
+        self._check_open()
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            # find the end without holding on to the data
+            while self._decode():
+                self._buffer_start = self._decoded()
+                self._buffer = ''
+            offset += self._decoded()
+        elif whence != os.SEEK_SET:
+            raise IOError("Invalid whence (%s)" % whence)
+        if offset < 0:
+            raise IOError("Invalid offset %d" % offset)
+
+        point = self._points[bisect_right([p.position for p in self._points], offset) - 1]
+        if offset < self._buffer_start or point.position > self._decoded():
+            self._restore(point)
+        if offset <= self._decoded():
+            self._position = offset
+            self._compact()
+        else:
+            self._skip_to(offset)
+
+    def _check_open(self):
+        if self._file.closed:
+            raise ValueError("I/O operation on closed file")
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self._file.close()
+        self._buffer = ''
+        self._points = self._points[:1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
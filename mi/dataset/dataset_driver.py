@@ -10,7 +10,14 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import os
+import json
+import time
+import Queue
 import gevent
+import multiprocessing
+from itertools import islice
+from collections import deque
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import InstrumentParameterException
@@ -24,11 +31,15 @@ from mi.core.instrument.protocol_param_dict import ProtocolParameterDict
 from mi.core.instrument.protocol_param_dict import ParameterDictType
 from mi.core.instrument.protocol_param_dict import Parameter
 from mi.core.common import BaseEnum
+from mi.core.time import get_monotonic_time
+from mi.dataset.harvester import CatalogFileStatus, TailWindow
+from mi.dataset.compressed_file import open_data_file
 
 class DataSourceConfigKey(BaseEnum):
     HARVESTER = 'harvester'
     PARSER = 'parser'
     DRIVER = 'driver'
+    CHECKPOINT = 'checkpoint'
 
 # Driver parameters.
 class DriverParameter(BaseEnum):
@@ -36,6 +47,19 @@ class DriverParameter(BaseEnum):
     RECORDS_PER_SECOND = 'records_per_second'
     PUBLISHER_POLLING_INTERVAL = 'publisher_polling_interval'
     BATCHED_PARTICLE_COUNT = 'batched_particle_count'
+    PARSER_POOL_SIZE = 'parser_pool_size'
+    PARSER_QUEUE_DEPTH = 'parser_queue_depth'
+    CHECKPOINT_COUNT = 'checkpoint_count'
+    CHECKPOINT_INTERVAL = 'checkpoint_interval'
+    BURST_SIZE = 'burst_size'
+
+class PublisherStatusKey(BaseEnum):
+    """
+    Keys of the publisher status reported by SimpleDataSetDriver
+    """
+    RATE = 'rate'
+    PUBLISHED = 'published'
+    BACKLOG = 'backlog'
 
 class DataSourceLocation(object):
     """
@@ -74,12 +98,193 @@ class DataSourceLocation(object):
             self.parser_position = parser_position
             return
 
+class TokenBucket(object):
+    """
+    Rate limit for publishing that allows bursts.  Tokens build up at rate
+    per second to at most burst, each record published takes one.  Taking
+    more tokens than there are puts the bucket in debt, which is only slept
+    off once it is worth min_sleep seconds, so a steady rate is kept
+    without a sleep for every record.  A rate of None or 0 is unlimited.
+    """
+    # seconds the achieved rate is measured over
+    RATE_WINDOW = 10
+
+    def __init__(self, rate=None, burst=1, min_sleep=0.01, clock=get_monotonic_time):
+        """
+        @param rate records per second, None or 0 for no limit
+        @param burst most records published without a wait
+        @param min_sleep shortest wait returned by take()
+        @param clock function returning the time in seconds
+        """
+        self._clock = clock
+        self._min_sleep = min_sleep
+        self._taken = deque()
+        self.published = 0
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst):
+        """
+        Set the rate and burst, starting with a full bucket.
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last = self._clock()
+
+    def take(self, count):
+        """
+        Take tokens for records published.
+        @param count number of records
+        @retval seconds to wait before publishing more, 0 for none
+        """
+        now = self._clock()
+        self.published += count
+        self._taken.append((now, count))
+        while self._taken[0][0] < now - self.RATE_WINDOW:
+            self._taken.popleft()
+
+        if not self._rate:
+            return 0
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate) - count
+        self._last = now
+        wait = -self._tokens / float(self._rate)
+        if wait < self._min_sleep:
+            return 0
+        return wait
+
+    def rate(self):
+        """
+        @retval records per second published over the last RATE_WINDOW
+        seconds
+        """
+        now = self._clock()
+        while self._taken and self._taken[0][0] < now - self.RATE_WINDOW:
+            self._taken.popleft()
+        if not self._taken:
+            return 0.0
+        elapsed = max(now - self._taken[0][0], self._min_sleep)
+        return sum(count for (when, count) in self._taken) / elapsed
+
+class StateCheckpoint(object):
+    """
+    Coalesces driver state updates into checkpoints.  A checkpoint is taken
+    once count updates are waiting, or once the first of them has waited
+    interval seconds, so the state persisted is never further behind what
+    has been published than that.  The interval is checked on each update,
+    so a publisher that does not yield still takes checkpoints; a timer
+    only takes the last one once updates stop.  With a state file path each
+    checkpoint is written to a temporary file, synced and renamed over the
+    state file, so the file always holds a whole state, before it is passed
+    on to the callback.
+    """
+    def __init__(self, callback, path=None, count=1, interval=None, clock=get_monotonic_time):
+        """
+        @param callback called with each state checkpointed
+        @param path local file to persist states in, None to only call back
+        @param count number of updates to coalesce
+        @param interval longest time in seconds to hold an update, None for
+            no limit
+        @param clock function returning a monotonic time in seconds
+        """
+        self._callback = callback
+        self._path = path
+        self._count = count
+        self._interval = interval
+        self._clock = clock
+        self._state = None
+        self._pending = 0
+        # when the first of the pending updates was made
+        self._first_pending = None
+        self._timer = None
+
+    def configure(self, count, interval):
+        """
+        Change how updates are coalesced, taking a checkpoint now if the
+        waiting updates are already due.
+        """
+        self._count = count
+        self._interval = interval
+        if self._due(self._clock()):
+            self.flush()
+
+    def load(self):
+        """
+        @retval the last state persisted in the state file, None if there
+        is none
+        """
+        if self._path is None or not os.path.exists(self._path):
+            return None
+        with open(self._path) as f:
+            return json.load(f)
+
+    def update(self, state):
+        """
+        Set the latest state, taking a checkpoint if one is due.
+        @param state driver state
+        """
+        now = self._clock()
+        if not self._pending:
+            self._first_pending = now
+        self._state = state
+        self._pending += 1
+        if self._due(now):
+            self.flush()
+        elif self._timer is None and self._interval:
+            self._timer = gevent.spawn_later(self._first_pending + self._interval - now, self._timed_flush)
+
+    def _due(self, now):
+        """
+        @retval True if the pending updates are due a checkpoint
+        """
+        if not self._pending:
+            return False
+        return self._pending >= self._count or \
+            bool(self._interval and now - self._first_pending >= self._interval)
+
+    def flush(self):
+        """
+        Take a checkpoint of the latest state if it has not been.
+        """
+        if self._timer is not None:
+            if self._timer is not gevent.getcurrent():
+                self._timer.kill(block=False)
+            self._timer = None
+        if not self._pending:
+            return
+        if self._path is not None:
+            self._write(self._state)
+        self._pending = 0
+        self._callback(self._state)
+
+    def _timed_flush(self):
+        self._timer = None
+        self.flush()
+
+    def _write(self, state):
+        """
+        Replace the state file with a new state.
+        """
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, self._path)
+        # sync the directory too, or the rename may not survive a crash
+        fd = os.open(os.path.dirname(os.path.abspath(self._path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
 class DataSetDriverConfigKeys(BaseEnum):
     PARTICLE_MODULE = "particle_module"
     PARTICLE_CLASS = "particle_class"
     DIRECTORY = "directory"
     PATTERN = "pattern"
     FREQUENCY = "frequency"
+    INOTIFY = "inotify"
+    CATALOG = "catalog"
     HARVESTER = "harvester"
     PARSER = "parser"
     MODULE = "module"
@@ -101,27 +306,70 @@ class DataSetDriver(object):
     
     Configurations should contain keys from the DataSetDriverConfigKey class
     and should look something like this example (more full documentation in the
-    "Dataset Agent Architecture" page on the OOI wiki):
+    "Dataset Agent Architecture" page on the OOI wiki).  The harvester
+    'frequency' is seconds between checks, or a dict such as
+    {'min': 1, 'max': 600, 'backoff': 2, 'jitter': 0.1} to poll quickly
+    while data arrives and back off while it does not.  With 'shared_loop'
+    set the harvester is checked on the one polling loop thread the process
+    shares between harvesters, rather than a thread of its own.  Files
+    matching the 'pattern' with a .gz, .bz2 or .xz suffix are decompressed
+    as they are parsed, with positions in the decompressed data.  The parser
+    'read_mode' is one of the dataset_parser.ReadMode values, with
+    'decode_processes' above 1 large files are split into ranges of at
+    least 'range_size' bytes decoded in that many processes.  With 'index'
+    set, to a sidecar path or True for <file>.idx, the parser indexes the
+    records it parses so it can seek to a record or time.  States are
+    saved every 'checkpoint_count' updates, or 'checkpoint_interval'
+    seconds after an update, and persisted in the optional 'checkpoint'
+    state file, which is read on startup when there is no memento.
+    Records are published in batches of 'batched_particle_count' at
+    'records_per_second', 0 for no limit, with bursts of up to
+    'burst_size' records:
     {
         'harvester':
         {
             'directory': '/tmp/dsatest',
             'pattern': '*.txt',
             'frequency': 1,
+            'inotify': True,
+            'shared_loop': True,
+            'catalog': '/tmp/dsatest_catalog.db',
+        },
+        'parser': {
+            'read_mode': 'mmap',
+            'block_size': 65536,
+            'max_block_size': 4194304,
+            'decode_processes': 4,
+            'range_size': 4194304,
+            'index': True,
         },
-        'parser': {}
         'driver': {
             'records_per_second'
+            'burst_size'
             'harvester_polling_interval'
             'batched_particle_count'
-        }
+            'parser_pool_size'
+            'parser_queue_depth'
+            'checkpoint_count'
+            'checkpoint_interval'
+        },
+        'checkpoint': '/tmp/dsatest_state.json',
     }
     """
+    # True if the files of the driver can be parsed in the parser pool: its
+    # new file queue holds (file handle, file name) tuples and its parser
+    # implements iter_records.  Other drivers reject a parser pool size > 1.
+    _parser_pool_supported = False
+
     def __init__(self, config, memento, data_callback, state_callback, exception_callback):
         self._config = config
         self._data_callback = data_callback
         self._state_callback = state_callback
         self._exception_callback = exception_callback
+        self._checkpoint = StateCheckpoint(state_callback, config.get(DataSourceConfigKey.CHECKPOINT))
+        self._rate_limit = TokenBucket()
+        if memento is None:
+            memento = self._checkpoint.load()
         self._memento = memento
         self._publisher_thread = None
 
@@ -132,6 +380,8 @@ class DataSetDriver(object):
         self._polling_interval = None
         self._generate_particle_count = None
         self._particle_count_per_second = None
+        self._parser_pool_size = None
+        self._parser_queue_depth = None
 
         self._build_param_dict()
 
@@ -153,6 +403,7 @@ class DataSetDriver(object):
 
         self._stop_sampling()
         self._stop_publisher_thread()
+        self._checkpoint.flush()
 
     def _start_sampling(self):
         raise NotImplementedException('virtual methond needs to be specialized')
@@ -217,13 +468,22 @@ class DataSetDriver(object):
 
         log.trace("set_resource: iterate through params: %s", params)
         for (key, val) in params.iteritems():
-            if key in [DriverParameter.BATCHED_PARTICLE_COUNT, DriverParameter.RECORDS_PER_SECOND]:
+            if key in [DriverParameter.BATCHED_PARTICLE_COUNT, DriverParameter.RECORDS_PER_SECOND,
+                       DriverParameter.PARSER_POOL_SIZE, DriverParameter.PARSER_QUEUE_DEPTH]:
                 if not isinstance(val, int): raise InstrumentParameterException("%s must be an integer" % key)
-            if key in [DriverParameter.PUBLISHER_POLLING_INTERVAL]:
+            if key in [DriverParameter.CHECKPOINT_COUNT, DriverParameter.BURST_SIZE]:
+                if not isinstance(val, int): raise InstrumentParameterException("%s must be an integer" % key)
+            if key in [DriverParameter.PUBLISHER_POLLING_INTERVAL, DriverParameter.CHECKPOINT_INTERVAL]:
                 if not isinstance(val, (int, float)): raise InstrumentParameterException("%s must be an float" % key)
 
-            if val <= 0:
+            # 0 records per second publishes without a limit
+            if key == DriverParameter.RECORDS_PER_SECOND and val == 0:
+                pass
+            elif val <= 0:
                 raise InstrumentParameterException("%s must be > 0" % key)
+            if key == DriverParameter.PARSER_POOL_SIZE and val > 1 and not self._parser_pool_supported:
+                raise InstrumentParameterException("%s can not parse files in a parser pool" %
+                                                   self.__class__.__name__)
 
             self._param_dict.set_value(key, val)
 
@@ -231,6 +491,12 @@ class DataSetDriver(object):
         self._generate_particle_count = self._param_dict.get(DriverParameter.BATCHED_PARTICLE_COUNT)
         self._particle_count_per_second = self._param_dict.get(DriverParameter.RECORDS_PER_SECOND)
         self._polling_interval = self._param_dict.get(DriverParameter.PUBLISHER_POLLING_INTERVAL)
+        self._parser_pool_size = self._param_dict.get(DriverParameter.PARSER_POOL_SIZE)
+        self._parser_queue_depth = self._param_dict.get(DriverParameter.PARSER_QUEUE_DEPTH)
+        self._checkpoint.configure(self._param_dict.get(DriverParameter.CHECKPOINT_COUNT),
+                                   self._param_dict.get(DriverParameter.CHECKPOINT_INTERVAL))
+        self._rate_limit.configure(self._particle_count_per_second,
+                                   self._param_dict.get(DriverParameter.BURST_SIZE))
         log.trace("Driver Parameters: %s, %s, %s", self._polling_interval, self._particle_count_per_second, self._generate_particle_count)
 
     def get_resource(self, *args, **kwargs):
@@ -285,7 +551,17 @@ class DataSetDriver(object):
                 value=60,
                 type=ParameterDictType.INT,
                 display_name="Records Per Second",
-                description="Number of records to process per second")
+                description="Number of records to process per second, 0 for no limit")
+        )
+
+        self._param_dict.add_parameter(
+            Parameter(
+                DriverParameter.BURST_SIZE,
+                int,
+                value=1,
+                type=ParameterDictType.INT,
+                display_name="Burst Size",
+                description="Number of records that can be published at once above the records per second")
         )
 
         self._param_dict.add_parameter(
@@ -308,6 +584,46 @@ class DataSetDriver(object):
                 description="Number of particles to batch before sending to the agent")
         )
 
+        self._param_dict.add_parameter(
+            Parameter(
+                DriverParameter.PARSER_POOL_SIZE,
+                int,
+                value=1,
+                type=ParameterDictType.INT,
+                display_name="Parser Pool Size",
+                description="Number of processes parsing files, 1 parses them in the driver")
+        )
+
+        self._param_dict.add_parameter(
+            Parameter(
+                DriverParameter.PARSER_QUEUE_DEPTH,
+                int,
+                value=4,
+                type=ParameterDictType.INT,
+                display_name="Parser Queue Depth",
+                description="Number of files parsed ahead of publishing")
+        )
+
+        self._param_dict.add_parameter(
+            Parameter(
+                DriverParameter.CHECKPOINT_COUNT,
+                int,
+                value=1,
+                type=ParameterDictType.INT,
+                display_name="Checkpoint Count",
+                description="Number of state updates to coalesce into one saved state")
+        )
+
+        self._param_dict.add_parameter(
+            Parameter(
+                DriverParameter.CHECKPOINT_INTERVAL,
+                float,
+                value=1,
+                type=ParameterDictType.FLOAT,
+                display_name="Checkpoint Interval",
+                description="Longest time in seconds a state update waits to be saved")
+        )
+
         config = self._config.get(DataSourceConfigKey.DRIVER, {})
         log.debug("set_resource on startup with: %s", config)
         self.set_resource(config)
@@ -335,6 +651,8 @@ class DataSetDriver(object):
                 gevent.sleep(self._polling_interval)
         except Exception as e:
             log.error("Exception in publisher thread: %s", e)
+            # what was published before the error is checkpointed
+            self._checkpoint.flush()
             self._exception_callback(e)
 
         log.debug("publisher thread detected shutdown request")
@@ -346,6 +664,45 @@ class DataSetDriver(object):
         raise NotImplementedException('virtual methond needs to be specialized')
 
 
+# Number of record batches a parser pool worker may parse ahead of
+# publishing, for each file.
+PARSER_QUEUED_BATCHES = 4
+
+# The driver whose _build_parser the parser pool workers use, and the result
+# queues they hand records back through.  Pool workers are forked, so they
+# get these without them being pickled.
+_pool_driver = None
+_pool_queues = None
+
+def _init_pool_worker(driver, queues):
+    global _pool_driver, _pool_queues
+    _pool_driver = driver
+    _pool_queues = queues
+
+def _parse_file(name, mode, state, slot, count):
+    """
+    Parse a file in a parser pool worker, handing the records back in
+    batches through the result queue of the given slot.  The queue is
+    bounded, so the worker waits rather than parse far ahead of publishing.
+    None is queued once the file is done, whether it parsed or not.
+    @param name file to parse
+    @param mode mode to open it with
+    @param state parser state to start from
+    @param slot index of the result queue to use
+    @param count number of records in a batch
+    """
+    queue = _pool_queues[slot]
+    try:
+        with open_data_file(name, mode) as handle:
+            records = _pool_driver._build_parser(state, handle).iter_records()
+            batch = list(islice(records, count))
+            while batch:
+                queue.put(batch)
+                batch = list(islice(records, count))
+    finally:
+        queue.put(None)
+
+
 class SimpleDataSetDriver(DataSetDriver):
     """
     Simple data set driver handles cases where we are watching a single file and pushing the
@@ -356,17 +713,29 @@ class SimpleDataSetDriver(DataSetDriver):
     _new_file_queue = []
     _harvester_state = None
     _parser_state = None
+    _catalog = None
+    _current_file = None
+    _parser_pool = None
+    _pool_size = None
+    # result queues of the parser pool, one for each file being parsed
+    _parse_queues = None
+    # (file name, AsyncResult, queue slot) of files handed to the pool, in
+    # harvest order
+    _parsing = None
+    # the entry of _parsing being published
+    _publishing = None
 
     def __init__(self, config, memento, data_callback, state_callback, exception_callback):
         super(SimpleDataSetDriver, self).__init__(config, memento, data_callback, state_callback, exception_callback)
 
-        self._init_state(memento)
+        self._init_state(self._memento)
 
     def _start_sampling(self):
         # just a little nap before we start working.  Giving the agent time
         # to respond.
         try:
             self._harvester = self._build_harvester(self._harvester_state)
+            self._catalog = self._harvester.catalog
             self._harvester.start()
         except Exception as e:
             log.debug("Exception detected when starting sampling: %s", e, exc_info=True)
@@ -380,6 +749,7 @@ class SimpleDataSetDriver(DataSetDriver):
             self._harvester = None
         else:
             log.debug("poller not running. not need to shutdown")
+        self._stop_parser_pool()
 
     ####
     ##    Helpers
@@ -420,12 +790,143 @@ class SimpleDataSetDriver(DataSetDriver):
         """
         Main loop to listen for new files to parse.  Parse them and move on.
         """
+        if self._parser_pool_size > 1 or self._parsing:
+            self._poll_parser_pool()
+            return
+
         # If we have files, grab the first and process it.
         count = len(self._new_file_queue)
         log.trace("Checking for new files in queue, count: %d", count)
         if(count > 0):
             self._got_file(self._new_file_queue.pop(0))
 
+    def _poll_parser_pool(self):
+        """
+        Hand new files to the parser pool, up to the queue depth, then
+        publish the records parsed so far in the order the files were
+        harvested.  A file is only published once every file before it has
+        been, so states are saved just as they are when parsing one file at
+        a time.
+        """
+        if self._parsing is None:
+            self._parsing = deque()
+        depth = max(self._parser_queue_depth, self._parser_pool_size)
+
+        while self._parser_pool_size > 1 and self._new_file_queue and len(self._parsing) < depth:
+            (handle, name) = self._new_file_queue.pop(0)
+            # only the first file can carry on from a saved parser state
+            state = None if self._parsing else self._resume_state(name)
+            pool = self._get_parser_pool(depth)
+            slot = min(set(xrange(len(self._parse_queues))) - set(entry[2] for entry in self._parsing))
+            log.debug("Parsing %s in the parser pool", name)
+            result = pool.apply_async(_parse_file, (name, handle.mode, state, slot,
+                                                    self._generate_particle_count))
+            self._parsing.append((name, result, slot))
+
+        while self._parsing and self._publish_parsed(self._parsing[0]):
+            self._parsing.popleft()
+
+        if not self._parsing and (self._parser_pool_size != self._pool_size or
+                                  depth != len(self._parse_queues or [])):
+            self._stop_parser_pool()
+
+    def _get_parser_pool(self, depth):
+        """
+        @param depth: number of files that may be parsed at once
+        @retval the parser pool, started when it is first needed
+        """
+        if self._parser_pool is None:
+            log.debug("Starting parser pool with %d workers", self._parser_pool_size)
+            self._parse_queues = [multiprocessing.Queue(PARSER_QUEUED_BATCHES) for i in xrange(depth)]
+            self._parser_pool = multiprocessing.Pool(self._parser_pool_size, _init_pool_worker,
+                                                     (self, self._parse_queues))
+            self._pool_size = self._parser_pool_size
+        return self._parser_pool
+
+    def _stop_parser_pool(self):
+        """
+        Stop the parser pool.  Files still being parsed are dropped, the
+        harvester finds them again from its state when sampling restarts.
+        """
+        if self._parser_pool is not None:
+            log.debug("Stopping parser pool")
+            self._parser_pool.terminate()
+            self._parser_pool = None
+            self._pool_size = None
+            self._parse_queues = None
+        self._parsing = None
+        self._publishing = None
+
+    def _publish_parsed(self, entry):
+        """
+        Publish the record batches a pool worker has parsed from a file so far.
+        @param entry: (file name, AsyncResult, queue slot) of the file
+        @retval True once the whole file has been published
+        """
+        (name, result, slot) = entry
+        if self._publishing is not entry:
+            self._publishing = entry
+            self._current_file = name
+            if self._catalog is not None:
+                self._catalog.mark_parsing(name)
+
+        queue = self._parse_queues[slot]
+        while True:
+            try:
+                batch = queue.get_nowait()
+            except Queue.Empty:
+                return False
+            if batch is None:
+                break
+            self._data_callback([particle for (particle, state) in batch])
+            self._save_parser_state(batch[-1][1])
+            self._throttle(len(batch))
+
+        try:
+            result.get()
+        except Exception as e:
+            if self._catalog is not None:
+                self._catalog.mark_failed(name, e)
+            raise
+
+        self._publishing = None
+        self._save_harvester_state(name)
+        return True
+
+    def _throttle(self, count):
+        """
+        Wait, if publishing has got ahead of the records per second, and
+        yield to other greenlets in any case.
+        @param count: number of records just published
+        """
+        delay = self._rate_limit.take(count)
+        # sleep even with no delay, so the rest of the agent gets a turn
+        # while a large file or backlog is published
+        gevent.sleep(delay)
+
+    def publisher_status(self):
+        """
+        @retval dict of PublisherStatusKey values: the records per second
+        achieved recently, the number of records published and the number of
+        files waiting to be published.
+        """
+        return {PublisherStatusKey.RATE: self._rate_limit.rate(),
+                PublisherStatusKey.PUBLISHED: self._rate_limit.published,
+                PublisherStatusKey.BACKLOG: len(self._new_file_queue) + len(self._parsing or [])}
+
+    def _resume_state(self, name):
+        """
+        @param name: file about to be parsed
+        @retval the parser state to start parsing it from
+        """
+        if self._catalog is not None:
+            # The parser state in the memento belongs to the file that was
+            # being parsed, if the catalog knows which one that was.
+            parsing = [entry.name for entry in self._catalog.outstanding(CatalogFileStatus.PARSING)]
+            if parsing and name not in parsing:
+                return None
+        return self._parser_state
+
     def _got_file(self, file_tuple):
         """
         We have a file that we want to parse.  Stand up the parser and do some work.
@@ -433,43 +934,71 @@ class SimpleDataSetDriver(DataSetDriver):
         """
         handle, name = file_tuple
         log.info("Detected new file, handle: %r, name: %s", handle, name)
-        count = 1
-        delay = None
-
-        # Calulate the delay between grabbing records to publish.
-        if self._generate_particle_count:
-            delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-
-        if self._generate_particle_count:
-            count = self._generate_particle_count
+        if isinstance(handle, TailWindow):
+            self._got_window(handle)
+            return
+        count = self._generate_particle_count
 
         # For some reason when adding the handle to the _new_file_queue the file
         # handle is closed.  Haven't had a chance to investigate, but this hack
-        # re-opens the file.
-        handle = open(handle.name, handle.mode)
+        # re-opens the file, decompressing it as it is read if need be.
+        handle = open_data_file(handle.name, handle.mode)
+
+        self._current_file = name
+        self._parser_state = self._resume_state(name)
+        if self._catalog is not None:
+            self._catalog.mark_parsing(name)
 
         parser = self._build_parser(self._parser_state, handle)
 
-        while(True):
-            result = parser.get_records(count)
-            if result:
-                log.trace("Record parsed: %r delay: %f", result, delay)
-                if delay:
-                    gevent.sleep(delay)
-            else:
-                break
+        try:
+            while(True):
+                result = parser.get_records(count)
+                if result:
+                    log.trace("Record parsed: %r", result)
+                    self._throttle(len(result))
+                else:
+                    break
+        except Exception as e:
+            if self._catalog is not None:
+                self._catalog.mark_failed(name, e)
+            raise
 
         # Once we have successfully imported the file reset the parser state
         # and store the harvester state.
         self._save_harvester_state(name)
 
+    def _got_window(self, window):
+        """
+        Parse a range appended to a followed file, read in place through the
+        window, then close it.  The harvester state saved is the window's, so
+        a restart picks up after the last window parsed.  Parser positions
+        count from the start of the window, and a window only partly parsed
+        when the driver stopped is delivered again from its start, so no
+        parser state is carried into a window.
+        @param window: TailWindow handed on by a TailFollowHarvester
+        """
+        count = self._generate_particle_count
+        self._current_file = None
+        try:
+            parser = self._build_parser(None, window)
+            while(True):
+                result = parser.get_records(count)
+                if result:
+                    self._throttle(len(result))
+                else:
+                    break
+        finally:
+            window.close()
+        self._save_harvester_state(window.state())
+
     def _save_driver_state(self):
         """
         Build a memento object from the harvester and parser state and tell the
-        agent, via callback, to persist the state.
+        agent, via callback, to persist the state once the checkpoint is due.
         """
         state = self._get_memento()
-        self._state_callback(state)
+        self._checkpoint.update(state)
 
     def _save_parser_state(self, state):
         """
@@ -478,6 +1007,8 @@ class SimpleDataSetDriver(DataSetDriver):
         """
         log.trace("saving parser state: %r", state)
         self._parser_state = state
+        if self._catalog is not None and self._current_file:
+            self._catalog.set_position(self._current_file, state)
         self._save_driver_state()
 
     def _save_harvester_state(self, state):
@@ -490,6 +1021,8 @@ class SimpleDataSetDriver(DataSetDriver):
         log.debug("saving harvester state: %r", state)
         self._parser_state = None
         self._harvester_state = state
+        if self._catalog is not None and self._current_file:
+            self._catalog.mark_parsed(self._current_file)
         self._save_driver_state()
 
     def _get_memento(self):
@@ -527,3 +1060,12 @@ class SimpleDataSetDriver(DataSetDriver):
 
         count = len(self._new_file_queue)
         log.trace("Current new file queue length: %d", count)
+
+    def _new_window_callback(self, window):
+        """
+        Callback used by a TailFollowHarvester when data is appended to the
+        followed file.  The window is queued like a file and closed once it
+        has been parsed.
+        @param window: TailWindow of the appended data
+        """
+        self._new_file_callback(window, window.name)
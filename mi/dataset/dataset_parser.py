@@ -11,10 +11,107 @@ out of files and feed them into the system.
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import os
+import copy
+import mmap
+import multiprocessing
+from collections import deque
+from itertools import islice
+
 from mi.core.log import get_logger ; log = get_logger()
-from mi.core.instrument.chunker import StringChunker
+from mi.core.common import BaseEnum
+from mi.core.instrument.chunker import StringChunker, BlockChunker
 from mi.core.instrument.data_particle import DataParticleKey
 from mi.core.exceptions import DatasetParserException, NotImplementedException
+from mi.dataset.record_index import RecordIndex, INDEX_SUFFIX
+
+# block sizes used by the block and mmap read modes, reads start small so
+# the first records come out quickly and double up to the maximum
+DEFAULT_BLOCK_SIZE = 64 * 1024
+DEFAULT_MAX_BLOCK_SIZE = 4 * 1024 * 1024
+
+# smallest range of a file given to a decode process
+DEFAULT_RANGE_SIZE = 4 * 1024 * 1024
+
+class ParserConfigKey(BaseEnum):
+    """
+    Optional parser configuration keys, alongside particle_module and
+    particle_class
+    """
+    READ_MODE = 'read_mode'
+    BLOCK_SIZE = 'block_size'
+    MAX_BLOCK_SIZE = 'max_block_size'
+    DECODE_PROCESSES = 'decode_processes'
+    RANGE_SIZE = 'range_size'
+    INDEX = 'index'
+
+class ReadMode(BaseEnum):
+    """
+    How a BufferLoadingParser reads its file.  CHUNK reads 1k at a time into
+    a StringChunker.  BLOCK reads growing blocks into a BlockChunker, whose
+    cost does not grow with the amount buffered.  MMAP maps the file and
+    sieves the mapping in place, so file data is only copied as records are
+    taken; it falls back to BLOCK for streams without a file descriptor.
+    """
+    CHUNK = 'chunk'
+    BLOCK = 'block'
+    MMAP = 'mmap'
+
+class RangeFile(object):
+    """
+    File-like view of an open file that ends at a given offset, so a parser
+    reading it decodes one range of the file.  Positions are those of the
+    whole file.  It has no file descriptor, so parsers read it in blocks.
+    """
+    def __init__(self, stream_handle, end):
+        """
+        @param stream_handle An open file
+        @param end The file offset the range ends at
+        """
+        self._stream_handle = stream_handle
+        self._end = end
+
+    def _remaining(self, size):
+        remaining = max(self._end - self._stream_handle.tell(), 0)
+        if size is None or size < 0:
+            return remaining
+        return min(size, remaining)
+
+    def read(self, size=-1):
+        return self._stream_handle.read(self._remaining(size))
+
+    def readline(self, size=-1):
+        return self._stream_handle.readline(self._remaining(size))
+
+    def tell(self):
+        return self._stream_handle.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._stream_handle.seek(offset, whence)
+
+def _decode_range(parser_class, config, name, start, end, state, new_sequence, index):
+    """
+    Decode one range of a file in a decode process.
+    @param parser_class The BufferLoadingParser subclass to decode with
+    @param config The parser configuration
+    @param name The file name
+    @param start The file offset the range starts at
+    @param end The file offset the range ends at
+    @param state The parser state to start from
+    @param new_sequence True if the first record starts a new sequence
+    @param index True to index the records of the range
+    @retval (list of (particle, state) tuples, True if a new sequence was
+        started after the last record, list of IndexEntry for the records)
+    """
+    with open(name, 'rb') as stream:
+        parser = parser_class(config, state, RangeFile(stream, end), None, None)
+        if stream.tell() != start:
+            raise DatasetParserException("Range of %s starts at %d, not %d" % (name, stream.tell(), start))
+        parser._new_sequence = new_sequence
+        if index:
+            parser._index = RecordIndex()
+        records = list(parser.iter_records())
+    return (records, parser._new_sequence, list(parser._index or []))
 
 class Parser(object):
     """ abstract class to show API needed for plugin poller objects """
@@ -35,21 +132,65 @@ class Parser(object):
            ultimately from the agent) where we send our sample particle to
            be published into ION
         """
-        self._chunker = StringChunker(sieve_fn)
+        self._read_mode = config.get(ParserConfigKey.READ_MODE, ReadMode.CHUNK)
+        if self._read_mode == ReadMode.CHUNK:
+            self._chunker = StringChunker(sieve_fn)
+        elif ReadMode.has(self._read_mode):
+            self._chunker = BlockChunker(sieve_fn, hold_tail=True)
+        else:
+            raise DatasetParserException("Unknown read mode %s" % self._read_mode)
+        if self._read_mode == ReadMode.MMAP and not hasattr(stream_handle, 'fileno'):
+            log.debug("Parser stream can not be mapped, reading blocks")
+            self._read_mode = ReadMode.BLOCK
+        self._min_block_size = config.get(ParserConfigKey.BLOCK_SIZE, DEFAULT_BLOCK_SIZE)
+        self._max_block_size = max(config.get(ParserConfigKey.MAX_BLOCK_SIZE, DEFAULT_MAX_BLOCK_SIZE),
+                                   self._min_block_size)
+        self._decode_processes = config.get(ParserConfigKey.DECODE_PROCESSES, 1)
+        self._range_size = config.get(ParserConfigKey.RANGE_SIZE, DEFAULT_RANGE_SIZE)
+        # record lists from the decode processes, and the record buffer
+        # they are loaded into, replaced by set_state
+        self._ranges = None
+        self._ranges_buffer = None
+        self._ranges_end = None
+        self._block_size = self._min_block_size
+        # handle position the next block read starts from, and the file map
+        self._read_position = None
+        self._mapping = None
         self._stream_handle = stream_handle
         self._state = state
         self._state_callback = state_callback
         self._publish_callback = publish_callback
         self._config = config
         self._new_sequence = True
+        # index of the records parsed, and file offset of the last data chunk
+        self._index = self._open_index(config.get(ParserConfigKey.INDEX))
+        self._chunk_offset = None
         
         #build class from module and class name, then set the state
         if config.get("particle_module"):
             self._particle_module = __import__(config.get("particle_module"), fromlist = [config.get("particle_class")])
-            self._particle_class = getattr(self._particle_module, config.get("particle_class"))
+            # parsers of several particle classes take them from the module
+            if config.get("particle_class"):
+                self._particle_class = getattr(self._particle_module, config.get("particle_class"))
         else:
             log.warn("No particle module specified in config")
 
+    def _open_index(self, index):
+        """
+        @param index The index parser config, a sidecar file path or True
+            for a sidecar next to the file
+        @retval RecordIndex for the file, None if records are not indexed
+        """
+        if not index:
+            return None
+        name = getattr(self._stream_handle, 'name', None)
+        if index is True:
+            if name is None:
+                log.warn("Parser stream has no file name, records are not indexed")
+                return None
+            index = name + INDEX_SUFFIX
+        return RecordIndex(index, name)
+
     def start_new_sequence(self):
         """
         Reset the seqeunce flag to true
@@ -62,6 +203,15 @@ class Parser(object):
         """
         raise NotImplementedException("get_records() not overridden!")
 
+    def iter_records(self):
+        """
+        Generate (particle, state) tuples as the file is parsed, reading
+        ahead no further than needed for the next record.  Nothing is
+        published and the state callback is not called, the caller decides
+        what to do with each record.
+        """
+        raise NotImplementedException("iter_records() not overridden!")
+
     def set_state(self, state):
         """
         Set the state of the last published data block.
@@ -110,8 +260,135 @@ class BufferLoadingParser(Parser):
     records from this buffer as they are requested. Parsers dont have
     to operate this way, but it can keep memory in check and smooth out
     stream inputs if they dont all come at once.
+
+    Subclasses keep the (particle, state) tuples in self._record_buffer, a
+    deque, and fill it from parse_chunks().
+
+    With the decode_processes parser config greater than 1 a file is cut
+    into ranges that are decoded in that many processes and the records
+    come back in file order.  Subclasses that can decode from the middle of
+    a file set _range_boundary_matcher, and return the state to start a
+    range with from _range_state().
+
+    With the index parser config the offset, length and internal timestamp
+    of each record are kept in a RecordIndex as records are parsed, in a
+    sidecar file that later parsers of the file read back.  seek_record(),
+    seek_time() and replay() use it to start from a record or a time
+    rather than the start of the file.  Subclasses that index records take
+    data chunks with _next_data_chunk(), pass each record to
+    _index_record(), and return the state to decode a record from with
+    _index_state().
     """
-        
+
+    # regex whose matches end where a range can start and decode without
+    # what comes before it, just as the whole file would be decoded there.
+    # Matches should end after a record, not after noise that starts a new
+    # sequence.  None if files can not be split.
+    _range_boundary_matcher = None
+
+    # True if subclasses use _chunk_offset for every data chunk, not only
+    # for indexing
+    _track_chunk_offset = False
+
+    def _range_state(self, position):
+        """
+        @param position The file offset a range starts at
+        @retval The parser state to decode a range from
+        """
+        raise NotImplementedException("_range_state() not overridden!")
+
+    def _index_state(self, entry):
+        """
+        @param entry The IndexEntry of a record
+        @retval The parser state to decode from that record on
+        """
+        raise NotImplementedException("_index_state() not overridden!")
+
+    def _next_data_chunk(self):
+        """
+        Take the next data chunk from the chunker, noting its file offset
+        for _index_record().  The chunker has everything up to the end of
+        the chunk cleaned away, and the file has been read up to the end of
+        what the chunker holds.
+        @retval (timestamp, chunk, start, end) as from get_next_data_with_index()
+        """
+        result = self._chunker.get_next_data_with_index()
+        if (self._index is not None or self._track_chunk_offset) and result[1] is not None:
+            self._chunk_offset = self._stream_handle.tell() - len(self._chunker) - len(result[1])
+        return result
+
+    def _index_record(self, particle, chunk):
+        """
+        Index a record parsed from the last chunk taken by _next_data_chunk().
+        @param particle The particle of the record
+        @param chunk The data chunk of the record
+        """
+        if self._index is not None:
+            self._index.add(self._chunk_offset, len(chunk),
+                            particle.contents[DataParticleKey.INTERNAL_TIMESTAMP])
+
+    def _require_index(self):
+        if self._index is None:
+            raise DatasetParserException("Records are not indexed, set the %s parser config" % ParserConfigKey.INDEX)
+        return self._index
+
+    def seek_record(self, number):
+        """
+        Carry on parsing from an indexed record, for instance the one after
+        the last record published before a crash.
+        @param number The number of the record in the index
+        @throws DatasetParserException if the records are not indexed or
+            the record is not in the index
+        """
+        index = self._require_index()
+        if not 0 <= number < len(index):
+            raise DatasetParserException("Record %d is not in the index of %d records" % (number, len(index)))
+        self.set_state(self._index_state(index[number]))
+
+    def seek_time(self, timestamp):
+        """
+        Carry on parsing from the first indexed record at or after a time.
+        @param timestamp NTP4 internal timestamp
+        @throws DatasetParserException if the records are not indexed or
+            none are at or after the time
+        """
+        self.seek_record(self._require_index().find_time(timestamp))
+
+    def replay(self, start_time, end_time):
+        """
+        Generate (particle, state) tuples for the indexed records in a time
+        range, reading only that part of the file.  The first record starts
+        a new sequence.
+        @param start_time NTP4 time the range starts at
+        @param end_time NTP4 time the range ends before
+        @throws DatasetParserException if the records are not indexed
+        """
+        (first, stop) = self._require_index().find_range(start_time, end_time)
+        if first == stop:
+            return
+        self.seek_record(first)
+        self.start_new_sequence()
+        for record in islice(self.iter_records(), stop - first):
+            yield record
+
+    def iter_records(self):
+        """
+        Generate (particle, state) tuples, loading one block's worth of
+        records into the record buffer at a time.
+        """
+        while True:
+            if not self._record_buffer:
+                try:
+                    self._load_particle_buffer()
+                except EOFError:
+                    return
+                finally:
+                    if self._index is not None:
+                        self._index.flush()
+                if not self._record_buffer:
+                    return
+            yield self._record_buffer.popleft()
+
     def get_records(self, num_records):
         """
         Go ahead and execute the data parsing loop up to a point. This involves
@@ -122,37 +399,23 @@ class BufferLoadingParser(Parser):
         """
         if num_records <= 0:
             return []
-        try:
-            while len(self._record_buffer) < num_records:
-                self._load_particle_buffer()        
-        except EOFError:
-            pass            
-        return self._yank_particles(num_records)
-                
-    def _yank_particles(self, num_records):
-        """
-        Get particles out of the buffer and publish them. Update the state
-        of what has been published, too.
-        @param num_records The number of particles to remove from the buffer
-        @retval A list with num_records elements from the buffer. If num_records
-        cannot be collected (perhaps due to an EOF), the list will have the
-        elements it was able to collect.
-        """
-        if len(self._record_buffer) < num_records:
-            num_to_fetch = len(self._record_buffer)
-        else:
-            num_to_fetch = num_records
-        log.trace("Yanking %s records of %s requested",
-                  num_to_fetch,
-                  num_records)
+        return self._yank_particles(list(islice(self.iter_records(), num_records)))
+
+    def _yank_particles(self, records):
+        """
+        Publish records taken from the buffer. Update the state of what has
+        been published, too.
+        @param records A list of (particle, state) tuples, possibly fewer
+        than were asked for (perhaps due to an EOF)
+        @retval A list of the particles published
+        """
+        log.trace("Yanking %s records", len(records))
 
         return_list = []
-        records_to_return = self._record_buffer[:num_to_fetch]
-        self._record_buffer = self._record_buffer[num_to_fetch:]
-        if len(records_to_return) > 0:
-            self._state = records_to_return[-1][1] # state side of tuple of last entry
+        if len(records) > 0:
+            self._state = records[-1][1] # state side of tuple of last entry
             # strip the state info off of them now that we have what we need
-            for item in records_to_return:
+            for item in records:
                 log.debug("Record to return: %s", item)
                 return_list.append(item[0])
             self._publish_sample(return_list)
@@ -160,30 +423,186 @@ class BufferLoadingParser(Parser):
             self._state_callback(self._state) # push new state to driver
 
         return return_list
-        
+
     def _load_particle_buffer(self):
         """
         Load up the internal record buffer with some particles based on a
         gather from the get_block method.
         """
+        if self._ranges_buffer is None and self._decode_processes > 1:
+            self._ranges = self._start_ranges()
+            self._ranges_buffer = self._record_buffer
+        if self._ranges is not None:
+            if self._record_buffer is self._ranges_buffer:
+                for records in self._ranges:
+                    if records:
+                        self._record_buffer.extend(records)
+                        return
+                # carry on reading after the last range
+                self._stream_handle.seek(self._ranges_end)
+            else:
+                log.debug("Parser state set while decoding ranges, reading the file")
+                self._ranges.close()
+            self._ranges = None
+
         while self.get_block():
             result = self.parse_chunks()
             self._record_buffer.extend(result)
+            # stop once there are records rather than buffering the whole file
+            if result:
+                break
+
+    def _start_ranges(self):
+        """
+        Cut the rest of the file into ranges and start decoding them.
+        @retval A generator of the record list of each range in file order,
+            None if the file can not be split
+        """
+        name = getattr(self._stream_handle, 'name', None)
+        if self._range_boundary_matcher is None or name is None or not hasattr(self._stream_handle, 'fileno'):
+            log.debug("Parser stream can not be split into ranges")
+            return None
+        if multiprocessing.current_process().daemon:
+            # pool workers may not start processes of their own
+            log.debug("Parser in a daemon process, not decoding ranges")
+            return None
+
+        start = self._stream_handle.tell()
+        fileno = self._stream_handle.fileno()
+        size = os.fstat(fileno).st_size
+        if size - start <= self._range_size:
+            return None
+        mapping = mmap.mmap(fileno, size, access=mmap.ACCESS_READ)
+        try:
+            ranges = []
+            while True:
+                match = self._range_boundary_matcher.search(mapping, start + self._range_size)
+                if match is None or match.end() >= size:
+                    break
+                ranges.append((start, match.end()))
+                start = match.end()
+            ranges.append((start, size))
+        finally:
+            mapping.close()
+        if len(ranges) == 1:
+            return None
+        self._ranges_end = size
+        log.debug("Decoding %s in %d ranges", name, len(ranges))
+        return self._decode_ranges(name, ranges)
+
+    def _decode_ranges(self, name, ranges):
+        """
+        Decode ranges in a pool of processes, keeping twice as many ranges
+        in hand as there are processes.  The first range starts from the
+        parser state, the others from _range_state().
+        @param name The file name
+        @param ranges List of (start, end) file offsets
+        @retval A generator of the record list of each range in file order
+        """
+        config = dict(self._config)
+        config[ParserConfigKey.DECODE_PROCESSES] = 1
+        # ranges are indexed in memory and added to this parser's index
+        config.pop(ParserConfigKey.INDEX, None)
+        index = self._index is not None
+        state = copy.deepcopy(self._state)
+        new_sequence = self._new_sequence
+        gap = False
+        ranges = deque(ranges)
+        pending = deque()
+        pool = multiprocessing.Pool(self._decode_processes)
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < 2 * self._decode_processes:
+                    (start, end) = ranges.popleft()
+                    pending.append(pool.apply_async(_decode_range, (self.__class__, config, name, start, end,
+                                                                    state, new_sequence, index)))
+                    state = self._range_state(end)
+                    new_sequence = False
+
+                (records, range_gap, entries) = pending.popleft().get()
+                for entry in entries:
+                    self._index.add(*entry)
+                if records:
+                    if gap:
+                        # a gap at the end of an earlier range
+                        records[0][0].contents[DataParticleKey.NEW_SEQUENCE] = True
+                    gap = range_gap
+                else:
+                    gap = gap or range_gap
+                yield records
+        finally:
+            pool.terminate()
 
     def get_block(self, size=1024):
         """
         Get a block of characters for processing
-        @param size The size of the block to try to read
+        @param size The size of the block to try to read in CHUNK read mode,
+            other read modes use the configured block sizes
         @retval The length of data retreived
         @throws EOFError when the end of the file is reached
         """
-        # read in some more data
-        data = self._stream_handle.read(size)
-        if data:
-            self._chunker.add_chunk(data, self._timestamp)
-            return len(data)
-        else: # EOF
+        if self._read_mode == ReadMode.CHUNK:
+            # read in some more data
+            data = self._stream_handle.read(size)
+            if data:
+                self._chunker.add_chunk(data, self._timestamp)
+                return len(data)
+            else: # EOF
+                raise EOFError
+
+        position = self._stream_handle.tell()
+        if position != self._read_position:
+            # moved by set_state, what was buffered is from somewhere else
+            self._chunker = BlockChunker(self._chunker.sieve, hold_tail=True)
+            self._block_size = self._min_block_size
+            self._mapping = None
+
+        try:
+            if self._read_mode == ReadMode.MMAP:
+                length = self._extend_mapping(position)
+            else:
+                data = self._stream_handle.read(self._block_size)
+                if not data:
+                    raise EOFError
+                length = len(data)
+                self._chunker.add_chunk(data, self._timestamp)
+        except EOFError:
+            # the last record is held back until it is known to be complete
+            length = self._chunker.flush(self._timestamp)
+            if not length:
+                raise
+            return length
+
+        self._read_position = position + length
+        self._block_size = min(self._block_size * 2, self._max_block_size)
+        return length
+
+    def _extend_mapping(self, position):
+        """
+        Give the chunker the next block of the mapped file, mapping the file
+        again if it has grown.
+        @param position The file position of the block
+        @retval The length of data added
+        @throws EOFError when the end of the file is reached
+        """
+        fileno = self._stream_handle.fileno()
+        size = os.fstat(fileno).st_size
+        if self._mapping is None or size > len(self._mapping):
+            if size == 0:
+                raise EOFError
+            mapping = mmap.mmap(fileno, size, access=mmap.ACCESS_READ)
+            if self._mapping is None:
+                self._chunker.attach(mapping, position)
+            else:
+                self._chunker.remap(mapping)
+            self._mapping = mapping
+
+        length = min(self._block_size, len(self._mapping) - position)
+        if length <= 0:
             raise EOFError
+        self._chunker.extend(length, self._timestamp)
+        self._stream_handle.seek(position + length)
+        return length
 
     def parse_chunks(self):
         """
@@ -20,6 +20,8 @@ from mi.dataset.harvester import AdditiveSequentialFileHarvester
 
 
 class HypmCTDPFDataSetDriver(SimpleDataSetDriver):
+    _parser_pool_supported = True
+
     @classmethod
     def stream_config(cls):
         return [CtdpfParserDataParticle.type()]
@@ -11,9 +11,9 @@ initial release
 __author__ = 'Emily Hahn'
 __license__ = 'Apache 2.0'
 
+import os
+import time
 import string
-import hashlib
-import gevent
 
 from mi.core.log import get_logger ; log = get_logger()
 
@@ -21,6 +21,7 @@ from mi.dataset.dataset_driver import SimpleDataSetDriver
 from mi.dataset.parser.mflm import StateKey
 from mi.dataset.parser.ctdmo import CtdmoParser, CtdmoParserDataParticle
 from mi.dataset.harvester import SingleFileChangeHarvester, FileChangeHarvesterMementoKey
+from mi.dataset.harvester import mtime_ns, RACY_MTIME_WINDOW
 
 
 class MflmCTDMODataSetDriver(SimpleDataSetDriver):
@@ -75,28 +76,17 @@ class MflmCTDMODataSetDriver(SimpleDataSetDriver):
     def _got_file(self, file_tuple):
         """
         We have a file that we want to parse.  Stand up the parser and do some work.
-        @param file_tuple: (file_handle, file_size) tuple returned by the harvester
+        @param file_tuple: (file_handle, file_size, checksum) tuple returned by the harvester
         """
-        handle, size = file_tuple
+        handle, size, checksum = file_tuple
         log.info("Detected new file, handle: %r, size: %d", handle, size)
-        count = 1
-        delay = None
-
-        # Calulate the delay between grabbing records to publish.
-        if self._generate_particle_count:
-            delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-
-        if self._generate_particle_count:
-            count = self._generate_particle_count
+        count = self._generate_particle_count
 
         # For some reason when adding the handle to the _new_file_queue the file
         # handle is closed.  Haven't had a chance to investigate, but this hack
         # re-opens the file.
         handle = open(handle.name, handle.mode)
-        data = handle.read()
-        checksum = hashlib.md5(data).hexdigest()
-        # reset position after reading data to calculate checksum
-        handle.seek(0)
+        stat_result = os.fstat(handle.fileno())
         # need to check if the file has grown larger, if it has update the last
         # unprocessed data index
         log.debug('About to check parser state %s', self._parser_state)
@@ -123,9 +113,8 @@ class MflmCTDMODataSetDriver(SimpleDataSetDriver):
         while(True):
             result = parser.get_records(count)
             if result:
-                log.trace("Record parsed: %r delay: %f", result, delay)
-                if delay:
-                    gevent.sleep(delay)
+                log.trace("Record parsed: %r", result)
+                self._throttle(len(result))
             else:
                 break
 
@@ -133,6 +122,11 @@ class MflmCTDMODataSetDriver(SimpleDataSetDriver):
         # and store the harvester state.
         state = {FileChangeHarvesterMementoKey.LAST_FILESIZE: size,
                  FileChangeHarvesterMementoKey.LAST_CHECKSUM: checksum}
+        if stat_result.st_size == size and \
+        time.time() - stat_result.st_mtime > RACY_MTIME_WINDOW:
+            # lets a restarted harvester skip re-reading an unchanged file
+            state[FileChangeHarvesterMementoKey.LAST_MTIME] = mtime_ns(stat_result)
+            state[FileChangeHarvesterMementoKey.LAST_INODE] = stat_result.st_ino
         self._save_harvester_state(state)
 
     def _save_harvester_state(self, state):
@@ -145,17 +139,18 @@ class MflmCTDMODataSetDriver(SimpleDataSetDriver):
         self._harvester_state = state
         self._save_driver_state()
 
-    def _new_file_callback(self, file_handle, file_size):
+    def _new_file_callback(self, file_handle, file_size, checksum):
         """
         Callback used by the harvester called when a new file is detected.  Store the
-        file handle and filename in a queue.
+        file handle, size and checksum in a queue.
         @param file_handle: file handle to the new found file.
-        @param file_name: file name of the found file.
+        @param file_size: size of the file when the harvester checked it.
+        @param checksum: md5 of the file when the harvester checked it.
         """
         index = len(self._new_file_queue)
 
         log.trace("Add new file to the new file queue: handle: %r, size: %d", file_handle, file_size)
-        self._new_file_queue.append((file_handle, file_size))
+        self._new_file_queue.append((file_handle, file_size, checksum))
 
         count = len(self._new_file_queue)
         log.trace("Current new file queue length: %d", count)
\ No newline at end of file
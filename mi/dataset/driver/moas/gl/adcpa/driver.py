@@ -20,6 +20,8 @@ from mi.dataset.harvester import AdditiveSequentialFileHarvester
 
 
 class AdcpaDataSetDriver(SimpleDataSetDriver):
+    _parser_pool_supported = True
+
     @classmethod
     def stream_config(cls):
         return [ADCPA_PD0_PARSED_DataParticle.type()]
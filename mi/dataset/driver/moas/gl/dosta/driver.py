@@ -21,6 +21,8 @@ from mi.dataset.harvester import AdditiveSequentialFileHarvester
 
 
 class DOSTADataSetDriver(SimpleDataSetDriver):
+    _parser_pool_supported = True
+
     @classmethod
     def stream_config(cls):
         return [GgldrDostaDelayedDataParticle.type()]
@@ -0,0 +1,91 @@
+"""
+@package mi.dataset.driver.moas.gl.streams.driver
+@file marine-integrations/mi/dataset/driver/moas/gl/streams/driver.py
+@author Stuart Pearce & Chris Wingard
+@brief Driver for all the particle streams of a glider at once
+Release notes:
+
+initial release
+"""
+
+__author__ = 'Stuart Pearce & Chris Wingard'
+__license__ = 'Apache 2.0'
+
+from mi.core.log import get_logger
+log = get_logger()
+
+from mi.core.exceptions import ConfigurationException
+from mi.dataset.dataset_driver import SimpleDataSetDriver
+from mi.dataset.parser.glider import GliderStreamsParser, GliderConfigKey
+from mi.dataset.parser.glider import GgldrCtdgvDelayedDataParticle
+from mi.dataset.parser.glider import GgldrDostaDelayedDataParticle
+from mi.dataset.parser.glider import GgldrFlordDelayedDataParticle
+from mi.dataset.parser.glider import GgldrEngDelayedDataParticle
+from mi.dataset.parser.glider import CgldrCtdgvDelayedDataParticle
+from mi.dataset.parser.glider import CgldrDostaDelayedDataParticle
+from mi.dataset.parser.glider import CgldrFlortDelayedDataParticle
+from mi.dataset.parser.glider import CgldrParadDelayedDataParticle
+from mi.dataset.parser.glider import CgldrEngDelayedDataParticle
+from mi.dataset.harvester import SortingDirectoryHarvester
+
+
+class GliderStreamsDataSetDriver(SimpleDataSetDriver):
+    """
+    Parses each global glider file once for all of its particle streams,
+    rather than once for each stream as the ctdgv, dosta, flord and
+    engineering drivers do.  The particle_classes parser config picks the
+    streams to publish, all of the driver's by default.  The parser state
+    holds the position of each stream, so each carries on from its own last
+    record.
+    """
+    particle_classes = [GgldrCtdgvDelayedDataParticle,
+                        GgldrDostaDelayedDataParticle,
+                        GgldrFlordDelayedDataParticle,
+                        GgldrEngDelayedDataParticle]
+    _parser_pool_supported = True
+
+    @classmethod
+    def stream_config(cls):
+        return [particle_class.type() for particle_class in cls.particle_classes]
+
+    def _build_parser(self, parser_state, infile):
+        config = self._parser_config
+        names = [particle_class.__name__ for particle_class in self.particle_classes]
+        config.setdefault(GliderConfigKey.PARTICLE_CLASSES, names)
+        unknown = set(config[GliderConfigKey.PARTICLE_CLASSES]) - set(names)
+        if unknown:
+            raise ConfigurationException("%s does not publish %s" % (self.__class__.__name__, sorted(unknown)))
+        config.update({
+            'particle_module': 'mi.dataset.parser.glider'
+        })
+        log.debug("MYCONFIG: %s", config)
+        self._parser = GliderStreamsParser(
+            config,
+            parser_state,
+            infile,
+            self._save_parser_state,
+            self._data_callback
+        )
+
+        return self._parser
+
+    def _build_harvester(self, harvester_state):
+        self._harvester = SortingDirectoryHarvester(
+            self._harvester_config,
+            harvester_state,
+            self._new_file_callback,
+            self._exception_callback
+        )
+
+        return self._harvester
+
+
+class CoastalGliderStreamsDataSetDriver(GliderStreamsDataSetDriver):
+    """
+    Parses each coastal glider file once for all of its particle streams.
+    """
+    particle_classes = [CgldrCtdgvDelayedDataParticle,
+                        CgldrDostaDelayedDataParticle,
+                        CgldrFlortDelayedDataParticle,
+                        CgldrParadDelayedDataParticle,
+                        CgldrEngDelayedDataParticle]
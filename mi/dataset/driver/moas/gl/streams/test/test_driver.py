@@ -0,0 +1,92 @@
+"""
+@package mi.dataset.driver.moas.gl.streams.test.test_driver
+@file marine-integrations/mi/dataset/driver/moas/gl/streams/test/test_driver.py
+@author Stuart Pearce & Chris Wingard
+@brief Test cases for publishing all the glider particle streams from one
+parse of each file
+"""
+
+__author__ = 'Stuart Pearce & Chris Wingard'
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import ConfigurationException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.dataset.dataset_driver import DriverParameter
+from mi.dataset.parser.glider import GliderParser, GliderConfigKey
+from mi.dataset.driver.moas.gl.streams.driver import GliderStreamsDataSetDriver
+
+RESOURCE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'ctdgv', 'resource')
+
+@attr('UNIT', group='mi')
+class GliderStreamsDriverTest(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.name = os.path.join(self.directory, 'unit_363_2013_245_6_6.mrg')
+        shutil.copy(os.path.join(RESOURCE_PATH, 'unit_363_2013_245_6_6.mrg'), self.name)
+
+    def _run(self, memento=None, parser_config=None):
+        config = {'harvester': {'directory': self.directory, 'pattern': '*.mrg'},
+                  'parser': parser_config or {},
+                  'driver': {DriverParameter.RECORDS_PER_SECOND: 100000,
+                             DriverParameter.BATCHED_PARTICLE_COUNT: 50}}
+        published = []
+        states = []
+        driver = GliderStreamsDataSetDriver(config, memento, published.extend, states.append, None)
+        driver._new_file_queue = [(open(self.name), self.name)]
+        driver._poll()
+        return (published, [state['parser'] for state in states])
+
+    def _values(self, particles):
+        return [(particle.type(), repr(particle._build_parsed_values()),
+                 particle.contents[DataParticleKey.INTERNAL_TIMESTAMP]) for particle in particles]
+
+    def test_streams(self):
+        """
+        Each stream gets the particles a parser of its class alone makes.
+        """
+        (published, states) = self._run()
+        for particle_class in GliderStreamsDataSetDriver.particle_classes:
+            with open(self.name) as stream:
+                parser = GliderParser({'particle_module': 'mi.dataset.parser.glider',
+                                       'particle_class': particle_class.__name__}, None, stream, None, None)
+                expected = self._values(particle for (particle, state) in parser.iter_records())
+            self.assertGreater(len(expected), 0)
+            self.assertEqual([value for value in self._values(published) if value[0] == particle_class.type()],
+                             expected)
+        # the harvester state is saved once the file is parsed
+        self.assertEqual(states[-1], None)
+        self.assertEqual(sorted(states[-2].keys()), sorted(GliderStreamsDataSetDriver.stream_config()))
+
+    def test_resume(self):
+        """
+        From a saved state each stream carries on after its own last record.
+        """
+        # blocks hold back a record until its line is complete, where a
+        # chunk read can end part way through one
+        parser_config = {'read_mode': 'block'}
+        (published, states) = self._run(parser_config=parser_config)
+        # after five batches of records, some streams are a record behind
+        memento = {'harvester': None, 'parser': states[4]}
+        self.assertGreater(len(set(state['position'] for state in states[4].values())), 1)
+        (resumed, resumed_states) = self._run(memento, dict(parser_config))
+        self.assertEqual(self._values(resumed), self._values(published[250:]))
+        self.assertEqual(resumed_states[-2], states[-2])
+
+    def test_particle_classes(self):
+        (published, states) = self._run(parser_config={
+            GliderConfigKey.PARTICLE_CLASSES: ['GgldrDostaDelayedDataParticle']})
+        self.assertEqual(set(particle.type() for particle in published), set(['ggldr_dosta_delayed']))
+
+        with self.assertRaises(ConfigurationException):
+            self._run(parser_config={GliderConfigKey.PARTICLE_CLASSES: ['CgldrParadDelayedDataParticle']})
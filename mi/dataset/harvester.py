@@ -14,14 +14,27 @@ __license__ = 'Apache 2.0'
 
 import os
 import glob
+import json
+import time
+import bisect
+import mmap
+import zlib
 import hashlib
+import sqlite3
+import threading
+from collections import namedtuple
 
 from mi.core.log import get_logger ; log = get_logger()
-from mi.core.poller import DirectoryPoller, ConditionPoller
+from mi.core.poller import DirectoryPoller, ConditionPoller, watch_directory, get_polling_loop
+from mi.core.inotify import IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_ONLYDIR
 from mi.core.common import BaseEnum
+from mi.dataset.compressed_file import open_data_file, is_compressed
 
 class Harvester(object):
     """ abstract class to show API needed for plugin poller objects """
+    # HarvesterCatalog of the files found, when one is configured
+    catalog = None
+
     def __init__(self, config, memento, data_callback, exception_callback):  
         pass
 
@@ -38,6 +51,57 @@ class Harvester(object):
         """
         pass
 
+    def _share_loop(self, config):
+        """
+        With the 'shared_loop' config key set, have the process wide
+        PollingLoop check for data rather than a thread of this harvester's
+        own, so many harvesters share one thread.
+        @param config harvester config
+        """
+        if config.get('shared_loop'):
+            self.use_loop(get_polling_loop())
+
+    def _open_catalog(self, config, last_file_completed):
+        """
+        Open the catalog named by the 'catalog' config key, if any.  The
+        memento stays authoritative: the file it says was completed last is
+        marked parsed in the catalog.
+        @param config harvester config
+        @param last_file_completed file name from the memento
+        """
+        path = config.get('catalog')
+        if path:
+            self.catalog = get_catalog(path)
+            # files handed on since the harvester started
+            self._queued = set()
+            entry = self.catalog.get(last_file_completed) if last_file_completed else None
+            if entry and entry.status != CatalogFileStatus.PARSED:
+                self.catalog.mark_parsed(last_file_completed)
+
+    def _catalog_files(self, files, completed):
+        """
+        Record files in the catalog and return the ones still to be parsed:
+        new files, files changed since they were parsed, and files that were
+        queued or being parsed when the driver stopped.
+        @param files file names found by the poller
+        @param completed predicate for files the memento says are done, used
+        to seed a new catalog
+        @retval file names to hand to the driver
+        """
+        # a file already handed on is only handed on again if it has changed
+        return [name for name in self.catalog.scan(files, completed)
+                if name not in self._queued or self.catalog.get(name).status == CatalogFileStatus.NEW]
+
+    def _deliver(self, filename):
+        """
+        Open a file and pass it to the file callback.
+        """
+        if self.catalog is not None:
+            self.catalog.mark_queued(filename)
+            self._queued.add(filename)
+        with open_data_file(filename) as f:
+            self.callback(f, filename)
+
 ## other pollers that check HTTP, FTP or other methods of finding data may be
 ## added here down the road
 
@@ -55,32 +119,52 @@ class AdditiveSequentialFileHarvester(DirectoryPoller, Harvester):
         log.debug("Start directory poller path: %s, pattern: %s", directory, pattern)
         self.callback = file_callback
         self.last_file_completed = memento
+        self._open_catalog(config, memento)
         DirectoryPoller.__init__(self,
                                  directory,
                                  pattern,
                                  self.on_new_files,
                                  exception_callback,
-                                 config.get('frequency', 1))
+                                 config.get('frequency', 1),
+                                 config.get('inotify', True))
+        self._share_loop(config)
+        # the catalog decides which files still need parsing
+        self.report_all = self.catalog is not None
 
     def on_new_files(self, files):
         """
         New files have been found, open each file and process it in the callback
         """
+        if self.catalog is not None:
+            for file in self._catalog_files(files, lambda f: not f > self.last_file_completed):
+                self._deliver(file)
+            return
+
         for file in files:
             log.debug("Found new file: %s", file)
             if file>self.last_file_completed:
                 log.debug("Found new file and state verified: %s", file)
                 log.debug("File callback: %s", self.callback)
-                with open(file,'rb') as f:
+                with open_data_file(file) as f:
                     self.callback(f, file)
                     
-            
+
+def watch_file(poller, directory, filename):
+    """
+    Have poller check a file when it is modified, or replaced by a file moved
+    into the directory. The directory is watched so the file may be created
+    later.
+    """
+    poller.watch(directory, IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR,
+                 lambda name: name == filename)
+
 class FilePoller(ConditionPoller):
     """
     poll a single file to determine if that file has had additional data appended to it
     """
     
-    def __init__(self, directory, filename, last_read_offset, callback, exception_callback=None, interval=1):
+    def __init__(self, directory, filename, last_read_offset, callback, exception_callback=None, interval=1,
+                 use_inotify=True):
         """
         @param directory directory of the file to monitor
         @param filename name of the file to monitor
@@ -88,6 +172,7 @@ class FilePoller(ConditionPoller):
         @param callback the callback to call when new data has been found in the file
         @param exception_callback the callback to call when an exception has occurred
         @param interval the interval between checking on the file in seconds
+        @param use_inotify check the file when it changes rather than every interval, where inotify is available
         """
         try:
             if not os.path.isdir(directory):
@@ -95,6 +180,8 @@ class FilePoller(ConditionPoller):
             self._file = directory + '/' + filename
             self._last_offset = last_read_offset
             super(FilePoller,self).__init__(self._check_for_data, callback, exception_callback, interval)
+            if use_inotify:
+                watch_file(self, directory, filename)
         except:
             log.error('failed init?', exc_info=True)
             
@@ -138,7 +225,9 @@ class SingleFileHarvester(FilePoller, Harvester):
                             last_read_offset,
                             self.on_new_data,
                             exception_callback,
-                            config.get('frequency', 1))
+                            config.get('frequency', 1),
+                            config.get('inotify', True))
+        self._share_loop(config)
         
     def on_new_data(self, fullfile):
         """
@@ -150,9 +239,423 @@ class SingleFileHarvester(FilePoller, Harvester):
             with open(fullfile, 'rb') as f:
                 self.callback(f, filesize)
 
+def pread(fd, length, offset):
+    """
+    Read up to length bytes at offset without using or moving the file
+    position, so several readers can share a descriptor.  Uses os.pread
+    where it exists, otherwise an mmap of just the requested range.
+    @param fd file descriptor
+    @param length number of bytes to read
+    @param offset file offset to read from
+    @retval the bytes read, short at the end of the file
+    """
+    if hasattr(os, 'pread'):
+        return os.pread(fd, length, offset)
+    length = min(length, os.fstat(fd).st_size - offset)
+    if length <= 0:
+        return ''
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    mapped = mmap.mmap(fd, offset - start + length, access=mmap.ACCESS_READ, offset=start)
+    try:
+        return mapped[offset - start:offset - start + length]
+    finally:
+        mapped.close()
+
+class TailFollowHarvesterMementoKey(BaseEnum):
+    OFFSET = "offset"
+    INODE = "inode"
+
+class TailWindow(object):
+    """
+    A range of bytes appended to a followed file.  It reads like a file
+    limited to the range, with tell() and seek() in file offsets, through
+    pread on its own duplicate of the follower's descriptor.  The range
+    stays readable after the file is rotated away, until the window is
+    closed.
+    """
+    def __init__(self, fd, name, inode, offset, length, truncated=False):
+        """
+        @param fd descriptor of the followed file, duplicated
+        @param name path of the followed file
+        @param inode inode of the file the range is in
+        @param offset file offset of the first new byte
+        @param length number of new bytes
+        @param truncated True if the file was truncated or replaced, so the
+        range starts over at the beginning of a file
+        """
+        self._fd = os.dup(fd)
+        self.name = name
+        self.inode = inode
+        self.offset = offset
+        self.length = length
+        self.truncated = truncated
+        self._position = offset
+
+    @property
+    def end(self):
+        return self.offset + self.length
+
+    def read(self, size=-1):
+        remaining = self.end - self._position
+        if size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return ''
+        data = pread(self._fd, size, self._position)
+        self._position += len(data)
+        return data
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position):
+        self._position = min(max(position, self.offset), self.end)
+
+    def state(self):
+        """
+        @retval harvester memento to save once the window has been parsed
+        """
+        return {TailFollowHarvesterMementoKey.OFFSET: self.end,
+                TailFollowHarvesterMementoKey.INODE: self.inode}
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return '<TailWindow %s %d+%d>' % (self.name, self.offset, self.length)
+
+class TailFollowPoller(ConditionPoller):
+    """
+    Follow a single file the way tail -F does.  The file stays open between
+    checks and each check only fstats it; appended bytes are handed on as
+    TailWindows, so the work per check is proportional to the new data
+    rather than to the file.  A file that shrinks was truncated and is read
+    again from the start; a different inode at the path means the file was
+    rotated, and the rest of the old file is handed on before following the
+    new one from its start.
+    """
+    def __init__(self, directory, filename, last_offset, last_inode, callback, exception_callback=None,
+                 interval=1, use_inotify=True):
+        """
+        @param directory directory of the file to follow
+        @param filename name of the file to follow
+        @param last_offset offset of the first byte not yet read (can be None)
+        @param last_inode inode of the file last_offset is in (can be None)
+        @param callback called with a list of TailWindows when data is appended
+        @param exception_callback the callback to call when an exception has occurred
+        @param interval the interval between checking on the file in seconds
+        @param use_inotify check the file when it changes rather than every interval, where inotify is available
+        """
+        if not os.path.isdir(directory):
+            raise ValueError('%s is not an existing directory'%directory)
+        self._file = os.path.join(directory, filename)
+        self._offset = last_offset or 0
+        self._last_inode = last_inode
+        self._fd = None
+        self._inode = None
+        self._starts_over = False
+        super(TailFollowPoller, self).__init__(self._check_for_data, callback, exception_callback, interval)
+        if use_inotify:
+            watch_file(self, directory, filename)
+
+    def _open(self):
+        """
+        Open the file at the path, if there is one.  A file other than the
+        one the saved offset was in is read from its start.
+        @retval True if the file is open
+        """
+        try:
+            fd = os.open(self._file, os.O_RDONLY)
+        except OSError:
+            return False
+        self._fd = fd
+        self._inode = os.fstat(fd).st_ino
+        if self._last_inode is not None and self._inode != self._last_inode:
+            log.warn('%s was replaced while it was not followed, reading it from the start', self._file)
+            self._offset = 0
+            self._starts_over = True
+        self._last_inode = self._inode
+        return True
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _window(self):
+        """
+        @retval TailWindow of the bytes from the offset to the end of the
+        open file, or None if there are none
+        """
+        size = os.fstat(self._fd).st_size
+        if size < self._offset:
+            log.warn('%s was truncated from %d to %d bytes', self._file, self._offset, size)
+            self._offset = 0
+            self._starts_over = True
+        if size == self._offset:
+            return None
+        window = TailWindow(self._fd, self._file, self._inode, self._offset, size - self._offset,
+                            self._starts_over)
+        self._offset = size
+        self._starts_over = False
+        return window
+
+    def _check_for_data(self):
+        """
+        @retval list of TailWindows with the data appended since the last
+        check, or None
+        """
+        if self._fd is None and not self._open():
+            return None
+
+        try:
+            path_inode = os.stat(self._file).st_ino
+        except OSError:
+            # moved away and not replaced yet, keep reading the old file
+            path_inode = self._inode
+
+        windows = [self._window()]
+        if path_inode != self._inode:
+            # rotated: the rest of the old file went out above, now follow
+            # the new file from its start
+            log.info('%s was rotated, following the new file', self._file)
+            self._close()
+            self._offset = 0
+            self._last_inode = None
+            if self._open():
+                self._starts_over = True
+                windows.append(self._window())
+        windows = [window for window in windows if window]
+        return windows or None
+
+    def _stopped(self):
+        super(TailFollowPoller, self)._stopped()
+        self._close()
+
+class TailFollowHarvester(TailFollowPoller, Harvester):
+    """
+    Follow a single file and hand each range of appended bytes to the data
+    callback as a TailWindow, instead of the whole file as
+    SingleFileHarvester does.  Once the callback returns it owns the window
+    and closes it when the range has been parsed, which may be later, so a
+    driver can queue windows as it queues files.
+    The memento is the state() of the last window parsed.
+    """
+    def __init__(self, config, memento, data_callback, exception_callback):
+        """
+        @param config a configuration dictionary containing harvester config
+        @param memento dict of TailFollowHarvesterMementoKey values (can be None)
+        @param data_callback called with each TailWindow, which it must
+        close once the window has been parsed
+        @param exception_callback the callback to call when an exception has occurred
+        """
+        if not isinstance(config, dict):
+            raise TypeError("Config object must be a dict")
+        memento = memento or {}
+        if not isinstance(memento, dict):
+            raise TypeError("memento must be a dict")
+
+        self.callback = data_callback
+        TailFollowPoller.__init__(self,
+                                  config['directory'],
+                                  config['filename'],
+                                  memento.get(TailFollowHarvesterMementoKey.OFFSET),
+                                  memento.get(TailFollowHarvesterMementoKey.INODE),
+                                  self.on_new_data,
+                                  exception_callback,
+                                  config.get('frequency', 1),
+                                  config.get('inotify', True))
+        self._share_loop(config)
+
+    def on_new_data(self, windows):
+        windows = list(windows)
+        try:
+            while windows:
+                log.debug("Appended data found: %r", windows[0])
+                self.callback(windows[0])
+                windows.pop(0)
+        finally:
+            # close the window the callback raised on and those after it
+            for window in windows:
+                window.close()
+
 class FileChangeHarvesterMementoKey(BaseEnum):
     LAST_FILESIZE = "last_filesize"
     LAST_CHECKSUM = "last_checksum"
+    # optional, added by newer drivers; lets a restarted harvester skip
+    # re-reading a file that has not changed
+    LAST_MTIME = "last_mtime"
+    LAST_INODE = "last_inode"
+
+# size of the blocks compared by the FileChangeDetector
+CHANGE_DETECTOR_BLOCK_SIZE = 1024 * 1024
+
+# A file modified within this many seconds of a check may be modified again
+# without its mtime changing, so its fstat result is not trusted.
+RACY_MTIME_WINDOW = 2
+
+def mtime_ns(stat_result):
+    """
+    @param stat_result result of os.stat or os.fstat
+    @retval modification time in integer nanoseconds
+    """
+    return int(round(stat_result.st_mtime * 1e9))
+
+def _iter_blocks(filehandle, size, block_size):
+    """
+    Yield buffers over consecutive blocks of a file, backed by an mmap so
+    no more than a page cache view is held at a time.
+    """
+    mapped = mmap.mmap(filehandle.fileno(), size, access=mmap.ACCESS_READ)
+    try:
+        for offset in xrange(0, size, block_size):
+            yield buffer(mapped, offset, block_size)
+    finally:
+        mapped.close()
+
+def file_md5(filehandle, size=None, block_size=CHANGE_DETECTOR_BLOCK_SIZE):
+    """
+    Compute the md5 checksum of an open file without reading it into memory.
+    @param filehandle open file
+    @param size number of bytes to hash, defaults to the file size
+    @retval hex digest
+    """
+    if size is None:
+        size = os.fstat(filehandle.fileno()).st_size
+    md5 = hashlib.md5()
+    if size:
+        for block in _iter_blocks(filehandle, size, block_size):
+            md5.update(block)
+    return md5.hexdigest()
+
+class FileChangeDetector(object):
+    """
+    Detect appends to, or changes within, a single file without reading the
+    whole file on every check.
+
+    The first gate is fstat: if size, mtime and inode are unchanged the file
+    is not read at all.  As with git's index, a file modified within
+    RACY_MTIME_WINDOW of the check is read again next time because a further
+    write may not move the mtime.  When the same file has grown, only the
+    last block known is read again and checked with crc32 against the
+    previous check; if it is unchanged the file has been appended to, and
+    only the appended data is read, carrying the md5 forward.  The whole
+    file is only read on the first check after a start, when the file has
+    been replaced by a new inode, truncated or rewritten without growing,
+    or when data before the end of the last check has changed.
+    """
+    def __init__(self, path, last_size=None, last_checksum=None, last_mtime=None, last_inode=None,
+                 block_size=CHANGE_DETECTOR_BLOCK_SIZE):
+        """
+        @param path file to monitor
+        @param last_size size of the file when it was last read (can be None)
+        @param last_checksum md5 of the file when it was last read (can be None)
+        @param last_mtime modification time in ns when it was last read (can be None)
+        @param last_inode inode of the file when it was last read (can be None)
+        @param block_size size of the blocks compared between checks
+        """
+        self.path = path
+        self.block_size = block_size
+        self.size = last_size
+        self.checksum = last_checksum
+        self._identity = None
+        self._inode = last_inode
+        if None not in (last_size, last_mtime, last_inode):
+            self._identity = (last_size, last_mtime, last_inode)
+        self._blocks = None
+        # md5 of the file up to size, carried forward as it is appended to
+        self._md5 = None
+        self.blocks_read = 0
+
+    def check(self):
+        """
+        @retval True if the file has changed since the last check
+        """
+        with open(self.path, 'rb') as filehandle:
+            stat_result = os.fstat(filehandle.fileno())
+            size = stat_result.st_size
+            identity = (size, mtime_ns(stat_result), stat_result.st_ino)
+            if identity == self._identity or size == 0:
+                return False
+
+            try:
+                changed = None
+                if self._blocks and stat_result.st_ino == self._inode and size > self.size:
+                    changed = self._append_scan(filehandle, size)
+                if changed is None:
+                    changed = self._full_scan(filehandle, size)
+            except ValueError:
+                # truncated after the fstat; look again next time
+                log.debug('%s changed size while checking', self.path)
+                return False
+
+        self._inode = stat_result.st_ino
+        self.size = size
+        self._identity = None
+        if time.time() - stat_result.st_mtime > RACY_MTIME_WINDOW:
+            self._identity = identity
+        return changed
+
+    def _full_scan(self, filehandle, size):
+        """
+        Compute block checksums and the md5 in one pass and compare the md5
+        to the last known checksum.
+        """
+        md5 = hashlib.md5()
+        blocks = []
+        for block in _iter_blocks(filehandle, size, self.block_size):
+            md5.update(block)
+            blocks.append(zlib.crc32(block))
+        self.blocks_read += len(blocks)
+        self._blocks = blocks
+        self._md5 = md5
+
+        checksum = md5.hexdigest()
+        changed = not (size == self.size and checksum == self.checksum)
+        self.checksum = checksum
+        return changed
+
+    def _append_scan(self, filehandle, size):
+        """
+        Check the last block known is unchanged, then checksum the data
+        appended after it, adding it to the md5.
+        @retval True if the file has been appended to, None if data before
+        the end of the last check has changed and the whole file must be read
+        """
+        position = (self.size - 1) // self.block_size * self.block_size
+        last = position // self.block_size
+        filehandle.seek(position)
+        block = filehandle.read(self.size - position)
+        self.blocks_read += 1
+        if len(block) < self.size - position:
+            raise ValueError('file truncated')
+        if zlib.crc32(block) != self._blocks[last]:
+            return None
+
+        md5 = self._md5.copy()
+        blocks = self._blocks[:last]
+        filehandle.seek(position)
+        while position < size:
+            block = filehandle.read(min(self.block_size, size - position))
+            if not block:
+                raise ValueError('file truncated')
+            md5.update(block[max(0, self.size - position):])
+            blocks.append(zlib.crc32(block))
+            position += len(block)
+        self.blocks_read += len(blocks) - last
+
+        self._blocks = blocks
+        self._md5 = md5
+        self.checksum = md5.hexdigest()
+        return True
 
 class FileChangePoller(ConditionPoller):
     """
@@ -160,7 +663,8 @@ class FileChangePoller(ConditionPoller):
     had the data within the file changed
     """
 
-    def __init__(self, directory, filename, last_size, last_checksum, callback, exception_callback=None, interval=1):
+    def __init__(self, directory, filename, last_size, last_checksum, callback, exception_callback=None, interval=1,
+                 use_inotify=True, last_mtime=None, last_inode=None):
         """
         @param directory directory of the file to monitor
         @param filename name of the file to monitor
@@ -169,50 +673,43 @@ class FileChangePoller(ConditionPoller):
         @param callback the callback to call when new data has been found in the file
         @param exception_callback the callback to call when an exception has occurred
         @param interval the interval between checking on the file in seconds
+        @param use_inotify check the file when it changes rather than every interval, where inotify is available
+        @param last_mtime modification time in ns of the previously read file (can be None)
+        @param last_inode inode of the previously read file (can be None)
         """
         if not os.path.isdir(directory):
             raise ValueError('%s is not a directory'%directory)
         try:
             self._file = directory + '/' + filename
-            self._last_size = last_size
-            self._last_checksum = last_checksum
+            self._detector = FileChangeDetector(self._file, last_size, last_checksum, last_mtime, last_inode)
             super(FileChangePoller,self).__init__(self._check_for_data,
                                                   callback, exception_callback,
                                                   interval)
+            if use_inotify:
+                watch_file(self, directory, filename)
         except:
             log.error('failed init?', exc_info=True)
 
+    @property
+    def _last_size(self):
+        return self._detector.size
+
+    @property
+    def _last_checksum(self):
+        return self._detector.checksum
+
     def _check_for_data(self):
         """
-        find out how the last file offset relates to the current file size.
-        If it is less than the current file size, return the file.  Also
-        compare the file checksums, if it is different than the previous
-        checksum return the file.
+        Return the file, with its size and md5 when checked, if data has been
+        appended to it or changed within it since the last check.
         """
         if not os.path.isfile(self._file):
             # file does not exist yet
             return None
-        filesize = os.path.getsize(self._file)
-        # files, but no change since last time
-        log.debug("Checking file size, size is %d, last size was %s",
-                  filesize, str(self._last_size))
-        if filesize == 0:
-            # file is empty
-            return None
-        # calculate the checksum
-        with open(self._file) as filehandle:
-            data = filehandle.read()
-            md5_checksum = hashlib.md5(data).hexdigest()
-        if self._last_size and filesize and \
-        filesize==self._last_size and \
-        self._last_checksum is not None and \
-        self._last_checksum == md5_checksum:
-            # file size and checksums are the same
+        if not self._detector.check():
             return None
-        # checksum or file size is different
-        self._last_checksum = md5_checksum
-        self._last_size = filesize
-        return self._file
+        log.debug("File changed, size is %d", self._detector.size)
+        return (self._file, self._detector.size, self._detector.checksum)
 
 class SingleFileChangeHarvester(FileChangePoller, Harvester):
     """
@@ -225,7 +722,8 @@ class SingleFileChangeHarvester(FileChangePoller, Harvester):
         @param config a configuration dictionary containing harvester config
         @param last_read_offset offset of the last byte read in this file (can be None)
         @param last_checksum checksum of the last file read (can be None)
-        @param data_callback the callback to call when new data has been found in the file
+        @param data_callback the callback to call when new data has been found in the
+        file, with the open file, its size and its md5 when checked
         @param exception_callback the callback to call when an exception has occurred
         """
         if not isinstance(config, dict):
@@ -239,6 +737,8 @@ class SingleFileChangeHarvester(FileChangePoller, Harvester):
         if memento != {}:
             last_size = memento[FileChangeHarvesterMementoKey.LAST_FILESIZE]
             last_checksum = memento[FileChangeHarvesterMementoKey.LAST_CHECKSUM]
+        last_mtime = memento.get(FileChangeHarvesterMementoKey.LAST_MTIME)
+        last_inode = memento.get(FileChangeHarvesterMementoKey.LAST_INODE)
 
         FileChangePoller.__init__(self,
                                   config['directory'],
@@ -247,17 +747,99 @@ class SingleFileChangeHarvester(FileChangePoller, Harvester):
                                   last_checksum,
                                   self.on_new_data,
                                   exception_callback,
-                                  config.get('frequency', 1))
+                                  config.get('frequency', 1),
+                                  config.get('inotify', True),
+                                  last_mtime,
+                                  last_inode)
+        self._share_loop(config)
 
-    def on_new_data(self, fullfile):
+    def on_new_data(self, found):
         """
-        When new data has been found, open the file and seek to the last
-        offset if there is one
+        When new data has been found, open the file and hand it on with the
+        size and md5 it had when checked
         """
-        if fullfile:
-            filesize = os.path.getsize(fullfile)
+        if found:
+            (fullfile, filesize, checksum) = found
             with open(fullfile, 'rb') as f:
-                self.callback(f, filesize)
+                self.callback(f, filesize, checksum)
+
+class SortedFileIndex(object):
+    """
+    Filenames kept in order of a sort key.  Each name's key is computed
+    once, when the name is first seen, and new names are placed with a
+    binary search, so updating the index with a directory listing costs
+    O(n) for the set difference plus O(new * log n) for the inserts instead
+    of a full re-sort.
+    """
+    def __init__(self, key):
+        """
+        @param key function from filename to sort key
+        """
+        self._key = key
+        self._entries = []
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filename):
+        return filename in self._keys
+
+    def key(self, filename):
+        """
+        @retval the sort position key of a filename; cached for indexed names
+        """
+        entry_key = self._keys.get(filename)
+        if entry_key is None:
+            entry_key = (self._key(filename), filename)
+        return entry_key
+
+    def update(self, filenames):
+        """
+        Make the index hold exactly the given filenames.
+        @param filenames iterable of the current filenames
+        @retval (added, removed) lists of filenames
+        """
+        current = set(filenames)
+        removed = [fn for fn in self._keys if fn not in current]
+        added = [fn for fn in current if fn not in self._keys]
+
+        if removed:
+            for fn in removed:
+                del self._keys[fn]
+            self._entries = [entry for entry in self._entries if entry[1] in self._keys]
+
+        for fn in added:
+            self._keys[fn] = self.key(fn)
+        if len(added) > len(self._entries) / 8:
+            # many new names, e.g. the first listing: one sort is cheaper
+            self._entries.extend(self._keys[fn] for fn in added)
+            self._entries.sort()
+        else:
+            for fn in added:
+                bisect.insort(self._entries, self._keys[fn])
+        return (added, removed)
+
+    def filenames(self):
+        """
+        @retval all filenames in sorted order
+        """
+        return [entry[1] for entry in self._entries]
+
+    def last(self):
+        """
+        @retval the last filename or None if the index is empty
+        """
+        if self._entries:
+            return self._entries[-1][1]
+        return None
+
+    def after(self, filename):
+        """
+        @retval the filenames that sort after filename, in order
+        """
+        position = bisect.bisect_right(self._entries, self.key(filename))
+        return [entry[1] for entry in self._entries[position:]]
 
 class SortingDirectoryPoller(ConditionPoller):
     """
@@ -265,36 +847,45 @@ class SortingDirectoryPoller(ConditionPoller):
     expects files to be added which can have several separate IDs separated with underscores
     these will be sorted from left to right as integers instead of ascii.
     """
-    def __init__(self, directory, wildcard, callback, exception_callback=None, interval=1):
+    def __init__(self, directory, wildcard, callback, exception_callback=None, interval=1, use_inotify=True):
         if not os.path.isdir(directory):
             raise ValueError('%s is not a directory'%directory)
         self._path = directory + '/' + wildcard
         self._last_filename = None
+        self._index = SortedFileIndex(self.ascii_to_int_list)
         super(SortingDirectoryPoller,self).__init__(self._check_for_files, callback, exception_callback, interval)
+        if use_inotify:
+            watch_directory(self, directory, wildcard)
+
+    # report every new file, including ones that sort before the last file
+    # found, rather than only the files after it
+    report_all_new = False
 
     def _check_for_files(self):
-        unsorted_filenames = glob.glob(self._path)      
-        filenames = self.sort_files(unsorted_filenames)
+        (added, removed) = self._index.update(glob.glob(self._path))
+        last = self._index.last()
+        if self.report_all_new:
+            self._last_filename = last
+            out = sorted(added, key=self._index.key)
+            log.trace('found files: %r', out)
+            return out or None
         # files, but no change since last time
-        if self._last_filename and filenames and filenames[-1]==self._last_filename:
+        if self._last_filename and last == self._last_filename:
             return None
         # no files yet, just like last time
-        if not self._last_filename and not filenames:
+        if not self._last_filename and not last:
             return None
-        if self._last_filename:
-            # if the last filename has been deleted, who knows where we are, just return all the files
-            try:
-                position = filenames.index(self._last_filename) # raises ValueError if file was removed
-                out = filenames[position+1:]
-            except ValueError:
-                log.debug("Lost previous last filename %s", self._last_filename)
-                out = filenames
+        if self._last_filename and self._last_filename in self._index:
+            out = self._index.after(self._last_filename)
         else:
-            out = filenames
-        self._last_filename = filenames[-1]
+            if self._last_filename:
+                # if the last filename has been deleted, who knows where we are, just return all the files
+                log.debug("Lost previous last filename %s", self._last_filename)
+            out = self._index.filenames()
+        self._last_filename = last
         log.trace('found files: %r', out)
         return out
-    
+
     def sort_files(self, filenames):
         """
         Sorts files which have multiple indices separated by underscores in a file name.
@@ -306,32 +897,15 @@ class SortingDirectoryPoller(ConditionPoller):
             return filenames
 
         log.debug("LENGTH: %d", len(filenames))
-        # this assumes all files have the same extension
-        file_extension = filenames[0].split('.')
-        split_names = ()
-        for fn in filenames:
-            split_name = self.ascii_to_int_list(fn)
-            # append this split up name as a tuple
-            split_names = split_names + (split_name, ) 
-        # now sort all the int formatted names
-        sorted_tuple = sorted(split_names)
-        # put the filenames back to string format
-        sorted_filenames = []
-        i = 0
-        for fn in sorted_tuple:
-            # recombine files with underscores
-            this_file = ''
-            for item in fn:
-                this_file = this_file + str(item) + '_'
-            # remove the last underscore, and add the file extension back in
-            sorted_filenames.append(this_file[:-1] + '.' + file_extension[1])
-            i += 1
-            
-        log.trace("sorted %s", sorted_filenames)    
+        sorted_filenames = sorted(filenames, key=lambda fn: (self.ascii_to_int_list(fn), fn))
+        log.trace("sorted %s", sorted_filenames)
         return sorted_filenames
-    
+
     @staticmethod
     def ascii_to_int_list(filename):
+        # compressed files sort as the files they hold
+        if is_compressed(filename):
+            filename = os.path.splitext(filename)[0]
         # remove file extension and split by underscores
         file_extension = filename.split('.')
         split_name = filename.replace('.' + file_extension[1], '').split('_')
@@ -344,8 +918,8 @@ class SortingDirectoryPoller(ConditionPoller):
                 # ignore error
                 pass
         return split_name
-    
-    
+
+
 class SortingDirectoryHarvester(SortingDirectoryPoller, Harvester):
     """
     Poll a single directory looking for new files with the directory poller.
@@ -356,32 +930,263 @@ class SortingDirectoryHarvester(SortingDirectoryPoller, Harvester):
 
         self.callback = file_callback
         self.last_file_completed = memento
+        self._open_catalog(config, memento)
         SortingDirectoryPoller.__init__(self,
                                  config['directory'],
                                  config['pattern'],
                                  self.on_new_files,
                                  exception_callback,
-                                 config.get('frequency', 1))
+                                 config.get('frequency', 1),
+                                 config.get('inotify', True))
+        self._share_loop(config)
+        # the catalog decides which files still need parsing
+        self.report_all_new = self.catalog is not None
 
     def on_new_files(self, files):
         """
         New files have been found, open each file and process it in the callback
         """
+        last_file_int_list = None
+        if self.last_file_completed:
+            last_file_int_list = SortingDirectoryPoller.ascii_to_int_list(self.last_file_completed)
+
+        if self.catalog is not None:
+            completed = lambda fn: last_file_int_list is not None and \
+                                   not self._index.key(fn)[0] > last_file_int_list
+            for fn in self._catalog_files(files, completed):
+                self._deliver(fn)
+            return
+
         for fn in files:
             
             if self.last_file_completed:
                 # sort the last file and new file into int list form so they will
                 # evalulate > not as ascii strings but as integers
-                fn_int_list = SortingDirectoryPoller.ascii_to_int_list(fn)
-                last_file_int_list = SortingDirectoryPoller.ascii_to_int_list(self.last_file_completed)
+                fn_int_list = self._index.key(fn)[0]
                 if fn_int_list > last_file_int_list:
-                    with open(fn,'rb') as f:
+                    with open_data_file(fn) as f:
                         self.callback(f, fn)
             else:
                 # there is no last file completed, so this file must be new, return it
-                with open(fn,'rb') as f:
+                with open_data_file(fn) as f:
                     self.callback(f, fn)
 
         
         
     
+
+
+class CatalogFileStatus(BaseEnum):
+    NEW = 'new'
+    QUEUED = 'queued'
+    PARSING = 'parsing'
+    PARSED = 'parsed'
+    FAILED = 'failed'
+
+CatalogEntry = namedtuple('CatalogEntry', ['name', 'size', 'mtime', 'inode', 'checksum', 'status',
+                                           'position', 'error', 'discovered', 'updated'])
+
+class HarvesterCatalog(object):
+    """
+    Persistent record, in a sqlite database, of every file a harvester has
+    found: its size, mtime and inode when found, where it is in the parse
+    and the last parser position stored for it.
+
+    A restarted harvester only stats the files in its directory and hands
+    on the ones that are new, changed, or were not finished, instead of
+    trusting a single last file name.  A file is changed when its size,
+    mtime or inode differ from those recorded when it was found, so the
+    catalog never reads file contents.  The checksum column is no longer
+    filled in; it is kept so catalogs written before stay readable.
+
+    The memento is still saved and is still authoritative for the file it
+    names; the catalog only adds to it.  The database runs in WAL mode with
+    synchronous=NORMAL, so a position update does not wait for an fsync; a
+    process crash loses nothing, a power failure may lose the last updates,
+    which the memento then covers.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            name TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime INTEGER,
+            inode INTEGER,
+            checksum TEXT,
+            status TEXT NOT NULL,
+            position TEXT,
+            error TEXT,
+            discovered REAL,
+            updated REAL
+        );
+        CREATE INDEX IF NOT EXISTS files_status ON files (status);
+    """
+
+    def __init__(self, path):
+        """
+        @param path sqlite database file, created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError as e:
+            log.warn('harvester catalog %s can not use WAL mode: %s', path, e)
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        log.debug('opened harvester catalog %s', path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def scan(self, filenames, completed=None):
+        """
+        Record the current state of files and return those still to be
+        parsed.  Files being parsed when the driver stopped come first, so
+        the parser position in the memento is applied to the right file.
+        @param filenames files found by the harvester
+        @param completed predicate for files already parsed according to the
+        memento; only used for a catalog that is still empty
+        @retval list of file names whose status is not parsed
+        """
+        parsing = []
+        pending = []
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                seed = completed is not None and len(self) == 0
+                for name in filenames:
+                    try:
+                        stat = os.stat(name)
+                    except OSError:
+                        continue
+                    identity = (stat.st_size, mtime_ns(stat), stat.st_ino)
+                    row = self._conn.execute(
+                        'SELECT size, mtime, inode, checksum, status FROM files WHERE name = ?',
+                        (name,)).fetchone()
+
+                    if row is None:
+                        status = CatalogFileStatus.NEW
+                        if seed and completed(name):
+                            status = CatalogFileStatus.PARSED
+                        self._conn.execute(
+                            'INSERT INTO files (name, size, mtime, inode, status, discovered, updated) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?)', (name,) + identity + (status, now, now))
+                    else:
+                        status = row[4]
+                        if tuple(row[0:3]) != identity:
+                            log.info('%s changed since it was cataloged', name)
+                            status = CatalogFileStatus.NEW
+                            self._conn.execute(
+                                'UPDATE files SET size = ?, mtime = ?, inode = ?, status = ?, updated = ?, '
+                                'checksum = NULL, position = NULL, error = NULL '
+                                'WHERE name = ?', identity + (status, now, name))
+
+                    if status == CatalogFileStatus.PARSING:
+                        parsing.append(name)
+                    elif status != CatalogFileStatus.PARSED:
+                        pending.append(name)
+        return parsing + pending
+
+    def get(self, name):
+        """
+        @retval CatalogEntry for the file, or None if it is not cataloged
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM files WHERE name = ?', (name,)).fetchone()
+        return self._entry(row) if row else None
+
+    def outstanding(self, status=None):
+        """
+        @param status only return files with this status
+        @retval CatalogEntry list of files not yet parsed, in discovery order
+        """
+        query = 'SELECT * FROM files WHERE status != ?'
+        args = [CatalogFileStatus.PARSED]
+        if status:
+            query += ' AND status = ?'
+            args.append(status)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY discovered, name', args).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def status_counts(self):
+        """
+        @retval dict of status to number of files
+        """
+        with self._lock:
+            return dict(self._conn.execute('SELECT status, COUNT(*) FROM files GROUP BY status').fetchall())
+
+    def mark_queued(self, name):
+        self._set_status(name, CatalogFileStatus.QUEUED)
+
+    def mark_parsing(self, name):
+        self._set_status(name, CatalogFileStatus.PARSING)
+
+    def mark_failed(self, name, error):
+        self._set_status(name, CatalogFileStatus.FAILED, error=str(error))
+
+    def mark_parsed(self, name):
+        """
+        Mark a cataloged file parsed.  The identity recorded when it was
+        found is kept, so a file changed while it was parsed is found again.
+        """
+        self._set_status(name, CatalogFileStatus.PARSED, position=None)
+
+    def set_position(self, name, position):
+        """
+        Record the parser state for a file.
+        @param position JSON serializable parser state
+        """
+        try:
+            encoded = json.dumps(position)
+        except (TypeError, ValueError) as e:
+            log.warn('can not store parser position %r for %s: %s', position, name, e)
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute('UPDATE files SET position = ?, updated = ? WHERE name = ?',
+                                   (encoded, time.time(), name))
+
+    def _set_status(self, name, status, **columns):
+        """
+        Update the status and any other columns of a cataloged file.  Files
+        that are not in the catalog are ignored.
+        """
+        columns['status'] = status
+        columns['updated'] = time.time()
+        if 'error' not in columns and status != CatalogFileStatus.FAILED:
+            columns['error'] = None
+        names = sorted(columns)
+        with self._lock:
+            with self._conn:
+                self._conn.execute('UPDATE files SET %s WHERE name = ?' % ', '.join('%s = ?' % c for c in names),
+                                   [columns[c] for c in names] + [name])
+
+    @staticmethod
+    def _entry(row):
+        row = list(row)
+        if row[6] is not None:
+            row[6] = json.loads(row[6])
+        return CatalogEntry(*row)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(path):
+    """
+    @param path sqlite database file
+    @retval the HarvesterCatalog for path, shared within the process so the
+    harvester and driver use the same connection
+    """
+    path = os.path.abspath(path)
+    with _catalogs_lock:
+        if path not in _catalogs:
+            _catalogs[path] = HarvesterCatalog(path)
+        return _catalogs[path]
@@ -24,35 +24,85 @@ import copy
 import datetime as dt
 import re
 from calendar import timegm
-from functools import partial
-from struct import unpack
+from collections import deque
+from struct import unpack, unpack_from
+
+import numpy as np
 
 from mi.core.log import get_logger
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException, DatasetParserException
-from mi.core.instrument.chunker import StringChunker
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey
 from mi.dataset.dataset_parser import BufferLoadingParser
 
 # start the logger
 log = get_logger()
 
-# Regex set to find each ensemble in the PD0 packet. It starts by specifying the
-# first 6 bytes of the header data (this is more explicit than just the 0x7f7f
-# marker the manual specifies, helping to avoid cases where the marker could
-# actually be in the data string, thus giving a false positive data record
-# marker), followed by the remaining N bytes in the ensemble. It stops, without
-# consuming bytes, at the beginning of the next ensemble (again using the first
-# 6 bytes of the header) or the end of the file. This dynamic regex is required
-# since the ensemble sizes will vary during the course of a deployment as
-# bottom-tracking is automatically turned on and off. This also allows the
-# glider pilots the flexibility to change the sampling characteristics of the
-# ADCPA without impacting the parser code.
-ADCPA_PD0_PARSED_REGEX = (
-    b'(\x7f\x7f[\x00-\xFF]{2}\x00[\x06|\x07]{1}[\x00-\xFF]+?)' +  # header bytes plus rest of ensemble
-    '(?=(\x7f\x7f[\x00-\xFF]{2}\x00[\x06|\x07]{1})|\Z)'  # start of the next ensemble, or EOF
-)
-ADCPA_PD0_PARSED_MATCHER = re.compile(ADCPA_PD0_PARSED_REGEX, re.DOTALL)
+# The first 6 bytes of an ensemble header: the 0x7f7f header and data source
+# ids, the number of bytes in the ensemble, a spare byte and the number of data
+# types, which is 6, or 7 when bottom-tracking is on. This is more explicit than
+# just the 0x7f7f marker the manual specifies, helping to avoid cases where the
+# marker could actually be in the data string, thus giving a false positive data
+# record marker. Ensemble sizes vary during the course of a deployment as
+# bottom-tracking is automatically turned on and off, so each ensemble is framed
+# on the number of bytes its header gives. This also allows the glider pilots
+# the flexibility to change the sampling characteristics of the ADCPA without
+# impacting the parser code.
+ADCPA_PD0_HEADER_MATCHER = re.compile(b'\x7f\x7f[\x00-\xFF]{2}\x00[\x06\x07]', re.DOTALL)
+
+# The start of an ensemble, on the first 6 bytes of its header. Ensembles end
+# where the next one starts, so a file can be split into ranges there.
+ADCPA_PD0_BOUNDARY_MATCHER = re.compile(b'(?=\x7f\x7f[\x00-\xFF]{2}\x00[\x06\x07])', re.DOTALL)
+
+
+def pd0_sieve_function(raw_data):
+    """
+    Frame the PD0 ensembles in a block of data. An ensemble is the number of
+    bytes its header gives, followed by a two byte checksum of those bytes.
+    Headers whose first data type does not start right after the data type
+    offsets, and ensembles whose checksum does not match, are left as non-data
+    along with anything else between ensembles. An ensemble cut short by the end of the
+    data is left until more data is added, so only the data being framed is
+    held, however large the file.
+    @param raw_data string or buffer to frame
+    @retval list of (start, end) tuples, one per ensemble
+    """
+    return_list = []
+    length = len(raw_data)
+    match = ADCPA_PD0_HEADER_MATCHER.search(raw_data)
+    while match:
+        start = match.start()
+        if start + 8 > length:
+            break
+        (num_bytes, spare, num_data_types, first_offset) = unpack_from('<HBBH', raw_data, start + 2)
+        end = start + num_bytes + 2
+        if first_offset != 6 + 2 * num_data_types:
+            position = start + 1
+        elif end > length:
+            break
+        elif int(np.frombuffer(raw_data, np.uint8, num_bytes, start).sum()) & 65535 == \
+                unpack_from('<H', raw_data, start + num_bytes)[0]:
+            return_list.append((start, end))
+            position = end
+        else:
+            log.debug("Checksum mismatch in the ensemble at %d", start)
+            position = start + 1
+        match = ADCPA_PD0_HEADER_MATCHER.search(raw_data, position)
+
+    return return_list
+
+
+def _beam_columns(chunk, dtype):
+    """
+    Split the rows of 4 beam values that follow a data type id into columns.
+    @param chunk The data type, starting with its 2 byte id
+    @param dtype numpy type of the values
+    @retval list of 4 lists of values, one per beam
+    """
+    size = np.dtype(dtype).itemsize
+    rows = (len(chunk) - 2) / 4 / size
+    values = np.frombuffer(chunk, dtype, rows * 4, 2).reshape(rows, 4)
+    return [values[:, beam].tolist() for beam in range(4)]
 
 
 ###############################################################################
@@ -282,13 +332,11 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result = []
 
         length = unpack("<H", self.raw_data[2:4])[0]
-        data = str(self.raw_data)
+        if len(self.raw_data) < length + 2:
+            raise SampleException("Ensemble is shorter than its header gives")
 
         # Calculate the checksum
-        total = int(0)
-        for i in range(0, length):
-            total += int(ord(data[i]))
-
+        total = int(np.frombuffer(self.raw_data, np.uint8, length).sum())
         checksum = total & 65535    # bitwise and with 65535 or mod vs 65536
 
         if checksum != unpack("<H", self.raw_data[length: length+2])[0]:
@@ -666,9 +714,6 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 2 / 4
-        offset = 0
-
         velocity_data_id = unpack("<H", chunk[0:2])[0]
         if 256 != velocity_data_id:
             raise SampleException("velocity_data_id was not equal to 256")
@@ -676,17 +721,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.VELOCITY_DATA_ID,
                                   DataParticleKey.VALUE: velocity_data_id})
 
-        water_velocity_east = []
-        water_velocity_north = []
-        water_velocity_up = []
-        error_velocity = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<hhhh', chunk[offset + 2: offset + 10])
-            water_velocity_east.append(a)
-            water_velocity_north.append(b)
-            water_velocity_up.append(c)
-            error_velocity.append(d)
-            offset += 4 * 2
+        (water_velocity_east, water_velocity_north, water_velocity_up,
+         error_velocity) = _beam_columns(chunk, '<i2')
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.WATER_VELOCITY_EAST,
                                   DataParticleKey.VALUE: water_velocity_east})
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.WATER_VELOCITY_NORTH,
@@ -702,9 +738,6 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 4
-        offset = 0
-
         correlation_magnitude_id = unpack("<H", chunk[0:2])[0]
         if 512 != correlation_magnitude_id:
             raise SampleException("correlation_magnitude_id was not equal to 512")
@@ -712,17 +745,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_ID,
                                   DataParticleKey.VALUE: correlation_magnitude_id})
 
-        correlation_magnitude_beam1 = []
-        correlation_magnitude_beam2 = []
-        correlation_magnitude_beam3 = []
-        correlation_magnitude_beam4 = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            correlation_magnitude_beam1.append(a)
-            correlation_magnitude_beam2.append(b)
-            correlation_magnitude_beam3.append(c)
-            correlation_magnitude_beam4.append(d)
-            offset += 4
+        (correlation_magnitude_beam1, correlation_magnitude_beam2,
+         correlation_magnitude_beam3, correlation_magnitude_beam4) = _beam_columns(chunk, np.uint8)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_BEAM1,
                                   DataParticleKey.VALUE: correlation_magnitude_beam1})
@@ -739,26 +763,14 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 4
-        offset = 0
-
         echo_intensity_id = unpack("<H", chunk[0:2])[0]
         if 768 != echo_intensity_id:
             raise SampleException("echo_intensity_id was not equal to 768")
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.ECHO_INTENSITY_ID,
                                   DataParticleKey.VALUE: echo_intensity_id})
 
-        echo_intesity_beam1 = []
-        echo_intesity_beam2 = []
-        echo_intesity_beam3 = []
-        echo_intesity_beam4 = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            echo_intesity_beam1.append(a)
-            echo_intesity_beam2.append(b)
-            echo_intesity_beam3.append(c)
-            echo_intesity_beam4.append(d)
-            offset += 4
+        (echo_intesity_beam1, echo_intesity_beam2,
+         echo_intesity_beam3, echo_intesity_beam4) = _beam_columns(chunk, np.uint8)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.ECHO_INTENSITY_BEAM1,
                                   DataParticleKey.VALUE: echo_intesity_beam1})
@@ -775,9 +787,6 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
 
         @throws SampleException If there is a problem with sample creation
         """
-        N = (len(chunk) - 2) / 4
-        offset = 0
-
         percent_good_id = unpack("<H", chunk[0:2])[0]
         if 1024 != percent_good_id:
             raise SampleException("percent_good_id was not equal to 1024")
@@ -785,17 +794,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_GOOD_ID,
                                   DataParticleKey.VALUE: percent_good_id})
 
-        percent_good_3beam = []
-        percent_transforms_reject = []
-        percent_bad_beams = []
-        percent_good_4beam = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            percent_good_3beam.append(a)
-            percent_transforms_reject.append(b)
-            percent_bad_beams.append(c)
-            percent_good_4beam.append(d)
-            offset += 4
+        (percent_good_3beam, percent_transforms_reject,
+         percent_bad_beams, percent_good_4beam) = _beam_columns(chunk, np.uint8)
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_GOOD_3BEAM,
                                   DataParticleKey.VALUE: percent_good_3beam})
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_TRANSFORMS_REJECT,
@@ -956,6 +956,8 @@ class AdcpaParser(BufferLoadingParser):
     AdcpaParser parses a TRDI ExplorerDVL (ADCPA) PD0 formatted data file that
     has been logged on the TWR Slocum Coastal Electric Glider.
     """
+    _range_boundary_matcher = ADCPA_PD0_BOUNDARY_MATCHER
+
     def __init__(self,
                  config,
                  state,
@@ -966,14 +968,13 @@ class AdcpaParser(BufferLoadingParser):
         super(AdcpaParser, self).__init__(config,
                                           stream_handle,
                                           state,
-                                          partial(StringChunker.regex_sieve_function,
-                                                  regex_list=[ADCPA_PD0_PARSED_MATCHER]),
+                                          pd0_sieve_function,
                                           state_callback,
                                           publish_callback,
                                           *args,
                                           **kwargs)
         self._timestamp = 0.0
-        self._record_buffer = []  # holds tuples of (record, state)
+        self._record_buffer = deque()  # holds tuples of (record, state)
         self._read_state = {StateKey.POSITION: 0}
         if state:
             self.set_state(self._state)
@@ -992,13 +993,16 @@ class AdcpaParser(BufferLoadingParser):
         if not StateKey.POSITION in state_obj:
             raise DatasetParserException("Invalid state keys")
 
-        self._record_buffer = []
+        self._record_buffer = deque()
         self._state = state_obj
         self._read_state = state_obj
 
         # seek to it
         self._stream_handle.seek(state_obj[StateKey.POSITION])
 
+    def _range_state(self, position):
+        return {StateKey.POSITION: position}
+
     def _increment_state(self, increment):
         """
         Increment the parser position by a certain amount in bytes. This
@@ -1013,21 +1017,6 @@ class AdcpaParser(BufferLoadingParser):
 
         self._read_state[StateKey.POSITION] += increment
 
-    def get_block(self):
-        """
-        Overwrites get_block method in dataset_parser.py to simply read the
-        entire file rather than break it into chunks.
-        @retval The length of data retreived
-        @throws EOFError when the end of the file is reached
-        """
-        # read in some more data
-        data = self._stream_handle.read()
-        if data:
-            self._chunker.add_chunk(data, self._timestamp)
-            return len(data)
-        else:  # EOF
-            raise EOFError
-
     def parse_chunks(self):
         """
         @retval a list of tuples with sample particles encountered in this
@@ -1041,8 +1030,7 @@ class AdcpaParser(BufferLoadingParser):
         (timestamp, chunk, start, end) = self._chunker.get_next_data_with_index(True)
         while chunk is not None:
             # particleize the data block received.
-            particle = self._extract_sample(self._particle_class, ADCPA_PD0_PARSED_MATCHER,
-                                            chunk, self._timestamp)
+            particle = self._extract_sample(self._particle_class, None, chunk, self._timestamp)
 
             # if the particle is good, set the state and append particle
             if particle:
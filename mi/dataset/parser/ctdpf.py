@@ -17,6 +17,7 @@ import re
 import time
 import ntplib
 from functools import partial
+from collections import deque
 from dateutil import parser
 from dateutil import tz
 
@@ -34,6 +35,10 @@ TIME_MATCHER = re.compile(TIME_REGEX, re.DOTALL)
 DATA_REGEX = r' (\d*\.\d*),\s*(\d*\.\d*),\s*(\d*\.\d*),\s*(\d*\.\d)'
 DATA_MATCHER = re.compile(DATA_REGEX, re.DOTALL)
 
+# a timestamp line sets the time of the records after it, so a file can
+# be split into ranges at one that follows a record
+RANGE_BOUNDARY_MATCHER = re.compile(r'^' + DATA_REGEX + r'\s*\n(?=' + TIME_REGEX + ')', re.MULTILINE)
+
 DATE_REGEX = r'(\d{2})/(\d{2})/(\d{4}) (\d{2}):(\d{2}):(\d{2})'
 DATE_MATCHER = re.compile(DATE_REGEX)
 
@@ -106,7 +111,9 @@ class CtdpfParserDataParticle(DataParticle):
             return False
     
 class CtdpfParser(BufferLoadingParser):
-    
+
+    _range_boundary_matcher = RANGE_BOUNDARY_MATCHER
+
     def __init__(self,
                  config,
                  state,
@@ -125,7 +132,7 @@ class CtdpfParser(BufferLoadingParser):
                                           *args,
                                           **kwargs)
         self._timestamp = 0.0
-        self._record_buffer = [] # holds tuples of (record, state)
+        self._record_buffer = deque() # holds tuples of (record, state)
         self._read_state = {StateKey.POSITION:0, StateKey.TIMESTAMP:0.0}
                 
         if state:
@@ -147,13 +154,25 @@ class CtdpfParser(BufferLoadingParser):
         
         self._timestamp = state_obj[StateKey.TIMESTAMP]
         self._timestamp += 1
-        self._record_buffer = []
+        self._record_buffer = deque()
         self._state = state_obj
         self._read_state = state_obj
         
         # seek to it
         self._stream_handle.seek(state_obj[StateKey.POSITION])
 
+    def _range_state(self, position):
+        """
+        A range starts at a timestamp line, which sets the timestamp
+        """
+        return {StateKey.POSITION: position, StateKey.TIMESTAMP: 0.0}
+
+    def _index_state(self, entry):
+        """
+        set_state() adds a second for the record before the position
+        """
+        return {StateKey.POSITION: entry.offset, StateKey.TIMESTAMP: entry.timestamp - 1}
+
     @staticmethod
     def _parse_time(datestr):
         dt = parser.parse(datestr)
@@ -224,8 +243,8 @@ class CtdpfParser(BufferLoadingParser):
             parsing, plus the state. An empty list of nothing was parsed.
         """            
         result_particles = []
-        (timestamp, chunk, start, end) = self._chunker.get_next_data_with_index()
-        non_data = None
+        (timestamp, chunk, start, end) = self._next_data_chunk()
+        (nd_timestamp, non_data) = self._chunker.get_next_non_data(clean=True)
 
         # sieve looks for timestamp, update and increment position
         while (chunk != None):
@@ -248,21 +267,22 @@ class CtdpfParser(BufferLoadingParser):
                     self._increment_state(end, self._timestamp)    
                     self._increment_timestamp() # increment one samples worth of time
                     result_particles.append((sample, copy.copy(self._read_state)))
-
-                # Check for noise between records, but ignore newline.  This is detecting noise following
-                # the last successful chunk read which is why it is post sample generation.
-                if non_data is not None:
-                    log.trace("Non-data detected: '%s'", non_data)
-                    if not WHITESPACE_MATCHER.match(non_data):
-                        log.info("Gap in datafile detected.")
-                        self.start_new_sequence()
-
-                    self._increment_state(len(non_data), self._timestamp)
+                    self._index_record(sample, chunk)
 
             else:
                 raise SampleException("Unhandled chunk: %s", chunk)
 
-            (timestamp, chunk, start, end) = self._chunker.get_next_data_with_index()
+            # Check for noise between records, but ignore newline.  This is detecting noise following
+            # the last successful chunk read which is why it is post sample generation.
+            if non_data is not None:
+                log.trace("Non-data detected: '%s'", non_data)
+                if not WHITESPACE_MATCHER.match(non_data):
+                    log.info("Gap in datafile detected.")
+                    self.start_new_sequence()
+
+                self._increment_state(len(non_data), self._timestamp)
+
+            (timestamp, chunk, start, end) = self._next_data_chunk()
             (nd_timestamp, non_data) = self._chunker.get_next_non_data(clean=True)
 
         return result_particles
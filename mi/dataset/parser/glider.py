@@ -9,6 +9,7 @@ __author__ = 'Stuart Pearce & Chris Wingard'
 __license__ = 'Apache 2.0'
 
 import re
+import operator
 import numpy as np
 import ntplib
 import time
@@ -16,12 +17,11 @@ import copy
 import pdb
 
 from math import copysign
-from functools import partial
+from collections import deque
 
 from mi.core.log import get_logger
 from mi.core.common import BaseEnum
-from mi.core.exceptions import SampleException, DatasetParserException
-from mi.core.instrument.chunker import StringChunker
+from mi.core.exceptions import SampleException, DatasetParserException, ConfigurationException
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey
 from mi.core.instrument.data_particle import DataParticleValue
 from mi.dataset.dataset_parser import BufferLoadingParser
@@ -29,6 +29,8 @@ from mi.dataset.dataset_parser import BufferLoadingParser
 # start the logger
 log = get_logger()
 
+NEWLINE_MATCHER = re.compile(r'\n')
+
 ###############################################################################
 # Define the Particle Classes for Global and Coastal Gliders, both the delayed
 # (delivered over Iridium network) and the recovered (downloaded from a glider
@@ -47,6 +49,14 @@ class StateKey(BaseEnum):
     POSITION = 'position'
 
 
+class GliderConfigKey(BaseEnum):
+    """
+    Glider parser configuration keys, alongside particle_module
+    """
+    # names of the particle classes a GliderStreamsParser makes particles of
+    PARTICLE_CLASSES = 'particle_classes'
+
+
 class DataParticleType(BaseEnum):
     # Data particle types for the Open Ocean (aka Global) and Coastal gliders.
     # ADCPA data will parsed by a different parser (adcpa.py)
@@ -107,6 +117,21 @@ class GliderParticle(DataParticle):
     # contain actual science data for this instrument.  This flag
     # will be set to true if we have found data when parsed.
     common_parameters = GliderParticleKey.list()
+    # the columns the particle is built from, set by each particle class
+    parameters = None
+
+    @classmethod
+    def columns(cls):
+        """
+        The glider file columns a parser needs to decode for this particle:
+        its parameters, the science parameters that decide whether a record
+        has data for it, and the record time.
+        @retval set of column labels, or None for every column
+        """
+        if cls.parameters is None:
+            return None
+        return set(cls.parameters) | set(getattr(cls, 'science_parameters', [])) | \
+            set([GliderParticleKey.M_PRESENT_TIME])
 
     def _parsed_values(self, key_list):
         log.debug("Build a particle with keys: %s", key_list)
@@ -152,6 +177,7 @@ class CtdgvParticleKey(GliderParticleKey):
 
 class GgldrCtdgvDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.GGLDR_CTDGV_DELAYED
+    parameters = CtdgvParticleKey.list()
     science_parameters = CtdgvParticleKey.science_parameter_list()
 
     def _build_parsed_values(self):
@@ -161,11 +187,13 @@ class GgldrCtdgvDelayedDataParticle(GliderParticle):
 
         @param result A returned list with sub dictionaries of the data
         """
-        return self._parsed_values(CtdgvParticleKey.list())
+        return self._parsed_values(self.parameters)
 
 
 class CgldrCtdgvDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.CGLDR_CTDGV_DELAYED
+    parameters = CtdgvParticleKey.list()
+    science_parameters = CtdgvParticleKey.science_parameter_list()
 
     def _build_parsed_values(self):
         """
@@ -174,7 +202,7 @@ class CgldrCtdgvDelayedDataParticle(GliderParticle):
 
         @param result A returned list with sub dictionaries of the data
         """
-        return self._parsed_values(CtdgvParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
 
 
 class DostaParticleKey(DataParticleKey):
@@ -194,10 +222,16 @@ class DostaParticleKey(DataParticleKey):
         'sci_water_temp',
         'sci_water_pressure'
     ]
+    SCIENCE_LIST = [
+        'sci_oxy4_oxygen',
+        'sci_oxy4_saturation'
+    ]
 
 
 class GgldrDostaDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.GGLDR_DOSTA_DELAYED
+    parameters = DostaParticleKey.KEY_LIST
+    science_parameters = DostaParticleKey.SCIENCE_LIST
 
     def _build_parsed_values(self):
         """
@@ -207,11 +241,13 @@ class GgldrDostaDelayedDataParticle(GliderParticle):
         @param gpd A GliderParser class instance.
         @param result A returned list with sub dictionaries of the data
         """
-        return self._parsed_values(DostaParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
 
 
 class CgldrDostaDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.CGLDR_DOSTA_DELAYED
+    parameters = DostaParticleKey.KEY_LIST
+    science_parameters = DostaParticleKey.SCIENCE_LIST
 
     def _build_parsed_values(self):
         """
@@ -221,7 +257,7 @@ class CgldrDostaDelayedDataParticle(GliderParticle):
         @param gpd A GliderParser class instance.
         @param result A returned list with sub dictionaries of the data
         """
-        return self._parsed_values(DostaParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
 
 
 class FlordParticleKey(DataParticleKey):
@@ -237,10 +273,16 @@ class FlordParticleKey(DataParticleKey):
         'sci_m_present_time',
         'sci_m_present_secs_into_mission'
     ]
+    SCIENCE_LIST = [
+        'sci_flbb_bb_units',
+        'sci_flbb_chlor_units'
+    ]
 
 
 class GgldrFlordDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.GGLDR_FLORD_DELAYED
+    parameters = FlordParticleKey.KEY_LIST
+    science_parameters = FlordParticleKey.SCIENCE_LIST
 
     def _build_parsed_values(self):
         """
@@ -251,7 +293,7 @@ class GgldrFlordDelayedDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(FlordParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
 
 
 class FlortParticleKey(DataParticleKey):
@@ -261,17 +303,24 @@ class FlortParticleKey(DataParticleKey):
         'm_lat',
         'm_lon',
         'sci_flbbcd_bb_units',
-        'sci_flbbcd_cdom_units'
+        'sci_flbbcd_cdom_units',
         'sci_flbbcd_chlor_units',
         'm_present_time',  # need m_ timestamps for lats & lons
         'm_present_secs_into_mission',
         'sci_m_present_time',
         'sci_m_present_secs_into_mission'
     ]
+    SCIENCE_LIST = [
+        'sci_flbbcd_bb_units',
+        'sci_flbbcd_cdom_units',
+        'sci_flbbcd_chlor_units'
+    ]
 
 
 class CgldrFlortDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.CGLDR_FLORT_DELAYED
+    parameters = FlortParticleKey.KEY_LIST
+    science_parameters = FlortParticleKey.SCIENCE_LIST
 
     def _build_parsed_values(self):
         """
@@ -282,7 +331,7 @@ class CgldrFlortDelayedDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(FlordParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
 
 
 class EngineeringParticleKey(DataParticleKey):
@@ -309,10 +358,14 @@ class EngineeringParticleKey(DataParticleKey):
         'm_water_vy',
         'x_low_power_status'
     ]
+    # any engineering value, though not the times every record has
+    SCIENCE_LIST = [key for key in KEY_LIST if key not in GliderParticleKey.list()]
 
 
 class GgldrEngDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.GGLDR_ENG_DELAYED
+    parameters = EngineeringParticleKey.KEY_LIST
+    science_parameters = EngineeringParticleKey.SCIENCE_LIST
 
     def _build_parsed_values(self):
         """
@@ -323,11 +376,13 @@ class GgldrEngDelayedDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(EngineeringParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
 
 
 class CgldrEngDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.CGLDR_ENG_DELAYED
+    parameters = EngineeringParticleKey.KEY_LIST
+    science_parameters = EngineeringParticleKey.SCIENCE_LIST
 
     def _build_parsed_values(self):
         """
@@ -338,7 +393,7 @@ class CgldrEngDelayedDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(EngineeringParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
 
 
 class ParadParticleKey(DataParticleKey):
@@ -346,17 +401,22 @@ class ParadParticleKey(DataParticleKey):
         'm_present_time',  # need m_ timestamps for lats & lons
         'm_present_secs_into_mission',
         'sci_m_present_time',
-        'sci_m_present_secs_into_mission'
+        'sci_m_present_secs_into_mission',
         'm_gps_lat',
         'm_gps_lon',
         'm_lat',
         'm_lon',
         'sci_bsipar_par'
     ]
+    SCIENCE_LIST = [
+        'sci_bsipar_par'
+    ]
 
 
 class CgldrParadDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.CGLDR_PARAD_DELAYED
+    parameters = ParadParticleKey.KEY_LIST
+    science_parameters = ParadParticleKey.SCIENCE_LIST
 
     def _build_parsed_values(self):
         """
@@ -367,7 +427,80 @@ class CgldrParadDelayedDataParticle(GliderParticle):
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(ParadParticleKey.KEY_LIST)
+        return self._parsed_values(self.parameters)
+
+
+class GliderColumnDecoder(object):
+    """
+    Decodes glider data records in bulk into a 2-D array of floats, one row
+    per record and one column per sensor, holding only the columns asked
+    for.  A glider can log over a thousand sensors while a particle is
+    built from a few dozen, so the others are split out of each record and
+    dropped without being converted.  Sensors with no value in a record
+    are NaN.
+    """
+    def __init__(self, labels, num_bytes, columns, position_converter):
+        """
+        @param labels The column labels from the file header
+        @param num_bytes The column byte sizes from the file header
+        @param columns Labels of the columns to decode, None for all
+        @param position_converter Converts a latitude or longitude string
+            to decimal degrees
+        """
+        self.column_count = len(labels)
+        indexes = [ii for (ii, label) in enumerate(labels) if columns is None or label in columns]
+        self.labels = [labels[ii] for ii in indexes]
+        if len(indexes) == 1:
+            self._select = lambda values: (values[indexes[0]],)
+        elif indexes:
+            self._select = operator.itemgetter(*indexes)
+        else:
+            self._select = lambda values: ()
+        # latitude and longitude strings are converted to decimal degrees,
+        # one and two byte sensors are integers
+        self._positions = [jj for (jj, label) in enumerate(self.labels) if '_lat' in label or '_lon' in label]
+        self._integers = [num_bytes[ii] in (1, 2) and jj not in self._positions
+                          for (jj, ii) in enumerate(indexes)]
+        self._position_converter = position_converter
+
+    def decode(self, records):
+        """
+        @param records List of data record strings
+        @retval float array of shape (records, columns)
+        @throws DatasetParserException if a record does not have the number
+            of columns described in the header
+        """
+        rows = []
+        for record in records:
+            values = record.split()
+            if len(values) != self.column_count:
+                raise DatasetParserException('Glider data file does not have the ' +
+                                             'same number of columns as described ' +
+                                             'in the header.\n' +
+                                             'Described: %d, Actual: %d' %
+                                             (self.column_count, len(values)))
+            rows.append(self._select(values))
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.labels))
+        for jj in self._positions:
+            data[:, jj] = [self._position_converter(row[jj]) for row in rows]
+        return data
+
+    def data_dicts(self, data):
+        """
+        @param data Array from decode()
+        @retval list of dictionaries of the values of each record, keyed by
+            column label, as the glider particles take them
+        """
+        result = []
+        columns = zip(self.labels, self._integers)
+        for row in data.tolist():
+            data_dict = {}
+            for ((label, integer), value) in zip(columns, row):
+                if integer and not np.isnan(value):
+                    value = int(value)
+                data_dict[label] = {'Name': label, 'Data': value}
+            result.append(data_dict)
+        return result
 
 
 class GliderParser(BufferLoadingParser):
@@ -377,7 +510,13 @@ class GliderParser(BufferLoadingParser):
     science data file, and holds the self describing header data in a header
     dictionary and the data in a data dictionary using the column labels as the
     dictionary keys. These dictionaries are used to build the particles.
+
+    The state position is the file offset of the end of the last record
+    read, so a parser given the state carries on with the next record.
     """
+    # states are file offsets of the end of a record
+    _track_chunk_offset = True
+
     def __init__(self,
                  config,
                  state,
@@ -388,19 +527,23 @@ class GliderParser(BufferLoadingParser):
 
         self._stream_handle = stream_handle
         self._timestamp = 0.0
-        self._record_buffer = []  # holds tuples of (record, state)
+        self._record_buffer = deque()  # holds tuples of (record, state)
         self._read_state = {StateKey.POSITION: 0}
         self._read_header()
+        self._sample_matcher = self._get_sample_pattern()
 
         super(GliderParser, self).__init__(config,
                                            self._stream_handle,
                                            state,
-                                           partial(StringChunker.regex_sieve_function,
-                                                   regex_list=[self._get_sample_pattern()]),
+                                           self._sieve,
                                            state_callback,
                                            publish_callback,
                                            *args,
                                            **kwargs)
+        # records are lines, ranges of the file start after one
+        self._range_boundary_matcher = re.compile(r'^' + self._get_sample_pattern().pattern + r'\n', re.MULTILINE)
+        self._decoder = GliderColumnDecoder(self._header_dict['labels'], self._header_dict['num_of_bytes'],
+                                            self._columns(), self._string_to_ddegrees)
         if state:
             self.set_state(self._state)
 
@@ -435,15 +578,42 @@ class GliderParser(BufferLoadingParser):
         if column_count == 0:
             raise SampleException("sensors_per_cycle is 0")
 
-        regex = r''
-        for i in range(0, column_count-1):
-            regex += r'([-\d\.]+|NaN)\s'
-
-        regex += r'([-\d\.]+|NaN) *$'
+        # without groups, as python allows no more than 100 of them and a
+        # glider can log well over a thousand sensors
+        regex = r'(?:[-\d\.]+\s|NaN\s){%d}(?:[-\d\.]+|NaN) *$' % (column_count - 1)
 
         log.debug("Sample Pattern: %s", regex)
         return re.compile(regex, re.MULTILINE)
 
+    def _sieve(self, raw_data):
+        """
+        Find the data records in the raw data: the last sensors_per_cycle
+        values of each line, as the sample pattern finds them.  Searched
+        for, the pattern is tried from every character of a line and costs
+        time in the square of the line length, which with a thousand
+        sensors is most of the parse.  Here it is only matched once per
+        line, at the value sensors_per_cycle from the end.
+        @param raw_data The data to sieve, a string or buffer
+        @retval list of (start, end) tuples of the records
+        """
+        column_count = self._header_dict['sensors_per_cycle']
+        result = []
+        position = 0
+        while position < len(raw_data):
+            newline = NEWLINE_MATCHER.search(raw_data, position)
+            end = newline.start() if newline else len(raw_data)
+            line = raw_data[position:end]
+            values = line.rstrip(' ').rsplit(None, column_count)
+            if len(values) >= column_count:
+                # the record starts after any values before it
+                rest = line[len(values[0]):] if len(values) > column_count else line
+                start = position + len(line) - len(rest.lstrip())
+                match = self._sample_matcher.match(raw_data, start, end)
+                if match:
+                    result.append((match.start(), match.end()))
+            position = end + 1
+        return result
+
     def _read_file_definition(self):
         """
         Read the first 14 lines of the data file for the file definitions, values
@@ -513,72 +683,70 @@ class GliderParser(BufferLoadingParser):
         if not (StateKey.POSITION in state_obj):
             raise DatasetParserException("Invalid state keys")
 
-        self._record_buffer = []
+        self._record_buffer = deque()
         self._state = state_obj
         self._read_state = state_obj
 
         # seek to it
         self._stream_handle.seek(state_obj[StateKey.POSITION])
 
-    def _increment_state(self, increment):
-        """
-        Increment the parser position by a certain amount in bytes. This
-        indicates what has been READ from the file, not what has been published.
-        This allows a reload of the file position.
+    def _range_state(self, position):
+        return {StateKey.POSITION: position}
+
+    def _index_state(self, entry):
+        return {StateKey.POSITION: entry.offset}
 
-        @param increment Number of bytes to increment the parser position.
+    def _columns(self):
+        """
+        @retval labels of the columns the particles need, None for all
         """
-        log.trace("Incrementing current state: %s with inc: %s",
-                  self._read_state, increment)
-        self._read_state[StateKey.POSITION] += increment
-        # Thomas, my monkey of a son, wanted this comment inserted in the code. -CW
+        particle_class = getattr(self, '_particle_class', None)
+        if particle_class is None or not hasattr(particle_class, 'columns'):
+            return None
+        return particle_class.columns()
 
     def _read_data(self, data_record):
         """
-        Read in the column labels, data type, number of bytes of each
-        data type, and the data from an ASCII glider data file.
+        Read the values of the columns the particles need from a data
+        record of an ASCII glider data file.
+        @retval dictionary of the values keyed by column label
         """
         log.debug("_read_data: Data Record: %s", data_record)
+        return self._decoder.data_dicts(self._decoder.decode([data_record]))[0]
 
-        data_dict = {}
-        num_columns = self._header_dict['sensors_per_cycle']
-        data_labels = self._header_dict['labels']
-        #data_units = self._header_dict['data_units']
-        num_bytes = self._header_dict['num_of_bytes']
-        data = data_record.split()
-        if num_columns != len(data):
-            raise DatasetParserException('Glider data file does not have the ' +
-                                         'same number of columns as described ' +
-                                         'in the header.\n' +
-                                         'Described: %d, Actual: %d' %
-                                         (num_columns, len(data)))
-
-        # extract record to dictionary
-        for ii in range(num_columns):
-            log.trace("_read_data: index: %d label: %s, value: %s", ii, data_labels[ii], data[ii])
-
-            if (num_bytes[ii] == 1) or (num_bytes[ii] == 2):
-                    str2data = int
-            elif (num_bytes[ii] == 4) or (num_bytes[ii] == 8):
-                    str2data = float
-
-            # check to see if this is a latitude/longitude string
-            if ('_lat' in data_labels[ii]) or ('_lon' in data_labels[ii]):
-                # convert latitiude/longitude strings to decimal degrees
-
-                value = self._string_to_ddegrees(data[ii])
-            else:
-                value = str2data(data[ii])
-
-            data_dict[data_labels[ii]] = {
-                'Name': data_labels[ii],
-                #'Units': data_units[ii],
-                #'Number_of_Bytes': int(num_bytes[ii]),
-                'Data': value
-            }
+    def _decode_chunks(self):
+        """
+        Take all the records in the buffer, each with the noise the chunker
+        has after it, and decode them together.
+        @retval (list of (data_record, end, chunk offset, non_data) tuples,
+            list of the data dictionaries of the records)
+        """
+        non_data = None
+        chunks = []
+        (timestamp, data_record, start, end) = self._next_data_chunk()
+        while data_record is not None:
+            chunks.append((data_record, end, self._chunk_offset, non_data))
+            # process the next chunk, all the way through the file.
+            (timestamp, data_record, start, end) = self._next_data_chunk()
+            (nd_timestamp, non_data) = self._chunker.get_next_non_data(clean=True)
+        if not chunks:
+            return ([], [])
+        return (chunks, self._decoder.data_dicts(self._decoder.decode([chunk[0] for chunk in chunks])))
 
-        log.trace("Data dict parsed: %s", data_dict)
-        return data_dict
+    def _record_timestamp(self, data_dict):
+        """
+        @param data_dict The data dictionary of a record
+        @retval the NTP timestamp of the record, from m_present_time
+        @throws SampleException if the record has no m_present_time
+        """
+        # from the parsed data, m_present_time is the unix timestamp
+        try:
+            record_time = data_dict['m_present_time']['Data']
+            timestamp = ntplib.system_to_ntp_time(record_time)
+            log.debug("Converting record timestamp %f to ntp timestamp %f", record_time, timestamp)
+        except KeyError:
+            raise SampleException("unable to find timestamp in data")
+        return timestamp
 
     def parse_chunks(self):
         """
@@ -589,29 +757,19 @@ class GliderParser(BufferLoadingParser):
         """
         # set defaults
         result_particles = []
-        non_data = None
 
-        # collect the data from the file
-        (timestamp, data_record, start, end) = self._chunker.get_next_data_with_index()
-
-        while data_record is not None:
-            # parse the data record into a data dictionary to pass to the
-            # particle class
-            data_dict = self._read_data(data_record)
-
-            # from the parsed data, m_present_time is the unix timestamp
-            try:
-                record_time = data_dict['m_present_time']['Data']
-                timestamp = ntplib.system_to_ntp_time(data_dict['m_present_time']['Data'])
-                log.debug("Converting record timestamp %f to ntp timestamp %f", record_time, timestamp)
-            except KeyError:
-                raise SampleException("unable to find timestamp in data")
+        (chunks, data_dicts) = self._decode_chunks()
+        for (chunk, data_dict) in zip(chunks, data_dicts):
+            (data_record, end, self._chunk_offset, non_data) = chunk
+            timestamp = self._record_timestamp(data_dict)
+            # the state is the end of the last record read, science data or not
+            self._read_state[StateKey.POSITION] = self._chunk_offset + len(data_record)
 
             if self._has_science_data(data_dict):
                 # create the particle
                 particle = self._extract_sample(self._particle_class, None, data_dict, timestamp)
-                self._increment_state(end)
                 result_particles.append((particle, copy.copy(self._read_state)))
+                self._index_record(particle, data_record)
             else:
                 log.debug("No science data found in particle. %s", data_dict)
 
@@ -621,22 +779,20 @@ class GliderParser(BufferLoadingParser):
                     log.info("Gap in datafile detected.")
                     log.trace("Noise detected: %s", non_data)
                     self.start_new_sequence()
-            if non_data is not None:
-                self._increment_state(len(non_data))
-
-            # process the next chunk, all the way through the file.
-            (timestamp, data_record, start, end) = self._chunker.get_next_data_with_index()
-            (nd_timestamp, non_data) = self._chunker.get_next_non_data(clean=True)
 
         # publish the results
         return result_particles
 
-    def _has_science_data(self, data_dict):
+    def _has_science_data(self, data_dict, particle_class=None):
         """
         Examine the data_dict to see if it contains science data.
+        @param particle_class The particle class whose science parameters
+            to look for, the parser's particle class by default
         """
-        for key in data_dict.keys():
-            if key in self._particle_class.science_parameters:
+        if particle_class is None:
+            particle_class = self._particle_class
+        for key in particle_class.science_parameters:
+            if key in data_dict:
                 value = data_dict[key]['Data']
                 if not np.isnan(value):
                     log.debug("Found science value for key: %s, value: %s", key, value)
@@ -689,4 +845,139 @@ class GliderParser(BufferLoadingParser):
 
         return ddegrees
 
+
+class GliderStreamsParser(GliderParser):
+    """
+    GliderStreamsParser parses a glider data file once for several particle
+    classes, named in the particle_classes parser config, rather than once
+    for each class with a GliderParser.  Each record is decoded once, with
+    the columns of all the classes, and makes a particle of each class it
+    has science data for.  The particles of each class start their own
+    sequences.
+
+    The state holds a position for each particle stream, the end of the
+    last record parsed for it: {stream: {'position': offset}}.  Parsing
+    carries on from the earliest position, and the records before a
+    stream's position make no particles for it, so streams that are not in
+    the state start from the first record.  Files are not split into
+    ranges, as a range can not carry on the sequence of each stream.
+    """
+
+    def __init__(self,
+                 config,
+                 state,
+                 stream_handle,
+                 state_callback,
+                 publish_callback,
+                 *args, **kwargs):
+
+        names = config.get(GliderConfigKey.PARTICLE_CLASSES)
+        if not names or not config.get('particle_module'):
+            raise ConfigurationException("Glider streams parser needs particle_module and %s configured" %
+                                         GliderConfigKey.PARTICLE_CLASSES)
+        module = __import__(config.get('particle_module'), fromlist=names)
+        self._particle_classes = [getattr(module, name) for name in names]
+        self._streams = [particle_class.type() for particle_class in self._particle_classes]
+        # streams whose next particle starts a new sequence
+        self._new_sequences = set(self._streams)
+        self._stream_state = None
+
+        super(GliderStreamsParser, self).__init__(config,
+                                                  state,
+                                                  stream_handle,
+                                                  state_callback,
+                                                  publish_callback,
+                                                  *args,
+                                                  **kwargs)
+        self._range_boundary_matcher = None
+        if self._stream_state is None:
+            self._stream_state = self._positions({})
+
+    def _read_header(self):
+        super(GliderStreamsParser, self)._read_header()
+        self._data_start = self._read_state[StateKey.POSITION]
+
+    def _columns(self):
+        """
+        @retval labels of the columns any of the particle classes need
+        """
+        columns = set()
+        for particle_class in self._particle_classes:
+            columns |= particle_class.columns()
+        return columns
+
+    def _positions(self, state_obj):
+        """
+        @param state_obj A parser state
+        @retval copy of the state with a position for each stream
+        @throws DatasetParserException if there is a bad state structure
+        """
+        if not isinstance(state_obj, dict):
+            raise DatasetParserException("Invalid state structure")
+        positions = dict(state_obj)
+        for stream in self._streams:
+            position = positions.setdefault(stream, {StateKey.POSITION: self._data_start})
+            if not isinstance(position, dict) or StateKey.POSITION not in position:
+                raise DatasetParserException("Invalid state keys for stream %s" % stream)
+        return positions
+
+    def set_state(self, state_obj):
+        """
+        Set the value of the state object for this parser
+        @param state_obj The object to set the state to, a dict of a dict
+            with a StateKey.POSITION value for each stream.  The position
+            is number of bytes into the file.
+        @throws DatasetParserException if there is a bad state structure
+        """
+        log.trace("Attempting to set state to: %s", state_obj)
+        self._stream_state = self._positions(state_obj)
+        self._record_buffer = deque()
+        self._state = state_obj
+
+        # seek to the earliest stream, after the header
+        position = min(self._stream_state[stream][StateKey.POSITION] for stream in self._streams)
+        self._stream_handle.seek(max(position, self._data_start))
+
+    def _index_state(self, entry):
+        return dict((stream, {StateKey.POSITION: entry.offset}) for stream in self._streams)
+
+    def start_new_sequence(self):
+        super(GliderStreamsParser, self).start_new_sequence()
+        self._new_sequences = set(self._streams)
+
+    def parse_chunks(self):
+        """
+        Create particles of each class out of chunks
+        @retval a list of tuples with sample particles encountered in this
+            parsing, plus the state. An empty list is returned if nothing was
+            parsed.
+        """
+        result_particles = []
+
+        (chunks, data_dicts) = self._decode_chunks()
+        for (chunk, data_dict) in zip(chunks, data_dicts):
+            (data_record, end, self._chunk_offset, non_data) = chunk
+            record_end = self._chunk_offset + len(data_record)
+            timestamp = self._record_timestamp(data_dict)
+
+            for (stream, particle_class) in zip(self._streams, self._particle_classes):
+                if record_end <= self._stream_state[stream][StateKey.POSITION]:
+                    # parsed for this stream before the state was saved
+                    continue
+                self._stream_state[stream] = {StateKey.POSITION: record_end}
+                if self._has_science_data(data_dict, particle_class):
+                    self._new_sequence = stream in self._new_sequences
+                    particle = self._extract_sample(particle_class, None, data_dict, timestamp)
+                    self._new_sequences.discard(stream)
+                    result_particles.append((particle, copy.copy(self._stream_state)))
+                    self._index_record(particle, data_record)
+
+            # Check for noise between records, but ignore newline.
+            if non_data is not None and non_data != "\n":
+                log.info("Gap in datafile detected.")
+                log.trace("Noise detected: %s", non_data)
+                self.start_new_sequence()
+
+        return result_particles
+
 # End of glider.py
@@ -12,6 +12,9 @@ import collections
 import gevent
 import numpy as np
 import os
+import shutil
+import tempfile
+from struct import pack, unpack
 from nose.plugins.attrib import attr
 
 from mi.core.log import get_logger
@@ -19,7 +22,9 @@ from mi.core.log import get_logger
 from mi.core.exceptions import SampleException
 from mi.dataset.test.test_parser import ParserUnitTestCase
 from mi.dataset.dataset_driver import DataSetDriverConfigKeys
+from mi.dataset.dataset_parser import ParserConfigKey, ReadMode
 from mi.dataset.parser.adcpa import AdcpaParser, ADCPA_PD0_PARSED_DataParticle, StateKey
+from mi.dataset.parser.adcpa import pd0_sieve_function
 
 log = get_logger()
 
@@ -393,3 +398,73 @@ class AdcpaParserUnitTestCase(ParserUnitTestCase):
         particles = self.parser.get_records(5)
         self.parse_particles(particles)
         self.assert_result(self.test04, self.parsed_data, particles)
+
+
+@attr('UNIT', group='mi')
+class AdcpaSieveUnitTestCase(ParserUnitTestCase):
+    """
+    Framing PD0 ensembles as the file is read
+    """
+    def setUp(self):
+        ParserUnitTestCase.setUp(self)
+        with open(AdcpaParserUnitTestCase.TEST_DATA, 'rb') as f:
+            self.data = f.read()
+        self.ensembles = [self.data[start:end] for (start, end) in pd0_sieve_function(self.data)]
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _parse(self, data, read_mode=ReadMode.CHUNK):
+        path = os.path.join(self.directory, 'data.PD0')
+        with open(path, 'wb') as f:
+            f.write(data)
+        config = {
+            DataSetDriverConfigKeys.PARTICLE_MODULE: 'mi.dataset.parser.adcpa',
+            DataSetDriverConfigKeys.PARTICLE_CLASS: 'ADCPA_PD0_PARSED_DataParticle',
+            ParserConfigKey.READ_MODE: read_mode,
+            ParserConfigKey.BLOCK_SIZE: 1000
+        }
+        with open(path, 'rb') as stream:
+            return [(particle.raw_data, state[StateKey.POSITION]) for (particle, state) in
+                    AdcpaParser(config, {StateKey.POSITION: 0}, stream, None, None).iter_records()]
+
+    def test_sieve(self):
+        """
+        The ensembles run end to end through the file, each as long as its
+        header gives.
+        """
+        self.assertEqual(len(self.ensembles), 264)
+        self.assertEqual(''.join(self.ensembles), self.data)
+        for ensemble in self.ensembles:
+            self.assertEqual(len(ensemble), unpack('<H', ensemble[2:4])[0] + 2)
+
+        # an ensemble cut short is left until the rest of it is added
+        self.assertEqual(pd0_sieve_function(self.data[:1000]), [(0, 446), (446, 892)])
+        self.assertEqual(pd0_sieve_function(buffer(self.data, 446, 450)), [(0, 446)])
+        self.assertEqual(pd0_sieve_function(self.data[:5]), [])
+
+    def test_noise(self):
+        """
+        Data between ensembles, headers that do not start an ensemble and
+        ensembles whose checksum does not match are skipped.
+        """
+        bad_checksum = self.ensembles[1][:-2] + pack('<H', (unpack('<H', self.ensembles[1][-2:])[0] + 1) % 65536)
+        false_header = self.ensembles[2][:6] + 'garbage'
+        data = ''.join([self.ensembles[0], 'noise', bad_checksum, false_header, self.ensembles[3],
+                        self.ensembles[4][:100]])
+        self.assertEqual([data[start:end] for (start, end) in pd0_sieve_function(data)],
+                         [self.ensembles[0], self.ensembles[3]])
+
+        # the position of an ensemble takes in what was skipped before it
+        expected = [(self.ensembles[0], 446), (self.ensembles[3], len(data) - 100)]
+        for read_mode in ReadMode.list():
+            self.assertEqual(self._parse(data, read_mode), expected, read_mode)
+
+    def test_read_modes(self):
+        """
+        Whichever way the file is read, the same ensembles come out at the
+        same positions.
+        """
+        positions = np.cumsum([len(ensemble) for ensemble in self.ensembles]).tolist()
+        expected = zip(self.ensembles, positions)
+        for read_mode in ReadMode.list():
+            self.assertEqual(self._parse(self.data, read_mode), expected, read_mode)
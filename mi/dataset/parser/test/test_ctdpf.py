@@ -201,6 +201,30 @@ GPS2:
         self.assert_(isinstance(self.publish_callback_value, list))        
         self.assertEqual(self.publish_callback_value[0], self.particle_d)
         
+    def test_iter_records(self):
+        """
+        Records come out of the generator one at a time with their states,
+        without being published, and get_records carries on after them.
+        """
+        self.stream_handle = StringIO(CtdpfParserUnitTestCase.TEST_DATA)
+        self.parser = CtdpfParser(self.config, self.position, self.stream_handle,
+                                  self.pos_callback, self.pub_callback)
+
+        records = self.parser.iter_records()
+        (particle, state) = records.next()
+        self.assertEqual(particle, self.particle_a)
+        self.assertEqual(state[StateKey.POSITION], 137)
+        (particle, state) = records.next()
+        self.assertEqual(particle, self.particle_b)
+        self.assertEqual(state[StateKey.POSITION], 174)
+        self.assertEqual(self.publish_callback_value, None)
+        self.assertEqual(self.position_callback_value, None)
+
+        result = self.parser.get_records(1)
+        self.assert_result(result, 211, self.base_timestamp+2, self.particle_c)
+        self.assertEqual([particle for (particle, state) in records], [self.particle_d])
+        self.assertEqual(self.parser.get_records(1), [])
+
     def test_get_many(self):
         self.stream_handle = StringIO(CtdpfParserUnitTestCase.TEST_DATA)
         self.parser = CtdpfParser(self.config, self.position, self.stream_handle,
@@ -277,4 +301,4 @@ GPS2:
         self.assert_result(result, 137, self.base_timestamp, self.particle_a)
 
         result = self.parser.get_records(1)
-        self.assert_result(result, 193, self.base_timestamp+60, self.particle_e)
+        self.assert_result(result, 194, self.base_timestamp+60, self.particle_e)
@@ -19,10 +19,12 @@ log = get_logger()
 
 from nose.plugins.attrib import attr
 
-from mi.core.exceptions import SampleException
+from mi.core.exceptions import SampleException, DatasetParserException
+from mi.core.instrument.data_particle import DataParticleKey
 from mi.dataset.test.test_parser import ParserUnitTestCase
 from mi.dataset.dataset_driver import DataSetDriverConfigKeys
-from mi.dataset.parser.glider import GliderParser, StateKey
+from mi.dataset.parser.glider import GliderParser, GliderColumnDecoder, StateKey
+from mi.dataset.parser.glider import GliderStreamsParser, GliderConfigKey
 from mi.dataset.parser.glider import GgldrCtdgvDelayedDataParticle, CtdgvParticleKey
 from mi.dataset.parser.glider import GgldrDostaDelayedDataParticle
 from mi.dataset.parser.glider import GgldrFlordDelayedDataParticle
@@ -387,3 +389,144 @@ class OtherGliderTest(GliderParserUnitTestCase):
         particle = GgldrCtdgvDelayedDataParticle("this is some data, not the expected dict")
         with self.assertRaises(SampleException):
             particle._build_parsed_values()
+
+@attr('UNIT', group='mi')
+class GliderColumnDecoderTest(GliderParserUnitTestCase):
+    """
+    Bulk decoding of glider records into the columns particles use.
+    """
+    config = {DataSetDriverConfigKeys.PARTICLE_MODULE: 'mi.dataset.parser.glider',
+              DataSetDriverConfigKeys.PARTICLE_CLASS: 'GgldrCtdgvDelayedDataParticle'}
+
+    def setUp(self):
+        GliderParserUnitTestCase.setUp(self)
+        self.set_data(HEADER)
+        self.reset_parser()
+        self.labels = ['m_depth', 'm_gps_lat', 'x_status', 'sci_water_temp']
+        self.num_bytes = [4, 8, 1, 4]
+        self.records = ['12.5 5004.24 3 NaN', 'NaN 0 NaN 15.2']
+
+    def test_decode(self):
+        decoder = GliderColumnDecoder(self.labels, self.num_bytes, None, self.parser._string_to_ddegrees)
+        data = decoder.decode(self.records)
+        self.assertEqual(data.shape, (2, 4))
+        (first, second) = decoder.data_dicts(data)
+
+        self.assertEqual(first['m_depth'], {'Name': 'm_depth', 'Data': 12.5})
+        self.assertAlmostEqual(first['m_gps_lat']['Data'], 50.0 + 4.24 / 60.0)
+        self.assertEqual(first['x_status']['Data'], 3)
+        self.assertIsInstance(first['x_status']['Data'], int)
+        self.assertTrue(np.isnan(first['sci_water_temp']['Data']))
+
+        # a position of 0 and a missing integer are NaN
+        self.assertTrue(np.isnan(second['m_gps_lat']['Data']))
+        self.assertTrue(np.isnan(second['x_status']['Data']))
+        self.assertEqual(second['sci_water_temp']['Data'], 15.2)
+
+    def test_columns(self):
+        """
+        Only the columns asked for are decoded, in file order.
+        """
+        decoder = GliderColumnDecoder(self.labels, self.num_bytes, set(['sci_water_temp', 'm_depth', 'other']),
+                                      self.parser._string_to_ddegrees)
+        self.assertEqual(decoder.labels, ['m_depth', 'sci_water_temp'])
+        data = decoder.decode(self.records)
+        self.assertEqual(data.shape, (2, 2))
+        self.assertEqual(sorted(decoder.data_dicts(data)[1].keys()), ['m_depth', 'sci_water_temp'])
+
+        decoder = GliderColumnDecoder(self.labels, self.num_bytes, set(['x_status']),
+                                      self.parser._string_to_ddegrees)
+        self.assertEqual(decoder.data_dicts(decoder.decode(self.records))[0], {'x_status': {'Name': 'x_status',
+                                                                                            'Data': 3}})
+
+        with self.assertRaises(DatasetParserException):
+            decoder.decode(['1 2 3'])
+
+    def test_particle_columns(self):
+        """
+        The parser decodes only the columns of its particle class.
+        """
+        self.set_data(HEADER, CTDGR_RECORD)
+        self.reset_parser()
+        record = self.parser.get_records(1)[0]
+        self.assertEqual(set(record.raw_data.keys()),
+                         GgldrCtdgvDelayedDataParticle.columns() & set(HEADER.split('\n')[-3].split()))
+        self.assertEqual(record.raw_data['sci_water_temp']['Data'], 15.2229)
+
+    def test_wide(self):
+        """
+        Files with more sensors than a regular expression can have groups
+        are parsed.
+        """
+        extra = ['x_extra_%d' % ii for ii in range(150)]
+        lines = HEADER.split('\n')
+        lines[-5] = 'sensors_per_cycle: %d' % (28 + len(extra))
+        lines[-3] += ' ' + ' '.join(extra)
+        lines[-2] += ' nodim' * len(extra)
+        lines[-1] = lines[-1].rstrip() + ' 4' * len(extra)
+        records = [record + ' 1.5' * len(extra) for record in CTDGR_RECORD.strip().split('\n')]
+        self.set_data('\n'.join(lines), '\n', '\n'.join(records) + '\n')
+        self.reset_parser()
+        result = self.parser.get_records(3)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[1].raw_data['sci_water_temp']['Data'], 15.2283)
+        self.assertNotIn('x_extra_0', result[1].raw_data)
+
+DOSTA_RECORD = """
+NaN NaN NaN NaN NaN NaN NaN NaN NaN NaN NaN NaN NaN 132.347 1376510709.3468 NaN NaN NaN NaN NaN NaN 132.347 1376510709.3468 238.585 94.319 NaN NaN NaN """
+
+@attr('UNIT', group='mi')
+class GliderStreamsParserTest(GliderParserUnitTestCase):
+    """
+    Parsing a glider file once for several particle classes.
+    """
+    config = {DataSetDriverConfigKeys.PARTICLE_MODULE: 'mi.dataset.parser.glider',
+              GliderConfigKey.PARTICLE_CLASSES: ['GgldrCtdgvDelayedDataParticle',
+                                                 'GgldrDostaDelayedDataParticle']}
+
+    def reset_parser(self, state = {}):
+        self.state_callback_values = []
+        self.publish_callback_values = []
+        self.parser = GliderStreamsParser(self.config, state, self.test_data,
+                                          self.state_callback, self.pub_callback)
+
+    def test_streams(self):
+        data = HEADER + CTDGR_RECORD + DOSTA_RECORD
+        self.set_data(data)
+        self.reset_parser()
+        records = list(self.parser.iter_records())
+        self.assertEqual([particle.type() for (particle, state) in records],
+                         ['ggldr_ctdgv_delayed', 'ggldr_ctdgv_delayed', 'ggldr_dosta_delayed'])
+        # the first particle of each stream starts a sequence
+        self.assertEqual([particle.contents[DataParticleKey.NEW_SEQUENCE] for (particle, state) in records],
+                         [True, False, True])
+
+        # each stream is at the end of the last record parsed for it
+        ctd_end = len(HEADER + CTDGR_RECORD)
+        self.assertEqual(records[1][1]['ggldr_ctdgv_delayed'], {StateKey.POSITION: ctd_end})
+        # the dosta stream is parsed after the ctd stream, a record behind
+        self.assertEqual(records[1][1]['ggldr_dosta_delayed'],
+                         {StateKey.POSITION: len(HEADER) + CTDGR_RECORD.index('\n', 1)})
+        # the ctd stream is parsed first, and has no data in the last record
+        self.assertEqual(records[2][1], {'ggldr_ctdgv_delayed': {StateKey.POSITION: len(data)},
+                                         'ggldr_dosta_delayed': {StateKey.POSITION: len(data)}})
+
+    def test_set_state(self):
+        """
+        Each stream carries on from its own position, streams that are not
+        in the state from the first record.
+        """
+        self.set_data(HEADER + CTDGR_RECORD + DOSTA_RECORD)
+        state = {'ggldr_ctdgv_delayed': {StateKey.POSITION: len(HEADER + CTDGR_RECORD)}}
+        self.reset_parser(state)
+        self.assertEqual([particle.type() for (particle, state) in self.parser.iter_records()],
+                         ['ggldr_dosta_delayed'])
+
+        # after the first record
+        state = {'ggldr_ctdgv_delayed': {StateKey.POSITION: len(HEADER) + CTDGR_RECORD.index('\n', 1)}}
+        self.parser.set_state(state)
+        self.assertEqual([particle.raw_data['sci_water_temp']['Data'] for (particle, state) in
+                          self.parser.iter_records() if particle.type() == 'ggldr_ctdgv_delayed'], [15.2283])
+
+        with self.assertRaises(DatasetParserException):
+            self.parser.set_state({'ggldr_dosta_delayed': 10})
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.record_index
+@file mi/dataset/record_index.py
+@author Steve Foley
+@brief Sidecar index of the records parsed from a data set file, used to
+seek straight to a record or a time instead of parsing from the start.
+"""
+
+__author__ = 'Steve Foley'
+__license__ = 'Apache 2.0'
+
+import os
+import zlib
+import struct
+from bisect import bisect_left
+from collections import namedtuple
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.exceptions import DatasetParserException
+
+# a sidecar index sits next to its file with this suffix by default
+INDEX_SUFFIX = '.idx'
+
+# the sidecar starts with this header and the identity of the file indexed,
+# followed by a fixed size entry for each record: offset, length and NTP4
+# internal timestamp, little endian
+INDEX_MAGIC = 'MIDX'
+INDEX_HEADER = INDEX_MAGIC + '\x00\x00\x00\x02'
+INDEX_ENTRY = struct.Struct('<QId')
+
+# the identity of the file indexed is its size when last indexed and the
+# length and CRC32 of the block it starts with, up to IDENTITY_BLOCK bytes
+INDEX_IDENTITY = struct.Struct('<QII')
+IDENTITY_BLOCK = 4096
+INDEX_START = len(INDEX_HEADER) + INDEX_IDENTITY.size
+
+IndexEntry = namedtuple('IndexEntry', ['offset', 'length', 'timestamp'])
+
+class RecordIndex(object):
+    """
+    The file offset, length and internal timestamp of each record parsed
+    from a file, numbered in file order.  With a path the index is read
+    from, and appended to, a sidecar file, so a later parser can find
+    records without parsing what comes before them.
+
+    Records are added as a parser finds them.  A record starting before the
+    end of the last record indexed has been indexed already, by an earlier
+    parse or before set_state moved back, and is ignored.  Records a parse
+    skips over are not indexed, so numbers count the records indexed.
+    Timestamps are taken to increase through a file, as they do for the
+    records of one instrument.
+
+    The sidecar records the identity of the file it indexes.  A sidecar
+    whose file has since been replaced or truncated, or that was written by
+    an older version, is ignored and rebuilt as the file is parsed again.
+    """
+    def __init__(self, path=None, data_file=None):
+        """
+        @param path The sidecar file, None to keep the index in memory
+        @param data_file The file indexed, None not to check the sidecar
+            belongs to it
+        @throws DatasetParserException if the sidecar is not an index
+        """
+        self._path = path
+        self._data_file = data_file
+        # length and CRC32 of the first block of the file indexed
+        self._identity = None
+        self._offsets = []
+        self._lengths = []
+        self._timestamps = []
+        # entries not yet written to the sidecar, and its length
+        self._pending = []
+        self._size = None
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self._path, 'rb') as f:
+            data = f.read()
+        if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise DatasetParserException("%s is not a record index" % self._path)
+        if data[:len(INDEX_HEADER)] != INDEX_HEADER or len(data) < INDEX_START:
+            log.info("Index %s is from another version, rebuilding it", self._path)
+            return
+        (size, length, crc) = INDEX_IDENTITY.unpack_from(data, len(INDEX_HEADER))
+        if self._data_file is not None:
+            current = self._read_identity(length)
+            if current is None or current[0] < size or current[1:] != (length, crc):
+                log.info("Index %s is not an index of %s as it is now, rebuilding it",
+                         self._path, self._data_file)
+                return
+        self._identity = (length, crc)
+        # a write cut short leaves part of an entry, which is dropped
+        count = (len(data) - INDEX_START) // INDEX_ENTRY.size
+        for number in range(count):
+            (offset, length, timestamp) = INDEX_ENTRY.unpack_from(data, INDEX_START + number * INDEX_ENTRY.size)
+            self._offsets.append(offset)
+            self._lengths.append(length)
+            self._timestamps.append(timestamp)
+        self._size = INDEX_START + count * INDEX_ENTRY.size
+        log.debug("Loaded %d records from index %s", count, self._path)
+
+    def _read_identity(self, length=IDENTITY_BLOCK):
+        """
+        @param length The number of bytes at the start of the file to check
+        @retval (size, length, CRC32) of the file indexed, (0, 0, 0) if there
+            is no file to check, None if it can not be read
+        """
+        if self._data_file is None:
+            return (0, 0, 0)
+        try:
+            size = os.path.getsize(self._data_file)
+            with open(self._data_file, 'rb') as f:
+                block = f.read(length)
+        except (IOError, OSError) as e:
+            log.warn("Could not read %s to check its index: %s", self._data_file, e)
+            return None
+        return (size, len(block), zlib.crc32(block) & 0xffffffff)
+
+    def _read_size(self):
+        """
+        @retval size of the file indexed, 0 if there is no file to check or
+            it can not be read
+        """
+        if self._data_file is None:
+            return 0
+        try:
+            return os.path.getsize(self._data_file)
+        except OSError as e:
+            log.warn("Could not read the size of %s for its index: %s", self._data_file, e)
+            return 0
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, number):
+        """
+        @param number The record number
+        @retval IndexEntry of the record
+        """
+        return IndexEntry(self._offsets[number], self._lengths[number], self._timestamps[number])
+
+    def __iter__(self):
+        for number in range(len(self)):
+            yield self[number]
+
+    @property
+    def end(self):
+        """
+        @retval file offset of the end of the last record indexed, 0 if none
+        """
+        if not self._offsets:
+            return 0
+        return self._offsets[-1] + self._lengths[-1]
+
+    def add(self, offset, length, timestamp):
+        """
+        Index the next record of the file.
+        @param offset The file offset of the record
+        @param length The length of the record in bytes
+        @param timestamp The NTP4 internal timestamp of the record
+        @retval True if the record was indexed, False if it already was
+        """
+        if offset < self.end:
+            return False
+        self._offsets.append(offset)
+        self._lengths.append(length)
+        self._timestamps.append(timestamp)
+        if self._path is not None:
+            self._pending.append(INDEX_ENTRY.pack(offset, length, timestamp))
+        return True
+
+    def flush(self):
+        """
+        Append the records added since the last flush to the sidecar.
+        """
+        if not self._pending:
+            return
+        if self._size is None:
+            # the first block is only read when the sidecar is started, after
+            # that only the size of the file changes
+            identity = self._read_identity() or (0, 0, 0)
+            with open(self._path, 'wb') as f:
+                f.write(INDEX_HEADER)
+            self._identity = identity[1:]
+            self._size = INDEX_START
+            size = identity[0]
+        else:
+            size = self._read_size()
+        data = ''.join(self._pending)
+        with open(self._path, 'r+b') as f:
+            f.truncate(self._size)
+            f.seek(self._size)
+            f.write(data)
+            # the size the file has grown to, with the records just indexed
+            f.seek(len(INDEX_HEADER))
+            f.write(INDEX_IDENTITY.pack(size, *self._identity))
+        self._size += len(data)
+        self._pending = []
+
+    def find_time(self, timestamp):
+        """
+        @param timestamp An NTP4 timestamp
+        @retval number of the first record at or after the time, the number
+            of records if there is none
+        """
+        return bisect_left(self._timestamps, timestamp)
+
+    def find_range(self, start_time, end_time):
+        """
+        @param start_time NTP4 time the range starts at
+        @param end_time NTP4 time the range ends before
+        @retval (first, stop) record numbers of the records in the range
+        """
+        first = self.find_time(start_time)
+        return (first, max(first, self.find_time(end_time)))
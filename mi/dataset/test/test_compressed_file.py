@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_compressed_file
+@file mi/dataset/test/test_compressed_file.py
+@author Steve Foley
+@brief Test reading compressed data set files through CompressedFile, on
+their own and parsed by a driver.
+"""
+
+import os
+import bz2
+import copy
+import gzip
+import random
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import DatasetParserException, ConfigurationException
+from mi.dataset.dataset_driver import DriverParameter
+from mi.dataset import compressed_file
+from mi.dataset.compressed_file import CompressedFile, open_data_file
+from mi.dataset.test.test_parser_pool import CtdpfDriver
+from mi.dataset.test.test_parser_read_mode import ctdpf_data
+
+@attr('UNIT', group='mi')
+class TestCompressedFile(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.data = ctdpf_data(3000)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _gzip(self, name, members):
+        with open(self._path(name), 'wb') as f:
+            for member in members:
+                with gzip.GzipFile(fileobj=f, mode='wb') as compressed:
+                    compressed.write(member)
+        return self._path(name)
+
+    def _bz2(self, name, streams):
+        with open(self._path(name), 'wb') as f:
+            for stream in streams:
+                f.write(bz2.compress(stream))
+        return self._path(name)
+
+    def _check(self, stream):
+        """
+        Random reads, readlines and seeks give what they do on the data.
+        """
+        random.seed(42)
+        position = 0
+        for i in range(300):
+            action = random.choice(['read', 'readline', 'seek', 'seek', 'back'])
+            if action == 'read':
+                size = random.choice([1, 100, 5000, 100000])
+                expected = self.data[position:position + size]
+                self.assertEqual(stream.read(size), expected)
+                position += len(expected)
+            elif action == 'readline':
+                end = self.data.find('\n', position)
+                end = len(self.data) if end < 0 else end + 1
+                self.assertEqual(stream.readline(), self.data[position:end])
+                position = end
+            elif action == 'seek':
+                position = random.randint(0, len(self.data))
+                stream.seek(position)
+            else:
+                position = max(position - random.randint(0, 2000), 0)
+                stream.seek(position)
+            self.assertEqual(stream.tell(), position)
+        stream.seek(-10, os.SEEK_END)
+        self.assertEqual(stream.read(), self.data[-10:])
+        stream.seek(0)
+        self.assertEqual(stream.read(), self.data)
+
+    def test_gzip(self):
+        path = self._gzip('data.txt.gz', [self.data])
+        with CompressedFile(path, read_size=4096, seek_point_spacing=20000) as stream:
+            self._check(stream)
+            # a seek point at the start and then every 20000 bytes or so
+            self.assertGreater(len(stream._points), len(self.data) / 25000)
+
+    def test_bz2(self):
+        with CompressedFile(self._bz2('data.txt.bz2', [self.data]), read_size=4096) as stream:
+            self._check(stream)
+
+    def test_streams(self):
+        """
+        Files of several compressed streams read as one.
+        """
+        parts = [self.data[:1000], self.data[1000:50000], '', self.data[50000:]]
+        with CompressedFile(self._gzip('data.txt.gz', parts), read_size=4096) as stream:
+            self._check(stream)
+        with CompressedFile(self._bz2('data.txt.bz2', parts), read_size=4096) as stream:
+            self._check(stream)
+            # a seek point at the start of each stream with data
+            self.assertEqual([point.position for point in stream._points], [0, 1000, 50000])
+
+    def test_line_size(self):
+        path = self._gzip('data.txt.gz', ['one\ntwo\nthree'])
+        with CompressedFile(path) as stream:
+            self.assertEqual(stream.readline(2), 'on')
+            self.assertEqual(stream.readline(), 'e\n')
+            self.assertEqual(stream.readlines(), ['two\n', 'three'])
+            self.assertEqual(stream.readline(), '')
+        with self.assertRaises(ValueError):
+            stream.read()
+
+    def test_corrupt(self):
+        path = self._path('bad.txt.gz')
+        with open(path, 'wb') as f:
+            f.write('not gzip data')
+        with CompressedFile(path) as stream:
+            with self.assertRaises(DatasetParserException):
+                stream.read()
+
+    def test_open(self):
+        path = self._path('data.txt')
+        with open(path, 'w') as f:
+            f.write(self.data)
+        with open_data_file(path) as stream:
+            self.assertIsInstance(stream, file)
+        with open_data_file(self._gzip('data.txt.gz', [self.data])) as stream:
+            self.assertIsInstance(stream, CompressedFile)
+            self.assertFalse(hasattr(stream, 'fileno'))
+
+        if compressed_file.lzma is None:
+            with open(self._path('data.txt.xz'), 'wb') as f:
+                f.write('')
+            with self.assertRaises(ConfigurationException):
+                open_data_file(self._path('data.txt.xz'))
+
+@attr('UNIT', group='mi')
+class TestCompressedDriver(MiUnitTest):
+    """
+    Compressed files are parsed by a driver as the files they hold.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.data = ctdpf_data(300)
+        self.names = []
+        for (suffix, write) in (('', open), ('.gz', gzip.open), ('.bz2', bz2.BZ2File)):
+            self.names.append(os.path.join(self.directory, 'data.txt' + suffix))
+            f = write(self.names[-1], 'wb')
+            f.write(self.data)
+            f.close()
+
+    def _run(self, name, memento=None):
+        config = {'harvester': {'directory': self.directory, 'pattern': '*.txt*'},
+                  'parser': {}, 'driver': {DriverParameter.RECORDS_PER_SECOND: 100000}}
+        published = []
+        states = []
+        driver = CtdpfDriver(config, memento, lambda particles: published.extend(p.raw_data for p in particles),
+                             states.append, None)
+        driver._new_file_queue = [(open(name, 'rb'), name)]
+        driver._poll()
+        return (published, [state['parser'] for state in states])
+
+    def test_driver(self):
+        expected = self._run(self.names[0])
+        self.assertEqual(len(expected[0]), 300)
+        for name in self.names[1:]:
+            self.assertEqual(self._run(name), expected, name)
+
+    def test_resume(self):
+        memento = {'harvester': None, 'parser': {'position': 5003, 'timestamp': 3526416001.0}}
+        # the ctdpf parser updates the state it is given
+        expected = self._run(self.names[0], copy.deepcopy(memento))
+        self.assertLess(len(expected[0]), 300)
+        for name in self.names[1:]:
+            self.assertEqual(self._run(name, copy.deepcopy(memento)), expected, name)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_file_change_detector
+@file mi/dataset/test/test_file_change_detector.py
+@author Bill French
+@brief Test the incremental file change detection used by the file change
+harvester
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.harvester import FileChangeDetector, file_md5, mtime_ns
+
+@attr('UNIT', group='mi')
+class TestFileChangeDetector(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'node59p1.dat')
+
+    def write(self, data, mode='wb', age=10):
+        """
+        write to the file and set its mtime age seconds in the past so the
+        fstat gate is trusted
+        """
+        with open(self.path, mode) as f:
+            f.write(data)
+        if age:
+            then = time.time() - age
+            os.utime(self.path, (then, then))
+
+    def test_file_md5(self):
+        data = os.urandom(10000)
+        self.write(data)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(file_md5(f, block_size=1000), hashlib.md5(data).hexdigest())
+            self.assertEqual(file_md5(f, 100), hashlib.md5(data[:100]).hexdigest())
+
+    def test_changes(self):
+        self.write('')
+        detector = FileChangeDetector(self.path, block_size=4)
+        # empty files are ignored
+        self.assertFalse(detector.check())
+
+        self.write('0123456789')
+        self.assertTrue(detector.check())
+        self.assertEqual(detector.checksum, hashlib.md5('0123456789').hexdigest())
+        self.assertEqual(detector.blocks_read, 3)
+
+        # unchanged, nothing read
+        self.assertFalse(detector.check())
+        self.assertEqual(detector.blocks_read, 3)
+
+        # touched without changing content
+        self.write('0123456789', age=5)
+        self.assertFalse(detector.check())
+
+        # appended
+        self.write('ab', mode='ab')
+        self.assertTrue(detector.check())
+        self.assertEqual(detector.size, 12)
+
+        # a fresh write is rechecked even if the next one keeps the mtime
+        self.write('0123456789ab', age=None)
+        self.assertFalse(detector.check())
+        stat_result = os.stat(self.path)
+        self.write('0123X56789ab', age=None)
+        os.utime(self.path, (stat_result.st_atime, stat_result.st_mtime))
+        self.assertTrue(detector.check())
+
+        # replaced by a new file
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write('a new file')
+        os.rename(self.path + '.tmp', self.path)
+        self.assertTrue(detector.check())
+        self.assertEqual(detector.checksum, hashlib.md5('a new file').hexdigest())
+
+    def test_old_memento(self):
+        """
+        A memento with only size and checksum needs one full read to confirm
+        the file is unchanged.
+        """
+        self.write('0123456789')
+        detector = FileChangeDetector(self.path, 10, hashlib.md5('0123456789').hexdigest())
+        self.assertFalse(detector.check())
+        self.assertEqual(detector.blocks_read, 1)
+
+        detector = FileChangeDetector(self.path, 10, hashlib.md5('something else').hexdigest())
+        self.assertTrue(detector.check())
+
+    def test_new_memento(self):
+        """
+        A memento with mtime and inode avoids reading an unchanged file.
+        """
+        self.write('0123456789')
+        stat_result = os.stat(self.path)
+        detector = FileChangeDetector(self.path, 10, 'not checked',
+                                      mtime_ns(stat_result), stat_result.st_ino)
+        self.assertFalse(detector.check())
+        self.assertEqual(detector.blocks_read, 0)
+
+        self.write('9876543210')
+        self.assertTrue(detector.check())
+
+    def test_append(self):
+        """
+        Appending to a file reads only the last block known and the appended
+        data, and the md5 is carried forward.
+        """
+        data = '0123456789'
+        self.write(data)
+        detector = FileChangeDetector(self.path, block_size=4)
+        self.assertTrue(detector.check())
+        self.assertEqual(detector.blocks_read, 3)
+
+        for chunk in ('ab', 'cdefgh', 'i', 'jklmnop'):
+            data += chunk
+            blocks_read = detector.blocks_read
+            self.write(chunk, mode='ab')
+            self.assertTrue(detector.check())
+            self.assertEqual(detector.size, len(data))
+            self.assertEqual(detector.checksum, hashlib.md5(data).hexdigest())
+            # the last block known is checked again, then every block from it on
+            last = (len(data) - len(chunk) - 1) // 4
+            self.assertEqual(detector.blocks_read - blocks_read, 1 + (len(data) + 3) // 4 - last)
+
+        # a change in the last block known means the whole file is read
+        data = data[:-1] + 'X' + 'qr'
+        blocks_read = detector.blocks_read
+        self.write(data)
+        self.assertTrue(detector.check())
+        self.assertEqual(detector.checksum, hashlib.md5(data).hexdigest())
+        self.assertEqual(detector.blocks_read - blocks_read, 1 + (len(data) + 3) // 4)
+
+        # truncated, the whole file is read
+        data = data[:5]
+        self.write(data)
+        self.assertTrue(detector.check())
+        self.assertEqual(detector.checksum, hashlib.md5(data).hexdigest())
+        self.assertFalse(detector.check())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_harvester_catalog
+@file mi/dataset/test/test_harvester_catalog.py
+@author Bill French
+@brief Test the persistent harvester catalog and its use by the directory
+harvesters and the simple data set driver.
+"""
+
+import os
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.harvester import HarvesterCatalog, CatalogFileStatus
+from mi.dataset.harvester import AdditiveSequentialFileHarvester, SortingDirectoryHarvester
+from mi.dataset.dataset_driver import SimpleDataSetDriver
+
+class RecordParser(object):
+    """
+    Parser stand in returning each line of a file as a record, saving the
+    line count as its state.
+    """
+    def __init__(self, state, infile, state_callback, fail=False):
+        self._lines = infile.readlines()
+        self._position = state or 0
+        self._state_callback = state_callback
+        self._fail = fail
+
+    def get_records(self, count):
+        if self._fail:
+            raise ValueError('bad record')
+        records = self._lines[self._position:self._position + count]
+        self._position += len(records)
+        if records:
+            self._state_callback(self._position)
+        return records
+
+class CatalogDriver(SimpleDataSetDriver):
+    def __init__(self, *args, **kwargs):
+        self.parsed = []
+        self.fail = False
+        SimpleDataSetDriver.__init__(self, *args, **kwargs)
+
+    def _build_parser(self, parser_state, infile):
+        self.parsed.append((infile.name, parser_state))
+        return RecordParser(parser_state, infile, self._save_parser_state, self.fail)
+
+    def _build_harvester(self, harvester_state):
+        return AdditiveSequentialFileHarvester(self._harvester_config, harvester_state,
+                                               self._new_file_callback, self._exception_callback)
+
+@attr('UNIT', group='mi')
+class TestHarvesterCatalog(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.db = os.path.join(self.directory, 'catalog.db')
+        self.found = []
+
+    def _write(self, name, data='line\n'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def _callback(self, handle, name):
+        self.found.append(name)
+
+    def _config(self):
+        return {'directory': self.directory, 'pattern': '*.txt', 'catalog': self.db, 'inotify': False}
+
+    def test_scan(self):
+        catalog = HarvesterCatalog(self.db)
+        a = self._write('a.txt')
+        b = self._write('b.txt')
+        self.assertEqual(catalog.scan([a, b, os.path.join(self.directory, 'gone.txt')]), [a, b])
+        self.assertEqual(catalog.status_counts(), {CatalogFileStatus.NEW: 2})
+
+        catalog.mark_parsing(a)
+        catalog.set_position(a, {'position': 10})
+        self.assertEqual(catalog.get(a).position, {'position': 10})
+        catalog.mark_parsed(a)
+        entry = catalog.get(a)
+        self.assertEqual(entry.status, CatalogFileStatus.PARSED)
+        self.assertIsNone(entry.position)
+        self.assertEqual(catalog.scan([a, b]), [b])
+        self.assertEqual([e.name for e in catalog.outstanding()], [b])
+
+        # the catalog survives a restart
+        catalog.close()
+        catalog = HarvesterCatalog(self.db)
+        self.assertEqual(catalog.scan([a, b]), [b])
+
+        # changed content is parsed again
+        self._write('a.txt', 'line\nmore\n')
+        self.assertEqual(catalog.scan([a, b]), [a, b])
+        self.assertEqual(catalog.get(a).status, CatalogFileStatus.NEW)
+
+        # so is a file copied in again, its inode has changed
+        catalog.mark_parsed(a)
+        os.remove(a)
+        self._write('a.txt', 'line\nmore\n')
+        self.assertEqual(catalog.scan([a, b]), [a, b])
+
+        catalog.mark_failed(b, ValueError('bad record'))
+        self.assertEqual(catalog.get(b).error, 'bad record')
+        self.assertEqual(catalog.status_counts(), {CatalogFileStatus.NEW: 1, CatalogFileStatus.FAILED: 1})
+
+        # marking files that are not cataloged does nothing
+        catalog.mark_parsed(os.path.join(self.directory, 'gone.txt'))
+        self.assertEqual(len(catalog), 2)
+
+    def test_changed_while_parsing(self):
+        """
+        A file appended to while it was parsed is found again.
+        """
+        catalog = HarvesterCatalog(self.db)
+        a = self._write('a.txt')
+        self.assertEqual(catalog.scan([a]), [a])
+        catalog.mark_parsing(a)
+        with open(a, 'a') as f:
+            f.write('more\n')
+        catalog.mark_parsed(a)
+        self.assertEqual(catalog.scan([a]), [a])
+
+    def test_late_file(self):
+        """
+        With a catalog, a file arriving after the harvester has moved past
+        its name is still harvested.
+        """
+        files = [self._write(name) for name in ('b.txt', 'c.txt')]
+        harvester = AdditiveSequentialFileHarvester(self._config(), None, self._callback, None)
+        harvester.on_new_files(harvester._check_for_files())
+        self.assertEqual(self.found, files)
+        self.assertIsNone(harvester._check_for_files())
+
+        late = self._write('a.txt')
+        harvester.on_new_files(harvester._check_for_files())
+        self.assertEqual(self.found, files + [late])
+
+    def test_parsing_first(self):
+        catalog = HarvesterCatalog(self.db)
+        files = [self._write(name) for name in ('a.txt', 'b.txt', 'c.txt')]
+        catalog.scan(files)
+        catalog.mark_parsing(files[2])
+        self.assertEqual(catalog.scan(files), [files[2], files[0], files[1]])
+
+    def test_seed_from_memento(self):
+        """
+        A new catalog takes the files the memento says were done as parsed,
+        after that files arriving out of order are still harvested.
+        """
+        files = [self._write(name) for name in ('f_8.txt', 'f_9.txt', 'f_10.txt')]
+        harvester = SortingDirectoryHarvester(self._config(), files[1], self._callback, None)
+        harvester.on_new_files(harvester._check_for_files())
+        self.assertEqual(self.found, [files[2]])
+
+        late = self._write('f_7.txt')
+        harvester.on_new_files(harvester._check_for_files())
+        self.assertEqual(self.found, [files[2], late])
+        self.assertEqual(harvester.catalog.get(late).status, CatalogFileStatus.QUEUED)
+
+    def test_restart(self):
+        """
+        After a restart only files not yet parsed are harvested, whatever
+        their names.
+        """
+        files = [self._write(name) for name in ('a.txt', 'b.txt', 'c.txt')]
+        harvester = AdditiveSequentialFileHarvester(self._config(), None, self._callback, None)
+        harvester.on_new_files(files)
+        self.assertEqual(self.found, files)
+        harvester.catalog.mark_parsed(files[0])
+        harvester.catalog.mark_parsed(files[2])
+
+        # the memento says b.txt was completed, the catalog missed it
+        self.found = []
+        harvester = AdditiveSequentialFileHarvester(self._config(), files[1], self._callback, None)
+        harvester.on_new_files(files)
+        self.assertEqual(self.found, [])
+        self.assertEqual(harvester.catalog.outstanding(), [])
+
+    def test_driver(self):
+        states = []
+        config = {'harvester': self._config(), 'parser': {}}
+        driver = CatalogDriver(config, None, None, states.append, None)
+        driver._new_file_queue = []
+        a = self._write('a.txt', 'one\ntwo\n')
+        b = self._write('b.txt', 'three\n')
+
+        driver._harvester = driver._build_harvester(None)
+        driver._catalog = driver._harvester.catalog
+        driver._harvester.on_new_files([a, b])
+        driver._poll()
+        self.assertEqual(driver._catalog.get(a).status, CatalogFileStatus.PARSED)
+        self.assertEqual(driver._catalog.get(b).status, CatalogFileStatus.QUEUED)
+        self.assertEqual(states[-1]['harvester'], a)
+
+        # b stopped part way: its parser state is applied to it and only it
+        driver._catalog.mark_parsing(b)
+        c = self._write('c.txt', 'four\n')
+        driver._parser_state = 1
+        driver._new_file_queue = [(open(c), c)]
+        driver._poll()
+        driver._parser_state = 1
+        driver._new_file_queue = [(open(b), b)]
+        driver._poll()
+        self.assertEqual(driver.parsed[1:], [(c, None), (b, 1)])
+        self.assertEqual(driver._catalog.outstanding(), [])
+
+        driver.fail = True
+        d = self._write('d.txt')
+        driver._harvester.on_new_files([d])
+        with self.assertRaises(ValueError):
+            driver._poll()
+        self.assertEqual(driver._catalog.get(d).status, CatalogFileStatus.FAILED)
+        self.assertEqual(driver._catalog.get(d).error, 'bad record')
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_parser_pool
+@file mi/dataset/test/test_parser_pool.py
+@author Bill French
+@brief Test that files parsed by the driver's parser pool are published,
+with their states, just as they are when parsed one at a time.
+"""
+
+import os
+import copy
+import time
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import SampleException
+from mi.core.exceptions import InstrumentParameterException
+from mi.dataset.dataset_driver import SimpleDataSetDriver, DriverParameter
+from mi.dataset.harvester import file_md5
+from mi.dataset.parser.ctdpf import CtdpfParser
+from mi.dataset.driver.mflm.ctd.driver import MflmCTDMODataSetDriver
+from mi.dataset.test.test_parser_read_mode import ctdpf_data
+
+MFLM_RESOURCE = os.path.join(os.path.dirname(__file__), '..', 'driver', 'mflm', 'ctd', 'resource')
+
+class CtdpfDriver(SimpleDataSetDriver):
+    _parser_pool_supported = True
+
+    def _build_parser(self, parser_state, infile):
+        config = {'particle_module': 'mi.dataset.parser.ctdpf',
+                  'particle_class': 'CtdpfParserDataParticle'}
+        return CtdpfParser(config, parser_state, infile, self._save_parser_state, self._data_callback)
+
+    def _build_harvester(self, harvester_state):
+        return None
+
+@attr('UNIT', group='mi')
+class TestParserPool(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.files = []
+        for (index, count) in enumerate([120, 5, 300, 1, 60, 200, 10]):
+            self.files.append(self._write('file_%d.txt' % index, ctdpf_data(count)))
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def _config(self, driver_config):
+        # publish without the default rate limit
+        driver_config[DriverParameter.RECORDS_PER_SECOND] = 100000
+        return {'harvester': {'directory': self.directory, 'pattern': '*.txt'},
+                'parser': {}, 'driver': driver_config}
+
+    def _run(self, files, driver_config, memento=None):
+        """
+        Poll a driver until it has published files.
+        @retval (particle raw data, mementos saved) in the order published
+        """
+        published = []
+        states = []
+        config = self._config(driver_config)
+        driver = CtdpfDriver(config, copy.deepcopy(memento),
+                             lambda particles: published.extend(p.raw_data for p in particles),
+                             states.append, None)
+        self.addCleanup(driver._stop_parser_pool)
+        driver._new_file_queue = [(open(name), name) for name in files]
+
+        end = time.time() + 30
+        while (driver._new_file_queue or driver._parsing) and time.time() < end:
+            driver._poll()
+            time.sleep(.01)
+        self.assertEqual(driver._new_file_queue, [])
+        self.assertFalse(driver._parsing)
+        return (published, states)
+
+    def test_same_as_serial(self):
+        (published, states) = self._run(self.files, {})
+        self.assertEqual(len(published), 696)
+
+        for (pool_size, depth) in ((2, 2), (3, 5)):
+            result = self._run(self.files, {DriverParameter.PARSER_POOL_SIZE: pool_size,
+                                            DriverParameter.PARSER_QUEUE_DEPTH: depth})
+            self.assertEqual(result, (published, states))
+
+    def test_resume(self):
+        """
+        A saved parser state applies to the first file only.
+        """
+        memento = {'harvester': None, 'parser': {'position': 174, 'timestamp': 3526416001.0}}
+        expected = self._run(self.files, {}, memento)
+        result = self._run(self.files, {DriverParameter.PARSER_POOL_SIZE: 3}, memento)
+        self.assertEqual(result, expected)
+        self.assertEqual(len(result[0]), 694)
+
+    def test_failure(self):
+        """
+        Files before a bad file are published before its error is raised.
+        """
+        bad = self._write('bad.txt', ' 42.2095, 13.4344,  143.63,   2830.2\n')
+        files = self.files[:2] + [bad] + self.files[2:]
+        published = []
+        config = self._config({DriverParameter.PARSER_POOL_SIZE: 2})
+        driver = CtdpfDriver(config, None, published.extend, lambda state: None, None)
+        self.addCleanup(driver._stop_parser_pool)
+        driver._new_file_queue = [(open(name), name) for name in files]
+
+        with self.assertRaises(SampleException):
+            end = time.time() + 30
+            while time.time() < end:
+                driver._poll()
+                time.sleep(.01)
+        self.assertEqual(len(published), 125)
+
+    def test_bounded(self):
+        """
+        Records are published as they are parsed, and a worker does not
+        parse more than a few batches ahead of publishing.
+        """
+        published = []
+        config = self._config({DriverParameter.PARSER_POOL_SIZE: 2})
+        driver = CtdpfDriver(config, None, published.extend, lambda state: None, None)
+        self.addCleanup(driver._stop_parser_pool)
+        driver._new_file_queue = [(open(self.files[2]), self.files[2])]
+
+        end = time.time() + 30
+        while not published and time.time() < end:
+            driver._poll()
+            time.sleep(.01)
+        time.sleep(.5)
+        self.assertFalse(driver._parsing[0][1].ready())
+
+        while driver._parsing and time.time() < end:
+            driver._poll()
+            time.sleep(.01)
+        self.assertEqual(len(published), 300)
+
+    def test_unsupported_driver(self):
+        """
+        A driver whose files can not be parsed in the pool rejects a pool
+        size over 1 and carries on parsing files itself.
+        """
+        shutil.copy(os.path.join(MFLM_RESOURCE, 'node59p1_step1.dat'),
+                    os.path.join(self.directory, 'node59p1.dat'))
+        published = []
+        config = self._config({})
+        config['harvester']['pattern'] = 'node59p1.dat'
+        driver = MflmCTDMODataSetDriver(config, None, published.extend, lambda state: None, None)
+        with self.assertRaises(InstrumentParameterException):
+            driver.set_resource({DriverParameter.PARSER_POOL_SIZE: 2})
+        with self.assertRaises(InstrumentParameterException):
+            MflmCTDMODataSetDriver(self._config({DriverParameter.PARSER_POOL_SIZE: 2}),
+                                   None, published.extend, lambda state: None, None)
+
+        name = os.path.join(self.directory, 'node59p1.dat')
+        with open(name, 'rb') as f:
+            checksum = file_md5(f)
+        driver._new_file_queue = [(open(name), os.path.getsize(name), checksum)]
+        driver._poll()
+        self.assertGreater(len(published), 0)
+        self.assertIsNone(driver._parsing)
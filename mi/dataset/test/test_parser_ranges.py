@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_parser_ranges
+@file mi/dataset/test/test_parser_ranges.py
+@author Steve Foley
+@brief Test that files split into ranges and decoded in several processes
+give the same records, in the same order, as a parser reading the whole
+file.
+"""
+
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.dataset.test.test_parser import ParserUnitTestCase
+from mi.dataset.dataset_driver import DataSetDriverConfigKeys
+from mi.dataset.dataset_parser import ParserConfigKey, ReadMode, RangeFile
+from mi.dataset.parser.ctdpf import CtdpfParser, StateKey
+from mi.dataset.parser.glider import GliderParser
+from mi.dataset.parser.adcpa import AdcpaParser
+from mi.dataset.test.test_parser_read_mode import ctdpf_data, GLIDER_DATA
+
+ADCPA_DATA = os.path.join(os.path.dirname(__file__), '..', 'parser', 'test', 'LA101636.PD0')
+
+@attr('UNIT', group='mi')
+class TestParserRanges(ParserUnitTestCase):
+
+    def setUp(self):
+        ParserUnitTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _write(self, data):
+        path = os.path.join(self.directory, 'data.txt')
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def _config(self, module, particle_class, processes=1, range_size=0, read_mode=ReadMode.BLOCK):
+        return {DataSetDriverConfigKeys.PARTICLE_MODULE: module,
+                DataSetDriverConfigKeys.PARTICLE_CLASS: particle_class,
+                ParserConfigKey.READ_MODE: read_mode,
+                ParserConfigKey.DECODE_PROCESSES: processes,
+                ParserConfigKey.RANGE_SIZE: range_size}
+
+    def _parse(self, parser_class, config, stream, state=None):
+        """
+        @retval list of (raw data, internal timestamp, new sequence, state)
+        for every record
+        """
+        parser = parser_class(config, state, stream, lambda state: None, lambda particles: None)
+        result = []
+        for (particle, state) in parser.iter_records():
+            raw_data = particle.raw_data
+            if isinstance(raw_data, dict):
+                # glider records are dicts, which unpickle in another order
+                raw_data = sorted(raw_data.items())
+            result.append((repr(raw_data), particle.contents[DataParticleKey.INTERNAL_TIMESTAMP],
+                           particle.contents[DataParticleKey.NEW_SEQUENCE], state))
+        return result
+
+    def _ctdpf_data(self, records=2000, noise=(400, 1207)):
+        """
+        @param records The number of records
+        @param noise Line numbers to put noise before
+        @retval ctdpf file contents with noise in the data, some of it just
+        before timestamps where the file could be split
+        """
+        lines = ctdpf_data(records).splitlines(True)
+        for index in range(len(lines) - 1, 0, -1):
+            if (index % 7 == 0 and lines[index].startswith('10/01')) or index in noise:
+                lines.insert(index, 'noise\n')
+        return ''.join(lines)
+
+    def _assert_resumes(self, parser_class, config, path, result, expected):
+        """
+        Assert a parser started from the state of each record carries on
+        with the records after it in a parse of the whole file.  The first
+        record a parser returns always starts a new sequence.
+        """
+        for (number, record) in enumerate(result):
+            with open(path) as stream:
+                rest = self._parse(parser_class, config, stream, dict(record[3]))
+            following = expected[number + 1:]
+            self.assertEqual([r[:2] for r in rest], [r[:2] for r in following], 'from record %d' % number)
+            self.assertEqual([r[2] for r in rest[1:]], [r[2] for r in following[1:]], 'from record %d' % number)
+
+    def test_range_file(self):
+        stream = RangeFile(StringIO('one\ntwo\nthree\n'), 6)
+        self.assertEqual(stream.readline(), 'one\n')
+        self.assertEqual(stream.readline(), 'tw')
+        self.assertEqual(stream.read(), '')
+        stream.seek(2)
+        self.assertEqual(stream.read(100), 'e\ntw')
+        self.assertEqual(stream.tell(), 6)
+
+    def test_ctdpf(self):
+        """
+        Records and their states match a parse of the whole file.
+        """
+        path = self._write(self._ctdpf_data())
+        module = 'mi.dataset.parser.ctdpf'
+        particle_class = 'CtdpfParserDataParticle'
+        with open(path) as stream:
+            expected = self._parse(CtdpfParser, self._config(module, particle_class), stream)
+        self.assertEqual(len(expected), 2000)
+
+        for range_size in (3000, 10000, 25000):
+            with open(path) as stream:
+                result = self._parse(CtdpfParser, self._config(module, particle_class, 3, range_size), stream)
+            self.assertEqual(result, expected, '%d byte ranges' % range_size)
+
+    def test_ctdpf_state(self):
+        """
+        A parser started part way through a file decodes the rest of it in
+        ranges.  Setting the state while ranges are decoded reads the file
+        from there instead.
+        """
+        path = self._write(self._ctdpf_data())
+        module = 'mi.dataset.parser.ctdpf'
+        particle_class = 'CtdpfParserDataParticle'
+        state = {StateKey.POSITION: 30000, StateKey.TIMESTAMP: 3526416001.0}
+        with open(path) as stream:
+            expected = self._parse(CtdpfParser, self._config(module, particle_class), stream, dict(state))
+        with open(path) as stream:
+            result = self._parse(CtdpfParser, self._config(module, particle_class, 2, 5000), stream, dict(state))
+        self.assertEqual(result, expected)
+
+        with open(path) as stream:
+            parser = CtdpfParser(self._config(module, particle_class, 2, 5000), None, stream,
+                                 lambda state: None, lambda particles: None)
+            particles = parser.get_records(20)
+            parser.set_state(dict(state))
+            particles += parser.get_records(5000)
+        self.assertEqual([repr(p.raw_data) for p in particles[20:]], [r[0] for r in expected])
+
+    def test_glider(self):
+        with open(GLIDER_DATA) as f:
+            lines = f.read().splitlines(True)
+        path = self._write(''.join(lines[:17] + lines[17:] * 50))
+        module = 'mi.dataset.parser.glider'
+        particle_class = 'GgldrCtdgvDelayedDataParticle'
+        with open(path) as stream:
+            expected = self._parse(GliderParser, self._config(module, particle_class), stream)
+        with open(path) as stream:
+            result = self._parse(GliderParser, self._config(module, particle_class, 3, 2000), stream)
+        self.assertEqual(len(expected), 150)
+        self.assertEqual(result, expected)
+
+    def test_resume(self):
+        """
+        Parsers started from the states of records decoded in ranges carry
+        on just as a parse of the whole file does.
+        """
+        path = self._write(self._ctdpf_data(300, (40, 127)))
+        module = 'mi.dataset.parser.ctdpf'
+        particle_class = 'CtdpfParserDataParticle'
+        with open(path) as stream:
+            expected = self._parse(CtdpfParser, self._config(module, particle_class), stream)
+        with open(path) as stream:
+            result = self._parse(CtdpfParser, self._config(module, particle_class, 3, 1500), stream)
+        self._assert_resumes(CtdpfParser, self._config(module, particle_class), path, result, expected)
+
+        with open(GLIDER_DATA) as f:
+            lines = f.read().splitlines(True)
+        path = self._write(''.join(lines[:17] + lines[17:] * 50))
+        module = 'mi.dataset.parser.glider'
+        particle_class = 'GgldrCtdgvDelayedDataParticle'
+        with open(path) as stream:
+            expected = self._parse(GliderParser, self._config(module, particle_class), stream)
+        with open(path) as stream:
+            result = self._parse(GliderParser, self._config(module, particle_class, 3, 2000), stream)
+        self._assert_resumes(GliderParser, self._config(module, particle_class), path, result, expected)
+
+    def test_adcpa(self):
+        """
+        Ranges of an ADCPA file split at ensemble headers.
+        """
+        module = 'mi.dataset.parser.adcpa'
+        particle_class = 'ADCPA_PD0_PARSED_DataParticle'
+        with open(ADCPA_DATA, 'rb') as stream:
+            expected = self._parse(AdcpaParser, self._config(module, particle_class, read_mode=ReadMode.CHUNK),
+                                   stream)
+        with open(ADCPA_DATA, 'rb') as stream:
+            result = self._parse(AdcpaParser, self._config(module, particle_class, 2, 10000, ReadMode.CHUNK),
+                                 stream)
+        self.assertGreater(len(expected), 100)
+        self.assertEqual(result, expected)
+
+    def test_not_split(self):
+        """
+        Streams without a file, and files no bigger than a range, are read
+        as usual.
+        """
+        data = self._ctdpf_data()
+        config = self._config('mi.dataset.parser.ctdpf', 'CtdpfParserDataParticle', 2, len(data))
+        expected = self._parse(CtdpfParser, self._config('mi.dataset.parser.ctdpf', 'CtdpfParserDataParticle'),
+                               StringIO(data))
+        self.assertEqual(self._parse(CtdpfParser, config, StringIO(data)), expected)
+        with open(self._write(data)) as stream:
+            self.assertEqual(self._parse(CtdpfParser, config, stream), expected)
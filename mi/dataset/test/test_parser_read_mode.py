@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_parser_read_mode
+@file mi/dataset/test/test_parser_read_mode.py
+@author Steve Foley
+@brief Test that the block and mmap read modes of BufferLoadingParser give
+the same records and states as the original 1k chunk reads, with a
+benchmark of the read modes over a large ctdpf file.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.dataset.test.test_parser import ParserUnitTestCase
+from mi.dataset.dataset_driver import DataSetDriverConfigKeys
+from mi.dataset.dataset_parser import ParserConfigKey, ReadMode
+from mi.dataset.parser.ctdpf import CtdpfParser, StateKey
+from mi.dataset.parser.glider import GliderParser
+
+#bin/nosetests -s -v mi/dataset/test/test_parser_read_mode.py:TestParserReadMode.test_benchmark
+BENCHMARK_RECORDS = 20000
+
+CTDPF_HEADER = """
+* Sea-Bird SBE52 MP Data File *
+
+*** Starting profile number 42 ***
+"""
+
+GLIDER_DATA = os.path.join(os.path.dirname(__file__), '..', 'parser', 'test', 'test_glider_data.mrg')
+
+def ctdpf_data(count):
+    """
+    @retval ctdpf file contents with count records and a new timestamp every
+    50 records
+    """
+    lines = [CTDPF_HEADER]
+    for i in range(count):
+        if i % 50 == 0:
+            lines.append("10/01/2011 %02d:%02d:01\nGPS1:\nGPS2:\n" % (i / 3000 % 24, i / 50 % 60))
+        lines.append(" %02d.%04d, 13.4344,  143.63,   2830.2\n" % (i % 100, i % 10000))
+    return ''.join(lines)
+
+@attr('UNIT', group='mi')
+class TestParserReadMode(ParserUnitTestCase):
+
+    def setUp(self):
+        ParserUnitTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _config(self, module, particle_class, read_mode, block_size, max_block_size):
+        return {DataSetDriverConfigKeys.PARTICLE_MODULE: module,
+                DataSetDriverConfigKeys.PARTICLE_CLASS: particle_class,
+                ParserConfigKey.READ_MODE: read_mode,
+                ParserConfigKey.BLOCK_SIZE: block_size,
+                ParserConfigKey.MAX_BLOCK_SIZE: max_block_size}
+
+    def _write(self, data):
+        path = os.path.join(self.directory, 'data.txt')
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def _parse(self, parser_class, config, stream, state=None, count=7):
+        """
+        @retval list of (raw data, internal timestamp, state) for every record
+        """
+        states = []
+        parser = parser_class(config, state, stream, states.append, lambda particles: None)
+        result = []
+        while True:
+            particles = parser.get_records(count)
+            if not particles:
+                return result
+            for particle in particles:
+                # repr so glider NaN values compare equal
+                result.append((repr(particle.raw_data), particle.contents[DataParticleKey.INTERNAL_TIMESTAMP]))
+            result[-1] += (states[-1],)
+
+    def _compare_modes(self, parser_class, module, particle_class, data, expected=None):
+        """
+        Parse data in each read mode and compare with the records expected,
+        by default those from the original 1k chunk reads.  The parsers
+        count non-data split across reads slightly differently, so block
+        sizes are whole 1k chunks for the states to match exactly.
+        """
+        path = self._write(data)
+        if expected is None:
+            expected = self._parse(parser_class, self._config(module, particle_class, ReadMode.CHUNK, 0, 0),
+                                   StringIO(data))
+        self.assertGreater(len(expected), 0)
+        for (mode, block_size, max_block_size) in ((ReadMode.BLOCK, 1024, 8 * 1024),
+                                                   (ReadMode.BLOCK, 64 * 1024, 4 * 1024 * 1024),
+                                                   (ReadMode.MMAP, 1024, 8 * 1024),
+                                                   (ReadMode.MMAP, 64 * 1024, 4 * 1024 * 1024)):
+            config = self._config(module, particle_class, mode, block_size, max_block_size)
+            with open(path) as stream:
+                result = self._parse(parser_class, config, stream)
+            self.assertEqual(result, expected, '%s mode, %d byte blocks' % (mode, block_size))
+        # without a file descriptor the mmap mode reads blocks
+        config = self._config(module, particle_class, ReadMode.MMAP, 1024, 8 * 1024)
+        self.assertEqual(self._parse(parser_class, config, StringIO(data)), expected)
+
+    def test_ctdpf(self):
+        self._compare_modes(CtdpfParser, 'mi.dataset.parser.ctdpf', 'CtdpfParserDataParticle', ctdpf_data(500))
+
+    def test_ctdpf_set_state(self):
+        """
+        Moving the parser part way through a block starts reading again from
+        the new position.
+        """
+        data = ctdpf_data(200)
+        path = self._write(data)
+        results = {}
+        for mode in (ReadMode.CHUNK, ReadMode.BLOCK, ReadMode.MMAP):
+            states = []
+            config = self._config('mi.dataset.parser.ctdpf', 'CtdpfParserDataParticle', mode, 1024, 4096)
+            with open(path) as stream:
+                parser = CtdpfParser(config, None, stream, states.append, lambda particles: None)
+                particles = parser.get_records(20)
+                parser.set_state(states[-1])
+                particles += parser.get_records(30)
+                parser.set_state({StateKey.POSITION: 0, StateKey.TIMESTAMP: 0.0})
+                particles += parser.get_records(200)
+            results[mode] = [(p.raw_data, p.contents[DataParticleKey.INTERNAL_TIMESTAMP]) for p in particles]
+            self.assertEqual(len(particles), 250)
+        self.assertEqual(results[ReadMode.BLOCK], results[ReadMode.CHUNK])
+        self.assertEqual(results[ReadMode.MMAP], results[ReadMode.CHUNK])
+
+    def test_glider(self):
+        """
+        Glider records are checked against a parse of the whole file in one
+        read.  The 1k chunk reads cut a record short at a chunk boundary,
+        and the glider positions only count science records, so only the
+        records themselves are compared.
+        """
+        with open(GLIDER_DATA) as f:
+            lines = f.read().splitlines(True)
+        # the header, then the data lines many times over
+        data = ''.join(lines[:17] + lines[17:] * 50)
+        module = 'mi.dataset.parser.glider'
+        particle_class = 'GgldrCtdgvDelayedDataParticle'
+
+        def records(config, stream):
+            return [record[:2] for record in self._parse(GliderParser, config, stream)]
+
+        expected = records(self._config(module, particle_class, ReadMode.BLOCK, len(data), len(data)),
+                           StringIO(data))
+        self.assertEqual(len(expected), 150)
+        path = self._write(data)
+        for (mode, block_size) in ((ReadMode.BLOCK, 100), (ReadMode.BLOCK, 1024), (ReadMode.MMAP, 1024)):
+            config = self._config(module, particle_class, mode, block_size, 8 * 1024)
+            with open(path) as stream:
+                self.assertEqual(records(config, stream), expected, '%s mode, %d byte blocks' % (mode, block_size))
+
+    def test_benchmark(self):
+        """
+        Parse a large file in each read mode.  The chunk mode cost grows with
+        the amount buffered, the others should not.
+        """
+        path = self._write(ctdpf_data(BENCHMARK_RECORDS))
+        times = {}
+        for mode in (ReadMode.CHUNK, ReadMode.BLOCK, ReadMode.MMAP):
+            config = self._config('mi.dataset.parser.ctdpf', 'CtdpfParserDataParticle', mode,
+                                  64 * 1024, 4 * 1024 * 1024)
+            with open(path) as stream:
+                start = time.time()
+                self.assertEqual(len(self._parse(CtdpfParser, config, stream, count=1000)), BENCHMARK_RECORDS)
+                times[mode] = time.time() - start
+
+        log.info('%d records, %d bytes: %s', BENCHMARK_RECORDS, os.path.getsize(path),
+                 ', '.join('%s %.3fs' % (mode, t) for (mode, t) in sorted(times.items())))
+        self.assertLess(times[ReadMode.BLOCK], times[ReadMode.CHUNK] * 2)
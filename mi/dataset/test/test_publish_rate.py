@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_publish_rate
+@file mi/dataset/test/test_publish_rate.py
+@author Bill French
+@brief Test the token bucket limiting how fast dataset drivers publish.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+
+import gevent
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentParameterException
+from mi.dataset.dataset_driver import TokenBucket, DriverParameter, PublisherStatusKey
+from mi.dataset.test.test_parser_pool import CtdpfDriver
+from mi.dataset.test.test_parser_read_mode import ctdpf_data
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@attr('UNIT', group='mi')
+class TestTokenBucket(MiUnitTest):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_burst(self):
+        bucket = TokenBucket(10, 5, clock=self.clock)
+        self.assertEqual([bucket.take(1) for i in range(5)], [0] * 5)
+        self.assertAlmostEqual(bucket.take(1), .1)
+        self.clock.now += .1
+        self.assertAlmostEqual(bucket.take(3), .3)
+
+        # the bucket fills up to the burst size
+        self.clock.now += 100
+        self.assertEqual(bucket.take(5), 0)
+        self.assertAlmostEqual(bucket.take(1), .1)
+
+    def test_min_sleep(self):
+        """
+        Waits too short to sleep build up until they are worth sleeping.
+        """
+        bucket = TokenBucket(1000, 1, min_sleep=.01, clock=self.clock)
+        waits = [bucket.take(1) for i in range(12)]
+        self.assertEqual(waits[:10], [0] * 10)
+        self.assertAlmostEqual(waits[10], .01)
+        self.assertAlmostEqual(waits[11], .011)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0, 1, clock=self.clock)
+        self.assertEqual([bucket.take(1000) for i in range(10)], [0] * 10)
+        bucket.configure(None, 1)
+        self.assertEqual(bucket.take(1000), 0)
+        self.assertEqual(bucket.published, 11000)
+
+    def test_rate(self):
+        bucket = TokenBucket(clock=self.clock)
+        self.assertEqual(bucket.rate(), 0.0)
+        for i in range(11):
+            bucket.take(20)
+            self.clock.now += .5
+        self.assertAlmostEqual(bucket.rate(), 220 / 5.5)
+        # only the last RATE_WINDOW seconds count
+        self.clock.now += 8
+        self.assertAlmostEqual(bucket.rate(), 80 / 10.0)
+        self.clock.now += 10
+        self.assertEqual(bucket.rate(), 0.0)
+
+@attr('UNIT', group='mi')
+class TestDriverPublishRate(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.names = []
+        for index in range(3):
+            self.names.append(os.path.join(self.directory, 'file_%d.txt' % index))
+            with open(self.names[-1], 'w') as f:
+                f.write(ctdpf_data(100))
+
+    def _driver(self, driver_config):
+        config = {'harvester': {'directory': self.directory, 'pattern': '*.txt'},
+                  'parser': {}, 'driver': driver_config}
+        self.published = []
+        driver = CtdpfDriver(config, None, self.published.append, lambda state: None, None)
+        driver._new_file_queue = [(open(name), name) for name in self.names]
+        return driver
+
+    def test_unlimited(self):
+        driver = self._driver({DriverParameter.RECORDS_PER_SECOND: 0,
+                               DriverParameter.BATCHED_PARTICLE_COUNT: 40})
+        self.assertEqual(driver.publisher_status()[PublisherStatusKey.BACKLOG], 3)
+        start = time.time()
+        driver._poll()
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual([len(batch) for batch in self.published], [40, 40, 20])
+        status = driver.publisher_status()
+        self.assertEqual(status[PublisherStatusKey.PUBLISHED], 100)
+        self.assertEqual(status[PublisherStatusKey.BACKLOG], 2)
+        self.assertGreater(status[PublisherStatusKey.RATE], 0)
+
+    def test_yields(self):
+        """
+        Other greenlets run between batches, even with no limit.
+        """
+        driver = self._driver({DriverParameter.RECORDS_PER_SECOND: 0,
+                               DriverParameter.BATCHED_PARTICLE_COUNT: 10})
+        seen = []
+        def watch():
+            while True:
+                seen.append(len(self.published))
+                gevent.sleep(0)
+        watcher = gevent.spawn(watch)
+        gevent.sleep(0)
+        driver._poll()
+        watcher.kill()
+        self.assertEqual(sorted(set(seen)), range(11))
+
+    def test_limited(self):
+        """
+        A burst goes out at once, the rest at the records per second.
+        """
+        driver = self._driver({DriverParameter.RECORDS_PER_SECOND: 200,
+                               DriverParameter.BURST_SIZE: 50,
+                               DriverParameter.BATCHED_PARTICLE_COUNT: 10})
+        start = time.time()
+        driver._poll()
+        elapsed = time.time() - start
+        self.assertEqual(sum(len(batch) for batch in self.published), 100)
+        # 50 records over the burst at 200 per second
+        self.assertGreater(elapsed, .2)
+        self.assertLess(elapsed, 2)
+
+    def test_parameters(self):
+        driver = self._driver({})
+        self.assertEqual(driver.get_resource([DriverParameter.BURST_SIZE]), {DriverParameter.BURST_SIZE: 1})
+        driver.set_resource({DriverParameter.RECORDS_PER_SECOND: 0})
+        with self.assertRaises(InstrumentParameterException):
+            driver.set_resource({DriverParameter.RECORDS_PER_SECOND: -1})
+        with self.assertRaises(InstrumentParameterException):
+            driver.set_resource({DriverParameter.BURST_SIZE: 0})
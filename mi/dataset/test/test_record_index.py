@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_record_index
+@file mi/dataset/test/test_record_index.py
+@author Steve Foley
+@brief Test the sidecar record index and parsers seeking and replaying
+with it.
+"""
+
+import os
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.exceptions import DatasetParserException
+from mi.core.instrument.data_particle import DataParticleKey
+from mi.dataset.test.test_parser import ParserUnitTestCase
+from mi.dataset.dataset_driver import DataSetDriverConfigKeys
+from mi.dataset.dataset_parser import ParserConfigKey, ReadMode
+from mi.dataset.record_index import RecordIndex, IndexEntry, INDEX_HEADER, INDEX_ENTRY, INDEX_START
+from mi.dataset.parser.ctdpf import CtdpfParser
+from mi.dataset.parser.glider import GliderParser
+from mi.dataset.test.test_parser_read_mode import ctdpf_data, GLIDER_DATA
+
+@attr('UNIT', group='mi')
+class TestRecordIndex(ParserUnitTestCase):
+
+    def setUp(self):
+        ParserUnitTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'data.txt.idx')
+
+    def test_add(self):
+        index = RecordIndex()
+        self.assertEqual(index.end, 0)
+        self.assertTrue(index.add(10, 5, 100.0))
+        self.assertTrue(index.add(20, 5, 101.0))
+        # already indexed
+        self.assertFalse(index.add(10, 5, 100.0))
+        self.assertFalse(index.add(24, 5, 102.0))
+        self.assertTrue(index.add(25, 5, 102.0))
+        self.assertEqual(list(index), [IndexEntry(10, 5, 100.0), IndexEntry(20, 5, 101.0),
+                                       IndexEntry(25, 5, 102.0)])
+        self.assertEqual(index.end, 30)
+
+    def test_find(self):
+        index = RecordIndex()
+        for (number, timestamp) in enumerate([100.0, 101.0, 101.0, 105.0]):
+            index.add(number * 10, 10, timestamp)
+        self.assertEqual(index.find_time(50.0), 0)
+        self.assertEqual(index.find_time(101.0), 1)
+        self.assertEqual(index.find_time(102.0), 3)
+        self.assertEqual(index.find_time(106.0), 4)
+        self.assertEqual(index.find_range(101.0, 105.0), (1, 3))
+        self.assertEqual(index.find_range(105.0, 100.0), (3, 3))
+
+    def test_sidecar(self):
+        index = RecordIndex(self.path)
+        index.flush()
+        self.assertFalse(os.path.exists(self.path))
+        index.add(0, 10, 100.0)
+        index.add(10, 10, 101.0)
+        index.flush()
+        index.add(20, 10, 102.0)
+        index.flush()
+        self.assertEqual(os.path.getsize(self.path), INDEX_START + 3 * INDEX_ENTRY.size)
+        self.assertEqual(list(RecordIndex(self.path)), list(index))
+
+        # part of an entry from an interrupted write is dropped and written over
+        with open(self.path, 'ab') as f:
+            f.write(INDEX_ENTRY.pack(30, 10, 103.0)[:7])
+        index = RecordIndex(self.path)
+        self.assertEqual(len(index), 3)
+        index.add(30, 10, 103.0)
+        index.flush()
+        self.assertEqual(RecordIndex(self.path)[3], IndexEntry(30, 10, 103.0))
+
+        with open(self.path, 'wb') as f:
+            f.write('not an index')
+        with self.assertRaises(DatasetParserException):
+            RecordIndex(self.path)
+
+        # an index from another version is rebuilt
+        with open(self.path, 'wb') as f:
+            f.write('MIDX\x00\x00\x00\x01' + INDEX_ENTRY.pack(0, 10, 100.0))
+        self.assertEqual(len(RecordIndex(self.path)), 0)
+
+    def test_identity(self):
+        """
+        A sidecar is only used for the file it was written for, as long as
+        that file has not been truncated.
+        """
+        data_file = os.path.join(self.directory, 'data.txt')
+        with open(data_file, 'wb') as f:
+            f.write('a' * 30)
+        index = RecordIndex(self.path, data_file)
+        for offset in (0, 10, 20):
+            index.add(offset, 10, 100.0 + offset)
+        index.flush()
+        self.assertEqual(len(RecordIndex(self.path, data_file)), 3)
+
+        # appended to
+        with open(data_file, 'ab') as f:
+            f.write('a' * 10)
+        index = RecordIndex(self.path, data_file)
+        self.assertEqual(len(index), 3)
+        index.add(30, 10, 130.0)
+        index.flush()
+        self.assertEqual(len(RecordIndex(self.path, data_file)), 4)
+
+        # later flushes only update the size of the file
+        index._read_identity = None
+        with open(data_file, 'ab') as f:
+            f.write('a' * 10)
+        index.add(40, 10, 140.0)
+        index.flush()
+        self.assertEqual(len(RecordIndex(self.path, data_file)), 5)
+
+        # truncated
+        with open(data_file, 'r+b') as f:
+            f.truncate(35)
+        self.assertEqual(len(RecordIndex(self.path, data_file)), 0)
+
+        # replaced
+        with open(data_file, 'wb') as f:
+            f.write('b' * 40)
+        index = RecordIndex(self.path, data_file)
+        self.assertEqual(len(index), 0)
+        index.add(0, 40, 200.0)
+        index.flush()
+        self.assertEqual(list(RecordIndex(self.path, data_file)), [IndexEntry(0, 40, 200.0)])
+
+@attr('UNIT', group='mi')
+class TestParserIndex(ParserUnitTestCase):
+
+    def setUp(self):
+        ParserUnitTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.data = ctdpf_data(500)
+        self.path = os.path.join(self.directory, 'data.txt')
+        with open(self.path, 'w') as f:
+            f.write(self.data)
+
+    def _config(self, index=True, read_mode=ReadMode.CHUNK, **kwargs):
+        config = {DataSetDriverConfigKeys.PARTICLE_MODULE: 'mi.dataset.parser.ctdpf',
+                  DataSetDriverConfigKeys.PARTICLE_CLASS: 'CtdpfParserDataParticle',
+                  ParserConfigKey.READ_MODE: read_mode,
+                  ParserConfigKey.INDEX: index}
+        config.update(kwargs)
+        return config
+
+    def _parser(self, config, stream, state=None):
+        return CtdpfParser(config, state, stream, lambda state: None, lambda particles: None)
+
+    def _records(self, records):
+        return [(particle.raw_data, particle.contents[DataParticleKey.INTERNAL_TIMESTAMP],
+                 particle.contents[DataParticleKey.NEW_SEQUENCE]) for (particle, state) in records]
+
+    def test_index(self):
+        """
+        Every record is indexed at its offset in the file, whichever way
+        the file is read.
+        """
+        with open(self.path) as stream:
+            records = self._records(self._parser(self._config(), stream).iter_records())
+        index = RecordIndex(self.path + '.idx')
+        self.assertEqual(len(index), 500)
+        for (entry, record) in zip(index, records):
+            self.assertEqual(self.data[entry.offset:entry.offset + entry.length], record[0])
+            self.assertEqual(entry.timestamp, record[1])
+
+        for read_mode in (ReadMode.BLOCK, ReadMode.MMAP):
+            other = os.path.join(self.directory, '%s.idx' % read_mode)
+            with open(self.path) as stream:
+                list(self._parser(self._config(other, read_mode, block_size=1000), stream).iter_records())
+            self.assertEqual(list(RecordIndex(other)), list(index), read_mode)
+
+        # decoded in ranges
+        other = os.path.join(self.directory, 'ranges.idx')
+        with open(self.path) as stream:
+            list(self._parser(self._config(other, ReadMode.BLOCK, decode_processes=2, range_size=3000),
+                              stream).iter_records())
+        self.assertEqual(list(RecordIndex(other)), list(index))
+
+    def test_resume(self):
+        """
+        A parse started from a saved state carries on the index of an
+        earlier parse that stopped part way.
+        """
+        with open(self.path) as stream:
+            parser = self._parser(self._config(), stream)
+            parser.get_records(120)
+            state = dict(parser._state)
+        self.assertGreaterEqual(len(RecordIndex(self.path + '.idx')), 120)
+
+        with open(self.path) as stream:
+            self._parser(self._config(), stream, state).get_records(1000)
+        index = RecordIndex(self.path + '.idx')
+        self.assertEqual(len(index), 500)
+        offsets = [entry.offset for entry in index]
+        self.assertEqual(offsets, sorted(set(offsets)))
+
+    def test_replaced_file(self):
+        """
+        The index of a file that has been replaced is rebuilt.
+        """
+        with open(self.path) as stream:
+            list(self._parser(self._config(), stream).iter_records())
+        self.data = ctdpf_data(50)
+        with open(self.path, 'w') as f:
+            f.write('\n' + self.data)
+
+        with open(self.path) as stream:
+            records = self._records(self._parser(self._config(), stream).iter_records())
+        index = RecordIndex(self.path + '.idx', self.path)
+        self.assertEqual(len(index), 50)
+        for (entry, record) in zip(index, records):
+            self.assertEqual(self.data[entry.offset - 1:entry.offset - 1 + entry.length], record[0])
+
+    def test_seek(self):
+        with open(self.path) as stream:
+            expected = self._records(self._parser(self._config(), stream).iter_records())
+
+        with open(self.path) as stream:
+            parser = self._parser(self._config(), stream)
+            parser.seek_record(321)
+            result = self._records(parser.iter_records())
+            # the first record a parser returns starts a new sequence
+            self.assertEqual([r[:2] for r in result], [r[:2] for r in expected[321:]])
+            self.assertEqual(result[1:], expected[322:])
+            parser.seek_time(expected[40][1])
+            self.assertEqual(self._records(parser.iter_records())[:3], expected[40:43])
+            with self.assertRaises(DatasetParserException):
+                parser.seek_record(500)
+            with self.assertRaises(DatasetParserException):
+                parser.seek_time(expected[-1][1] + 1)
+
+        with open(self.path) as stream:
+            parser = self._parser(self._config(None), stream)
+            with self.assertRaises(DatasetParserException):
+                parser.seek_record(0)
+
+    def test_replay(self):
+        """
+        Only the records in the time range come out, the first starting a
+        new sequence.
+        """
+        with open(self.path) as stream:
+            expected = self._records(self._parser(self._config(), stream).iter_records())
+
+        with open(self.path) as stream:
+            parser = self._parser(self._config(), stream)
+            result = self._records(parser.replay(expected[260][1], expected[275][1]))
+            self.assertEqual(len(result), 15)
+            self.assertEqual(result[0][:2], expected[260][:2])
+            self.assertTrue(result[0][2])
+            self.assertEqual(result[1:], expected[261:275])
+            self.assertEqual(list(parser.replay(0.0, expected[0][1])), [])
+
+    def test_glider(self):
+        path = os.path.join(self.directory, 'glider.mrg')
+        shutil.copy(GLIDER_DATA, path)
+        config = {DataSetDriverConfigKeys.PARTICLE_MODULE: 'mi.dataset.parser.glider',
+                  DataSetDriverConfigKeys.PARTICLE_CLASS: 'GgldrCtdgvDelayedDataParticle',
+                  ParserConfigKey.INDEX: True}
+        with open(path) as stream:
+            # raw data dicts hold NaNs, which only compare equal by repr
+            expected = [repr(sorted(particle.raw_data.items())) for (particle, state) in
+                        GliderParser(config, None, stream, None, None).iter_records()]
+        index = RecordIndex(path + '.idx')
+        self.assertEqual(len(index), len(expected))
+        with open(path) as stream:
+            lines = stream.read()
+        for entry in index:
+            self.assertEqual(lines[entry.offset - 1], '\n')
+            self.assertEqual(lines[entry.offset + entry.length], '\n')
+
+        with open(path) as stream:
+            parser = GliderParser(config, None, stream, None, None)
+            parser.seek_record(1)
+            self.assertEqual([repr(sorted(particle.raw_data.items())) for (particle, state) in parser.iter_records()],
+                             expected[1:])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_sorted_file_index
+@file mi/dataset/test/test_sorted_file_index.py
+@author Bill French
+@brief Test the incrementally sorted file index used by the sorting
+directory poller, with a benchmark over a 100k file directory listing.
+"""
+
+import os
+import time
+import gzip
+import shutil
+import random
+import tempfile
+
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.harvester import SortedFileIndex, SortingDirectoryPoller, SortingDirectoryHarvester
+
+#bin/nosetests -s -v mi/dataset/test/test_sorted_file_index.py:TestSortedFileIndex.test_benchmark
+BENCHMARK_FILE_COUNT = 100000
+BENCHMARK_NEW_FILES = 10
+
+def glider_names(count, start=0):
+    """
+    @retval count file names shaped like glider merged files, in sort order
+    """
+    names = []
+    for i in range(start, start + count):
+        names.append('/tmp/dsatest/unit_363_%d_%d_%d_%d.mrg' % (2013 + i / 100000, i / 1000 % 100,
+                                                               i / 10 % 100, i % 10))
+    return names
+
+@attr('UNIT', group='mi')
+class TestSortedFileIndex(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_index(self):
+        index = SortedFileIndex(SortingDirectoryPoller.ascii_to_int_list)
+        (added, removed) = index.update(['a_10.mrg', 'a_9.mrg', 'a_1_5.mrg'])
+        self.assertEqual(sorted(added), ['a_10.mrg', 'a_1_5.mrg', 'a_9.mrg'])
+        self.assertEqual(removed, [])
+        self.assertEqual(index.filenames(), ['a_1_5.mrg', 'a_9.mrg', 'a_10.mrg'])
+        self.assertEqual(index.last(), 'a_10.mrg')
+
+        (added, removed) = index.update(['a_10.mrg', 'a_1_5.mrg', 'a_2.mrg', 'a_11.mrg'])
+        self.assertEqual(sorted(added), ['a_11.mrg', 'a_2.mrg'])
+        self.assertEqual(removed, ['a_9.mrg'])
+        self.assertEqual(index.filenames(), ['a_1_5.mrg', 'a_2.mrg', 'a_10.mrg', 'a_11.mrg'])
+        self.assertEqual(index.after('a_2.mrg'), ['a_10.mrg', 'a_11.mrg'])
+        self.assertEqual(index.after('a_9.mrg'), ['a_10.mrg', 'a_11.mrg'])
+        self.assertEqual(len(index), 4)
+
+    def test_sort_files(self):
+        poller = SortingDirectoryPoller(self.directory, '*.mrg', None)
+        names = ['u_363_2013_245_7_0.mrg', 'u_363_2013_245_6_10.mrg', 'u_363_2013_245_6_9.mrg']
+        self.assertEqual(poller.sort_files(names),
+                         ['u_363_2013_245_6_9.mrg', 'u_363_2013_245_6_10.mrg', 'u_363_2013_245_7_0.mrg'])
+
+    def test_sort_compressed(self):
+        """
+        Compressed files sort as the files they hold.
+        """
+        poller = SortingDirectoryPoller(self.directory, '*.mrg.gz', None)
+        names = ['u_363_2013_245_7_0.mrg.gz', 'u_363_2013_245_6_10.mrg.gz', 'u_363_2013_245_6_9.mrg.gz']
+        self.assertEqual(poller.sort_files(names),
+                         ['u_363_2013_245_6_9.mrg.gz', 'u_363_2013_245_6_10.mrg.gz', 'u_363_2013_245_7_0.mrg.gz'])
+        self.assertEqual(SortingDirectoryPoller.ascii_to_int_list('u_363_2013_245_6_9.mrg.gz'),
+                         SortingDirectoryPoller.ascii_to_int_list('u_363_2013_245_6_9.mrg'))
+
+    def test_harvest_compressed(self):
+        """
+        Compressed files after the last one completed are harvested in
+        order, decompressed as they are read.
+        """
+        for name in ('u_1_8.mrg.gz', 'u_1_9.mrg.gz', 'u_1_10.mrg.gz', 'u_2_0.mrg.gz'):
+            f = gzip.open(os.path.join(self.directory, name), 'wb')
+            f.write(name)
+            f.close()
+        found = []
+        config = {'directory': self.directory, 'pattern': '*.mrg.gz', 'inotify': False}
+        harvester = SortingDirectoryHarvester(config, os.path.join(self.directory, 'u_1_9.mrg.gz'),
+                                              lambda f, name: found.append((os.path.basename(name), f.read())),
+                                              None)
+        harvester.on_new_files(harvester._check_for_files())
+        self.assertEqual(found, [('u_1_10.mrg.gz', 'u_1_10.mrg.gz'), ('u_2_0.mrg.gz', 'u_2_0.mrg.gz')])
+
+    def test_check_for_files(self):
+        poller = SortingDirectoryPoller(self.directory, '*.mrg', None)
+        listing = ['d/u_1_9.mrg', 'd/u_1_10.mrg']
+        with patch('mi.dataset.harvester.glob.glob', side_effect=lambda path: list(listing)):
+            self.assertEqual(poller._check_for_files(), ['d/u_1_9.mrg', 'd/u_1_10.mrg'])
+            self.assertIsNone(poller._check_for_files())
+
+            listing.append('d/u_2_0.mrg')
+            self.assertEqual(poller._check_for_files(), ['d/u_2_0.mrg'])
+
+            # the last file went away, report everything
+            listing.remove('d/u_2_0.mrg')
+            listing.append('d/u_2_1.mrg')
+            self.assertEqual(poller._check_for_files(), ['d/u_1_9.mrg', 'd/u_1_10.mrg', 'd/u_2_1.mrg'])
+
+    def test_benchmark(self):
+        """
+        Poll a 100k file listing, then add a few files per poll.  Each poll
+        after the first should only pay for the listing and the new files.
+        """
+        listing = glider_names(BENCHMARK_FILE_COUNT)
+        random.shuffle(listing)
+        poller = SortingDirectoryPoller(self.directory, '*.mrg', None)
+
+        with patch('mi.dataset.harvester.glob.glob', side_effect=lambda path: listing):
+            start = time.time()
+            self.assertEqual(len(poller._check_for_files()), BENCHMARK_FILE_COUNT)
+            first_poll = time.time() - start
+
+            poll_times = []
+            for i in range(5):
+                new = glider_names(BENCHMARK_NEW_FILES, BENCHMARK_FILE_COUNT + i * BENCHMARK_NEW_FILES)
+                listing = listing + new
+                start = time.time()
+                self.assertEqual(poller._check_for_files(), new)
+                poll_times.append(time.time() - start)
+
+            start = time.time()
+            poller.sort_files(listing)
+            full_sort = time.time() - start
+
+        log.info('%d files: first poll %.3fs, incremental polls %s, full sort %.3fs',
+                 len(listing), first_poll, ['%.3f' % t for t in poll_times], full_sort)
+        self.assertLess(max(poll_times), full_sort)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_state_checkpoint
+@file mi/dataset/test/test_state_checkpoint.py
+@author Bill French
+@brief Test coalescing driver state updates into durable checkpoints.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+
+import gevent
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.dataset_driver import StateCheckpoint, DataSourceConfigKey, DriverParameter
+from mi.dataset.test.test_parser_pool import CtdpfDriver
+from mi.dataset.test.test_parser_read_mode import ctdpf_data
+
+@attr('UNIT', group='mi')
+class TestStateCheckpoint(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'state.json')
+        self.states = []
+
+    def test_count(self):
+        checkpoint = StateCheckpoint(self.states.append, count=3)
+        for state in range(7):
+            checkpoint.update(state)
+        self.assertEqual(self.states, [2, 5])
+        checkpoint.flush()
+        checkpoint.flush()
+        self.assertEqual(self.states, [2, 5, 6])
+
+        # lowering the count takes a checkpoint that is now due
+        checkpoint.update(7)
+        checkpoint.update(8)
+        checkpoint.configure(2, None)
+        self.assertEqual(self.states, [2, 5, 6, 8])
+
+    def test_interval(self):
+        checkpoint = StateCheckpoint(self.states.append, count=100, interval=0.05)
+        checkpoint.update(1)
+        checkpoint.update(2)
+        self.assertEqual(self.states, [])
+        gevent.sleep(0.1)
+        self.assertEqual(self.states, [2])
+
+        # a checkpoint taken early stops the timer
+        checkpoint.update(3)
+        checkpoint.flush()
+        gevent.sleep(0.1)
+        self.assertEqual(self.states, [2, 3])
+
+    def test_interval_without_yield(self):
+        """
+        Updates made after the interval has passed take a checkpoint, even
+        when the timer has had no chance to run.
+        """
+        clock = [100.0]
+        checkpoint = StateCheckpoint(self.states.append, count=100, interval=1, clock=lambda: clock[0])
+        checkpoint.update(1)
+        clock[0] += 0.5
+        checkpoint.update(2)
+        self.assertEqual(self.states, [])
+        clock[0] += 0.5
+        checkpoint.update(3)
+        self.assertEqual(self.states, [3])
+
+        # the window starts again with the next update
+        clock[0] += 5
+        checkpoint.update(4)
+        clock[0] += 0.9
+        checkpoint.update(5)
+        self.assertEqual(self.states, [3])
+        clock[0] += 0.1
+        checkpoint.configure(100, 1)
+        self.assertEqual(self.states, [3, 5])
+
+    def test_durable(self):
+        checkpoint = StateCheckpoint(self.states.append, self.path, count=2)
+        self.assertIsNone(checkpoint.load())
+        state = {'harvester': 'a.txt', 'parser': {'position': 10}}
+        checkpoint.update({'harvester': None, 'parser': None})
+        checkpoint.update(state)
+        self.assertEqual(StateCheckpoint(None, self.path).load(), state)
+        self.assertEqual(os.listdir(self.directory), ['state.json'])
+
+        # a write that did not finish leaves the last state in place
+        with open(self.path + '.tmp', 'w') as f:
+            f.write('{"harvester": "b.t')
+        self.assertEqual(StateCheckpoint(None, self.path).load(), state)
+
+    def test_driver(self):
+        """
+        The driver saves a state every checkpoint_count updates and when it
+        stops, and starts from the state file without a memento.
+        """
+        names = []
+        for index in range(2):
+            names.append(os.path.join(self.directory, 'file_%d.txt' % index))
+            with open(names[-1], 'w') as f:
+                f.write(ctdpf_data(25))
+        config = {'harvester': {'directory': self.directory, 'pattern': '*.txt'},
+                  'parser': {},
+                  'driver': {DriverParameter.RECORDS_PER_SECOND: 100000,
+                             DriverParameter.CHECKPOINT_COUNT: 10},
+                  DataSourceConfigKey.CHECKPOINT: self.path}
+        published = []
+        driver = CtdpfDriver(config, None, published.extend, self.states.append, None)
+        driver._new_file_queue = [(open(name), name) for name in names]
+        driver._poll()
+        driver._poll()
+        # 25 parser states and a harvester state for each file
+        self.assertEqual(len(published), 50)
+        self.assertEqual(len(self.states), 5)
+        driver.stop_sampling()
+        self.assertEqual(len(self.states), 6)
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {'harvester': names[1], 'parser': None})
+
+        driver = CtdpfDriver(config, None, published.extend, self.states.append, None)
+        self.assertEqual(driver._harvester_state, names[1])
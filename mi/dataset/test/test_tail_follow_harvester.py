@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_tail_follow_harvester
+@file mi/dataset/test/test_tail_follow_harvester.py
+@author Bill French
+@brief Test the tail follow harvester: appended ranges, truncation and
+rotation.
+"""
+
+import os
+import time
+import mmap
+import shutil
+import tempfile
+
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.timeout import Deadline
+from mi.core.poller import get_polling_loop
+from mi.dataset.dataset_driver import SimpleDataSetDriver, DriverParameter
+from mi.dataset.harvester import TailFollowHarvester, TailFollowHarvesterMementoKey, pread
+from mi.dataset.parser.ctdpf import CtdpfParser
+from mi.dataset.test.test_parser_read_mode import ctdpf_data
+
+FILENAME = 'controller.dat'
+
+class TailCtdpfDriver(SimpleDataSetDriver):
+    """
+    Driver following a ctdpf file, parsing what is appended to it.
+    """
+    def _build_parser(self, parser_state, infile):
+        config = {'particle_module': 'mi.dataset.parser.ctdpf',
+                  'particle_class': 'CtdpfParserDataParticle'}
+        return CtdpfParser(config, parser_state, infile, self._save_parser_state, self._data_callback)
+
+    def _build_harvester(self, harvester_state):
+        return TailFollowHarvester(self._harvester_config, harvester_state,
+                                   self._new_window_callback, self._exception_callback)
+
+@attr('UNIT', group='mi')
+class TestTailFollowHarvester(MiUnitTest):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, FILENAME)
+        self.config = {'directory': self.directory, 'filename': FILENAME, 'inotify': False}
+        self.windows = []
+
+    def _append(self, data, mode='a'):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def _callback(self, window):
+        # the callback owns the window once it returns
+        with window:
+            self.windows.append((window.offset, window.read(), window.truncated))
+
+    def _harvest(self, memento=None):
+        harvester = TailFollowHarvester(self.config, memento, self._callback, None)
+        self.addCleanup(harvester._close)
+        return harvester
+
+    def _check(self, harvester):
+        """
+        @retval list of (offset, data, truncated) delivered by one check
+        """
+        self.windows = []
+        value = harvester._check_for_data()
+        if value:
+            harvester.on_new_data(value)
+        return self.windows
+
+    def test_pread(self):
+        data = ''.join(chr(i % 251) for i in range(3 * mmap.ALLOCATIONGRANULARITY))
+        self._append(data)
+        fd = os.open(self.path, os.O_RDONLY)
+        self.addCleanup(os.close, fd)
+        for offset in (0, 7, mmap.ALLOCATIONGRANULARITY - 1, mmap.ALLOCATIONGRANULARITY + 5):
+            self.assertEqual(pread(fd, 100, offset), data[offset:offset + 100])
+        self.assertEqual(pread(fd, 100, len(data) - 10), data[-10:])
+        self.assertEqual(pread(fd, 100, len(data)), '')
+
+    def test_append(self):
+        harvester = self._harvest()
+        self.assertEqual(self._check(harvester), [])
+
+        self._append('one\n')
+        self.assertEqual(self._check(harvester), [(0, 'one\n', False)])
+        self.assertEqual(self._check(harvester), [])
+        self._append('two\nthree\n')
+        self.assertEqual(self._check(harvester), [(4, 'two\nthree\n', False)])
+
+        self._append('four\n')
+        windows = []
+        def callback(window):
+            with window:
+                window.seek(16)
+                windows.append((window.read(2), window.tell(), window.state()))
+        harvester.callback = callback
+        harvester.on_new_data(harvester._check_for_data())
+        self.assertEqual(windows, [('ur', 18, {TailFollowHarvesterMementoKey.OFFSET: 19,
+                                               TailFollowHarvesterMementoKey.INODE: os.stat(self.path).st_ino})])
+
+    def test_restart(self):
+        self._append('one\ntwo\n')
+        inode = os.stat(self.path).st_ino
+        harvester = self._harvest({TailFollowHarvesterMementoKey.OFFSET: 4,
+                                   TailFollowHarvesterMementoKey.INODE: inode})
+        self.assertEqual(self._check(harvester), [(4, 'two\n', False)])
+
+        # replaced while the harvester was down
+        with open(self.path + '.new', 'w') as f:
+            f.write('new\n')
+        os.rename(self.path + '.new', self.path)
+        harvester = self._harvest({TailFollowHarvesterMementoKey.OFFSET: 8,
+                                   TailFollowHarvesterMementoKey.INODE: inode})
+        self.assertEqual(self._check(harvester), [(0, 'new\n', True)])
+
+    def test_truncate(self):
+        self._append('one\ntwo\n')
+        harvester = self._harvest()
+        self._check(harvester)
+        self._append('x\n', 'w')
+        self.assertEqual(self._check(harvester), [(0, 'x\n', True)])
+        self._append('y\n')
+        self.assertEqual(self._check(harvester), [(2, 'y\n', False)])
+
+    def test_rotate(self):
+        """
+        The rest of the rotated file is delivered before the new file, and
+        stays readable after the harvester lets go of it.
+        """
+        self._append('one\n')
+        harvester = self._harvest()
+        self._check(harvester)
+
+        self._append('two\n')
+        os.rename(self.path, self.path + '.1')
+        # moved away, not replaced yet: the old file is still followed
+        self.assertEqual(self._check(harvester), [(4, 'two\n', False)])
+
+        self._append('three\n')
+        with open(self.path + '.1', 'a') as f:
+            f.write('last\n')
+        self.assertEqual(self._check(harvester), [(8, 'last\n', False), (0, 'three\n', True)])
+
+        self._append('four\n')
+        self.assertEqual(self._check(harvester), [(6, 'four\n', False)])
+
+    def test_callback_error(self):
+        """
+        Every window is closed when the callback raises, including those
+        it was not called with.
+        """
+        self._append('one\n')
+        harvester = self._harvest()
+        self._check(harvester)
+        self._append('two\n')
+        os.rename(self.path, self.path + '.1')
+        self._append('three\n')
+
+        windows = harvester._check_for_data()
+        self.assertEqual(len(windows), 2)
+        def callback(window):
+            raise ValueError('parse failed')
+        harvester.callback = callback
+        with self.assertRaises(ValueError):
+            harvester.on_new_data(windows)
+        self.assertEqual([window._fd for window in windows], [None, None])
+
+    def test_callback_owns_window(self):
+        """
+        A window handed to the callback stays readable after it returns,
+        until the receiver closes it.
+        """
+        harvester = self._harvest()
+        received = []
+        harvester.callback = received.append
+        self._append('one\n')
+        harvester.on_new_data(harvester._check_for_data())
+        self._append('two\n')
+        harvester.on_new_data(harvester._check_for_data())
+
+        self.assertEqual([window.read() for window in received], ['one\n', 'two\n'])
+        for window in received:
+            window.close()
+        self.assertEqual([window._fd for window in received], [None, None])
+
+    def test_driver(self):
+        """
+        A driver queues the windows the harvester hands it and parses them
+        later, publishing every record appended and saving the state of the
+        last window parsed.
+        """
+        self._append(ctdpf_data(0))
+        published = []
+        states = []
+        config = {'harvester': dict(self.config, pattern=FILENAME), 'parser': {},
+                  'driver': {DriverParameter.RECORDS_PER_SECOND: 100000}}
+        driver = TailCtdpfDriver(config, None, published.extend, states.append, None)
+        driver._new_file_queue = []
+        harvester = driver._build_harvester(None)
+        self.addCleanup(harvester._close)
+
+        # several windows are queued before any is parsed
+        windows = []
+        for count in (60, 5, 120):
+            self._append(ctdpf_data(count)[len(ctdpf_data(0)):])
+            value = harvester._check_for_data()
+            windows.extend(value)
+            harvester.on_new_data(value)
+        self.assertEqual(len(driver._new_file_queue), 3)
+
+        while driver._new_file_queue:
+            driver._poll()
+        self.assertEqual(len(published), 185)
+        self.assertEqual([window._fd for window in windows], [None] * 3)
+        self.assertEqual(driver._harvester_state, windows[-1].state())
+        self.assertEqual(driver._harvester_state[TailFollowHarvesterMementoKey.OFFSET],
+                         os.path.getsize(self.path))
+
+    def test_shared_loop(self):
+        """
+        Followed on the shared polling loop, data is delivered without a
+        thread of the harvester's own, and the file is let go on shutdown.
+        """
+        self.config.update({'shared_loop': True, 'frequency': .05})
+        harvester = self._harvest()
+        harvester.start()
+        self.addCleanup(harvester.shutdown)
+        self._append('one\n')
+        deadline = Deadline(5)
+        while not self.windows and not deadline.expired():
+            time.sleep(.01)
+        self.assertEqual(self.windows, [(0, 'one\n', False)])
+        self.assertTrue(get_polling_loop().hosts(harvester))
+        self.assertTrue(harvester.is_alive())
+        self.assertIsNone(harvester.ident)
+
+        harvester.shutdown()
+        while harvester.is_alive() and not deadline.expired():
+            time.sleep(.01)
+        self.assertFalse(harvester.is_alive())
+        self.assertIsNone(harvester._fd)
@@ -414,7 +414,9 @@ class DataSetIntegrationTestCase(DataSetTestCase):
         """
         Verify that we can get, set, and report all driver parameters.
         """
-        expected_params = [DriverParameter.BATCHED_PARTICLE_COUNT, DriverParameter.PUBLISHER_POLLING_INTERVAL, DriverParameter.RECORDS_PER_SECOND]
+        expected_params = [DriverParameter.BATCHED_PARTICLE_COUNT, DriverParameter.PUBLISHER_POLLING_INTERVAL, DriverParameter.RECORDS_PER_SECOND,
+                           DriverParameter.BURST_SIZE, DriverParameter.PARSER_POOL_SIZE, DriverParameter.PARSER_QUEUE_DEPTH,
+                           DriverParameter.CHECKPOINT_COUNT, DriverParameter.CHECKPOINT_INTERVAL]
         (res_cmds, res_params) = self.driver.get_resource_capabilities()
 
         # Ensure capabilities are as expected
@@ -805,7 +807,9 @@ class DataSetQualificationTestCase(DataSetTestCase):
             return agt_cmds, agt_pars, res_cmds, res_iface, res_pars
 
         log.debug("Initialize the agent")
-        expected_params = [DriverParameter.BATCHED_PARTICLE_COUNT, DriverParameter.PUBLISHER_POLLING_INTERVAL, DriverParameter.RECORDS_PER_SECOND]
+        expected_params = [DriverParameter.BATCHED_PARTICLE_COUNT, DriverParameter.PUBLISHER_POLLING_INTERVAL, DriverParameter.RECORDS_PER_SECOND,
+                           DriverParameter.BURST_SIZE, DriverParameter.PARSER_POOL_SIZE, DriverParameter.PARSER_QUEUE_DEPTH,
+                           DriverParameter.CHECKPOINT_COUNT, DriverParameter.CHECKPOINT_INTERVAL]
         self.assert_initialize(final_state=ResourceAgentState.COMMAND)
 
         log.debug("Call get capabilities")